@@ -5,24 +5,18 @@ EM200003227018CA 和 EM200003173839CA
 """
 
 import pymysql
+from order_source import get_connection
 import numpy as np
 from sklearn.cluster import DBSCAN, KMeans
 import math
 
-DB_CONFIG = {
-    'host': '15.156.112.57',
-    'port': 33306,
-    'user': 'select-user',
-    'password': 'emile2024',
-    'database': 'bonddb',
-    'charset': 'utf8mb4'
-}
 
 ORDER_GROUP = "Group202510172101060201"
 TARGET_ORDERS = ['EM200003227018CA', 'EM200003173839CA']
 
 def get_db_connection():
-    return pymysql.connect(**DB_CONFIG)
+    # ORDER_SOURCE=sqlite:orders.db / snapshot:snapshots/ 可離線執行
+    return get_connection()
 
 
 def calculate_distance(lat1, lon1, lat2, lon2):
@@ -1,34 +1,253 @@
 #!/usr/bin/env python3
 """Valhalla 訂單路徑規劃系統 - Flask 後端"""
 
-from flask import Flask, jsonify, request, send_from_directory
+import time
+_import_started = time.perf_counter()  # 冷啟動：模組載入耗時（/healthz 回報）
+
+from flask import Flask, jsonify, request, send_from_directory, g
 from flask_cors import CORS
 import pymysql
 import requests
 import os
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from app_logging import get_logger, LogSampler
+from metrics import REGISTRY, CONTENT_TYPE, REQUEST_LATENCY, DB_LATENCY, VALHALLA_LATENCY
+from neighbor_graph_cache import NeighborGraphCache
 from river_detection import verify_route_crossings, RiverDetector
+from crossing_points import CrossingPointIndex
 from tsp_solver import solve_tsp
+from plan_cache import PlanCache, order_snapshot_version
+from route_pipeline import route_params, run_route_pipeline, compact_steps, StageCache, STAGE_ORDER
+from response_format import format_response, dumps_json, loads_json
+from order_source import get_connection, get_write_connection, describe_source
+from order_writeback import write_back, plan_rows, WriteBackError
+from request_profiler import RequestProfiler, ProfilerBusy, profiling_requested, is_admin, load_profile
+from plan_jobs import PlanJobQueue, PlanJobError, JobQueueFull
+from plan_stream import (
+    RouteStream, encode_event, negotiate_stream_format, requested_stream_format, stream_response
+)
+from batch_planner import BatchPlanner, BATCH_MAX_GROUPS
+from warmup import Warmup
+from precompute import Precomputer, PRECOMPUTE_INTERVAL
 
 app = Flask(__name__, static_folder='static')
 CORS(app)
 
-# MySQL 配置
-DB_CONFIG = {
-    'host': '15.156.112.57',
-    'port': 33306,
-    'user': 'select-user',
-    'password': 'emile2024',
-    'database': 'bonddb',
-    'charset': 'utf8mb4'
-}
+logger = get_logger('app')
 
 # Valhalla API
 VALHALLA_URL = "https://valhalla1.openstreetmap.de"
 
+# 規劃結果快取（相同訂單快照 + 相同參數直接回傳）
+plan_cache = PlanCache.get_instance()
+
+APP_IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# 背景規劃工作（/api/route/jobs）
+plan_jobs = PlanJobQueue.get_instance()
+
+# /metrics 輸出各快取命中率
+REGISTRY.register_cache('plan', plan_cache)
+REGISTRY.register_cache('stage', StageCache.get_instance())
+REGISTRY.register_cache('neighbor_graph', NeighborGraphCache.get_instance())
+
 
 def get_db_connection():
-    """建立資料庫連接"""
-    return pymysql.connect(**DB_CONFIG)
+    """建立資料庫連接（ORDER_SOURCE 可改用本機 SQLite / 訂單快照）"""
+    return get_connection()
+
+
+def fetch_valid_orders(order_group):
+    """
+    從資料庫取得訂單並過濾有效座標
+
+    Returns:
+        有效訂單列表 [{'tracking_number', 'lat', 'lon'}, ...]；找不到訂單時返回 None
+    """
+    query = """
+        SELECT tracking_number, latitude, longitude
+        FROM ordersjb
+        WHERE order_group = %s
+        AND latitude IS NOT NULL
+        AND longitude IS NOT NULL
+        ORDER BY tracking_number
+    """
+
+    with DB_LATENCY.time(query='valid_orders'):
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(query, (order_group,))
+        orders = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+    if not orders:
+        return None
+
+    logger.debug(f"找到 {len(orders)} 個訂單")
+    return filter_valid_orders(orders)
+
+
+def fetch_valid_orders_many(order_groups):
+    """
+    一次查詢多個 order_group（WHERE order_group IN (...)）
+
+    Returns:
+        {order_group: 有效訂單列表}；找不到訂單的 order_group 不會出現在結果中
+    """
+    placeholders = ', '.join(['%s'] * len(order_groups))
+    query = f"""
+        SELECT order_group, tracking_number, latitude, longitude
+        FROM ordersjb
+        WHERE order_group IN ({placeholders})
+        AND latitude IS NOT NULL
+        AND longitude IS NOT NULL
+        ORDER BY order_group, tracking_number
+    """
+
+    with DB_LATENCY.time(query='valid_orders_batch'):
+        conn = get_db_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(query, tuple(order_groups))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['order_group'], []).append(row)
+    logger.debug(f"批次查詢 {len(order_groups)} 個 order_group，找到 {len(grouped)} 個、共 {len(rows)} 個訂單")
+    return {order_group: filter_valid_orders(orders) for order_group, orders in grouped.items()}
+
+
+def filter_valid_orders(orders):
+    """資料庫列 → 有效訂單 [{'tracking_number', 'lat', 'lon'}, ...]（座標換算並排除無效值）"""
+    valid_orders = []
+    sampler = LogSampler(logger)
+    for order in orders:
+        try:
+            lat_raw = float(order['latitude'])
+            lon_raw = float(order['longitude'])
+
+            # 資料庫格式：整數需除以 10^10 轉換為正確的經緯度
+            lat = lat_raw / 10000000000.0 if abs(lat_raw) > 1000 else lat_raw
+            lon = lon_raw / 10000000000.0 if abs(lon_raw) > 1000 else lon_raw
+
+            # 驗證經緯度範圍（排除 0,0）
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                if abs(lat) > 0.001 and abs(lon) > 0.001:
+                    valid_orders.append({
+                        'tracking_number': order['tracking_number'],
+                        'lat': lat,
+                        'lon': lon
+                    })
+        except (ValueError, TypeError) as e:
+            sampler.info("跳過無效座標: %s - %s", order.get('tracking_number'), e)
+            continue
+
+    if sampler.seen > sampler.logged:
+        logger.warning(f"共跳過 {sampler.seen} 筆無效座標")
+    return valid_orders
+
+
+def plan_json_response(payload, cache_status, result=None):
+    """回傳規劃結果（依請求協商格式與壓縮；X-Plan-Cache: HIT / MISS）"""
+    response = format_response(app.response_class, result=result, payload=payload if result is None else None)
+    response.headers['X-Plan-Cache'] = cache_status
+    if result is not None and 'profile' in result:
+        response.headers['X-Profile-Id'] = result['profile']['profile_id']
+    return response
+
+
+def start_profiling():
+    """
+    ?profile=1 / X-Profile: 1 時開始效能分析（需 X-Admin-Token）
+
+    Returns:
+        (profiler, error_response)：未要求分析時皆為 None
+    """
+    if not profiling_requested(request):
+        return None, None
+    if not is_admin(request):
+        return None, (jsonify({'error': '效能分析僅限管理員（需 X-Admin-Token）'}), 403)
+    profiler = RequestProfiler(request.path)
+    try:
+        profiler.start()
+    except ProfilerBusy as e:
+        return None, (jsonify({'error': str(e)}), 429)
+    g.profiler = profiler
+    return profiler, None
+
+
+def attach_profile(payload, profiler, result=None):
+    """分析模式：回應附上 profile 摘要（快取中的規劃結果不含）"""
+    if profiler is None:
+        return result
+    if result is None:
+        result = loads_json(payload)
+    result['profile'] = profiler.finish()
+    return result
+
+
+def store_plan(plan_key, order_group, result):
+    """序列化規劃結果（附 plan_id）並存入快取，返回 JSON 字串"""
+    result['plan_id'] = plan_key
+    payload = dumps_json(result).decode('utf-8')
+    plan_cache.put(plan_key, order_group, payload)
+    return payload
+
+
+def plan_with_steps(payload, steps_payload, steps_mode):
+    """依 steps 參數附加演算法步驟（none 時返回 None，直接使用快取字串）"""
+    if steps_mode == 'none':
+        return None
+    result = loads_json(payload)
+    steps = loads_json(steps_payload)
+    result['algorithm_steps'] = compact_steps(steps, result['orders']) if steps_mode == 'compact' else steps
+    result['steps_format'] = steps_mode
+    return result
+
+
+@app.before_request
+def start_request_timer():
+    """記錄請求開始時間（供 /metrics 的延遲直方圖）"""
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    """依路由樣板（而非實際路徑）記錄請求延遲，避免 plan_id 等參數造成標籤爆量"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            endpoint=endpoint, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+
+@app.teardown_request
+def stop_profiling(exc):
+    """請求結束時確保分析已停止（例外中斷時釋放分析鎖）"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """就緒檢查：預熱完成前返回 503（負載平衡器暫不轉送請求）"""
+    state = Warmup.get_instance().state()
+    state['import_seconds'] = round(APP_IMPORT_SECONDS, 4)
+    return jsonify(state), 200 if state['ready'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 格式監控指標"""
+    return app.response_class(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 
 @app.route('/')
@@ -66,1023 +285,461 @@ def get_orders():
         return jsonify({'error': 'order_group 參數必填'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
         # 查詢該 order_group 的所有訂單
         query = """
             SELECT tracking_number, latitude, longitude 
             FROM ordersjb 
             WHERE order_group = %s 
             AND latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            ORDER BY tracking_number
-        """
-        
-        cursor.execute(query, (order_group,))
-        orders = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        if not orders:
-            return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
-        
-        # 轉換格式：資料庫整數除以 10^10
-        result = []
-        for order in orders:
-            try:
-                lat_raw = float(order['latitude'])
-                lon_raw = float(order['longitude'])
-                
-                # 轉換格式
-                lat = lat_raw / 10000000000.0 if abs(lat_raw) > 1000 else lat_raw
-                lon = lon_raw / 10000000000.0 if abs(lon_raw) > 1000 else lon_raw
-                
-                # 驗證有效性
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    if abs(lat) > 0.001 and abs(lon) > 0.001:
-                        result.append({
-                            'tracking_number': order['tracking_number'],
-                            'lat': lat,
-                            'lon': lon
-                        })
-            except (ValueError, TypeError):
-                continue
-        
-        return jsonify({
-            'order_group': order_group,
-            'count': len(result),
-            'orders': result
-        })
-        
-    except Exception as e:
-        return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 500
-
-
-@app.route('/api/route', methods=['POST'])
-def calculate_route():
-    """計算優化路徑"""
-    data = request.json
-    
-    # 驗證輸入
-    if not data.get('start'):
-        return jsonify({'error': '起點必填'}), 400
-    if not data.get('order_group'):
-        return jsonify({'error': 'order_group 必填'}), 400
-    
-    start = data['start']
-    order_group = data['order_group']
-    costing = data.get('costing', 'auto')
-    max_orders = data.get('max_orders', 5000)  # 用戶指定的最大訂單數
-    max_group_size = data.get('max_group_size', 30)  # 每組最多訂單數
-    cluster_radius = data.get('cluster_radius', 1.0)  # 鄰域半徑 (km)
-    min_samples = data.get('min_samples', 3)  # DBSCAN 最小樣本數
-    metric = data.get('metric', 'euclidean')  # 距離計算方式
-    random_state = data.get('random_state', 42)  # K-means 隨機種子
-    n_init = data.get('n_init', 10)  # K-means 初始化次數
-    verification = data.get('verification', 'none')  # 跨河檢測方式
-    group_penalty = data.get('group_penalty', 2.0)  # 群組間跨河懲罰
-    inner_penalty = data.get('inner_penalty', 1.5)  # 組內跨河懲罰
-    check_highways = data.get('check_highways', False)  # 是否檢測高速公路
-    group_order_method = data.get('group_order_method', 'greedy')  # 群組排序方法
-    inner_order_method = data.get('inner_order_method', 'nearest')  # 組內排序方法
-    end_point_mode = data.get('end_point_mode', 'last_order')  # 終點模式
-    end_point = data.get('end_point')  # 終點座標（手動模式）
-    
-    print(f"[DEBUG] 計算路徑請求: order_group={order_group}, costing={costing}, max_orders={max_orders}, start={start}, end_point_mode={end_point_mode}")
-    
-    try:
-        # 從資料庫取得訂單座標
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        query = """
-            SELECT tracking_number, latitude, longitude 
-            FROM ordersjb 
-            WHERE order_group = %s 
-            AND latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            ORDER BY tracking_number
-        """
-        
-        cursor.execute(query, (order_group,))
-        orders = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        if not orders:
-            return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
-        
-        print(f"[DEBUG] 找到 {len(orders)} 個訂單")
-        
-        # 驗證並過濾有效的經緯度
-        valid_orders = []
-        for order in orders:
-            try:
-                # 資料庫格式：整數需除以 10^10 轉換為正確的經緯度
-                lat_raw = float(order['latitude'])
-                lon_raw = float(order['longitude'])
-                
-                # 轉換格式：如果數值很大，除以 10^10
-                if abs(lat_raw) > 1000:
-                    lat = lat_raw / 10000000000.0
-                else:
-                    lat = lat_raw
-                    
-                if abs(lon_raw) > 1000:
-                    lon = lon_raw / 10000000000.0
-                else:
-                    lon = lon_raw
-                
-                # 驗證經緯度範圍
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    if abs(lat) > 0.001 and abs(lon) > 0.001:  # 排除 0,0
-                        valid_orders.append({
-                            'tracking_number': order['tracking_number'],
-                            'lat': lat,
-                            'lon': lon
-                        })
-                        print(f"[DEBUG] 訂單 {order['tracking_number']}: ({lat:.6f}, {lon:.6f})")
-            except (ValueError, TypeError) as e:
-                print(f"[WARN] 跳過無效座標: {order.get('tracking_number')} - {e}")
-                continue
-        
-        if not valid_orders:
-            return jsonify({'error': '沒有有效的訂單座標'}), 404
-        
-        # 限制訂單數量（用戶指定或默認 5000）
-        max_allowed = min(max_orders, 5000)  # 最多 5000 個
-        if len(valid_orders) > max_allowed:
-            print(f"[INFO] 訂單數量 {len(valid_orders)}，取前 {max_allowed} 個計算")
-            valid_orders = valid_orders[:max_allowed]
-        
-        print(f"[DEBUG] 有效訂單: {len(valid_orders)} 個")
-        
-        # 使用 DBSCAN + K-means 混合聚類
-        from sklearn.cluster import DBSCAN, KMeans
-        import numpy as np
-        import math
-        import time
-        
-        # 初始化演算法步驟記錄
-        algorithm_steps = []
-        step_counter = 0
-        
-        def calculate_distance(lat1, lon1, lat2, lon2):
-            """計算兩點之間的歐幾里得距離"""
-            return math.sqrt((lat2 - lat1)**2 + (lon2 - lon1)**2)
-        
-        # 步驟 1: DBSCAN 聚類（粗分）
-        n_orders = len(valid_orders)
-        
-        print(f"[INFO] 使用混合聚類對 {n_orders} 個訂單分組（每組最多 {max_group_size} 個，半徑 {cluster_radius} km）...")
-        
-        # 準備數據
-        coords = np.array([[o['lat'], o['lon']] for o in valid_orders])
-        
-        # 記錄步驟 0：初始狀態
-        step_counter += 1
-        algorithm_steps.append({
-            'step': step_counter,
-            'name': '初始化',
-            'description': f'載入 {n_orders} 個訂單座標',
-            'timestamp': float(time.time()),
-            'affected_by': ['order_group'],
-            'data': {
-                'orders': [{'lat': float(o['lat']), 'lon': float(o['lon']), 'tracking_number': o['tracking_number']} for o in valid_orders],
-                'total_orders': int(n_orders)
-            }
-        })
-        
-        # DBSCAN 參數（根據 metric 選擇不同的處理方式）
-        step_counter += 1
-        if metric == 'haversine':
-            # Haversine 需要弧度並使用地球半徑
-            coords_rad = np.radians(coords)
-            eps_distance = cluster_radius / 6371.0  # 地球半徑 6371 km
-            dbscan = DBSCAN(eps=eps_distance, min_samples=min_samples, metric='haversine')
-            cluster_labels = dbscan.fit_predict(coords_rad)
-            print(f"[INFO] 使用 Haversine 距離，eps={eps_distance:.6f} 弧度")
-        else:
-            # Euclidean 或 Manhattan：1 度 ≈ 111 km
-            eps_distance = cluster_radius / 111.0
-            dbscan = DBSCAN(eps=eps_distance, min_samples=min_samples, metric=metric)
-            cluster_labels = dbscan.fit_predict(coords)
-            print(f"[INFO] 使用 {metric} 距離，eps={eps_distance:.6f} 度")
-        
-        # 記錄步驟 1：DBSCAN 聚類完成
-        unique_labels = set(cluster_labels)
-        n_clusters = len(unique_labels) - (1 if -1 in unique_labels else 0)
-        n_noise = list(cluster_labels).count(-1)
-        
-        # 建立初步群組資料並計算中心點
-        dbscan_clusters = {}
-        dbscan_centers = {}
-        for idx, label in enumerate(cluster_labels):
-            label_key = str(int(label))  # 轉換為字符串
-            if label_key not in dbscan_clusters:
-                dbscan_clusters[label_key] = []
-            dbscan_clusters[label_key].append({
-                'index': int(idx),
-                'lat': float(valid_orders[idx]['lat']),
-                'lon': float(valid_orders[idx]['lon']),
-                'tracking_number': valid_orders[idx]['tracking_number']
-            })
-        
-        # 計算每個 DBSCAN 群組的中心點
-        for label_key, orders in dbscan_clusters.items():
-            center_lat = sum(o['lat'] for o in orders) / len(orders)
-            center_lon = sum(o['lon'] for o in orders) / len(orders)
-            dbscan_centers[label_key] = {
-                'lat': float(center_lat),
-                'lon': float(center_lon),
-                'count': len(orders)
-            }
-        
-        # 生成包含中心點的描述
-        cluster_centers_desc = []
-        for label_key, center in sorted(dbscan_centers.items(), key=lambda x: int(x[0]) if x[0] != '-1' else -999):
-            if label_key != '-1':  # 排除噪聲點
-                cluster_centers_desc.append(f"群組{label_key}: ({center['lat']:.5f}, {center['lon']:.5f}), {center['count']}點")
-        
-        centers_text = " | ".join(cluster_centers_desc[:3])  # 只顯示前3個群組避免太長
-        if len(cluster_centers_desc) > 3:
-            centers_text += f" | ...共{len(cluster_centers_desc)}組"
-        
-        algorithm_steps.append({
-            'step': step_counter,
-            'name': 'DBSCAN 密度聚類',
-            'description': f'找到 {n_clusters} 組，{n_noise} 噪聲點 | 中心點: {centers_text}',
-            'timestamp': float(time.time()),
-            'affected_by': ['cluster_radius', 'min_samples', 'metric'],
-            'data': {
-                'method': 'DBSCAN',
-                'parameters': {
-                    'eps': eps_distance,
-                    'min_samples': min_samples,
-                    'metric': metric,
-                    'radius_km': cluster_radius
-                },
-                'result': {
-                    'n_clusters': int(n_clusters),
-                    'n_noise': int(n_noise),
-                    'clusters': dbscan_clusters,
-                    'centers': dbscan_centers
-                },
-                'stats': {
-                    'total_groups': int(n_clusters),
-                    'noise_points': int(n_noise),
-                    'clustered_points': int(n_orders - n_noise)
-                }
-            }
-        })
-        
-        # 處理噪聲點（label = -1）：將它們分配到最近的群組
-        noise_indices = np.where(cluster_labels == -1)[0]
-        noise_reassignments = []
-        
-        if len(noise_indices) > 0:
-            print(f"[INFO] 發現 {len(noise_indices)} 個孤立點，分配到最近的群組...")
-            step_counter += 1
-            
-            for idx in noise_indices:
-                point = coords[idx]
-                # 找到最近的非噪聲點
-                valid_clusters = cluster_labels[cluster_labels != -1]
-                if len(valid_clusters) > 0:
-                    distances = [calculate_distance(point[0], point[1], coords[i][0], coords[i][1]) 
-                               for i in range(len(coords)) if cluster_labels[i] != -1]
-                    if distances:
-                        nearest_idx = [i for i in range(len(coords)) if cluster_labels[i] != -1][np.argmin(distances)]
-                        old_label = cluster_labels[idx]
-                        new_label = cluster_labels[nearest_idx]
-                        cluster_labels[idx] = new_label
-                        
-                        # 計算目標群組的中心點
-                        target_cluster_points = [(valid_orders[i]['lat'], valid_orders[i]['lon']) 
-                                               for i in range(len(cluster_labels)) if cluster_labels[i] == new_label]
-                        target_center_lat = sum(p[0] for p in target_cluster_points) / len(target_cluster_points)
-                        target_center_lon = sum(p[1] for p in target_cluster_points) / len(target_cluster_points)
-                        
-                        noise_reassignments.append({
-                            'order_index': int(idx),
-                            'tracking_number': valid_orders[idx]['tracking_number'],
-                            'lat': float(valid_orders[idx]['lat']),
-                            'lon': float(valid_orders[idx]['lon']),
-                            'old_label': int(old_label),
-                            'new_label': int(new_label),
-                            'distance_to_cluster': float(min(distances)),
-                            'target_center': {
-                                'lat': float(target_center_lat),
-                                'lon': float(target_center_lon)
-                            }
-                        })
-                else:
-                    cluster_labels[idx] = 0  # 如果沒有其他群組，創建新群組
-            
-            # 記錄步驟 2：噪聲點重新分配
-            # 生成分配目標摘要
-            reassignment_summary = {}
-            for ra in noise_reassignments:
-                target_label = ra['new_label']
-                if target_label not in reassignment_summary:
-                    reassignment_summary[target_label] = {
-                        'count': 0,
-                        'center': ra['target_center']
-                    }
-                reassignment_summary[target_label]['count'] += 1
-            
-            summary_text = " | ".join([
-                f"群組{label}: ({info['center']['lat']:.5f}, {info['center']['lon']:.5f}), {info['count']}點"
-                for label, info in list(reassignment_summary.items())[:2]
-            ])
-            if len(reassignment_summary) > 2:
-                summary_text += f" | ...共分配到{len(reassignment_summary)}個群組"
-            
-            algorithm_steps.append({
-                'step': step_counter,
-                'name': '噪聲點處理',
-                'description': f'{len(noise_indices)} 孤立點 → {summary_text}',
-                'timestamp': float(time.time()),
-                'affected_by': ['cluster_radius', 'min_samples'],
-                'data': {
-                    'noise_count': int(len(noise_indices)),
-                    'reassignments': noise_reassignments,
-                    'summary': reassignment_summary
-                }
-            })
-        
-        # 將訂單按群組分類
-        initial_clusters = {}
-        for idx, label in enumerate(cluster_labels):
-            if label not in initial_clusters:
-                initial_clusters[label] = []
-            initial_clusters[label].append(valid_orders[idx])
-        
-        print(f"[INFO] DBSCAN 完成，初步分成 {len(initial_clusters)} 組")
-        
-        # 步驟 3: 對大群組進行二次分割（用 K-means）
-        step_counter += 1
-        clusters = {}
-        cluster_id = 0
-        kmeans_operations = []
-        
-        for label, orders in initial_clusters.items():
-            if len(orders) <= max_group_size:
-                # 群組夠小，直接使用
-                clusters[cluster_id] = orders
-                print(f"  群組 {cluster_id}: {len(orders)} 個訂單（保持）")
-                
-                # 計算中心點
-                center_lat = sum(o['lat'] for o in orders) / len(orders)
-                center_lon = sum(o['lon'] for o in orders) / len(orders)
-                
-                kmeans_operations.append({
-                    'original_label': int(label),
-                    'action': 'keep',
-                    'size': int(len(orders)),
-                    'final_cluster_id': int(cluster_id),
-                    'center': {
-                        'lat': float(center_lat),
-                        'lon': float(center_lon)
-                    }
-                })
-                cluster_id += 1
-            else:
-                # 群組太大，用 K-means 細分
-                n_sub_clusters = (len(orders) + max_group_size - 1) // max_group_size  # 向上取整
-                print(f"  群組 {label} 有 {len(orders)} 個訂單，細分成 {n_sub_clusters} 個子群組...")
-                
-                # 計算原始群組中心點
-                orig_center_lat = sum(o['lat'] for o in orders) / len(orders)
-                orig_center_lon = sum(o['lon'] for o in orders) / len(orders)
-                
-                sub_coords = np.array([[o['lat'], o['lon']] for o in orders])
-                kmeans = KMeans(n_clusters=n_sub_clusters, random_state=random_state, n_init=n_init)
-                sub_labels = kmeans.fit_predict(sub_coords)
-                
-                split_info = {
-                    'original_label': int(label),
-                    'action': 'split',
-                    'original_size': int(len(orders)),
-                    'original_center': {
-                        'lat': float(orig_center_lat),
-                        'lon': float(orig_center_lon)
-                    },
-                    'n_sub_clusters': int(n_sub_clusters),
-                    'sub_clusters': []
-                }
-                
-                for sub_label in range(n_sub_clusters):
-                    sub_orders = [orders[i] for i in range(len(orders)) if sub_labels[i] == sub_label]
-                    clusters[cluster_id] = sub_orders
-                    print(f"    子群組 {cluster_id}: {len(sub_orders)} 個訂單")
-                    
-                    sub_center_lat = np.mean([o['lat'] for o in sub_orders])
-                    sub_center_lon = np.mean([o['lon'] for o in sub_orders])
-                    
-                    split_info['sub_clusters'].append({
-                        'final_cluster_id': int(cluster_id),
-                        'size': int(len(sub_orders)),
-                        'center': {
-                            'lat': float(sub_center_lat),
-                            'lon': float(sub_center_lon)
-                        }
-                    })
-                    cluster_id += 1
-                
-                kmeans_operations.append(split_info)
-        
-        print(f"[INFO] 最終分成 {len(clusters)} 組")
-        
-        # 記錄步驟 3：K-means 細分
-        # 生成細分操作摘要
-        split_ops = [op for op in kmeans_operations if op['action'] == 'split']
-        split_summary = []
-        for op in split_ops[:2]:  # 只顯示前2個
-            orig_center = op['original_center']
-            sub_centers_text = ", ".join([
-                f"({sc['center']['lat']:.5f}, {sc['center']['lon']:.5f})"
-                for sc in op['sub_clusters'][:2]
-            ])
-            if len(op['sub_clusters']) > 2:
-                sub_centers_text += f" ...共{len(op['sub_clusters'])}個"
-            split_summary.append(f"群組{op['original_label']}({orig_center['lat']:.5f}, {orig_center['lon']:.5f}) → {sub_centers_text}")
-        
-        summary_desc = " | ".join(split_summary)
-        if len(split_ops) > 2:
-            summary_desc += f" | ...共細分{len(split_ops)}組"
-        elif len(split_ops) == 0:
-            summary_desc = f"所有群組都在 {max_group_size} 個訂單內，無需細分"
-        
-        algorithm_steps.append({
-            'step': step_counter,
-            'name': 'K-means 細分大群組',
-            'description': summary_desc,
-            'timestamp': float(time.time()),
-            'affected_by': ['max_group_size', 'random_state', 'n_init'],
-            'data': {
-                'max_group_size': int(max_group_size),
-                'operations': kmeans_operations,
-                'final_clusters': {
-                    str(int(cid)): [{'lat': float(o['lat']), 'lon': float(o['lon']), 'tracking_number': o['tracking_number']} for o in orders]
-                    for cid, orders in clusters.items()
-                },
-                'stats': {
-                    'initial_groups': int(len(initial_clusters)),
-                    'final_groups': int(len(clusters)),
-                    'kept_groups': int(len([op for op in kmeans_operations if op['action'] == 'keep'])),
-                    'split_groups': int(len([op for op in kmeans_operations if op['action'] == 'split']))
-                }
-            }
-        })
-        
-        # 計算每個群組的中心點
-        cluster_centers = {}
-        for label, orders in clusters.items():
-            avg_lat = sum(o['lat'] for o in orders) / len(orders)
-            avg_lon = sum(o['lon'] for o in orders) / len(orders)
-            cluster_centers[label] = (avg_lat, avg_lon)
-        
-        # 步驟 3: 確定群組訪問順序（根據用戶選擇的方法）
-        cluster_order = []
-        start_pos = (start['lat'], start['lon'])
-        print(f"[INFO] 起點座標: ({start_pos[0]:.6f}, {start_pos[1]:.6f})")
-        print(f"[INFO] 群組中心點:")
-        for label, center in cluster_centers.items():
-            dist = calculate_distance(start_pos[0], start_pos[1], center[0], center[1])
-            print(f"  Cluster {label}: ({center[0]:.6f}, {center[1]:.6f}), 距起點: {dist:.4f}°")
-        
-        # 初始化河流檢測器（如果需要在群組排序時考慮跨河）
-        river_detector_for_groups = None
-        use_api_for_groups = False
-        
-        if verification == 'geometry':
-            river_detector_for_groups = RiverDetector.get_instance()
-            print(f"[INFO] 群組排序將考慮跨河（幾何檢測），懲罰係數: {group_penalty}")
-        elif verification == 'api':
-            use_api_for_groups = True
-            river_detector_for_groups = RiverDetector.get_instance()  # API 模式下組內仍用幾何
-            print(f"[INFO] 群組排序將考慮跨河（API 檢測），懲罰係數: {group_penalty}")
-        
-        print(f"[INFO] 使用 {group_order_method} 方法計算群組訪問順序...")
-        
-        # === 方法 1: Sweep Algorithm（智能方向掃描）===
-        if group_order_method == 'sweep':
-            print(f"[INFO] Sweep Algorithm: 智能選擇掃描方向...")
-            import math
-            
-            # 步驟 1: 計算每個群組相對起點的極角和距離
-            cluster_angles = {}
-            cluster_distances = {}
-            for label, center in cluster_centers.items():
-                dx = center[1] - start_pos[1]  # 經度差
-                dy = center[0] - start_pos[0]  # 緯度差
-                angle = math.atan2(dy, dx)  # 極角（-π 到 π）
-                dist = calculate_distance(start_pos[0], start_pos[1], center[0], center[1])
-                cluster_angles[label] = angle
-                cluster_distances[label] = dist
-            
-            # 步驟 2: 找到距離起點最近的群組
-            nearest_cluster = min(clusters.keys(), key=lambda x: cluster_distances[x])
-            nearest_center = cluster_centers[nearest_cluster]
-            start_angle = cluster_angles[nearest_cluster]
-            
-            print(f"[INFO] 最近群組: {nearest_cluster} (距離: {cluster_distances[nearest_cluster]:.2f} km, 極角: {math.degrees(start_angle):.1f}°)")
-            
-            # 步驟 3: 判斷其他群組在基準線（起點→最近群組）的左側/右側
-            # 使用叉積判斷：cross = (B-A) × (C-A)
-            # cross > 0: C在AB左側；cross < 0: C在AB右側
-            left_orders = 0
-            right_orders = 0
-            
-            for label, center in cluster_centers.items():
-                if label == nearest_cluster:
-                    continue
-                
-                # 向量: 起點 → 最近群組
-                vec_base_x = nearest_center[1] - start_pos[1]
-                vec_base_y = nearest_center[0] - start_pos[0]
-                
-                # 向量: 起點 → 當前群組
-                vec_current_x = center[1] - start_pos[1]
-                vec_current_y = center[0] - start_pos[0]
-                
-                # 叉積
-                cross_product = vec_base_x * vec_current_y - vec_base_y * vec_current_x
-                
-                # 統計兩側訂單數
-                order_count = len(clusters[label])
-                if cross_product > 0:
-                    left_orders += order_count
-                else:
-                    right_orders += order_count
-            
-            # 步驟 4: 決定掃描方向
-            # 右側訂單多 → 順時針（先處理右側）
-            # 左側訂單多 → 逆時針（先處理左側）
-            clockwise = (right_orders >= left_orders)
-            direction_text = "順時針" if clockwise else "逆時針"
-            
-            print(f"[INFO] 訂單分布: 左側 {left_orders} 個, 右側 {right_orders} 個")
-            print(f"[INFO] 選擇掃描方向: {direction_text} ({direction_text}先處理較多訂單側)")
-            
-            # 步驟 5: 將所有極角調整為相對於最近群組的角度
-            adjusted_angles = {}
-            for label in clusters.keys():
-                angle_diff = cluster_angles[label] - start_angle
-                # 標準化到 [0, 2π) 範圍
-                if angle_diff < 0:
-                    angle_diff += 2 * math.pi
-                adjusted_angles[label] = angle_diff
-            
-            # 步驟 6: 按調整後的極角排序
-            if clockwise:
-                # 順時針: 極角從小到大
-                cluster_order = sorted(clusters.keys(), key=lambda x: adjusted_angles[x])
-            else:
-                # 逆時針: 極角從大到小
-                cluster_order = sorted(clusters.keys(), key=lambda x: -adjusted_angles[x])
-            
-            print(f"[INFO] Sweep 完成，從最近群組 {nearest_cluster} 開始{direction_text}掃描")
-            print(f"[INFO] 群組順序: {cluster_order}")
-        
-        # === 方法 2: Greedy + 2-opt 優化 ===
-        elif group_order_method == '2opt':
-            # 先用貪心算法生成初始順序
-            print(f"[INFO] 步驟 1/2: 貪心算法生成初始順序...")
-            visited_clusters = set()
-            cluster_order = []
-            current_pos = start_pos
-            
-            while len(visited_clusters) < len(clusters):
-                best_cluster = None
-                best_cost = float('inf')
-                
-                for label in clusters.keys():
-                    if label in visited_clusters:
-                        continue
-                    
-                    cluster_center = cluster_centers[label]
-                    straight_dist = calculate_distance(
-                        current_pos[0], current_pos[1],
-                        cluster_center[0], cluster_center[1]
-                    )
-                    
-                    cost = straight_dist
-                    
-                    # 考慮跨河懲罰
-                    if use_api_for_groups:
-                        crosses = river_detector_for_groups.check_crossing_api(
-                            current_pos[0], current_pos[1],
-                            cluster_center[0], cluster_center[1]
-                        )
-                        if crosses:
-                            cost *= group_penalty
-                    elif river_detector_for_groups:
-                        result = river_detector_for_groups.check_obstacle_crossing(
-                            current_pos[0], current_pos[1],
-                            cluster_center[0], cluster_center[1],
-                            check_rivers=True,
-                            check_highways=check_highways
-                        )
-                        if result['crosses_any']:
-                            cost *= group_penalty
-                    
-                    if cost < best_cost:
-                        best_cost = cost
-                        best_cluster = label
-                
-                if best_cluster is not None:
-                    cluster_order.append(best_cluster)
-                    visited_clusters.add(best_cluster)
-                    current_pos = cluster_centers[best_cluster]
-            
-            print(f"[INFO] 初始順序: {cluster_order}")
-            
-            # 2-opt 優化
-            print(f"[INFO] 步驟 2/2: 2-opt 優化...")
-            
-            def calculate_route_cost(order, include_return=False):
-                """計算路線總成本"""
-                total = 0
-                pos = start_pos
-                for label in order:
-                    center = cluster_centers[label]
-                    total += calculate_distance(pos[0], pos[1], center[0], center[1])
-                    pos = center
-                # 是否考慮回到起點
-                if include_return:
-                    total += calculate_distance(pos[0], pos[1], start_pos[0], start_pos[1])
-                return total
-            
-            improved = True
-            iteration = 0
-            max_iterations = 100
-            
-            while improved and iteration < max_iterations:
-                improved = False
-                iteration += 1
-                
-                for i in range(len(cluster_order) - 1):
-                    for j in range(i + 2, len(cluster_order)):
-                        # 嘗試反轉 [i+1, j] 區間
-                        new_order = cluster_order[:i+1] + cluster_order[i+1:j+1][::-1] + cluster_order[j+1:]
-                        
-                        old_cost = calculate_route_cost(cluster_order)
-                        new_cost = calculate_route_cost(new_order)
-                        
-                        if new_cost < old_cost:
-                            cluster_order = new_order
-                            improved = True
-                            print(f"  [2-opt] Iteration {iteration}: 改善 {old_cost:.2f} → {new_cost:.2f}")
-                            break
-                    
-                    if improved:
-                        break
-            
-            print(f"[INFO] 2-opt 完成（{iteration} 次迭代），優化後順序: {cluster_order}")
-        
-        # === 方法 3: 貪心算法（默認）===
-        else:
-            print(f"[INFO] 使用貪心最近鄰算法...")
-            visited_clusters = set()
-            cluster_order = []
-            current_pos = start_pos
-            
-            while len(visited_clusters) < len(clusters):
-                best_cluster = None
-                best_cost = float('inf')
-                
-                for label in clusters.keys():
-                    if label in visited_clusters:
-                        continue
-                    
-                    cluster_center = cluster_centers[label]
-                    straight_dist = calculate_distance(
-                        current_pos[0], current_pos[1],
-                        cluster_center[0], cluster_center[1]
-                    )
-                    
-                    cost = straight_dist
-                    
-                    # 考慮跨河懲罰
-                    if use_api_for_groups:
-                        crosses = river_detector_for_groups.check_crossing_api(
-                            current_pos[0], current_pos[1],
-                            cluster_center[0], cluster_center[1]
-                        )
-                        if crosses:
-                            cost *= group_penalty
-                    elif river_detector_for_groups:
-                        result = river_detector_for_groups.check_obstacle_crossing(
-                            current_pos[0], current_pos[1],
-                            cluster_center[0], cluster_center[1],
-                            check_rivers=True,
-                            check_highways=check_highways
-                        )
-                        if result['crosses_any']:
-                            cost *= group_penalty
-                    
-                    if cost < best_cost:
-                        best_cost = cost
-                        best_cluster = label
-                
-                if best_cluster is not None:
-                    cluster_order.append(best_cluster)
-                    visited_clusters.add(best_cluster)
-                    current_pos = cluster_centers[best_cluster]
-                    print(f"[INFO] 群組 {len(cluster_order)}: 選擇 cluster {best_cluster}, 成本: {best_cost:.4f}")
-        
-        # 步驟 4: 為每個群組生成訂單順序
-        group_names = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J',
-                       'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T',
-                       'U', 'V', 'W', 'X', 'Y', 'Z']
-        optimized_orders = []
-        current_pos = start_pos
-
-        print(f"[INFO] 最終群組訪問順序（將決定 A, B, C... 的分配）:")
-        for idx, label in enumerate(cluster_order):
-            group_name = group_names[idx] if idx < len(group_names) else f"Z{idx-25}"
-            print(f"  {group_name} = Cluster {label} ({len(clusters[label])} 個訂單)")
-        
-        # 初始化河流檢測器（如果需要）
-        # 注意：API 模式下，組內仍使用幾何檢測（避免太多 API 調用）
-        river_detector = None
-        if verification in ['geometry', 'api']:
-            river_detector = RiverDetector.get_instance()
-            print(f"[INFO] 啟用組內跨河優化（幾何檢測），懲罰係數: {inner_penalty}")
-        
-        print(f"[INFO] 開始生成訂單順序...")
-        
-        for group_idx, cluster_label in enumerate(cluster_order):
-            group_name = group_names[group_idx] if group_idx < len(group_names) else f"Z{group_idx-25}"
-            group_orders = clusters[cluster_label].copy()
-            
-            print(f"[INFO] 處理群組 {group_name} ({len(group_orders)} 個訂單)，使用 {inner_order_method} 方法")
-            
-            # 根據 inner_order_method 選擇排序方式
-            if inner_order_method == 'nearest':
-                # 方法 1: 最近鄰算法（考慮跨河懲罰）- 原有方法
-                remaining = group_orders.copy()
-                group_sequence = []
-                
-                while remaining:
-                    # 找最近的訂單（考慮障礙懲罰：河流 + 高速公路）
-                    def calculate_cost(o):
-                        dist = calculate_distance(current_pos[0], current_pos[1], o['lat'], o['lon'])
-                        
-                        # 如果啟用了障礙檢測，檢查是否穿越並增加懲罰
-                        if river_detector:
-                            result = river_detector.check_obstacle_crossing(
-                                current_pos[0], current_pos[1], o['lat'], o['lon'],
-                                check_rivers=True,
-                                check_highways=check_highways
-                            )
-                            if result['crosses_any']:
-                                dist *= inner_penalty
-                        
-                        return dist
-                    
-                    nearest = min(remaining, key=calculate_cost)
-                    
-                    group_sequence.append(nearest)
-                    current_pos = (nearest['lat'], nearest['lon'])
-                    remaining.remove(nearest)
-            
-            elif inner_order_method in ['ortools', '2opt-inner', 'lkh']:
-                # 方法 2/3/4: 使用 TSP 求解器（考慮障礙物懲罰）
-                # 準備座標（加上當前位置作為起點）
-                coords_with_start = [current_pos] + [(o['lat'], o['lon']) for o in group_orders]
-                
-                # 定義考慮障礙物的距離函數
-                def obstacle_aware_distance(i, j, coords):
-                    """計算兩點間距離，考慮障礙物懲罰"""
-                    lat1, lon1 = coords[i]
-                    lat2, lon2 = coords[j]
-                    
-                    # 基礎直線距離
-                    dist = calculate_distance(lat1, lon1, lat2, lon2)
-                    
-                    # 如果啟用障礙檢測，檢查並應用懲罰
-                    if river_detector:
-                        result = river_detector.check_obstacle_crossing(
-                            lat1, lon1, lat2, lon2,
-                            check_rivers=True,
-                            check_highways=check_highways
-                        )
-                        if result['crosses_any']:
-                            dist *= inner_penalty  # 應用懲罰係數
-                    
-                    return dist
-                
-                try:
-                    # 求解 TSP（起點索引 = 0），使用障礙物感知的距離函數
-                    route_indices = solve_tsp(
-                        coords_with_start, 
-                        method=inner_order_method, 
-                        start_index=0,
-                        distance_func=obstacle_aware_distance if river_detector else None
-                    )
-                    
-                    # 移除起點索引，調整為訂單索引
-                    route_indices = [i - 1 for i in route_indices if i > 0]
-                    
-                    # 按 TSP 順序排列
-                    group_sequence = [group_orders[i] for i in route_indices]
-                    
-                    # 更新當前位置為最後一個訂單
-                    if group_sequence:
-                        current_pos = (group_sequence[-1]['lat'], group_sequence[-1]['lon'])
-                
-                except Exception as e:
-                    print(f"[ERROR] TSP 求解失敗: {e}，回退到 nearest neighbor")
-                    # 回退到最近鄰
-                    remaining = group_orders.copy()
-                    group_sequence = []
-                    
-                    while remaining:
-                        def calculate_cost(o):
-                            dist = calculate_distance(current_pos[0], current_pos[1], o['lat'], o['lon'])
-                            if river_detector:
-                                result = river_detector.check_obstacle_crossing(
-                                    current_pos[0], current_pos[1], o['lat'], o['lon'],
-                                    check_rivers=True,
-                                    check_highways=check_highways
-                                )
-                                if result['crosses_any']:
-                                    dist *= inner_penalty
-                            return dist
-                        
-                        nearest = min(remaining, key=calculate_cost)
-                        group_sequence.append(nearest)
-                        current_pos = (nearest['lat'], nearest['lon'])
-                        remaining.remove(nearest)
-            
-            else:
-                print(f"[WARN] 未知的組內排序方法: {inner_order_method}，使用 nearest neighbor")
-                # 默認：最近鄰
-                remaining = group_orders.copy()
-                group_sequence = []
-                
-                while remaining:
-                    def calculate_cost(o):
-                        dist = calculate_distance(current_pos[0], current_pos[1], o['lat'], o['lon'])
-                        if river_detector:
-                            result = river_detector.check_obstacle_crossing(
-                                current_pos[0], current_pos[1], o['lat'], o['lon'],
-                                check_rivers=True,
-                                check_highways=check_highways
-                            )
-                            if result['crosses_any']:
-                                dist *= inner_penalty
-                        return dist
-                    
-                    nearest = min(remaining, key=calculate_cost)
-                    group_sequence.append(nearest)
-                    current_pos = (nearest['lat'], nearest['lon'])
-                    remaining.remove(nearest)
-            
-            # 添加到結果，格式：A-01, A-02...
-            for seq_num, order in enumerate(group_sequence, 1):
-                optimized_orders.append({
-                    'sequence': len(optimized_orders) + 1,
-                    'group': group_name,
-                    'group_sequence': f"{group_name}-{seq_num:02d}",
-                    'tracking_number': order['tracking_number'],
-                    'lat': order['lat'],
-                    'lon': order['lon']
-                })
-        
-        # 記錄步驟：群組排序完成
-        step_counter += 1
-        group_order_info = []
-        for idx, label in enumerate(cluster_order):
-            group_name = group_names[idx] if idx < len(group_names) else f"Z{idx-25}"
-            center = cluster_centers[label]
-            group_order_info.append({
-                'group': group_name,
-                'cluster_id': int(label),
-                'size': int(len(clusters[label])),
-                'center': {
-                    'lat': float(center[0]),
-                    'lon': float(center[1])
-                }
-            })
-        
-        # 生成群組順序描述
-        group_desc = " → ".join([f"{g['group']}({g['size']})" for g in group_order_info[:5]])
-        if len(group_order_info) > 5:
-            group_desc += f" → ...共{len(group_order_info)}組"
-        
-        algorithm_steps.append({
-            'step': step_counter,
-            'name': '群組排序',
-            'description': f'使用 {group_order_method} 方法排序 {len(cluster_order)} 個群組 | {group_desc}',
-            'timestamp': float(time.time()),
-            'affected_by': ['group_order_method', 'verification', 'group_penalty', 'check_highways'],
-            'data': {
-                'method': group_order_method,
-                'total_groups': int(len(cluster_order)),
-                'group_order': group_order_info,
-                'cluster_centers': {str(int(label)): {'lat': float(center[0]), 'lon': float(center[1])} 
-                                   for label, center in cluster_centers.items()}
-            }
-        })
-        
-        print(f"[INFO] 路線計算完成，共 {len(optimized_orders)} 個訂單，分成 {len(cluster_order)} 組")
-        
-        # 記錄最終步驟：完成所有排序
-        step_counter += 1
-        algorithm_steps.append({
-            'step': step_counter,
-            'name': '完成訂單排序',
-            'description': f'所有 {len(optimized_orders)} 個訂單已排序完成',
-            'timestamp': float(time.time()),
-            'affected_by': ['inner_order_method', 'verification', 'inner_penalty', 'check_highways'],
-            'data': {
-                'total_orders': int(len(optimized_orders)),
-                'total_groups': int(len(cluster_order)),
-                'final_sequence': optimized_orders,  # 已經是純 Python dict，不需轉換
-                'group_order': [{'group': group_names[idx] if idx < len(group_names) else f"Z{idx-25}", 
-                                'cluster_id': int(label), 
-                                'size': int(len(clusters[label]))} 
-                               for idx, label in enumerate(cluster_order)]
-            }
-        })
-        
-        # 步驟 4.5: 處理終點設置
-        print(f"[DEBUG] 終點模式: {end_point_mode}, 終點座標: {end_point}")
-        
-        if end_point_mode == 'manual' and end_point:
-            # 手動終點：在路徑末端加入終點標記
-            print(f"[INFO] 加入手動終點: ({end_point['lat']}, {end_point['lon']})")
-            optimized_orders.append({
-                'sequence': len(optimized_orders) + 1,
-                'group': 'End',
-                'group_sequence': 'END',
-                'tracking_number': 'ENDPOINT',
-                'lat': end_point['lat'],
-                'lon': end_point['lon']
-            })
-        elif end_point_mode == 'farthest':
-            # 使用最遠訂單：重新排序確保最遠的在最後
-            print(f"[INFO] 調整順序確保最遠訂單在最後...")
-            
-            # 計算每個訂單距離起點的距離
-            import math
-            def distance_from_start(order):
-                return math.sqrt(
-                    (order['lat'] - start['lat'])**2 + 
-                    (order['lon'] - start['lon'])**2
-                )
-            
-            # 找出最遠訂單
-            farthest_order = max(optimized_orders, key=distance_from_start)
-            farthest_idx = optimized_orders.index(farthest_order)
-            
-            print(f"[INFO] 最遠訂單: {farthest_order['tracking_number']} (距離起點 {distance_from_start(farthest_order):.4f})")
-            
-            # 如果最遠訂單不在最後，移到最後
-            if farthest_idx != len(optimized_orders) - 1:
-                optimized_orders.remove(farthest_order)
-                optimized_orders.append(farthest_order)
+            AND longitude IS NOT NULL
+            ORDER BY tracking_number
+        """
+        
+        with DB_LATENCY.time(query='orders'):
+            conn = get_db_connection()
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute(query, (order_group,))
+            orders = cursor.fetchall()
+            cursor.close()
+            conn.close()
+        
+        if not orders:
+            return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
+        
+        # 轉換格式：資料庫整數除以 10^10
+        result = []
+        for order in orders:
+            try:
+                lat_raw = float(order['latitude'])
+                lon_raw = float(order['longitude'])
                 
-                # 重新編號
-                for i, order in enumerate(optimized_orders, 1):
-                    order['sequence'] = i
+                # 轉換格式
+                lat = lat_raw / 10000000000.0 if abs(lat_raw) > 1000 else lat_raw
+                lon = lon_raw / 10000000000.0 if abs(lon_raw) > 1000 else lon_raw
                 
-                print(f"[INFO] 已將最遠訂單移至最後")
-        
-        # 步驟 5: 障礙檢測（如果啟用）
-        crossings = []
-        if verification != 'none':
-            obstacle_type = "障礙（河流 + 高速公路）" if check_highways else "河流"
-            print(f"[INFO] 開始{obstacle_type}檢測（方法: {verification}）...")
-            crossings = verify_route_crossings(optimized_orders, verification, check_highways)
-            print(f"[INFO] 檢測完成，發現 {len(crossings)} 處穿越{obstacle_type}")
+                # 驗證有效性
+                if -90 <= lat <= 90 and -180 <= lon <= 180:
+                    if abs(lat) > 0.001 and abs(lon) > 0.001:
+                        result.append({
+                            'tracking_number': order['tracking_number'],
+                            'lat': lat,
+                            'lon': lon
+                        })
+            except (ValueError, TypeError):
+                continue
         
-        return jsonify({
-            'success': True,
-            'orders': optimized_orders,
-            'shape': '',
-            'total_orders': len(optimized_orders),
-            'total_groups': len(cluster_order),
-            'crossings': crossings,
-            'verification_method': verification,
-            'algorithm_steps': algorithm_steps  # 新增：演算法步驟記錄
+        return format_response(app.response_class, {
+            'order_group': order_group,
+            'count': len(result),
+            'orders': result
         })
         
+    except Exception as e:
+        return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 500
+
+
+def parse_route_request(data):
+    """
+    驗證 /api/route 請求
+
+    Returns:
+        (params, steps_mode, error_response)：驗證失敗時 error_response 不為 None
+    """
+    if not data or not data.get('start'):
+        return None, None, (jsonify({'error': '起點必填'}), 400)
+    if not data.get('order_group'):
+        return None, None, (jsonify({'error': 'order_group 必填'}), 400)
+    
+    params = route_params(data)
+    # 演算法步驟（選用）：none = 不附帶 | compact = 以訂單索引表示 | full = 完整內容
+    steps_mode = data.get('steps', 'none')
+    if steps_mode not in ('none', 'compact', 'full'):
+        return None, None, (jsonify({'error': f'未知的 steps 格式: {steps_mode}'}), 400)
+    return params, steps_mode, None
+
+
+def compute_route_plan(valid_orders, params, steps_mode='none', on_stage=None, stage_cache=None, use_cache=True,
+                       on_group=None):
+    """
+    /api/route 規劃核心（同步請求、背景工作、串流共用）
+
+    Returns:
+        (payload, steps_payload, cache_status)：規劃結果與步驟的 JSON 字串，HIT / MISS
+    """
+    order_group = params['order_group']
+    plan_key, obstacle_version = route_plan_key(valid_orders, params)
+    steps_key = PlanCache.steps_key(plan_key)
+    
+    if use_cache:
+        payload = plan_cache.get(plan_key, order_group)
+        steps_payload = plan_cache.get(steps_key, order_group) if payload is not None and steps_mode != 'none' else None
+        if payload is not None and (steps_mode == 'none' or steps_payload is not None):
+            logger.info(f"規劃結果快取命中: {plan_key}")
+            return payload, steps_payload, 'HIT'
+    
+    # 分階段規劃：未變動參數對應的階段直接重用
+    result = run_route_pipeline(valid_orders, params, obstacle_version, on_stage=on_stage, stage_cache=stage_cache,
+                                on_group=on_group)
+    
+    payload, steps_payload = store_route_result(plan_key, order_group, result)
+    return payload, steps_payload, 'MISS'
+
+
+def route_plan_key(valid_orders, params):
+    """/api/route 的規劃快取鍵（訂單快照 + 參數 + 障礙數據版本），返回 (plan_key, obstacle_version)"""
+    uses_obstacles = params['verification'] != 'none' or params.get('cluster_obstacles')
+    obstacle_version = RiverDetector.get_instance().data_version if uses_obstacles else None
+    if params['verification'] != 'none' and params.get('crossing_cost') == 'detour':
+        # 穿越點數據（橋樑 / 交流道）更新時，排序階段與規劃結果同樣失效
+        obstacle_version = f"{obstacle_version}-c{CrossingPointIndex.get_instance().data_version}"
+    plan_key = PlanCache.make_key(
+        'route', params['order_group'], order_snapshot_version(valid_orders), params, obstacle_version
+    )
+    return plan_key, obstacle_version
+
+
+def store_route_result(plan_key, order_group, result):
+    """存入 run_route_pipeline 的結果，返回 (payload, steps_payload)"""
+    result['order_group'] = order_group  # 寫回時確認規劃屬於該 order_group
+    # 步驟另外存放，可透過 /api/route/<plan_id>/steps 取得
+    steps_payload = dumps_json(result.pop('algorithm_steps')).decode('utf-8')
+    plan_cache.put(PlanCache.steps_key(plan_key), order_group, steps_payload)
+    return store_plan(plan_key, order_group, result), steps_payload
+
+
+@app.route('/api/route', methods=['POST'])
+def calculate_route():
+    """計算優化路徑"""
+    params, steps_mode, invalid = parse_route_request(request.json)
+    if invalid:
+        return invalid
+    order_group = params['order_group']
+    
+    logger.debug(f"計算路徑請求: order_group={order_group}, costing={params['costing']}, max_orders={params['max_orders']}, start={params['start']}, end_point_mode={params['end_point_mode']}")
+    
+    profiler, denied = start_profiling()
+    if denied:
+        return denied
+    
+    try:
+        valid_orders = fetch_valid_orders(order_group)
+        if profiler:
+            profiler.mark('fetch_orders')
+        if valid_orders is None:
+            return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
+        if not valid_orders:
+            return jsonify({'error': '沒有有效的訂單座標'}), 404
+        
+        # 分析模式：略過規劃快取並使用空的階段快取，所有階段都重算
+        payload, steps_payload, cache_status = compute_route_plan(
+            valid_orders, params, steps_mode,
+            on_stage=profiler.mark if profiler else None,
+            stage_cache=StageCache() if profiler else None,
+            use_cache=profiler is None
+        )
+        return plan_json_response(
+            payload, cache_status, attach_profile(payload, profiler, plan_with_steps(payload, steps_payload, steps_mode))
+        )
         
     except Exception as e:
-        print(f"[ERROR] 計算路徑錯誤: {str(e)}")
+        logger.error(f"計算路徑錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'計算路徑錯誤: {str(e)}'}), 500
 
 
+@app.route('/api/route/<plan_id>/steps', methods=['GET'])
+def get_route_steps(plan_id):
+    """取得已計算路徑的演算法步驟（steps=full | compact）"""
+    steps_format = request.args.get('steps', 'full')
+    if steps_format not in ('compact', 'full'):
+        return jsonify({'error': f'未知的 steps 格式: {steps_format}'}), 400
+    if not PlanCache.is_plan_id(plan_id):
+        return jsonify({'error': '無效的 plan_id'}), 400
+
+    payload = plan_cache.get(plan_id)
+    steps_payload = plan_cache.get(PlanCache.steps_key(plan_id))
+    if payload is None or steps_payload is None:
+        return jsonify({'error': '找不到規劃步驟（可能已過期，請重新計算路徑）'}), 404
+
+    steps = loads_json(steps_payload)
+    if steps_format == 'compact':
+        steps = compact_steps(steps, loads_json(payload)['orders'])
+
+    return format_response(app.response_class, {
+        'success': True,
+        'plan_id': plan_id,
+        'steps_format': steps_format,
+        'algorithm_steps': steps
+    })
+
+
+@app.route('/api/route/<plan_id>/write-back', methods=['POST'])
+def write_back_route(plan_id):
+    """
+    將已計算路徑的 delivery_sequence 與群組標籤寫回 ordersjb（單一交易）
+
+    {"order_group": "Group...", "clear_missing": false}；會修改正式資料，需 X-Admin-Token
+
+    只接受同一 order_group 的 /api/route 規劃，且需涵蓋目前所有有效訂單（max_orders 截斷的規劃返回 409）
+    """
+    if not is_admin(request):
+        return jsonify({'error': '寫回規劃結果僅限管理員（需 X-Admin-Token）'}), 403
+    data = request.json or {}
+    order_group = data.get('order_group')
+    if not order_group:
+        return jsonify({'error': 'order_group 必填'}), 400
+    if not PlanCache.is_plan_id(plan_id):
+        return jsonify({'error': '無效的 plan_id'}), 400
+
+    payload = plan_cache.get(plan_id, order_group)
+    if payload is None:
+        return jsonify({'error': '找不到規劃結果（可能已過期，請重新計算路徑）'}), 404
+    plan = loads_json(payload)
+    if plan.get('order_group') != order_group:
+        # 全局 / 智能規劃的群組標籤（Global 等）不是 delivery_group，也可能只涵蓋部分訂單
+        return jsonify({'error': f'此規劃不是 order_group {order_group} 的 /api/route 結果，請重新規劃'}), 409
+    rows = plan_rows(plan['orders'])
+
+    try:
+        with DB_LATENCY.time(query='write_back'):
+            conn = get_write_connection()
+            try:
+                valid_orders = fetch_valid_orders(order_group) or []
+                uncovered = {o['tracking_number'] for o in valid_orders} - {row[0] for row in rows}
+                if uncovered:
+                    raise WriteBackError(f'規劃只涵蓋 {len(rows)} / {len(valid_orders)} 筆有效訂單'
+                                         f'（max_orders 截斷或訂單已新增），請以完整訂單重新規劃', 409)
+                summary = write_back(conn, order_group, rows, clear_missing=bool(data.get('clear_missing', False)))
+            finally:
+                conn.close()
+    except WriteBackError as e:
+        return jsonify({'error': str(e)}), e.status
+    except PermissionError as e:
+        return jsonify({'error': f'資料庫未開放寫入: {e}'}), 503
+    except Exception as e:
+        logger.error(f"寫回 order_group={order_group} 失敗: {e}")
+        return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 500
+
+    return jsonify(dict(summary, success=True, order_group=order_group, plan_id=plan_id))
+
+
+@app.route('/api/route/jobs', methods=['POST'])
+def submit_route_job():
+    """
+    提交背景規劃工作（參數同 /api/route），立即返回 202 與 job_id
+
+    以 GET /api/route/jobs/<job_id> 輪詢進度；佇列已滿時返回 429 + Retry-After
+    """
+    params, _, invalid = parse_route_request(request.json)
+    if invalid:
+        return invalid
+    order_group = params['order_group']
+
+    def run(job):
+        valid_orders = fetch_valid_orders(order_group)
+        if valid_orders is None:
+            raise PlanJobError(f'找不到 order_group: {order_group} 的訂單')
+        if not valid_orders:
+            raise PlanJobError('沒有有效的訂單座標')
+        job.update('fetch_orders', preview={'total_orders': len(valid_orders)})
+        payload, _, cache_status = compute_route_plan(valid_orders, params, on_stage=job.update)
+        return payload, cache_status
+
+    try:
+        job = plan_jobs.submit(run, kind='route', stages=['fetch_orders'] + STAGE_ORDER,
+                               meta={'order_group': order_group})
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    logger.info(f"已提交規劃工作 {job.job_id}: order_group={order_group}")
+    response = jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status,
+        'status_url': f'/api/route/jobs/{job.job_id}'
+    })
+    response.headers['Location'] = f'/api/route/jobs/{job.job_id}'
+    return response, 202
+
+
+@app.route('/api/route/jobs/<job_id>', methods=['GET'])
+def get_route_job(job_id):
+    """
+    背景規劃工作狀態：queued | running | done | failed
+
+    running 時附 progress 與各階段的部分結果（partial）；done 時附完整規劃結果（result）
+    """
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'找不到規劃工作: {job_id}（可能已過期）'}), 404
+
+    state = job.to_dict(queue_position=plan_jobs.queue_position(job))
+    if job.status == 'done':
+        state['result'] = loads_json(job.payload)
+    return format_response(app.response_class, state)
+
+
+@app.route('/api/route/stream', methods=['POST'])
+def stream_route():
+    """
+    串流版 /api/route（SSE 或 NDJSON，事件定義見 plan_stream.py）
+
+    先送出群組分配，再逐一送出各群組排序結果，最後是障礙檢測與完整規劃；
+    規劃在背景工作中執行（與 /api/route/jobs 共用佇列，佇列已滿時返回 429）
+    """
+    params, _, invalid = parse_route_request(request.json)
+    if invalid:
+        return invalid
+    order_group = params['order_group']
+    stream = RouteStream(negotiate_stream_format(), params['verification'])
+
+    def run(job):
+        try:
+            valid_orders = fetch_valid_orders(order_group)
+            if valid_orders is None:
+                raise PlanJobError(f'找不到 order_group: {order_group} 的訂單')
+            if not valid_orders:
+                raise PlanJobError('沒有有效的訂單座標')
+            stream.emit('start', {'job_id': job.job_id, 'order_group': order_group, 'total_orders': len(valid_orders)})
+            job.update('fetch_orders', preview={'total_orders': len(valid_orders)})
+
+            def on_stage(stage, info):
+                job.update(stage, info)
+                stream.on_stage(stage, info)
+
+            payload, _, cache_status = compute_route_plan(valid_orders, params, on_stage=on_stage,
+                                                          on_group=stream.on_group)
+            stream.finish(dict(loads_json(payload), cache_status=cache_status))
+            return payload, cache_status
+        except PlanJobError as e:
+            stream.emit('error', {'error': str(e)})
+            raise
+        except Exception as e:
+            stream.emit('error', {'error': f'計算路徑錯誤: {str(e)}'})
+            raise
+        finally:
+            stream.close()
+
+    try:
+        job = plan_jobs.submit(run, kind='route-stream', stages=['fetch_orders'] + STAGE_ORDER,
+                               meta={'order_group': order_group})
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    response = stream_response(app.response_class, stream.events(), stream.fmt)
+    response.headers['X-Job-Id'] = job.job_id
+    return response
+
+
+def plan_batch(order_groups, orders_by_group, params, planner=None):
+    """
+    批次規劃：快取命中直接返回，其餘送入進程池；依完成順序逐一產生各 order_group 的結果
+
+    Args:
+        planner: 規劃進程池（預設 BatchPlanner 單例；預先規劃使用自己的進程池）
+
+    Yields:
+        {'order_group', 'status': done | failed, 'cache_status', 'elapsed', 'result' | 'error'}
+    """
+    planner = planner or BatchPlanner.get_instance()
+    pending = {}
+    for order_group in order_groups:
+        valid_orders = orders_by_group.get(order_group)
+        if not valid_orders:
+            yield {'order_group': order_group, 'status': 'failed',
+                   'error': f'找不到 order_group: {order_group} 的訂單' if valid_orders is None else '沒有有效的訂單座標'}
+            continue
+        group_params = dict(params, order_group=order_group)
+        plan_key, obstacle_version = route_plan_key(valid_orders, group_params)
+        payload = plan_cache.get(plan_key, order_group)
+        if payload is not None:
+            yield {'order_group': order_group, 'status': 'done', 'cache_status': 'HIT', 'elapsed': 0.0,
+                   'result': loads_json(payload)}
+            continue
+        pending[planner.submit(valid_orders, group_params, obstacle_version)] = (order_group, plan_key)
+
+    for future in as_completed(pending):
+        order_group, plan_key = pending[future]
+        try:
+            result, elapsed = future.result()
+        except BrokenProcessPool as e:
+            planner.reset()
+            logger.error(f"規劃進程異常結束（{order_group}）: {e}")
+            yield {'order_group': order_group, 'status': 'failed', 'error': f'規劃進程異常結束: {e}'}
+            continue
+        except Exception as e:
+            logger.error(f"批次規劃 {order_group} 失敗: {e}")
+            yield {'order_group': order_group, 'status': 'failed', 'error': f'計算路徑錯誤: {e}'}
+            continue
+        store_route_result(plan_key, order_group, result)
+        yield {'order_group': order_group, 'status': 'done', 'cache_status': 'MISS', 'elapsed': round(elapsed, 4),
+               'result': result}
+
+
+@app.route('/api/route/batch', methods=['POST'])
+def batch_route():
+    """
+    批次規劃多個 order_group（參數同 /api/route，所有 order_group 共用）
+
+    {"order_groups": ["Group...", ...], "start": {...}, ...}
+    預設返回 {results: {order_group: 規劃結果 | {error}}, summary}；
+    ?format=ndjson（或 Accept: application/x-ndjson / text/event-stream）時每完成一個 order_group 即送出
+    """
+    data = request.json or {}
+    order_groups = data.get('order_groups')
+    if not isinstance(order_groups, list) or not order_groups or not all(isinstance(g, str) and g for g in order_groups):
+        return jsonify({'error': 'order_groups 必須為非空的字串列表'}), 400
+    order_groups = list(dict.fromkeys(order_groups))  # 去除重複（保持順序）
+    if len(order_groups) > BATCH_MAX_GROUPS:
+        return jsonify({'error': f'單次最多 {BATCH_MAX_GROUPS} 個 order_group'}), 400
+    params, _, invalid = parse_route_request(dict(data, order_group=order_groups[0]))
+    if invalid:
+        return invalid
+    fmt = requested_stream_format()
+
+    logger.info(f"批次規劃: {len(order_groups)} 個 order_group")
+    started = time.perf_counter()
+    try:
+        orders_by_group = fetch_valid_orders_many(order_groups)
+    except Exception as e:
+        logger.error(f"批次查詢訂單失敗: {e}")
+        return jsonify({'error': f'資料庫錯誤: {str(e)}'}), 500
+
+    def summary(items):
+        return {
+            'total': len(order_groups),
+            'done': sum(1 for item in items if item['status'] == 'done'),
+            'failed': sum(1 for item in items if item['status'] == 'failed'),
+            'cached': sum(1 for item in items if item.get('cache_status') == 'HIT'),
+            'elapsed': round(time.perf_counter() - started, 4),
+        }
+
+    if fmt:
+        def chunks():
+            items = []
+            for item in plan_batch(order_groups, orders_by_group, params):
+                items.append({k: v for k, v in item.items() if k != 'result'})
+                yield encode_event('group', item, fmt)
+            yield encode_event('summary', summary(items), fmt)
+        return stream_response(app.response_class, chunks(), fmt)
+
+    items = list(plan_batch(order_groups, orders_by_group, params))
+    results = {}
+    for item in items:
+        results[item['order_group']] = item['result'] if item['status'] == 'done' else {'error': item['error']}
+        results[item['order_group']]['cache_status'] = item.get('cache_status')
+    return format_response(app.response_class, {
+        'success': True,
+        'results': {order_group: results[order_group] for order_group in order_groups},
+        'summary': summary(items),
+    })
+
+
 @app.route('/api/orders-sequence', methods=['GET'])
 def get_orders_by_sequence():
     """取得指定 order_group 的訂單，按 delivery_sequence 排序"""
@@ -1092,9 +749,6 @@ def get_orders_by_sequence():
         return jsonify({'error': 'order_group 參數必填'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
         # 查詢該 order_group 的所有訂單，按 delivery_sequence 排序
         query = """
             SELECT tracking_number, latitude, longitude, delivery_sequence
@@ -1106,11 +760,13 @@ def get_orders_by_sequence():
             ORDER BY delivery_sequence
         """
         
-        cursor.execute(query, (order_group,))
-        orders = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with DB_LATENCY.time(query='orders_sequence'):
+            conn = get_db_connection()
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            cursor.execute(query, (order_group,))
+            orders = cursor.fetchall()
+            cursor.close()
+            conn.close()
         
         if not orders:
             return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
@@ -1142,7 +798,7 @@ def get_orders_by_sequence():
         for idx, order in enumerate(result, 1):
             order['delivery_sequence'] = idx
         
-        return jsonify({
+        return format_response(app.response_class, {
             'order_group': order_group,
             'count': len(result),
             'orders': result
@@ -1159,29 +815,30 @@ def valhalla_route_proxy():
         data = request.json
         
         # 調用 Valhalla API
-        response = requests.post(
-            'https://valhalla1.openstreetmap.de/route',
-            json=data,
-            timeout=10
-        )
+        with VALHALLA_LATENCY.time(call='route'):
+            response = requests.post(
+                'https://valhalla1.openstreetmap.de/route',
+                json=data,
+                timeout=10
+            )
         
         if response.status_code == 200:
             return jsonify(response.json())
         elif response.status_code == 429:
-            print(f"[WARN] Valhalla API 限流 (429)")
+            logger.warning(f"Valhalla API 限流 (429)")
             return jsonify({'error': 'API 限流，請稍後重試'}), 429
         elif response.status_code == 400:
-            print(f"[ERROR] Valhalla API 400: {response.text}")
+            logger.error(f"Valhalla API 400: {response.text}")
             return jsonify({'error': 'API 請求格式錯誤'}), 400
         else:
-            print(f"[ERROR] Valhalla API {response.status_code}: {response.text}")
+            logger.error(f"Valhalla API {response.status_code}: {response.text}")
             return jsonify({'error': f'Valhalla API 錯誤: {response.status_code}'}), response.status_code
             
     except requests.exceptions.Timeout:
-        print(f"[ERROR] Valhalla API 超時")
+        logger.error(f"Valhalla API 超時")
         return jsonify({'error': 'API 請求超時'}), 504
     except Exception as e:
-        print(f"[ERROR] Valhalla 代理錯誤: {str(e)}")
+        logger.error(f"Valhalla 代理錯誤: {str(e)}")
         return jsonify({'error': f'代理錯誤: {str(e)}'}), 500
 
 
@@ -1280,7 +937,7 @@ def analyze_distribution():
             # 凸包頂點（用於視覺化）
             hull_vertices = coords_array[hull.vertices].tolist()
         except Exception as e:
-            print(f"[WARN] 凸包計算失敗: {e}")
+            logger.warning(f"凸包計算失敗: {e}")
             hull_area_km = 0
             density = 0
             hull_vertices = []
@@ -1428,7 +1085,7 @@ def test_db():
         
         return jsonify({
             'success': True,
-            'database': 'bonddb',
+            'database': describe_source(),
             'version': version[0]
         })
     except Exception as e:
@@ -1458,70 +1115,46 @@ def optimize_route_global():
     end_point_mode = data.get('end_point_mode', 'last_order')  # 終點模式
     end_point = data.get('end_point')  # 終點座標（手動模式）
     
-    print(f"[DEBUG] 全局優化請求: order_group={order_group}, method={method}, start={start}, end_point_mode={end_point_mode}")
+    logger.debug(f"全局優化請求: order_group={order_group}, method={method}, start={start}, end_point_mode={end_point_mode}")
+    
+    profiler, denied = start_profiling()
+    if denied:
+        return denied
     
     try:
-        # 從資料庫取得訂單座標
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        query = """
-            SELECT tracking_number, latitude, longitude 
-            FROM ordersjb 
-            WHERE order_group = %s 
-            AND latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            ORDER BY tracking_number
-        """
-        
-        cursor.execute(query, (order_group,))
-        orders = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        if not orders:
+        valid_orders = fetch_valid_orders(order_group)
+        if profiler:
+            profiler.mark('fetch_orders')
+        if valid_orders is None:
             return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
-        
-        print(f"[DEBUG] 找到 {len(orders)} 個訂單")
-        
-        # 驗證並過濾有效的經緯度
-        valid_orders = []
-        for order in orders:
-            try:
-                lat_raw = float(order['latitude'])
-                lon_raw = float(order['longitude'])
-                
-                # 轉換格式
-                lat = lat_raw / 10000000000.0 if abs(lat_raw) > 1000 else lat_raw
-                lon = lon_raw / 10000000000.0 if abs(lon_raw) > 1000 else lon_raw
-                
-                # 驗證經緯度範圍
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    if abs(lat) > 0.001 and abs(lon) > 0.001:
-                        valid_orders.append({
-                            'tracking_number': order['tracking_number'],
-                            'lat': lat,
-                            'lon': lon
-                        })
-            except (ValueError, TypeError) as e:
-                print(f"[WARN] 跳過無效座標: {order.get('tracking_number')} - {e}")
-                continue
-        
         if not valid_orders:
             return jsonify({'error': '沒有有效的訂單座標'}), 404
         
-        print(f"[DEBUG] 有效訂單: {len(valid_orders)} 個")
+        logger.debug(f"有效訂單: {len(valid_orders)} 個")
+        
+        plan_key = PlanCache.make_key(
+            'global', order_group, order_snapshot_version(valid_orders),
+            {
+                'start': start, 'method': method, 'verification': verification,
+                'penalty': penalty, 'check_highways': check_highways,
+                'end_point_mode': end_point_mode, 'end_point': end_point
+            },
+            RiverDetector.get_instance().data_version if verification != 'none' else None
+        )
+        cached = plan_cache.get(plan_key, order_group)
+        if cached is not None and profiler is None:
+            logger.info(f"規劃結果快取命中: {plan_key}")
+            return plan_json_response(cached, 'HIT')
         
         # 限制數量
         if len(valid_orders) > 200:
-            print(f"[WARN] 訂單數量 {len(valid_orders)} 超過限制，取前 200 個")
+            logger.warning(f"訂單數量 {len(valid_orders)} 超過限制，取前 200 個")
             valid_orders = valid_orders[:200]
         
         # 根據方法選擇優化策略
         if method == 'valhalla':
             # 使用 Valhalla Optimized Route API
-            print(f"[INFO] 使用 Valhalla Optimized Route API 優化 {len(valid_orders)} 個訂單...")
+            logger.info(f"使用 Valhalla Optimized Route API 優化 {len(valid_orders)} 個訂單...")
             
             # 檢查是否有手動終點
             has_manual_endpoint = (end_point_mode == 'manual' and end_point)
@@ -1533,17 +1166,18 @@ def optimize_route_global():
                 
                 if has_manual_endpoint:
                     locations.append({"lat": end_point['lat'], "lon": end_point['lon']})
-                    print(f"[INFO] 手動終點模式：將終點 ({end_point['lat']}, {end_point['lon']}) 納入 Valhalla 計算")
+                    logger.info(f"手動終點模式：將終點 ({end_point['lat']}, {end_point['lon']}) 納入 Valhalla 計算")
                 
                 # 調用 Valhalla optimized_route API
-                response = requests.post(
-                    'https://valhalla1.openstreetmap.de/optimized_route',
-                    json={
-                        "locations": locations,
-                        "costing": "auto"
-                    },
-                    timeout=30
-                )
+                with VALHALLA_LATENCY.time(call='optimized_route'):
+                    response = requests.post(
+                        'https://valhalla1.openstreetmap.de/optimized_route',
+                        json={
+                            "locations": locations,
+                            "costing": "auto"
+                        },
+                        timeout=30
+                    )
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -1562,7 +1196,7 @@ def optimize_route_global():
                         optimized_orders = [valid_orders[i] for i in order_indices if 0 <= i < len(valid_orders)]
                     else:
                         # API 返回格式不符，回退到貪心
-                        print("[WARN] Valhalla API 返回格式不符，回退到貪心")
+                        logger.warning("Valhalla API 返回格式不符，回退到貪心")
                         if has_manual_endpoint:
                             from tsp_solver import solve_tsp_with_end
                             coords_all = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in valid_orders] + [(end_point['lat'], end_point['lon'])]
@@ -1574,7 +1208,7 @@ def optimize_route_global():
                             route_indices = [i - 1 for i in route_indices if i > 0]
                         optimized_orders = [valid_orders[i] for i in route_indices]
                 else:
-                    print(f"[ERROR] Valhalla API 失敗: {response.status_code}，回退到貪心")
+                    logger.error(f"Valhalla API 失敗: {response.status_code}，回退到貪心")
                     if has_manual_endpoint:
                         from tsp_solver import solve_tsp_with_end
                         coords_all = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in valid_orders] + [(end_point['lat'], end_point['lon'])]
@@ -1587,7 +1221,7 @@ def optimize_route_global():
                     optimized_orders = [valid_orders[i] for i in route_indices]
             
             except Exception as e:
-                print(f"[ERROR] Valhalla 優化失敗: {e}，回退到貪心")
+                logger.error(f"Valhalla 優化失敗: {e}，回退到貪心")
                 if has_manual_endpoint:
                     from tsp_solver import solve_tsp_with_end
                     coords_all = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in valid_orders] + [(end_point['lat'], end_point['lon'])]
@@ -1601,14 +1235,14 @@ def optimize_route_global():
         
         elif method in ['ortools', 'lkh']:
             # 使用 TSP 求解器
-            print(f"[INFO] 使用 {method.upper()} 優化 {len(valid_orders)} 個訂單...")
+            logger.info(f"使用 {method.upper()} 優化 {len(valid_orders)} 個訂單...")
             
             # 檢查是否有手動終點
             has_manual_endpoint = (end_point_mode == 'manual' and end_point)
             
             if has_manual_endpoint:
                 # 手動終點模式：將終點加入 TSP 求解，並強制其為最後一個點
-                print(f"[INFO] 手動終點模式：將終點 ({end_point['lat']}, {end_point['lon']}) 納入 TSP 計算")
+                logger.info(f"手動終點模式：將終點 ({end_point['lat']}, {end_point['lon']}) 納入 TSP 計算")
                 coords_with_start_and_end = [(start['lat'], start['lon'])] + \
                                             [(o['lat'], o['lon']) for o in valid_orders] + \
                                             [(end_point['lat'], end_point['lon'])]
@@ -1625,10 +1259,10 @@ def optimize_route_global():
                     # 按順序排列
                     optimized_orders = [valid_orders[i] for i in route_indices]
                     
-                    print(f"[INFO] TSP 求解完成，路徑確保以終點結束")
+                    logger.info(f"TSP 求解完成，路徑確保以終點結束")
                 
                 except Exception as e:
-                    print(f"[ERROR] {method.upper()} 求解失敗: {e}，回退到貪心")
+                    logger.error(f"{method.upper()} 求解失敗: {e}，回退到貪心")
                     coords_with_start = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in valid_orders]
                     route_indices = solve_tsp(coords_with_start, method='nearest', start_index=0)
                     route_indices = [i - 1 for i in route_indices if i > 0]
@@ -1648,7 +1282,7 @@ def optimize_route_global():
                     optimized_orders = [valid_orders[i] for i in route_indices]
                 
                 except Exception as e:
-                    print(f"[ERROR] {method.upper()} 求解失敗: {e}，回退到貪心")
+                    logger.error(f"{method.upper()} 求解失敗: {e}，回退到貪心")
                     route_indices = solve_tsp(coords_with_start, method='nearest', start_index=0)
                     route_indices = [i - 1 for i in route_indices if i > 0]
                     optimized_orders = [valid_orders[i] for i in route_indices]
@@ -1668,12 +1302,14 @@ def optimize_route_global():
                 'lon': order['lon']
             })
         
-        print(f"[INFO] 全局優化完成，共 {len(result_orders)} 個訂單")
+        logger.info(f"全局優化完成，共 {len(result_orders)} 個訂單")
+        if profiler:
+            profiler.mark(method)
         
         # 處理終點設置
         if end_point_mode == 'manual' and end_point:
             # 手動終點：在路徑末端加入終點標記
-            print(f"[INFO] 加入手動終點: ({end_point['lat']}, {end_point['lon']})")
+            logger.info(f"加入手動終點: ({end_point['lat']}, {end_point['lon']})")
             result_orders.append({
                 'sequence': len(result_orders) + 1,
                 'group': 'End',
@@ -1684,7 +1320,7 @@ def optimize_route_global():
             })
         elif end_point_mode == 'farthest':
             # 使用最遠訂單：重新排序確保最遠的在最後
-            print(f"[INFO] 調整順序確保最遠訂單在最後...")
+            logger.info(f"調整順序確保最遠訂單在最後...")
             
             # 計算每個訂單距離起點的距離
             import math
@@ -1698,7 +1334,7 @@ def optimize_route_global():
             farthest_order = max(result_orders, key=distance_from_start)
             farthest_idx = result_orders.index(farthest_order)
             
-            print(f"[INFO] 最遠訂單: {farthest_order['tracking_number']} (距離起點 {distance_from_start(farthest_order):.4f})")
+            logger.info(f"最遠訂單: {farthest_order['tracking_number']} (距離起點 {distance_from_start(farthest_order):.4f})")
             
             # 如果最遠訂單不在最後，移到最後
             if farthest_idx != len(result_orders) - 1:
@@ -1710,16 +1346,18 @@ def optimize_route_global():
                     order['sequence'] = i
                     order['group_sequence'] = str(i)
                 
-                print(f"[INFO] 已將最遠訂單移至最後")
+                logger.info(f"已將最遠訂單移至最後")
         
         # 障礙檢測（如果啟用）
         crossings = []
         if verification != 'none':
-            print(f"[INFO] 開始障礙檢測（方法: {verification}）...")
+            logger.info(f"開始障礙檢測（方法: {verification}）...")
             crossings = verify_route_crossings(result_orders, verification, check_highways)
-            print(f"[INFO] 檢測完成，發現 {len(crossings)} 處穿越障礙")
+            logger.info(f"檢測完成，發現 {len(crossings)} 處穿越障礙")
+        if profiler:
+            profiler.mark('finish')
         
-        return jsonify({
+        payload = store_plan(plan_key, order_group, {
             'success': True,
             'orders': result_orders,
             'shape': '',
@@ -1729,9 +1367,10 @@ def optimize_route_global():
             'verification_method': verification,
             'optimization_method': method
         })
+        return plan_json_response(payload, 'MISS', attach_profile(payload, profiler))
     
     except Exception as e:
-        print(f"[ERROR] 全局優化錯誤: {str(e)}")
+        logger.error(f"全局優化錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'全局優化錯誤: {str(e)}'}), 500
@@ -1764,65 +1403,41 @@ def optimize_route_smart():
     next_group_linkage = data.get('nextGroupLinkage', 'none')
     linkage_weight = data.get('linkageWeight', 0.5)
 
-    print(f"[DEBUG] 智能路徑規劃請求: order_group={order_group}, maxGroupSize={max_group_size}, clusterRadius={cluster_radius}, strictGroupOrder={strict_group_order}, directionalConstraint={directional_constraint}, nextGroupLinkage={next_group_linkage}, linkageWeight={linkage_weight}")
-
-    try:
-        # 從資料庫取得訂單座標
-        conn = get_db_connection()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-
-        query = """
-            SELECT tracking_number, latitude, longitude
-            FROM ordersjb
-            WHERE order_group = %s
-            AND latitude IS NOT NULL
-            AND longitude IS NOT NULL
-            ORDER BY tracking_number
-        """
-
-        cursor.execute(query, (order_group,))
-        orders = cursor.fetchall()
+    logger.debug(f"智能路徑規劃請求: order_group={order_group}, maxGroupSize={max_group_size}, clusterRadius={cluster_radius}, strictGroupOrder={strict_group_order}, directionalConstraint={directional_constraint}, nextGroupLinkage={next_group_linkage}, linkageWeight={linkage_weight}")
 
-        cursor.close()
-        conn.close()
+    profiler, denied = start_profiling()
+    if denied:
+        return denied
 
-        if not orders:
+    try:
+        valid_orders = fetch_valid_orders(order_group)
+        if profiler:
+            profiler.mark('fetch_orders')
+        if valid_orders is None:
             return jsonify({'error': f'找不到 order_group: {order_group} 的訂單'}), 404
-
-        print(f"[DEBUG] 找到 {len(orders)} 個訂單")
-
-        # 驗證並過濾有效的經緯度
-        valid_orders = []
-        for order in orders:
-            try:
-                lat_raw = float(order['latitude'])
-                lon_raw = float(order['longitude'])
-
-                # 轉換格式
-                lat = lat_raw / 10000000000.0 if abs(lat_raw) > 1000 else lat_raw
-                lon = lon_raw / 10000000000.0 if abs(lon_raw) > 1000 else lon_raw
-
-                # 驗證經緯度範圍
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    if abs(lat) > 0.001 and abs(lon) > 0.001:
-                        valid_orders.append({
-                            'tracking_number': order['tracking_number'],
-                            'lat': lat,
-                            'lon': lon
-                        })
-            except (ValueError, TypeError) as e:
-                print(f"[WARN] 跳過無效座標: {order.get('tracking_number')} - {e}")
-                continue
-
         if not valid_orders:
             return jsonify({'error': '沒有有效的訂單座標'}), 404
 
-        print(f"[DEBUG] 有效訂單: {len(valid_orders)} 個")
+        logger.debug(f"有效訂單: {len(valid_orders)} 個")
+
+        plan_key = PlanCache.make_key(
+            'smart', order_group, order_snapshot_version(valid_orders),
+            {
+                'start': start, 'max_group_size': max_group_size,
+                'cluster_radius': cluster_radius, 'strict_group_order': strict_group_order,
+                'directional_constraint': directional_constraint,
+                'next_group_linkage': next_group_linkage, 'linkage_weight': linkage_weight
+            }
+        )
+        cached = plan_cache.get(plan_key, order_group)
+        if cached is not None and profiler is None:
+            logger.info(f"規劃結果快取命中: {plan_key}")
+            return plan_json_response(cached, 'HIT')
 
         # 使用新的智能路徑規劃演算法
         from tsp_solver import solve_tsp_smart
 
-        print(f"[INFO] 使用 Smart Route Planner 優化 {len(valid_orders)} 個訂單...")
+        logger.info(f"使用 Smart Route Planner 優化 {len(valid_orders)} 個訂單...")
 
         result = solve_tsp_smart(
             orders=valid_orders,
@@ -1835,6 +1450,8 @@ def optimize_route_smart():
             next_group_linkage=next_group_linkage,
             linkage_weight=linkage_weight
         )
+        if profiler:
+            profiler.mark('smart_planner')
 
         # 根據結果重新組織訂單
         result_orders = []
@@ -1867,11 +1484,11 @@ def optimize_route_smart():
                 global_sequence += 1  # 全局序號持續增加
                 group_sequence += 1   # 組內序號持續增加（但每組會重置）
 
-        print(f"[INFO] 智能路徑規劃完成！")
-        print(f"[INFO] 總距離: {result['total_distance']:.2f}")
-        print(f"[INFO] 組數: {result['metadata']['n_groups']}")
+        logger.info(f"智能路徑規劃完成！")
+        logger.info(f"總距離: {result['total_distance']:.2f}")
+        logger.info(f"組數: {result['metadata']['n_groups']}")
 
-        return jsonify({
+        payload = store_plan(plan_key, order_group, {
             'success': True,
             'orders': result_orders,
             'total_orders': len(result_orders),
@@ -1881,16 +1498,57 @@ def optimize_route_smart():
             'metadata': result['metadata'],
             'optimization_method': 'smart'
         })
+        return plan_json_response(payload, 'MISS', attach_profile(payload, profiler))
 
     except Exception as e:
-        print(f"[ERROR] 智能路徑規劃錯誤: {str(e)}")
+        logger.error(f"智能路徑規劃錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'智能路徑規劃錯誤: {str(e)}'}), 500
 
 
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """取得已儲存的效能分析摘要（僅限管理員）"""
+    if not is_admin(request):
+        return jsonify({'error': '效能分析僅限管理員（需 X-Admin-Token）'}), 403
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': f'找不到效能分析: {profile_id}'}), 404
+    return jsonify(profile)
+
+
+@app.route('/api/plan-cache/invalidate', methods=['POST'])
+def invalidate_plan_cache():
+    """清除指定 order_group 的規劃結果快取（訂單變動後呼叫）"""
+    data = request.json or {}
+    order_group = data.get('order_group')
+    if not order_group:
+        return jsonify({'error': 'order_group 必填'}), 400
+
+    removed = plan_cache.invalidate(order_group)
+    logger.info(f"已清除 order_group={order_group} 的 {removed} 筆規劃快取")
+
+    return jsonify({
+        'success': True,
+        'order_group': order_group,
+        'removed': removed
+    })
+
+
+@app.route('/api/precompute/status', methods=['GET'])
+def precompute_status():
+    """預先規劃排程的狀態（上一輪摘要、已追蹤的 order_group 數）"""
+    return jsonify(Precomputer.get_instance().status())
+
+
 if __name__ == '__main__':
     # 建立 static 目錄
     os.makedirs('static', exist_ok=True)
+    # debug reloader 的監看進程不處理請求，只在實際服務的子進程預熱
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        Warmup.get_instance().start_background()
+        if PRECOMPUTE_INTERVAL > 0:
+            Precomputer.get_instance().start_background(PRECOMPUTE_INTERVAL)
     app.run(debug=True, host='0.0.0.0', port=8080)
 
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""分級日誌（LOG_LEVEL 環境變數）與迴圈內的取樣輸出"""
+
+import logging
+import os
+import sys
+
+LOG_FORMAT = '[%(levelname)s] %(message)s'
+
+# 與原本 print 的 [WARN] 標記一致，方便 grep flask.log
+logging.addLevelName(logging.WARNING, 'WARN')
+
+
+def get_logger(name):
+    """取得模組 logger（輸出到 stdout，格式同原本的 [INFO] / [WARN] 標記）"""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    return logger
+
+
+class LogSampler:
+    """
+    迴圈內的取樣日誌：只輸出前 first 筆，之後每 every 筆輸出一次
+
+    Example:
+        sampler = LogSampler(logger)
+        for group in groups:
+            sampler.debug("處理群組 %s", group)
+        sampler.summary("群組")
+    """
+
+    def __init__(self, logger, first=5, every=100):
+        self.logger = logger
+        self.first = first
+        self.every = every
+        self.seen = 0
+        self.logged = 0
+
+    def _should_log(self):
+        self.seen += 1
+        if self.seen <= self.first or self.seen % self.every == 0:
+            self.logged += 1
+            return True
+        return False
+
+    def debug(self, msg, *args):
+        if self._should_log() and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args)
+
+    def info(self, msg, *args):
+        if self._should_log() and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(msg, *args)
+
+    def summary(self, what):
+        """輸出被省略的筆數"""
+        skipped = self.seen - self.logged
+        if skipped > 0:
+            self.logger.debug("...省略 %d 筆%s日誌", skipped, what)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+批次規劃（POST /api/route/batch）：多個 order_group 於進程池平行規劃
+
+規劃以 CPU 為主（DBSCAN、組內 TSP、障礙檢測），執行緒受 GIL 限制，
+改用 ProcessPoolExecutor，吞吐量隨 CPU 核心數增加。
+子進程預設以 spawn 啟動（gunicorn gthread worker 為多執行緒，直接 fork 可能在鎖上死結）；
+設定 OBSTACLE_STORE 時子進程以記憶體映射附加障礙數據，不需各自載入。
+  BATCH_WORKERS      → 進程數（預設 CPU 數）
+  BATCH_MAX_GROUPS   → 單次請求最多 order_group 數（預設 100）
+  BATCH_START_METHOD → spawn（預設）| forkserver | fork
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app_logging import get_logger
+
+logger = get_logger('batch_planner')
+
+BATCH_MAX_GROUPS = int(os.environ.get('BATCH_MAX_GROUPS', 100))
+
+
+def _init_worker():
+    """子進程啟動時先載入障礙數據（第一個工作不必等待）"""
+    from river_detection import ObstacleDetector
+    ObstacleDetector.get_instance()
+
+
+def plan_order_group(valid_orders, params, obstacle_version):
+    """
+    子進程：規劃單一 order_group
+
+    Returns:
+        (run_route_pipeline 的結果（含 algorithm_steps）, 規劃耗時秒數)
+    """
+    from route_pipeline import run_route_pipeline
+
+    start = time.perf_counter()
+    result = run_route_pipeline(valid_orders, params, obstacle_version)
+    return result, time.perf_counter() - start
+
+
+class BatchPlanner:
+    """規劃用進程池（第一次提交時才建立）"""
+
+    def __init__(self, max_workers=None, start_method='spawn'):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（BATCH_WORKERS / BATCH_START_METHOD 環境變數可調整）"""
+        if not hasattr(BatchPlanner, '_instance'):
+            BatchPlanner._instance = BatchPlanner(
+                max_workers=int(os.environ.get('BATCH_WORKERS', 0)) or None,
+                start_method=os.environ.get('BATCH_START_METHOD', 'spawn'),
+            )
+        return BatchPlanner._instance
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"建立規劃進程池: {self.max_workers} 個進程（{self.start_method}）")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def submit(self, valid_orders, params, obstacle_version):
+        return self.executor().submit(plan_order_group, valid_orders, params, obstacle_version)
+
+    def reset(self):
+        """子進程異常結束（BrokenProcessPool）後捨棄進程池，下次提交時重建"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+路徑規劃離線基準測試（不需資料庫 / 網路）
+
+測試項目：
+  hybrid_clustering           → core_routing_algorithms 混合聚類
+  tsp:<method>                → solve_tsp 各方法（nearest / 2opt-inner / ortools / lkh）
+  smart_planner               → SmartRoutePlanner.plan_route
+  obstacle_geometry           → ObstacleDetector 幾何檢測（合成河流 + 高速公路）
+  POST /api/route ...         → Flask 端點（test client，fetch_valid_orders 改讀合成訂單）
+
+使用方式：
+  python benchmark_pipeline.py                       # 預設情境，與基準比較
+  python benchmark_pipeline.py --quick               # 只跑 50 / 500 筆
+  python benchmark_pipeline.py --sizes 50,2000 --scenario river:toronto
+  python benchmark_pipeline.py --replay snapshots/Group....npz  # 重播實際訂單（快照 / JSON）
+  python benchmark_pipeline.py --save-baseline       # 更新 benchmark_baseline.json
+  python benchmark_pipeline.py --check               # 變慢超過門檻時 exit 1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import unicodedata
+from datetime import datetime
+
+from synthetic_orders import BOUNDING_BOXES, generate_orders, load_orders, start_point, write_obstacle_files
+
+DEFAULT_SIZES = (50, 500, 2000, 5000)
+QUICK_SIZES = (50, 500)
+
+# (分布, 區域)
+DEFAULT_SCENARIOS = (
+    ('clustered', 'toronto'),
+    ('linear', 'toronto'),
+    ('river', 'toronto'),
+    ('clustered', 'vancouver'),
+)
+
+# 各項目的訂單數上限（超過時只取前 N 筆，表格中標示實際筆數）
+TSP_LIMITS = {'nearest': 1000, '2opt-inner': 60, 'ortools': 100, 'lkh': 60}  # 2opt-inner 150 筆約 20 秒
+SMART_PLANNER_LIMIT = 2000  # 5000 筆約需 3 分鐘
+
+# 結果含隨機性的項目（模擬退火），不比較路線長度
+NONDETERMINISTIC = {'tsp:lkh'}
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+SLOWDOWN_THRESHOLD = 1.5  # 耗時超過基準 1.5 倍視為變慢
+ROUTE_LENGTH_TOLERANCE = 0.01  # 路線長度增加超過 1% 視為變差
+MIN_COMPARE_SECONDS = 0.05  # 太短的項目計時誤差大，不比較耗時
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """兩點間大圓距離（公里）"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def route_length_km(start, points):
+    """從起點依序走訪 points [(lat, lon), ...] 的總長度"""
+    total = 0.0
+    prev = (start['lat'], start['lon'])
+    for point in points:
+        total += haversine_km(prev[0], prev[1], point[0], point[1])
+        prev = point
+    return total
+
+
+@contextlib.contextmanager
+def quiet():
+    """靜音演算法的 print / logging 輸出（只保留基準表格）"""
+    previous = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(previous)
+
+
+def timed(func, repeat=1):
+    """執行 repeat 次，返回（最快耗時, 最後一次結果）"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with quiet():
+            result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# ============================================================================
+# 測試項目
+# ============================================================================
+
+def bench_hybrid_clustering(orders, start, repeat):
+    from core_routing_algorithms import hybrid_clustering
+
+    elapsed, clusters = timed(lambda: hybrid_clustering(orders), repeat)
+    return {'n': len(orders), 'seconds': elapsed, 'groups': len(clusters)}
+
+
+def bench_tsp(method):
+    def run(orders, start, repeat):
+        from tsp_solver import solve_tsp
+
+        subset = orders[:TSP_LIMITS[method]]
+        coords = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in subset]
+        elapsed, route = timed(lambda: solve_tsp(coords, method=method, start_index=0), repeat)
+        return {
+            'n': len(subset),
+            'seconds': elapsed,
+            'route_km': route_length_km(start, [coords[i] for i in route if i != 0]),
+        }
+    return run
+
+
+def bench_smart_planner(orders, start, repeat):
+    from smart_route_planner import SmartRoutePlanner
+
+    subset = orders[:SMART_PLANNER_LIMIT]
+    elapsed, result = timed(lambda: SmartRoutePlanner().plan_route(subset, start), repeat)
+    return {
+        'n': len(subset),
+        'seconds': elapsed,
+        'route_km': route_length_km(start, [(subset[i]['lat'], subset[i]['lon']) for i in result['route']]),
+        'groups': len(result['groups']),
+    }
+
+
+def bench_obstacle_geometry(detector):
+    def run(orders, start, repeat):
+        def check_all():
+            crossings = 0
+            for a, b in zip(orders, orders[1:]):
+                result = detector.check_obstacle_crossing(a['lat'], a['lon'], b['lat'], b['lon'],
+                                                          check_rivers=True, check_highways=True)
+                crossings += result['crosses_any']
+            return crossings
+
+        elapsed, crossings = timed(check_all, repeat)
+        return {'n': len(orders), 'seconds': elapsed, 'crossings': crossings}
+    return run
+
+
+class EndpointBench:
+    """Flask 端點（test client）：訂單改由記憶體提供，每次請求前清空快取"""
+
+    def __init__(self, detector):
+        import app as app_module
+        from neighbor_graph_cache import NeighborGraphCache
+        from river_detection import ObstacleDetector
+        from route_pipeline import StageCache
+
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+        self.orders_by_group = {}
+        self.caches = [app_module.plan_cache, StageCache.get_instance(), NeighborGraphCache.get_instance()]
+        # 合成障礙數據取代實際數據（數據檔不在 repo 中）
+        ObstacleDetector._instance = detector
+        app_module.fetch_valid_orders = lambda order_group: self.orders_by_group.get(order_group)
+
+    def clear_caches(self):
+        for cache in self.caches:
+            cache.clear()
+
+    def endpoint(self, path, body, warm=False, limit=None):
+        def run(orders, start, repeat):
+            orders = orders[:limit] if limit else orders
+            order_group = f"BENCH-{len(orders)}-{orders[0]['tracking_number']}"
+            self.orders_by_group[order_group] = orders
+            payload = dict(body, start=start, order_group=order_group)
+
+            def request():
+                if not warm:
+                    self.clear_caches()
+                response = self.client.post(path, json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+                return response.get_json()
+
+            if warm:
+                with quiet():
+                    request()  # 先跑一次讓快取有資料
+            elapsed, result = timed(request, repeat)
+            points = [(o['lat'], o['lon']) for o in result['orders'] if o.get('tracking_number') != 'ENDPOINT']
+            return {'n': len(points), 'seconds': elapsed, 'route_km': route_length_km(start, points)}
+        return run
+
+
+def build_benchmarks(detector):
+    endpoints = EndpointBench(detector)
+    return [
+        ('hybrid_clustering', bench_hybrid_clustering),
+        *[(f'tsp:{method}', bench_tsp(method)) for method in TSP_LIMITS],
+        ('smart_planner', bench_smart_planner),
+        ('obstacle_geometry', bench_obstacle_geometry(detector)),
+        ('POST /api/route', endpoints.endpoint('/api/route', {})),
+        ('POST /api/route geometry', endpoints.endpoint('/api/route', {'verification': 'geometry'})),
+        ('POST /api/route (cached)', endpoints.endpoint('/api/route', {}, warm=True)),
+        ('POST /api/optimize-route-global', endpoints.endpoint('/api/optimize-route-global', {'method': 'ortools'})),
+        ('POST /api/optimize-route-smart', endpoints.endpoint('/api/optimize-route-smart', {}, limit=SMART_PLANNER_LIMIT)),
+    ]
+
+
+# ============================================================================
+# 基準比較與輸出
+# ============================================================================
+
+def result_key(name, scenario, size):
+    return f"{name}|{scenario}|{size}"
+
+
+def compare(name, result, baseline):
+    """與基準比較，返回（耗時比, 路線長度變化比例, 是否變差）"""
+    if not baseline:
+        return None, None, False
+    ratio = result['seconds'] / baseline['seconds'] if baseline['seconds'] > 0 else None
+    length_delta = None
+    if name not in NONDETERMINISTIC and result.get('route_km') is not None and baseline.get('route_km'):
+        length_delta = result['route_km'] / baseline['route_km'] - 1
+    slower = (ratio is not None and ratio > SLOWDOWN_THRESHOLD
+              and max(result['seconds'], baseline['seconds']) >= MIN_COMPARE_SECONDS)
+    longer = length_delta is not None and length_delta > ROUTE_LENGTH_TOLERANCE
+    return ratio, length_delta, slower or longer
+
+
+def _display_width(text):
+    return sum(2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1 for ch in text)
+
+
+def _ljust(text, width):
+    return text + ' ' * max(0, width - _display_width(text))
+
+
+def _rjust(text, width):
+    return ' ' * max(0, width - _display_width(text)) + text
+
+
+def print_table(rows):
+    header = (_ljust('項目', 34) + _ljust('情境', 22) + _rjust('訂單', 6) + _rjust('耗時(s)', 10)
+              + _rjust('路線(km)', 11) + _rjust('基準(s)', 10) + _rjust('耗時比', 8) + _rjust('長度變化', 10))
+    print(header)
+    print('-' * 114)
+    for row in rows:
+        result = row['result']
+        if 'error' in result:
+            print(f"{row['name']:<34}{row['scenario']:<22}{row['size']:>6}  ❌ {result['error']}")
+            continue
+        baseline = row['baseline']
+        route_km = f"{result['route_km']:.1f}" if result.get('route_km') is not None else '-'
+        base_s = f"{baseline['seconds']:.3f}" if baseline else '-'
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+        delta = f"{row['length_delta'] * 100:+.1f}%" if row['length_delta'] is not None else '-'
+        flag = '  ⚠️' if row['regressed'] else ''
+        print(f"{row['name']:<34}{row['scenario']:<22}{result['n']:>6}{result['seconds']:>10.3f}"
+              f"{route_km:>11}{base_s:>10}{ratio:>8}{delta:>10}{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='路徑規劃離線基準測試')
+    parser.add_argument('--sizes', help='訂單數，逗號分隔（預設 50,500,2000,5000）')
+    parser.add_argument('--quick', action='store_true', help='只跑 50 / 500 筆')
+    parser.add_argument('--scenario', action='append', help='分布:區域，例如 river:toronto（可重複）')
+    parser.add_argument('--replay', action='append', default=[], help='重播訂單檔：.npz / .parquet 快照或 JSON（可重複）')
+    parser.add_argument('--only', help='只跑名稱包含此字串的項目，例如 tsp 或 /api/route')
+    parser.add_argument('--repeat', type=int, default=1, help='每項重複次數（取最快）')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準檔路徑')
+    parser.add_argument('--save-baseline', action='store_true', help='將本次結果寫入基準檔')
+    parser.add_argument('--check', action='store_true', help='有項目變差時 exit 1')
+    parser.add_argument('--output', help='另存本次結果（JSON）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    if args.sizes:
+        sizes = tuple(int(s) for s in args.sizes.split(','))
+    scenarios = [tuple(s.split(':')) for s in args.scenario] if args.scenario else list(DEFAULT_SCENARIOS)
+
+    # 訂單集：(情境名稱, 規模, 訂單, 起點)
+    order_sets = []
+    for distribution, region in scenarios:
+        for size in sizes:
+            order_sets.append((f"{distribution}:{region}", size, generate_orders(distribution, size, region), start_point(region)))
+    for filename in args.replay:
+        orders = load_orders(filename)
+        start = {'lat': orders[0]['lat'], 'lon': orders[0]['lon']}
+        order_sets.append((f"replay:{os.path.basename(filename)}", len(orders), orders, start))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+
+    # 每個區域一組合成障礙數據
+    tmp_dir = tempfile.mkdtemp(prefix='route_bench_')
+    detectors = {}
+
+    def detector_for(scenario):
+        from river_detection import ObstacleDetector
+
+        region = scenario.split(':')[1] if scenario.split(':')[1] in BOUNDING_BOXES else 'toronto'
+        if region not in detectors:
+            with quiet():
+                detectors[region] = ObstacleDetector(*write_obstacle_files(tmp_dir, region))
+        return detectors[region]
+
+    print("=" * 114)
+    print(f"路徑規劃基準測試  Python {platform.python_version()} / {platform.machine()}  ({datetime.now():%Y-%m-%d %H:%M})")
+    print("=" * 114)
+
+    rows = []
+    results = {}
+    for scenario, size, orders, start in order_sets:
+        with quiet():
+            benchmarks = build_benchmarks(detector_for(scenario))
+        for name, bench in benchmarks:
+            if args.only and args.only not in name:
+                continue
+            key = result_key(name, scenario, size)
+            try:
+                result = bench(orders, start, args.repeat)
+            except Exception as e:
+                result = {'error': str(e)}
+            ratio, length_delta, regressed = (None, None, False) if 'error' in result else compare(name, result, baseline.get(key))
+            rows.append({'name': name, 'scenario': scenario, 'size': size, 'result': result,
+                         'baseline': baseline.get(key), 'ratio': ratio,
+                         'length_delta': length_delta, 'regressed': regressed})
+            if 'error' not in result:
+                results[key] = result
+            print(f"  {name} [{scenario}, {size}] {result.get('seconds', float('nan')):.3f}s", file=sys.stderr)
+
+    print()
+    print_table(rows)
+
+    regressions = [row for row in rows if row['regressed']]
+    errors = [row for row in rows if 'error' in row['result']]
+    print()
+    print(f"共 {len(rows)} 項，變差 {len(regressions)} 項，失敗 {len(errors)} 項"
+          f"（門檻：耗時 > {SLOWDOWN_THRESHOLD}x 或路線長度 +{ROUTE_LENGTH_TOLERANCE:.0%}）")
+
+    document = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        # 合併：只覆蓋本次有跑的項目
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                saved = json.load(f).get('results', {})
+        saved.update(results)
+        document['results'] = dict(sorted(saved.items()))
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已更新基準檔 {args.baseline}（{len(results)} 項）")
+
+    if args.check and (regressions or errors):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,9 +17,7 @@ pip install numpy scikit-learn scipy ortools python-tsp
 import math
 import numpy as np
 from typing import List, Tuple, Dict, Optional, Callable
-from sklearn.cluster import DBSCAN, KMeans
-from scipy.spatial import ConvexHull
-from sklearn.decomposition import PCA
+from sklearn.cluster import DBSCAN, KMeans, MiniBatchKMeans
 
 
 # ============================================================================
@@ -277,6 +275,156 @@ def solve_tsp(coords: List[Tuple[float, float]],
 # 3. 混合聚类算法（DBSCAN + K-means）
 # ============================================================================
 
+# 超过此订单数的群组改用 MiniBatchKMeans 产生初始中心
+MINIBATCH_SEED_THRESHOLD = 2000
+
+# 容量分配时每个订单连到的最近中心数（最小费用流的弧数 = 订单数 × 此值）
+CAPACITY_CANDIDATES = 8
+
+
+def _capacitated_assign_flow(coords: np.ndarray, centers: np.ndarray,
+                             capacity: int, candidates: int = None) -> Optional[np.ndarray]:
+    """
+    最小费用流容量分配：source → 订单（容量 1）→ 中心（费用 = 距离）→ sink（容量 capacity）
+
+    每个订单只连到最近的 candidates 个中心（默认 CAPACITY_CANDIDATES），弧数 O(n × candidates)
+    而非 O(n × K)；受限的图不可行时（近处中心都已满）候选数加倍重新求解，直到使用全部中心
+
+    Returns:
+        每个订单的中心索引；OR-Tools 未安装或求解失败时返回 None
+    """
+    try:
+        from ortools.graph.python import min_cost_flow
+    except ImportError:
+        return None
+
+    n, k = len(coords), len(centers)
+    dists = np.sqrt(((coords[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    width = min(k, candidates or CAPACITY_CANDIDATES)
+
+    while True:
+        if width < k:
+            nearest = np.argpartition(dists, width - 1, axis=1)[:, :width]
+        else:
+            nearest = np.broadcast_to(np.arange(k), (n, k))
+        costs = np.rint(np.take_along_axis(dists, nearest, axis=1) * 1000000).astype(np.int64)  # 放大 10^6 倍，与 OR-Tools TSP 一致
+
+        source, sink = n + k, n + k + 1
+        point_nodes = np.arange(n, dtype=np.int64)
+        center_nodes = n + np.arange(k, dtype=np.int64)
+
+        smcf = min_cost_flow.SimpleMinCostFlow()
+        smcf.add_arcs_with_capacity_and_unit_cost(
+            np.full(n, source, dtype=np.int64), point_nodes,
+            np.ones(n, dtype=np.int64), np.zeros(n, dtype=np.int64))
+        assign_arcs = smcf.add_arcs_with_capacity_and_unit_cost(
+            np.repeat(point_nodes, width), (n + nearest).ravel().astype(np.int64),
+            np.ones(n * width, dtype=np.int64), costs.ravel())
+        smcf.add_arcs_with_capacity_and_unit_cost(
+            center_nodes, np.full(k, sink, dtype=np.int64),
+            np.full(k, capacity, dtype=np.int64), np.zeros(k, dtype=np.int64))
+        smcf.set_nodes_supplies(np.array([source, sink], dtype=np.int64),
+                                np.array([n, -n], dtype=np.int64))
+
+        status = smcf.solve()
+        if status == smcf.OPTIMAL:
+            break
+        if status == smcf.INFEASIBLE and width < k:
+            # 近处中心都已满：候选数加倍，最后才使用全部中心
+            width = min(k, width * 2)
+            continue
+        print("[WARN] 最小费用流求解失败，改用贪心容量分配")
+        return None
+
+    flows = np.asarray(smcf.flows(assign_arcs)).reshape(n, width)
+    return nearest[np.arange(n), np.argmax(flows, axis=1)]
+
+
+def _capacitated_assign_greedy(coords: np.ndarray, centers: np.ndarray,
+                               capacity: int) -> np.ndarray:
+    """
+    贪心 regret 容量分配（OR-Tools 不可用时的回退）
+
+    先处理「最近与次近中心差距最大」的订单，每个订单放入仍有空位的最近中心
+    """
+    n, k = len(coords), len(centers)
+    dists = np.sqrt(((coords[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    preference = np.argsort(dists, axis=1, kind='stable')
+
+    if k > 1:
+        sorted_dists = np.take_along_axis(dists, preference, axis=1)
+        regret = sorted_dists[:, 1] - sorted_dists[:, 0]
+    else:
+        regret = np.zeros(n)
+
+    labels = np.full(n, -1, dtype=int)
+    remaining = np.full(k, capacity, dtype=int)
+    for i in np.argsort(-regret, kind='stable'):
+        for c in preference[i]:
+            if remaining[c] > 0:
+                labels[i] = c
+                remaining[c] -= 1
+                break
+
+    return labels
+
+
+def capacitated_kmeans(coords, max_group_size: int,
+                       random_state: Optional[int] = 42,
+                       n_init: int = 10,
+                       max_iter: int = 20) -> np.ndarray:
+    """
+    容量约束 K-means：保证每个子群组 ≤ max_group_size，且大小均衡
+
+    流程：
+    1. K = ⌈n / max_group_size⌉，每组容量 = ⌈n / K⌉（≤ max_group_size）
+    2. KMeans（大群组用 MiniBatchKMeans）产生初始中心
+    3. 交替执行「容量约束分配（最小费用流）」与「更新中心」直到分配不再变化
+
+    Args:
+        coords: [[lat, lon], ...] 座标数组
+        max_group_size: 每组最大订单数
+        random_state: K-means 随机种子（固定时结果可重现）
+        n_init: K-means 初始化次数
+        max_iter: 分配/更新中心的最大迭代次数
+
+    Returns:
+        子群组标签数组（0 .. K-1）
+    """
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    n_clusters = max(1, (n + max_group_size - 1) // max_group_size)
+
+    if n_clusters == 1:
+        return np.zeros(n, dtype=int)
+
+    capacity = (n + n_clusters - 1) // n_clusters
+
+    if n > MINIBATCH_SEED_THRESHOLD:
+        seeder = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state,
+                                 n_init=n_init, batch_size=1024)
+    else:
+        seeder = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init)
+    centers = seeder.fit(coords).cluster_centers_
+
+    labels = None
+    for _ in range(max_iter):
+        new_labels = _capacitated_assign_flow(coords, centers, capacity)
+        if new_labels is None:
+            new_labels = _capacitated_assign_greedy(coords, centers, capacity)
+
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+
+        for c in range(n_clusters):
+            members = coords[labels == c]
+            if len(members) > 0:
+                centers[c] = members.mean(axis=0)
+
+    return labels
+
+
 def hybrid_clustering(orders: List[Dict], 
                      cluster_radius: float = 1.0,
                      min_samples: int = 3,
@@ -285,13 +433,13 @@ def hybrid_clustering(orders: List[Dict],
                      random_state: int = 42,
                      n_init: int = 10) -> Dict[int, List[Dict]]:
     """
-    混合聚类算法：DBSCAN（粗分）+ K-means（细分）
-    
+    混合聚类算法：DBSCAN（粗分）+ 容量约束 K-means（细分）
+
     Args:
         orders: 订单列表，每个订单包含 'lat', 'lon' 等字段
         cluster_radius: DBSCAN 聚类半径（单位: km）
         min_samples: DBSCAN 最小样本数
-        max_group_size: 每组最大订单数（触发 K-means 细分）
+        max_group_size: 每组最大订单数（触发 K-means 细分，保证不超过）
         metric: 距离计算方式（'euclidean' | 'haversine' | 'manhattan'）
         random_state: K-means 随机种子
         n_init: K-means 初始化次数
@@ -360,13 +508,13 @@ def hybrid_clustering(orders: List[Dict],
             print(f"  群组 {cluster_id}: {len(group_orders)} 个订单（保持）")
             cluster_id += 1
         else:
-            # 群组太大，用 K-means 细分
+            # 群组太大，用容量约束 K-means 细分
             n_sub_clusters = (len(group_orders) + max_group_size - 1) // max_group_size
             print(f"  群组 {label} 有 {len(group_orders)} 个订单，细分成 {n_sub_clusters} 个子群组...")
-            
+
             sub_coords = np.array([[o['lat'], o['lon']] for o in group_orders])
-            kmeans = KMeans(n_clusters=n_sub_clusters, random_state=random_state, n_init=n_init)
-            sub_labels = kmeans.fit_predict(sub_coords)
+            sub_labels = capacitated_kmeans(sub_coords, max_group_size,
+                                            random_state=random_state, n_init=n_init)
             
             for sub_label in range(n_sub_clusters):
                 sub_orders = [group_orders[i] for i in range(len(group_orders)) if sub_labels[i] == sub_label]
@@ -805,6 +953,10 @@ def analyze_order_distribution(orders: List[Dict]) -> Dict:
             - suggestions: 参数建议字典
             - reasoning: 建议理由
     """
+    # 仅参数建议使用，延迟导入（避免拖慢服务启动）
+    from scipy.spatial import ConvexHull
+    from sklearn.decomposition import PCA
+
     coords = np.array([[o['lat'], o['lon']] for o in orders])
     total_orders = len(coords)
     
@@ -17,9 +17,9 @@ pip install numpy scikit-learn scipy ortools python-tsp
 import math
 import numpy as np
 from typing import List, Tuple, Dict, Optional, Callable
-from sklearn.cluster import DBSCAN, KMeans
-from scipy.spatial import ConvexHull
-from sklearn.decomposition import PCA
+from sklearn.cluster import DBSCAN
+
+from core_routing_algorithms import capacitated_kmeans
 
 
 # ============================================================================
@@ -210,7 +210,7 @@ def hybrid_clustering(orders: List[Dict],
                      metric: str = 'euclidean',
                      random_state: int = 42,
                      n_init: int = 10) -> Dict[int, List[Dict]]:
-    """混合聚类算法：DBSCAN（粗分）+ K-means（细分）"""
+    """混合聚类算法：DBSCAN（粗分）+ 容量约束 K-means（细分）"""
     coords = np.array([[o['lat'], o['lon']] for o in orders])
     n_orders = len(orders)
     
@@ -267,8 +267,8 @@ def hybrid_clustering(orders: List[Dict],
             print(f"  群组 {label} 有 {len(group_orders)} 个订单，细分成 {n_sub_clusters} 个子群组...")
             
             sub_coords = np.array([[o['lat'], o['lon']] for o in group_orders])
-            kmeans = KMeans(n_clusters=n_sub_clusters, random_state=random_state, n_init=n_init)
-            sub_labels = kmeans.fit_predict(sub_coords)
+            sub_labels = capacitated_kmeans(sub_coords, max_group_size,
+                                            random_state=random_state, n_init=n_init)
             
             for sub_label in range(n_sub_clusters):
                 sub_orders = [group_orders[i] for i in range(len(group_orders)) if sub_labels[i] == sub_label]
@@ -579,6 +579,10 @@ def plan_route(orders: List[Dict],
 
 def analyze_order_distribution(orders: List[Dict]) -> Dict:
     """分析订单分布并提供智能参数建议"""
+    # 仅参数建议使用，延迟导入（避免拖慢服务启动）
+    from scipy.spatial import ConvexHull
+    from sklearn.decomposition import PCA
+
     coords = np.array([[o['lat'], o['lon']] for o in orders])
     total_orders = len(coords)
     
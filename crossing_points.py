@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+離線穿越點索引（橋樑 / 高架 / 交流道）與繞行距離估計
+
+原本穿越障礙的連線只能乘上固定懲罰係數（group_penalty / inner_penalty），
+或逐對呼叫 Valhalla（慢）。此索引從已下載的 OSM 數據取出可以穿越障礙的位置：
+  rivers   → 高速公路與河流的交點（高速公路橋）+ 橋樑 way 與河流的交點
+  highways → 橋樑 / 隧道 way 與高速公路的交點（跨越 / 穿越高速公路的一般道路）+ 交流道節點
+穿越障礙的點對以「經由最近穿越點」的距離估計實際行駛距離：
+  min over c ( |a - c| + |c - b| )，c 取 a、b、中點各自最近的 CROSSING_CANDIDATES 個穿越點
+距離單位與 route_pipeline.calculate_distance 相同（度），每對約數十微秒，批次計算更快。
+
+  CROSSING_POINTS_FILE → 橋樑 / 隧道 / 交流道數據（download_crossing_points.py 下載，預設 crossings_data.json；
+                         不存在時只使用河流 × 高速公路的交點）
+  CROSSING_CANDIDATES  → 每個端點查詢的候選穿越點數（預設 8）
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString
+from shapely.strtree import STRtree
+
+from app_logging import get_logger
+from river_detection import data_files_version
+
+logger = get_logger('crossing_points')
+
+CROSSING_POINTS_FILE = os.environ.get('CROSSING_POINTS_FILE', 'crossings_data.json')
+CROSSING_CANDIDATES = int(os.environ.get('CROSSING_CANDIDATES', 8))
+
+# 高速公路本身（不算跨越高速公路的道路）
+HIGHWAY_TYPES = {'motorway', 'motorway_link', 'trunk', 'trunk_link'}
+
+
+def read_overpass_ways(filename):
+    """
+    讀取 Overpass JSON（含標籤）
+
+    Returns:
+        (ways [(coords [(lon, lat), ...], tags)], 帶標籤的節點 [((lon, lat), tags)])
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    nodes = {e['id']: (e['lon'], e['lat']) for e in data['elements'] if e['type'] == 'node'}
+    ways, tagged_nodes = [], []
+    for element in data['elements']:
+        if element['type'] == 'way' and 'nodes' in element:
+            coords = [nodes[node_id] for node_id in element['nodes'] if node_id in nodes]
+            if len(coords) >= 2:
+                ways.append((coords, element.get('tags', {})))
+        elif element['type'] == 'node' and element.get('tags'):
+            tagged_nodes.append(((element['lon'], element['lat']), element['tags']))
+    return ways, tagged_nodes
+
+
+def intersection_points(lines, obstacles):
+    """lines 與 obstacles 的交點座標陣列 (n, 2)，(lon, lat)"""
+    lines = np.asarray(lines, dtype=object)
+    obstacles = np.asarray(obstacles, dtype=object)
+    if not len(lines) or not len(obstacles):
+        return np.empty((0, 2))
+    line_idx, obstacle_idx = STRtree(obstacles).query(lines, predicate='intersects')
+    if not len(line_idx):
+        return np.empty((0, 2))
+    points = shapely.intersection(lines[line_idx], obstacles[obstacle_idx])
+    # 重疊的線段以其端點作為穿越點
+    return shapely.get_coordinates(points)
+
+
+def _unique_points(points, decimals=5):
+    """合併約 1 m 內重複的穿越點（同一座橋的多條車道 / 多段 way）"""
+    if not len(points):
+        return np.empty((0, 2))
+    _, first = np.unique(np.round(points, decimals), axis=0, return_index=True)
+    return points[np.sort(first)]
+
+
+class CrossingPointIndex:
+    """各類障礙的穿越點 + cKDTree（唯讀，可多執行緒共用）"""
+
+    def __init__(self, points):
+        """
+        Args:
+            points: {'rivers': (n, 2) 陣列, 'highways': (n, 2) 陣列}，座標為 (lon, lat)
+        """
+        self.points = {kind: _unique_points(np.asarray(points.get(kind, np.empty((0, 2))), dtype=np.float64))
+                       for kind in ('rivers', 'highways')}
+        self.trees = {kind: cKDTree(pts) if len(pts) else None for kind, pts in self.points.items()}
+        self.data_version = None
+
+    @classmethod
+    def build(cls, rivers_data_file='rivers_data.json', highways_data_file='highways_data.json',
+              crossings_data_file=None):
+        """從已下載的 OSM 數據建立（crossings_data_file 不存在時只使用河流 × 高速公路的交點）"""
+        start = time.perf_counter()
+        crossings_data_file = crossings_data_file or CROSSING_POINTS_FILE
+        rivers = [LineString(coords) for coords, _ in read_overpass_ways(rivers_data_file)[0]]
+        highways = [LineString(coords) for coords, _ in read_overpass_ways(highways_data_file)[0]]
+
+        river_points = [intersection_points(highways, rivers)]
+        highway_points = []
+        files = [rivers_data_file, highways_data_file]
+        if os.path.exists(crossings_data_file):
+            files.append(crossings_data_file)
+            ways, tagged_nodes = read_overpass_ways(crossings_data_file)
+            bridges = [LineString(coords) for coords, tags in ways if tags.get('bridge', 'no') != 'no']
+            # 跨越 / 穿越高速公路的一般道路（高速公路本身的橋不算）
+            passes = [LineString(coords) for coords, tags in ways
+                      if (tags.get('bridge', 'no') != 'no' or tags.get('tunnel', 'no') != 'no')
+                      and tags.get('highway') not in HIGHWAY_TYPES]
+            river_points.append(intersection_points(bridges, rivers))
+            highway_points.append(intersection_points(passes, highways))
+            junctions = [coords for coords, tags in tagged_nodes if tags.get('highway') == 'motorway_junction']
+            if junctions:
+                highway_points.append(np.array(junctions, dtype=np.float64))
+        else:
+            logger.info(f"找不到 {crossings_data_file}，河流只使用高速公路橋，高速公路無穿越點（改用懲罰係數）")
+
+        index = cls({
+            'rivers': np.concatenate(river_points) if river_points else np.empty((0, 2)),
+            'highways': np.concatenate(highway_points) if highway_points else np.empty((0, 2)),
+        })
+        index.data_version = data_files_version(*files)
+        logger.info(f"穿越點索引: 河流 {len(index.points['rivers'])} 個、高速公路 {len(index.points['highways'])} 個"
+                    f"（{time.perf_counter() - start:.2f}s）")
+        return index
+
+    @staticmethod
+    def get_instance(rivers_data_file='rivers_data.json', highways_data_file='highways_data.json'):
+        """獲取單例實例（避免重複建立）"""
+        if not hasattr(CrossingPointIndex, '_instance'):
+            CrossingPointIndex._instance = CrossingPointIndex.build(rivers_data_file, highways_data_file)
+        return CrossingPointIndex._instance
+
+    def counts(self):
+        return {kind: len(points) for kind, points in self.points.items()}
+
+    def via_distance_many(self, kind, a, b, k=None):
+        """
+        批次估計經由最近穿越點的距離
+
+        Args:
+            kind: 'rivers' | 'highways'
+            a, b: (m, 2) 陣列，座標為 (lat, lon)
+            k: 每個端點的候選數
+
+        Returns:
+            (m,) 距離陣列（度）；該類別沒有穿越點時為 None
+        """
+        tree = self.trees[kind]
+        if tree is None:
+            return None
+        a = np.asarray(a, dtype=np.float64)[:, ::-1]
+        b = np.asarray(b, dtype=np.float64)[:, ::-1]
+        m = len(a)
+        k = min(k or CROSSING_CANDIDATES, tree.n)
+        # a、b、中點一次查詢 → 每對 3k 個候選
+        _, candidates = tree.query(np.concatenate([a, b, (a + b) / 2]), k=k)
+        candidates = candidates.reshape(3, m, -1).transpose(1, 0, 2).reshape(m, -1)
+        via = self.points[kind][candidates]
+        cost = (np.sqrt(((via - a[:, None, :]) ** 2).sum(axis=2)) +
+                np.sqrt(((via - b[:, None, :]) ** 2).sum(axis=2)))
+        return cost.min(axis=1)
+
+    def via_distance(self, kind, lat1, lon1, lat2, lon2):
+        """單對的經由穿越點距離（度）；沒有穿越點時為 None"""
+        result = self.via_distance_many(kind, [[lat1, lon1]], [[lat2, lon2]])
+        return None if result is None else float(result[0])
+
+    def detour_cost(self, lat1, lon1, lat2, lon2, crosses_river, crosses_highway):
+        """
+        穿越障礙的點對的估計行駛距離（同時穿越河流與高速公路時取較遠者）
+
+        Returns:
+            距離（度）；任一穿越類別沒有穿越點時為 None（呼叫端改用懲罰係數）
+        """
+        costs = []
+        for kind, crosses in (('rivers', crosses_river), ('highways', crosses_highway)):
+            if crosses:
+                cost = self.via_distance(kind, lat1, lon1, lat2, lon2)
+                if cost is None:
+                    return None
+                costs.append(cost)
+        return max(costs) if costs else None
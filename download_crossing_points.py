@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""下載並合併多個地區的橋樑、隧道與交流道數據（crossing_points.py 的穿越點來源）"""
+
+import json
+import time
+
+import requests
+
+from download_combined_regions import OVERPASS_URL, REGIONS, merge_data
+
+# 可通行的道路類型（人行道 / 自行車道的橋不算配送車輛可用的穿越點）
+ROAD_TYPES = ('motorway|motorway_link|trunk|trunk_link|primary|primary_link|secondary|secondary_link|'
+              'tertiary|tertiary_link|unclassified|residential|service')
+
+
+def download_region_crossings(region_key):
+    """下載單個地區的橋樑 / 隧道道路與交流道節點"""
+    region = REGIONS[region_key]
+    bbox = region['bbox']
+    area = f"{bbox['south']},{bbox['west']},{bbox['north']},{bbox['east']}"
+
+    query = f"""
+    [out:json][timeout:300];
+    (
+      way["highway"~"^({ROAD_TYPES})$"]["bridge"]["bridge"!="no"]({area});
+      way["highway"~"^({ROAD_TYPES})$"]["tunnel"]["tunnel"!="no"]({area});
+      node["highway"="motorway_junction"]({area});
+    );
+    out body;
+    >;
+    out skel qt;
+    """
+
+    print(f"\n🌉 下載 {region['name']} 橋樑 / 隧道 / 交流道數據...")
+    print(f"   範圍: {bbox}")
+
+    try:
+        response = requests.post(OVERPASS_URL, data={'data': query}, timeout=600)
+
+        if response.status_code == 200:
+            data = response.json()
+            ways_count = sum(1 for e in data['elements'] if e['type'] == 'way')
+            junctions_count = sum(1 for e in data['elements']
+                                  if e['type'] == 'node' and e.get('tags', {}).get('highway') == 'motorway_junction')
+
+            print(f"   ✅ 成功！")
+            print(f"      橋樑 / 隧道: {ways_count:,}")
+            print(f"      交流道: {junctions_count:,}")
+
+            return data
+        else:
+            print(f"   ❌ 失敗: HTTP {response.status_code}")
+            return None
+
+    except Exception as e:
+        print(f"   ❌ 錯誤: {e}")
+        return None
+
+
+def main():
+    print("=" * 70)
+    print("🌉 橋樑 / 隧道 / 交流道數據下載工具")
+    print("=" * 70)
+
+    datasets = []
+    for region_key in REGIONS.keys():
+        data = download_region_crossings(region_key)
+        if data:
+            datasets.append(data)
+        time.sleep(2)  # 避免API限制
+
+    if not datasets:
+        print("\n❌ 沒有下載到任何數據")
+        return
+
+    merged = merge_data(datasets)
+    output_file = 'crossings_data.json'
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+
+    print(f"\n💾 已保存到: {output_file}（{len(merged['elements']):,} 個元素）")
+    print("\n📝 下一步: 重啟 Flask 應用，/api/route 設定 \"crossing_cost\": \"detour\" 即可使用")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消")
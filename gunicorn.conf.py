@@ -0,0 +1,66 @@
+"""
+gunicorn 設定（生產環境）
+
+  gunicorn -c gunicorn.conf.py wsgi:application
+
+preload_app：master 先載入 wsgi.py（重型模組 + 障礙數據）再 fork，各 worker 以 copy-on-write 共用。
+fork 前呼叫 gc.freeze()，避免 worker 的垃圾回收掃描共用物件時觸發頁面複製。
+
+環境變數：
+  BIND              → 監聽位址（預設 0.0.0.0:8080）
+  WEB_CONCURRENCY   → worker 數（預設 CPU 數，最多 4；多 worker 時請設定 PLAN_CACHE_DIR，
+                      規劃快取、/api/route/jobs 的工作狀態與 /metrics 的數值才能跨 worker 共用）
+  GUNICORN_THREADS  → 每個 worker 的執行緒數（預設 4；串流回應會佔用一個執行緒直到結束）
+  GUNICORN_TIMEOUT  → 單一請求逾時秒數（預設 300，大型同步規劃可能需要數分鐘）
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = True
+chdir = os.path.dirname(os.path.abspath(__file__))  # 障礙數據以相對路徑載入
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    from metrics import REGISTRY
+    REGISTRY.clear_store()  # 上次執行留下的各 worker 指標快照
+
+
+def when_ready(server):
+    from metrics import REGISTRY
+    from plan_jobs import PlanJobQueue
+    from wsgi import PRELOAD_TIMINGS
+    server.log.info("預先載入耗時: " + ", ".join(f"{k} {v:.2f}s" for k, v in PRELOAD_TIMINGS.items()))
+    REGISTRY.flush()  # master 預熱期間的指標（worker fork 後從零開始計數）
+    if workers > 1 and not PlanJobQueue.get_instance().store_dir:
+        # 工作狀態只在提交的 worker 記憶體中，輪詢到其他 worker 會得到 404
+        server.log.warning(f"{workers} 個 worker 但未設定 PLAN_JOB_DIR / PLAN_CACHE_DIR："
+                           "/api/route/jobs 的輪詢只有提交工作的 worker 能回應，請設定共用目錄")
+    if workers > 1 and not REGISTRY.store_dir:
+        # 每次抓取只得到其中一個 worker 的計數器，數值會在抓取之間跳動
+        server.log.warning(f"{workers} 個 worker 但未設定 METRICS_DIR / PLAN_CACHE_DIR："
+                           "/metrics 只反映處理該請求的 worker，請設定共用目錄")
+
+
+def pre_fork(server, worker):
+    # 已載入的物件移到永久世代，worker 的 GC 不再觸碰（維持 copy-on-write 共用）
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from metrics import REGISTRY
+    REGISTRY.after_fork()
+    server.log.info(f"worker {worker.pid} 已啟動（共用 master 預先載入的狀態）")
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Prometheus 格式監控指標（/metrics）
+
+不依賴 prometheus_client：Counter / Histogram 以 dict + lock 實作，
+render() 輸出 Prometheus text exposition format (0.0.4)。
+
+多 worker（gunicorn）：設定 METRICS_DIR（或 PLAN_CACHE_DIR，預設使用其下的 metrics/）後，
+每個進程定期將自己的數值寫入 <pid>.json，/metrics 合計所有進程（同 prometheus_client 的 multiprocess 模式）；
+未設定時只反映處理該請求的進程。
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 延遲直方圖的預設區間（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 各 worker 寫入數值快照的間隔（秒；/metrics 請求時處理的 worker 另外立即寫入）
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1.0))
+
+
+def metrics_dir():
+    """多進程指標目錄：METRICS_DIR，其次 PLAN_CACHE_DIR/metrics；皆未設定時為 None（只輸出本進程）"""
+    if os.environ.get('METRICS_DIR'):
+        return os.environ['METRICS_DIR']
+    if os.environ.get('PLAN_CACHE_DIR'):
+        return os.path.join(os.environ['PLAN_CACHE_DIR'], 'metrics')
+    return None
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不減的計數器"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, items=None):
+        """items: 合計後的 [(key, value)]（多進程）；None 時輸出本進程"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        if items is None:
+            with self._lock:
+                items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """延遲直方圖（累積區間 + sum + count）"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # key -> [各區間計數..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """計時區塊：with HISTOGRAM.time(stage='dbscan'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        state = self._values.get(key)
+        return state[-1] if state else 0
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    @staticmethod
+    def merge(total, state):
+        return list(state) if total is None else [a + b for a, b in zip(total, state)]
+
+    def render(self, items=None):
+        """items: 合計後的 [(key, state)]（多進程）；None 時輸出本進程"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        if items is None:
+            with self._lock:
+                items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = ('le', _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """指標註冊表；collector 在輸出時才讀取（例如快取命中數）"""
+
+    def __init__(self, store_dir=None, flush_seconds=METRICS_FLUSH_SECONDS):
+        self._metrics = []
+        self._caches = {}
+        self._cache_baseline = {}  # fork 時繼承自 master 的快取命中數（master 的快照已包含）
+        self.store_dir = store_dir
+        self.flush_seconds = flush_seconds
+        self._last_written = None
+        self._write_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name, cache):
+        """登記具有 hits / misses 屬性的快取物件"""
+        self._caches[name] = cache
+
+    def _cache_counts(self):
+        counts = {}
+        for name, cache in self._caches.items():
+            base_hits, base_misses = self._cache_baseline.get(name, (0, 0))
+            counts[name] = [cache.hits - base_hits, cache.misses - base_misses]
+        return counts
+
+    # ------------------------------------------------------------------
+    # 多進程（共用目錄）
+    # ------------------------------------------------------------------
+
+    def snapshot(self):
+        """本進程的數值（寫入共用目錄）"""
+        return {
+            'metrics': {metric.name: metric.snapshot() for metric in self._metrics},
+            'caches': self._cache_counts(),
+        }
+
+    def flush(self):
+        """寫入本進程的快照（數值未變時略過）；原子替換，其他進程不會讀到半個檔案"""
+        if not self.store_dir:
+            return
+        with self._write_lock:
+            data = json.dumps(self.snapshot(), ensure_ascii=False, sort_keys=True)
+            if data == self._last_written:
+                return
+            path = os.path.join(self.store_dir, f"{os.getpid()}.json")
+            try:
+                os.makedirs(self.store_dir, exist_ok=True)
+                with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(f"{path}.tmp", path)
+                self._last_written = data
+            except OSError:
+                pass  # 下一次 flush 再試
+
+    def clear_store(self):
+        """移除上次執行留下的快照（gunicorn 啟動時由 master 呼叫）"""
+        if not self.store_dir or not os.path.isdir(self.store_dir):
+            return
+        for entry in os.scandir(self.store_dir):
+            if entry.name.endswith(('.json', '.tmp')):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def after_fork(self):
+        """
+        worker fork 後呼叫：清除繼承自 master 的數值（master 的快照已記錄），並啟動定期寫入的執行緒
+
+        已結束 worker 的快照保留，計數器不會因 worker 重啟而減少。
+        """
+        for metric in self._metrics:
+            metric.reset()
+        self._cache_baseline = {name: (cache.hits, cache.misses) for name, cache in self._caches.items()}
+        self._last_written = None
+        if self.store_dir:
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def _collect(self):
+        """合計共用目錄中所有進程的快照 → ({指標名稱: [(key, value)]}, {快取名稱: [hits, misses]})"""
+        self.flush()
+        totals = {metric.name: {} for metric in self._metrics}
+        caches = {name: [0, 0] for name in self._caches}
+        by_name = {metric.name: metric for metric in self._metrics}
+        for entry in (os.scandir(self.store_dir) if os.path.isdir(self.store_dir) else ()):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            for name, items in stored.get('metrics', {}).items():
+                if name not in by_name:
+                    continue
+                merged = totals[name]
+                for key, value in items:
+                    key = tuple(key)
+                    merged[key] = by_name[name].merge(merged.get(key), value)
+            for name, (hits, misses) in stored.get('caches', {}).items():
+                total = caches.setdefault(name, [0, 0])
+                total[0] += hits
+                total[1] += misses
+        return {name: sorted(merged.items()) for name, merged in totals.items()}, caches
+
+    def render(self):
+        if self.store_dir:
+            totals, caches = self._collect()
+        else:
+            totals, caches = {}, {name: [cache.hits, cache.misses] for name, cache in self._caches.items()}
+
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(totals.get(metric.name)))
+
+        if caches:
+            lines.append("# HELP cache_requests_total 快取查詢次數")
+            lines.append("# TYPE cache_requests_total counter")
+            for name, (hits, misses) in sorted(caches.items()):
+                lines.append(f'cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+            lines.append("# HELP cache_hit_ratio 快取命中率")
+            lines.append("# TYPE cache_hit_ratio gauge")
+            for name, (hits, misses) in sorted(caches.items()):
+                total = hits + misses
+                lines.append(f'cache_hit_ratio{{cache="{name}"}} {_format_value(hits / total if total else 0.0)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry(store_dir=metrics_dir())
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP 請求處理時間', ['endpoint', 'method', 'status']
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    'route_stage_duration_seconds',
+    '路徑規劃各階段耗時（dbscan / noise / split / group_order / inner_order / verification ...）',
+    ['stage']
+)
+STAGE_CACHE = REGISTRY.counter(
+    'route_stage_cache_total', '路徑規劃階段快取結果（hit = 重用, miss = 重算）', ['stage', 'result']
+)
+OBSTACLE_CHECKS = REGISTRY.counter(
+    'obstacle_checks_total', '障礙穿越檢測次數', ['kind', 'result']
+)
+DB_LATENCY = REGISTRY.histogram(
+    'db_query_duration_seconds', '資料庫查詢時間（含連線）', ['query']
+)
+VALHALLA_LATENCY = REGISTRY.histogram(
+    'valhalla_request_duration_seconds', 'Valhalla API 呼叫時間', ['call']
+)
+PLAN_JOBS = REGISTRY.counter(
+    'plan_jobs_total', '背景規劃工作（accepted / rejected = 佇列已滿, done / failed）', ['result']
+)
+WARMUP_LATENCY = REGISTRY.histogram(
+    'warmup_duration_seconds', '啟動預熱各步驟耗時（obstacles / pipeline / solvers / smart_planner）', ['step']
+)
+PRECOMPUTE_GROUPS = REGISTRY.counter(
+    'precompute_groups_total', '預先規劃的 order_group（planned / empty = 無有效座標 / failed）', ['result']
+)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""DBSCAN 鄰域圖快取 - 調整 cluster_radius / min_samples 時免重算鄰域搜尋"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+
+from app_logging import get_logger
+
+logger = get_logger('neighbor_graph_cache')
+
+# 前端 cluster_radius 滑桿上限（km），鄰域圖以此半徑建立一次
+MAX_CLUSTER_RADIUS_KM = 3.0
+
+# 超過此邊數的鄰域圖不快取（避免極密集訂單佔用過多記憶體）
+MAX_GRAPH_EDGES = 20_000_000
+
+
+def metric_space(coords, cluster_radius, metric):
+    """轉換為 DBSCAN 使用的座標空間與 eps（與 /api/route 的換算一致）"""
+    if metric == 'haversine':
+        # Haversine 需要弧度並使用地球半徑 6371 km
+        return np.radians(coords), cluster_radius / 6371.0
+    # Euclidean 或 Manhattan：1 度 ≈ 111 km
+    return coords, cluster_radius / 111.0
+
+
+def dbscan_from_graph(graph, row_ids, eps, min_samples, edge_filter=None):
+    """
+    在最大半徑鄰域圖上直接取出指定 eps 的 DBSCAN 結果（O(邊數)，不需建樹）
+
+    與 sklearn DBSCAN 相同規則：鄰居數含自身；群組依最小核心點索引編號；
+    邊界點歸入相鄰核心點中編號最小的群組。
+
+    Args:
+        graph: CSR 鄰域圖（data 為距離，含自身）
+        row_ids: 每條邊所屬的列索引（與 graph.data 對齊）
+        eps: 鄰域半徑（與 graph 相同單位）
+        min_samples: 最小樣本數
+        edge_filter: edge_filter(rows, cols) → 保留的邊（bool 陣列）；只對 eps 內的邊呼叫一次，
+                     被移除的邊不計入鄰居數、也不連通群組（障礙感知聚類）
+
+    Returns:
+        群組標籤陣列（-1 = 噪聲點）
+    """
+    n = graph.shape[0]
+    within = graph.data <= eps
+    rows = row_ids[within]
+    cols = graph.indices[within]
+    if edge_filter is not None:
+        keep = np.asarray(edge_filter(rows, cols), dtype=bool)
+        rows = rows[keep]
+        cols = cols[keep]
+
+    core = np.bincount(rows, minlength=n) >= min_samples
+    labels = np.full(n, -1, dtype=int)
+    if not core.any():
+        return labels
+
+    # 核心點之間的連通分量 = 群組（邊已按列排序，可直接組成 CSR）
+    core_edges = core[rows] & core[cols]
+    core_cols = cols[core_edges]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[core_edges], minlength=n), out=indptr[1:])
+    adjacency = csr_matrix((np.ones(len(core_cols), dtype=np.int8), core_cols, indptr), shape=(n, n))
+    # 鄰域圖對稱，強連通分量即連通分量（免去轉置與排序）
+    _, components = connected_components(adjacency, directed=True, connection='strong')
+
+    # 依最小核心點索引重新編號（與 sklearn 掃描順序一致）
+    core_indices = np.flatnonzero(core)
+    core_components = components[core_indices]
+    unique_components, first_pos = np.unique(core_components, return_index=True)
+    remap = np.empty(components.max() + 1, dtype=int)
+    remap[unique_components[np.argsort(first_pos)]] = np.arange(len(unique_components))
+    labels[core_indices] = remap[core_components]
+
+    # 邊界點：歸入相鄰核心點中編號最小的群組
+    border_edges = ~core[rows] & core[cols]
+    if border_edges.any():
+        border_labels = np.full(n, np.iinfo(int).max, dtype=int)
+        np.minimum.at(border_labels, rows[border_edges], labels[cols[border_edges]])
+        is_border = border_labels != np.iinfo(int).max
+        labels[is_border] = border_labels[is_border]
+
+    return labels
+
+
+class NeighborGraphCache:
+    """
+    以訂單快照為鍵，快取最大半徑下的稀疏鄰域圖（radius-neighbours graph）
+
+    任何 eps ≤ 最大半徑的 DBSCAN 都能直接在圖上篩選邊取得結果（dbscan_from_graph），
+    不需再次建樹搜尋；結果與直接執行 DBSCAN 完全相同。
+    """
+
+    def __init__(self, max_entries=32, max_radius_km=MAX_CLUSTER_RADIUS_KM):
+        self.max_entries = max_entries
+        self.max_radius_km = max_radius_km
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（所有請求共用快取）"""
+        if not hasattr(NeighborGraphCache, '_instance'):
+            NeighborGraphCache._instance = NeighborGraphCache()
+        return NeighborGraphCache._instance
+
+    @staticmethod
+    def snapshot_key(coords, metric):
+        """訂單快照鍵：座標內容雜湊 + 距離方式（訂單變動即自動失效）"""
+        digest = hashlib.sha1(np.ascontiguousarray(coords, dtype=float).tobytes()).hexdigest()
+        return f"{metric}:{len(coords)}:{digest}"
+
+    def get_graph(self, coords, metric='euclidean'):
+        """
+        取得（必要時建立）最大半徑鄰域圖
+
+        Returns:
+            (graph, row_ids, 是否命中快取)
+        """
+        key = self.snapshot_key(coords, metric)
+
+        with self._lock:
+            entry = self._graphs.get(key)
+            if entry is not None:
+                self._graphs.move_to_end(key)
+                self.hits += 1
+                return entry + (True,)
+            self.misses += 1
+
+        space, max_eps = metric_space(coords, self.max_radius_km, metric)
+        graph = NearestNeighbors(radius=max_eps, metric=metric).fit(space).radius_neighbors_graph(
+            space, mode='distance'
+        )
+        graph.sort_indices()  # 欄索引排序後，篩選出的子圖可直接作為 CSR 使用
+        row_ids = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+        logger.info(f"建立鄰域圖: {len(coords)} 個訂單, 半徑 {self.max_radius_km} km, {graph.nnz:,} 條邊")
+
+        entry = (graph, row_ids)
+        if graph.nnz <= MAX_GRAPH_EDGES:
+            with self._lock:
+                self._graphs[key] = entry
+                while len(self._graphs) > self.max_entries:
+                    self._graphs.popitem(last=False)
+        else:
+            logger.warning(f"鄰域圖過大（{graph.nnz:,} 條邊），不快取")
+
+        return entry + (False,)
+
+    def dbscan_labels(self, coords, cluster_radius, min_samples, metric='euclidean', edge_filter=None):
+        """
+        DBSCAN 聚類（使用快取鄰域圖）
+
+        Args:
+            coords: [[lat, lon], ...] 座標陣列
+            cluster_radius: 鄰域半徑（km）
+            min_samples: 最小樣本數
+            metric: 'euclidean' | 'haversine' | 'manhattan'
+            edge_filter: 移除鄰域圖中的邊（見 dbscan_from_graph）
+
+        Returns:
+            群組標籤陣列（-1 = 噪聲點）
+        """
+        coords = np.asarray(coords, dtype=float)
+        space, eps = metric_space(coords, cluster_radius, metric)
+
+        if cluster_radius > self.max_radius_km:
+            if edge_filter is None:
+                # 超出快取半徑：直接執行 DBSCAN
+                return DBSCAN(eps=eps, min_samples=min_samples, metric=metric).fit_predict(space)
+            # 需要篩選邊：以本次半徑建立鄰域圖（不快取）
+            graph = NearestNeighbors(radius=eps, metric=metric).fit(space).radius_neighbors_graph(
+                space, mode='distance'
+            )
+            graph.sort_indices()
+            row_ids = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+            return dbscan_from_graph(graph, row_ids, eps, min_samples, edge_filter)
+
+        graph, row_ids, _ = self.get_graph(coords, metric)
+        return dbscan_from_graph(graph, row_ids, eps, min_samples, edge_filter)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._graphs.clear()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+分塊、串流的 Overpass 障礙數據下載（直接寫出 OBSTACLE_STORE 打包目錄）
+
+原本的下載腳本（download_obstacles_auto.py、download_combined_regions.py、download_toronto_*.py）
+每個地區一次 600 秒的 Overpass 請求，整份回應讀入記憶體後寫成 JSON，應用程式每次啟動都要重新解析。
+此工具：
+  1. 地區切成 TILE_DEG 見方的分塊，以執行緒池並行下載（OVERPASS_WORKERS，預設 2，Overpass 每個 IP 約 2 個槽位）
+  2. 失敗（逾時、連線錯誤、429 / 5xx、Overpass runtime error）時指數退避重試
+  3. 查詢使用 out geom（way 直接附帶座標，不需保留節點表），回應以串流方式逐個元素解析
+  4. 每個分塊存成小型 .npz（way id + 座標）並記錄於 manifest.json；
+     再次執行時只下載過期（超過 max_age_days）、查詢改變或缺少的分塊
+  5. 所有分塊依 way id 去重後直接寫出打包目錄（obstacle_store.ObstacleStore），detector 以記憶體映射附加
+
+  python obstacle_download.py --region toronto --out /dev/shm/valhalla_obstacles
+  OBSTACLE_STORE=/dev/shm/valhalla_obstacles python app.py
+
+  --json 另外寫出 rivers_data.json / highways_data.json（一般模式、crossing_points.py 使用）
+  環境變數: OVERPASS_URL（可指向自建或測試用的 Overpass 服務）
+"""
+
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+
+from app_logging import get_logger
+from download_combined_regions import REGIONS
+
+logger = get_logger('obstacle_download')
+
+OVERPASS_URL = os.environ.get('OVERPASS_URL', 'http://overpass-api.de/api/interpreter')
+OVERPASS_WORKERS = int(os.environ.get('OVERPASS_WORKERS', 2))
+TILE_DEG = 0.1
+MAX_AGE_DAYS = 30
+MAX_RETRIES = 4
+RETRY_BACKOFF = 2.0
+REQUEST_TIMEOUT = 180
+CHUNK_SIZE = 64 * 1024
+
+# 與原下載腳本相同的篩選條件；relation 只取其成員 way（原腳本以 > 遞迴取得）
+QUERIES = {
+    'rivers': """
+[out:json][timeout:{timeout}];
+(
+  way["waterway"~"^(river|stream|canal)$"]({bbox});
+  rel["waterway"="river"]({bbox});
+  way(r)({bbox});
+);
+out geom qt;
+""",
+    'highways': """
+[out:json][timeout:{timeout}];
+(
+  way["highway"~"^(motorway|trunk|motorway_link)$"]({bbox});
+);
+out geom qt;
+""",
+}
+
+
+class OverpassError(Exception):
+    """Overpass 回應錯誤（可重試）"""
+
+
+def tile_grid(bbox, tile_deg=TILE_DEG):
+    """
+    地區切成分塊
+
+    Args:
+        bbox: {'south', 'west', 'north', 'east'}
+
+    Returns:
+        [(tile_id, (south, west, north, east)), ...]
+    """
+    tiles = []
+    south = bbox['south']
+    while south < bbox['north'] - 1e-9:
+        north = min(south + tile_deg, bbox['north'])
+        west = bbox['west']
+        while west < bbox['east'] - 1e-9:
+            east = min(west + tile_deg, bbox['east'])
+            tiles.append((f"{south:.4f}_{west:.4f}", (south, west, north, east)))
+            west = east
+        south = north
+    return tiles
+
+
+def tile_query(kind, bounds):
+    bbox = ','.join(f"{v:.6f}" for v in bounds)
+    return QUERIES[kind].format(bbox=bbox, timeout=REQUEST_TIMEOUT)
+
+
+def iter_elements(chunks):
+    """
+    串流解析 Overpass JSON：逐個產出 elements 陣列中的元素（不將整份回應讀入記憶體）
+
+    Args:
+        chunks: bytes 區塊的迭代器（response.iter_content）
+
+    Raises:
+        OverpassError: 回應不完整，或 elements 之後帶有 runtime error 的 remark（Overpass 逾時仍回傳 200）
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    state = 'header'  # header → elements → trailer
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if state == 'header':
+            pos = buffer.find('"elements"')
+            bracket = buffer.find('[', pos) if pos >= 0 else -1
+            if bracket < 0:
+                continue
+            buffer = buffer[bracket + 1:]
+            state = 'elements'
+        if state == 'elements':
+            while True:
+                buffer = buffer.lstrip(' \t\r\n,')
+                if not buffer:
+                    break
+                if buffer[0] == ']':
+                    buffer = buffer[1:]
+                    state = 'trailer'
+                    break
+                try:
+                    element, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break  # 元素不完整，等待下一個區塊
+                yield element
+                buffer = buffer[end:]
+        if state == 'trailer' and len(buffer) > 1_000_000:
+            buffer = buffer[-1_000_000:]
+    buffer += utf8.decode(b'', final=True)
+    if state != 'trailer':
+        raise OverpassError('回應不完整（elements 未結束）')
+    if '"remark"' in buffer and 'error' in buffer:
+        raise OverpassError(f"Overpass 錯誤: {buffer.strip()[:200]}")
+
+
+def fetch_tile(session, kind, bounds, url=None, retries=None, backoff=None):
+    """
+    下載單個分塊（失敗時指數退避重試）
+
+    Returns:
+        (way_ids, offsets, coords) 陣列（coords 為 (n, 2) [lon, lat]），嘗試次數
+    """
+    query = tile_query(kind, bounds)
+    retries = MAX_RETRIES if retries is None else retries
+    backoff = RETRY_BACKOFF if backoff is None else backoff
+    for attempt in range(1, retries + 2):
+        way_ids, lengths, coords = [], [], []
+        try:
+            with session.post(url or OVERPASS_URL, data={'data': query}, stream=True,
+                              timeout=REQUEST_TIMEOUT + 30) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise OverpassError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                for element in iter_elements(response.iter_content(CHUNK_SIZE)):
+                    geometry = element.get('geometry') if element.get('type') == 'way' else None
+                    points = [(p['lon'], p['lat']) for p in geometry or () if p]
+                    if len(points) >= 2:
+                        way_ids.append(element['id'])
+                        lengths.append(len(points))
+                        coords.extend(points)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(lengths)
+            return (np.array(way_ids, dtype=np.int64), offsets,
+                    np.array(coords, dtype=np.float64).reshape(-1, 2)), attempt
+        except (OverpassError, requests.ConnectionError, requests.Timeout) as e:
+            if attempt > retries:
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(f"{kind} {bounds} 下載失敗（{e}），{delay:.1f}s 後重試（{attempt}/{retries}）")
+            time.sleep(delay)
+
+
+class TileCache:
+    """分塊快取目錄：<kind>/<tile_id>.npz + manifest.json"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {'tiles': {}}
+
+    def path(self, kind, tile_id):
+        return os.path.join(self.directory, kind, f"{tile_id}.npz")
+
+    @staticmethod
+    def key(kind, tile_id):
+        return f"{kind}/{tile_id}"
+
+    def is_stale(self, kind, tile_id, bounds, max_age_days=MAX_AGE_DAYS, now=None):
+        """缺少、過期或查詢條件改變的分塊需要重新下載"""
+        entry = self.manifest['tiles'].get(self.key(kind, tile_id))
+        if entry is None or not os.path.exists(self.path(kind, tile_id)):
+            return True
+        if entry.get('query') != query_hash(kind, bounds):
+            return True
+        return (now or time.time()) - entry['fetched_at'] > max_age_days * 86400
+
+    def save(self, kind, tile_id, bounds, arrays, attempts, elapsed):
+        """寫入分塊（先寫暫存檔再替換）並更新 manifest"""
+        way_ids, offsets, coords = arrays
+        path = self.path(kind, tile_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = f"{path}.tmp.npz"
+        np.savez(staging, way_ids=way_ids, offsets=offsets, coords=coords)
+        os.replace(staging, path)
+        with self._lock:
+            self.manifest['tiles'][self.key(kind, tile_id)] = {
+                'bounds': list(bounds), 'query': query_hash(kind, bounds), 'fetched_at': time.time(),
+                'ways': int(len(way_ids)), 'vertices': int(len(coords)), 'attempts': attempts,
+                'seconds': round(elapsed, 3),
+            }
+            self._write_manifest()
+
+    def _write_manifest(self):
+        staging = f"{self.manifest_path}.tmp"
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(staging, self.manifest_path)
+
+    def load(self, kind, tile_id):
+        with np.load(self.path(kind, tile_id)) as data:
+            return data['way_ids'], data['offsets'], data['coords']
+
+    def version(self, keys):
+        """數據版本：相關分塊的下載時間與查詢的雜湊"""
+        digest = hashlib.sha1()
+        for key in sorted(keys):
+            entry = self.manifest['tiles'][key]
+            digest.update(f"{key}:{entry['query']}:{entry['fetched_at']};".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+
+def query_hash(kind, bounds):
+    return hashlib.sha1(tile_query(kind, bounds).encode('utf-8')).hexdigest()[:12]
+
+
+def merge_tiles(cache, kind, tile_ids):
+    """合併分塊並以 way id 去重（跨越分塊邊界的 way 會出現在多個分塊）→ [[(lon, lat), ...], ...]"""
+    seen = set()
+    lines = []
+    for tile_id in tile_ids:
+        way_ids, offsets, coords = cache.load(kind, tile_id)
+        for i, way_id in enumerate(way_ids.tolist()):
+            if way_id not in seen:
+                seen.add(way_id)
+                lines.append([tuple(p) for p in coords[offsets[i]:offsets[i + 1]].tolist()])
+    return lines
+
+
+def write_overpass_json(filename, lines):
+    """寫出與原下載腳本相容的 Overpass JSON（節點以流水號編號，逐條寫出）"""
+    staging = f"{filename}.tmp"
+    node_id = 1
+    with open(staging, 'w', encoding='utf-8') as f:
+        f.write('{"version": 0.6, "generator": "obstacle_download.py", "elements": [')
+        first = True
+        for way_id, line in enumerate(lines, 1):
+            node_ids = []
+            for lon, lat in line:
+                f.write(('' if first else ',') + json.dumps({'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon}))
+                first = False
+                node_ids.append(node_id)
+                node_id += 1
+            f.write(',' + json.dumps({'type': 'way', 'id': way_id, 'nodes': node_ids}))
+        f.write(']}')
+    os.replace(staging, filename)
+
+
+def download(bbox, out, cache_dir=None, tile_deg=TILE_DEG, workers=None, max_age_days=MAX_AGE_DAYS,
+             force=False, url=None, retries=None, json_dir=None, kinds=('rivers', 'highways'), simplify_m=None):
+    """
+    下載（只更新過期分塊）並寫出打包目錄
+
+    Args:
+        bbox: {'south', 'west', 'north', 'east'}
+        out: OBSTACLE_STORE 打包目錄
+        cache_dir: 分塊快取目錄（預設 <out>.tiles）
+        retries: 每個分塊的重試次數（預設 MAX_RETRIES）
+        json_dir: 另外寫出 rivers_data.json / highways_data.json 的目錄（None 不寫）
+        simplify_m: 簡化容差（公尺；None 使用 OBSTACLE_SIMPLIFY_M）
+
+    Returns:
+        報告 {'tiles', 'fetched', 'fresh', 'failed', 'attempts', 'data_version', 'lines', 'seconds'}
+        （沒有分塊更新且打包目錄已是最新時不重新打包，沒有 'lines'）
+    """
+    from obstacle_simplify import simplify_tolerance, versioned
+    from obstacle_store import ObstacleStore
+
+    start = time.perf_counter()
+    cache = TileCache(cache_dir or f"{os.path.abspath(out).rstrip(os.sep)}.tiles")
+    tiles = tile_grid(bbox, tile_deg)
+    jobs = [(kind, tile_id, bounds) for kind in kinds for tile_id, bounds in tiles
+            if force or cache.is_stale(kind, tile_id, bounds, max_age_days)]
+    logger.info(f"{len(tiles)} 個分塊 × {len(kinds)} 類：{len(jobs)} 個需要下載，"
+                f"{len(tiles) * len(kinds) - len(jobs)} 個仍有效")
+
+    failed, attempts = [], 0
+    session = requests.Session()
+    with ThreadPoolExecutor(max_workers=workers or OVERPASS_WORKERS) as pool:
+        futures = {pool.submit(fetch_tile, session, kind, bounds, url, retries): (kind, tile_id, bounds, time.perf_counter())
+                   for kind, tile_id, bounds in jobs}
+        for future in as_completed(futures):
+            kind, tile_id, bounds, submitted = futures[future]
+            try:
+                arrays, tries = future.result()
+            except Exception as e:
+                logger.error(f"{kind} {tile_id} 下載失敗: {e}")
+                failed.append(cache.key(kind, tile_id))
+                continue
+            attempts += tries
+            cache.save(kind, tile_id, bounds, arrays, tries, time.perf_counter() - submitted)
+
+    report = {'tiles': len(tiles) * len(kinds), 'fetched': len(jobs) - len(failed),
+              'fresh': len(tiles) * len(kinds) - len(jobs), 'failed': failed, 'attempts': attempts}
+    if failed:
+        # 部分分塊失敗時不覆寫打包目錄（避免寫出缺漏的數據）；已下載的分塊保留，下次只補下載失敗的分塊
+        report['seconds'] = round(time.perf_counter() - start, 2)
+        return report
+
+    simplify_m = simplify_tolerance(simplify_m)
+    data_version = versioned(
+        'overpass-' + cache.version([cache.key(kind, tile_id) for kind in kinds for tile_id, _ in tiles]), simplify_m)
+    report['data_version'] = data_version
+    if not jobs and not json_dir and os.path.exists(os.path.join(out, 'meta.json')):
+        if ObstacleStore.open(out).data_version == data_version:
+            report['seconds'] = round(time.perf_counter() - start, 2)
+            return report  # 沒有分塊更新，打包目錄已是最新
+
+    lines = {kind: merge_tiles(cache, kind, [tile_id for tile_id, _ in tiles]) for kind in kinds}
+    sources = {'download': {'bbox': bbox, 'tile_deg': tile_deg, 'tiles': cache.directory}}
+    ObstacleStore.build_from_lines(out, lines, data_version, sources, simplify_m)
+    if json_dir:
+        for kind in kinds:
+            write_overpass_json(os.path.join(json_dir, f"{kind}_data.json"), lines[kind])
+    report.update({'lines': {kind: len(kind_lines) for kind, kind_lines in lines.items()},
+                   'seconds': round(time.perf_counter() - start, 2)})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分塊下載 Overpass 障礙數據並寫出打包目錄')
+    parser.add_argument('--region', choices=sorted(REGIONS), help='預定義地區')
+    parser.add_argument('--bbox', help='自訂範圍 south,west,north,east')
+    parser.add_argument('--out', required=True, help='打包目錄（OBSTACLE_STORE，建議 /dev/shm/...）')
+    parser.add_argument('--cache', help='分塊快取目錄（預設 <out>.tiles）')
+    parser.add_argument('--tile', type=float, default=TILE_DEG, help='分塊大小（度）')
+    parser.add_argument('--workers', type=int, default=OVERPASS_WORKERS, help='並行下載數')
+    parser.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS, help='分塊有效天數')
+    parser.add_argument('--force', action='store_true', help='忽略快取，全部重新下載')
+    parser.add_argument('--json', metavar='DIR', help='另外寫出 rivers_data.json / highways_data.json')
+    args = parser.parse_args(argv)
+
+    if args.bbox:
+        south, west, north, east = (float(v) for v in args.bbox.split(','))
+        bbox = {'south': south, 'west': west, 'north': north, 'east': east}
+    elif args.region:
+        bbox = REGIONS[args.region]['bbox']
+    else:
+        parser.error('需要 --region 或 --bbox')
+
+    report = download(bbox, args.out, cache_dir=args.cache, tile_deg=args.tile, workers=args.workers,
+                      max_age_days=args.max_age_days, force=args.force, json_dir=args.json)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
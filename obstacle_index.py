@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+障礙穿越檢測的合併 + 預備幾何索引
+
+原本每次檢測先以 STRtree 取得候選，再於 Python 迴圈中逐條 LineString.intersects。
+此索引將空間上相鄰的線（STR 排序：先依 x 分條，再依 y 排序）每 group_size 條合併為一個
+MultiLineString，並以 shapely.prepare 預先建立內部索引；每次檢測只需：
+  1. STRtree 查詢候選群組（數量約為原本的 1 / group_size）
+  2. 一次向量化 shapely.intersects(候選群組, 連線)（預備幾何，C 層完成，不經 Python 迴圈）
+
+  OBSTACLE_GROUP_SIZE → 每個群組的線數（預設 32）
+  OBSTACLE_PREPARED=0 → 停用（回到逐條比對）
+"""
+
+import os
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+OBSTACLE_GROUP_SIZE = int(os.environ.get('OBSTACLE_GROUP_SIZE', 32))
+
+
+def group_lines(lines, group_size=OBSTACLE_GROUP_SIZE):
+    """
+    STR 排序分組（Sort-Tile-Recursive，與 STRtree 葉節點的分組方式相同）
+
+    Returns:
+        每個群組的線索引陣列列表
+    """
+    n = len(lines)
+    if n == 0:
+        return []
+    centers = shapely.get_coordinates(shapely.centroid(lines))
+    slabs = int(np.ceil(np.sqrt(max(1, n // group_size))))
+    per_slab = int(np.ceil(n / slabs))
+    by_x = np.argsort(centers[:, 0], kind='stable')
+    groups = []
+    for s in range(slabs):
+        slab = by_x[s * per_slab:(s + 1) * per_slab]
+        slab = slab[np.argsort(centers[slab, 1], kind='stable')]
+        groups.extend(slab[i:i + group_size] for i in range(0, len(slab), group_size))
+    return groups
+
+
+class PreparedObstacleIndex:
+    """合併後的預備幾何 + STRtree（唯讀，可多執行緒共用）"""
+
+    def __init__(self, lines, group_size=OBSTACLE_GROUP_SIZE):
+        # 只保留線（裁切後的 MultiLineString 展開；外框上的單點接觸不影響內部連線）
+        parts = shapely.get_parts(np.asarray(lines, dtype=object)) if len(lines) else np.empty(0, dtype=object)
+        self.lines = parts[shapely.get_type_id(parts) == 1] if len(parts) else parts
+        self.groups = group_lines(self.lines, group_size)
+        self.features = np.array([shapely.multilinestrings(self.lines[group]) for group in self.groups],
+                                 dtype=object)
+        shapely.prepare(self.features)
+        self.tree = STRtree(self.features) if len(self.features) else None
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def feature_count(self):
+        return len(self.features)
+
+    def candidates(self, line):
+        """外框與連線重疊的群組編號"""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64)
+        return self.tree.query(line)
+
+    def intersects_any(self, ids, line):
+        """候選群組中是否有任一條線與連線相交（一次向量化呼叫）"""
+        return bool(len(ids)) and bool(shapely.intersects(self.features[ids], line).any())
+
+    def crosses(self, line):
+        """連線是否與任一條線相交（含端點接觸，同 LineString.intersects）"""
+        return self.intersects_any(self.candidates(line), line)
+
+    def crosses_many(self, lines):
+        """
+        多條連線的批次檢測（一次 STRtree 批次查詢 + 一次向量化 intersects）
+
+        Returns:
+            bool 陣列（與 lines 對齊）
+        """
+        lines = np.asarray(lines, dtype=object)
+        result = np.zeros(len(lines), dtype=bool)
+        if self.tree is None or not len(lines):
+            return result
+        line_idx, feature_idx = self.tree.query(lines)
+        hits = shapely.intersects(self.features[feature_idx], lines[line_idx])
+        result[line_idx[hits]] = True
+        return result
+
+
+def prepared_enabled():
+    return os.environ.get('OBSTACLE_PREPARED', '1') != '0'
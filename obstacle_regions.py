@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+障礙區域標記：以面（polygonize）+ 淨空距離判斷穿越，大部分連線不需幾何運算
+
+研究範圍（外框）被河流 / 高速公路切割成多個面，每個點預先計算：
+  label     → 所在的面編號（落在邊上或過於接近時為 -1）
+  clearance → 與最近障礙線的距離
+兩點之間的連線：
+  1. 兩點都有面編號且不同 → 必定穿越（從一個面到另一個面只能經過障礙邊；外框邊不是兩面的共用邊）
+  2. 兩點距離 < clearance_a + clearance_b → 必定不穿越（連線完全落在兩個無障礙的圓內）
+  3. 其他（同一面但靠近障礙、斷頭河流附近）→ 精確幾何檢測
+兩條規則都是嚴格成立的結論，結果與精確檢測完全一致；
+每個點只需計算一次，n × n 穿越矩陣的大部分元素以陣列比較完成。
+
+ObstacleView（river_detection.py）在外框內建立 RegionMap，同一次規劃中重複出現的端點只標記一次。
+
+  OBSTACLE_REGIONS=0 → 停用（每對連線都做精確檢測）
+"""
+
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+from shapely.strtree import STRtree
+
+from app_logging import get_logger
+
+logger = get_logger('obstacle_regions')
+
+# 與障礙距離小於此值（度）的點不使用面編號（避免 polygonize 節點化的浮點誤差）
+LABEL_EPSILON = 1e-9
+
+
+class RegionMap:
+    """外框內的障礙面與淨空距離（唯讀）"""
+
+    def __init__(self, lines, bounds):
+        """
+        Args:
+            lines: 已裁切至外框的障礙線（LineString / MultiLineString）
+            bounds: (min_lon, min_lat, max_lon, max_lat)
+        """
+        self.bounds = bounds
+        lines = shapely.get_parts(np.asarray(lines, dtype=object)) if len(lines) else np.empty(0, dtype=object)
+        self.lines = lines[shapely.get_type_id(lines) == 1] if len(lines) else lines
+        self.obstacle_tree = STRtree(self.lines) if len(self.lines) else None
+
+        # 障礙線 + 外框邊界節點化後組成面（斷頭的河流不會形成面，由淨空距離 / 精確檢測處理）
+        edges = np.concatenate([self.lines, [box(*bounds).boundary]])
+        self.faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(shapely.unary_union(edges))))
+        shapely.prepare(self.faces)
+        self.face_tree = STRtree(self.faces)
+
+    @property
+    def face_count(self):
+        return len(self.faces)
+
+    def classify(self, lats, lons):
+        """
+        Returns:
+            (labels, clearance)：各點的面編號（-1 = 不確定）與最近障礙距離（度）
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        points = shapely.points(lons, lats)
+        n = len(points)
+
+        clearance = np.full(n, np.inf)
+        if self.obstacle_tree is not None and n:
+            (point_idx, _), distances = self.obstacle_tree.query_nearest(points, return_distance=True, all_matches=False)
+            clearance[point_idx] = distances
+
+        labels = np.full(n, -1, dtype=np.int64)
+        if n:
+            point_idx, face_idx = self.face_tree.query(points, predicate='intersects')
+            counts = np.bincount(point_idx, minlength=n)
+            unique = counts[point_idx] == 1  # 落在邊上（同時屬於兩個面）的點不標記
+            labels[point_idx[unique]] = face_idx[unique]
+        labels[clearance < LABEL_EPSILON] = -1
+        min_x, min_y, max_x, max_y = self.bounds
+        outside = (lons < min_x) | (lons > max_x) | (lats < min_y) | (lats > max_y)
+        labels[outside] = -1
+        clearance[outside] = 0.0
+        return labels, clearance
+
+    @staticmethod
+    def decide(label_a, clear_a, label_b, clear_b, distance):
+        """單對連線：True / False，無法判斷時 None（需精確檢測）"""
+        if label_a >= 0 and label_b >= 0 and label_a != label_b:
+            return True
+        if distance < clear_a + clear_b:
+            return False
+        return None
+
+    def crossing_matrix(self, lats, lons, exact=None):
+        """
+        n × n 穿越矩陣
+
+        Args:
+            exact: exact(i, j) → bool，無法以面 / 淨空判斷的配對呼叫（None 時該配對標記為 True，保守估計）
+
+        Returns:
+            (bool 矩陣, 統計 {'label': n, 'clearance': n, 'exact': n})
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        labels, clearance = self.classify(lats, lons)
+        labelled = labels >= 0
+        by_label = labelled[:, None] & labelled[None, :] & (labels[:, None] != labels[None, :])
+        distance = np.hypot(lons[:, None] - lons[None, :], lats[:, None] - lats[None, :])
+        by_clearance = ~by_label & (distance < clearance[:, None] + clearance[None, :])
+        undecided = ~by_label & ~by_clearance
+        np.fill_diagonal(undecided, False)
+
+        matrix = by_label.copy()
+        rows, cols = np.nonzero(np.triu(undecided, 1))
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            matrix[i, j] = matrix[j, i] = True if exact is None else bool(exact(i, j))
+
+        n_pairs = len(lats) * (len(lats) - 1) // 2
+        stats = {
+            'label': int(np.triu(by_label, 1).sum()),
+            'clearance': int(n_pairs - np.triu(by_label, 1).sum() - len(rows)),
+            'exact': int(len(rows)),
+        }
+        return matrix, stats
+
+
+def regions_enabled():
+    return os.environ.get('OBSTACLE_REGIONS', '1') != '0'
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+障礙線段載入時簡化（合併相連的 way + 保持拓撲的 Douglas-Peucker 簡化）
+
+OSM 的河流 / 高速公路 way 頂點遠多於穿越檢測所需；LineString.intersects 的成本隨頂點數增加，
+長線的外框也讓 STRtree 的候選變多。載入時依序：
+  1. 合併：首尾相接的 way 合併為一條線（shapely.line_merge，接點不再被迫保留）
+  2. 簡化：shapely.simplify(preserve_topology=True)，容差以公尺設定（換算為緯度方向的度數，經度方向更保守）
+  3. 切段：每段最多 MAX_PIECE_VERTICES 個頂點，維持 STRtree 外框的選擇性
+
+容差內的保證：被移除的頂點與簡化後線段的距離都在容差內，原線段與簡化線段之間的區域位於容差範圍內；
+連線兩端與簡化線的距離都大於容差時，真正跨到另一側（奇數次穿越）的連線一定仍被檢測到，
+只有在容差寬度內進出同一個彎曲（偶數次穿越）的連線可能改判為未穿越。
+
+  OBSTACLE_SIMPLIFY_M → 容差（公尺，預設 0 = 不簡化；建議 5，小於訂單座標誤差）
+
+  python obstacle_simplify.py rivers_data.json --tolerance 5   → 頂點數與檢測吞吐量報告
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+
+from app_logging import get_logger
+
+logger = get_logger('obstacle_simplify')
+
+OBSTACLE_SIMPLIFY_M = float(os.environ.get('OBSTACLE_SIMPLIFY_M', 0))
+MAX_PIECE_VERTICES = 64
+METERS_PER_DEGREE = 111320.0
+
+
+def simplify_tolerance(tolerance_m=None):
+    """簡化容差（公尺）：明確指定時使用指定值，否則使用 OBSTACLE_SIMPLIFY_M（呼叫時讀取）"""
+    return OBSTACLE_SIMPLIFY_M if tolerance_m is None else float(tolerance_m)
+
+
+def versioned(version, tolerance_m=None):
+    """數據版本加上簡化容差（容差變更時規劃快取與打包目錄失效）"""
+    tolerance_m = simplify_tolerance(tolerance_m)
+    return f"{version}-s{tolerance_m:g}" if tolerance_m > 0 else version
+
+
+def obstacle_data_version(*filenames, tolerance_m=None):
+    """障礙數據版本（數據檔 + 簡化容差；任一改變時規劃快取與打包目錄失效）"""
+    from river_detection import data_files_version
+
+    return versioned(data_files_version(*filenames), tolerance_m)
+
+
+def _split(coords, max_vertices):
+    """頂點陣列切成每段最多 max_vertices 個頂點（相鄰段共用端點）"""
+    if len(coords) <= max_vertices:
+        return [coords]
+    step = max_vertices - 1
+    return [coords[i:i + max_vertices] for i in range(0, len(coords) - 1, step)]
+
+
+def simplify_lines(lines, tolerance_m, max_vertices=MAX_PIECE_VERTICES):
+    """
+    合併 + 簡化 + 切段
+
+    Args:
+        lines: LineString 列表
+        tolerance_m: 容差（公尺）
+
+    Returns:
+        (LineString 列表, 報告 {lines, vertices: [前, 後], merged_lines, tolerance_m, seconds})
+    """
+    start = time.perf_counter()
+    lines = np.asarray(lines, dtype=object)
+    vertices_before = int(shapely.get_num_coordinates(lines).sum()) if len(lines) else 0
+    if not len(lines):
+        return [], {'lines': [0, 0], 'vertices': [0, 0], 'merged_lines': 0, 'tolerance_m': tolerance_m,
+                    'seconds': 0.0}
+
+    merged = shapely.get_parts(shapely.line_merge(shapely.multilinestrings(lines)))
+    simplified = shapely.simplify(merged, tolerance_m / METERS_PER_DEGREE, preserve_topology=True)
+    simplified = simplified[~shapely.is_empty(simplified)]
+
+    result = []
+    for line in shapely.get_parts(simplified):
+        coords = shapely.get_coordinates(line)
+        if len(coords) >= 2:
+            result.extend(LineString(piece) for piece in _split(coords, max_vertices))
+
+    report = {
+        'lines': [len(lines), len(result)],
+        'vertices': [vertices_before, int(sum(len(line.coords) for line in result))],
+        'merged_lines': len(merged),
+        'tolerance_m': tolerance_m,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+    return result, report
+
+
+def _crosses(tree, lines, query):
+    for idx in tree.query(query):
+        if query.intersects(lines[idx]):
+            return True
+    return False
+
+
+def crossing_throughput(original, simplified, queries):
+    """
+    比較簡化前後的穿越檢測（STRtree + intersects，與 ObstacleDetector 相同）
+
+    Args:
+        queries: [(lat1, lon1, lat2, lon2), ...]
+
+    Returns:
+        {'checks_per_second': [前, 後], 'speedup', 'crossings': [前, 後], 'lost', 'added'}
+    """
+    from shapely.strtree import STRtree
+
+    segments = [LineString([(lon1, lat1), (lon2, lat2)]) for lat1, lon1, lat2, lon2 in queries]
+    results, rates = [], []
+    for lines in (original, simplified):
+        tree = STRtree(lines)
+        started = time.perf_counter()
+        results.append([_crosses(tree, lines, segment) for segment in segments])
+        rates.append(len(segments) / max(time.perf_counter() - started, 1e-9))
+    before, after = results
+    return {
+        'checks_per_second': [round(rate) for rate in rates],
+        'speedup': round(rates[1] / rates[0], 2),
+        'crossings': [sum(before), sum(after)],
+        'lost': sum(1 for b, a in zip(before, after) if b and not a),
+        'added': sum(1 for b, a in zip(before, after) if a and not b),
+    }
+
+
+def random_queries(lines, count, seed=0, max_length=0.02):
+    """在障礙外框內隨機產生訂單連線（長度最多 max_length 度）"""
+    rng = random.Random(seed)
+    min_x, min_y, max_x, max_y = shapely.total_bounds(np.asarray(lines, dtype=object))
+    queries = []
+    for _ in range(count):
+        lat, lon = rng.uniform(min_y, max_y), rng.uniform(min_x, max_x)
+        queries.append((lat, lon, lat + rng.uniform(-max_length, max_length), lon + rng.uniform(-max_length, max_length)))
+    return queries
+
+
+def main(argv=None):
+    from obstacle_store import read_overpass_lines
+
+    parser = argparse.ArgumentParser(description='障礙線段簡化報告（頂點數、檢測吞吐量）')
+    parser.add_argument('filename', help='Overpass JSON（rivers_data.json / highways_data.json）')
+    parser.add_argument('--tolerance', type=float, default=OBSTACLE_SIMPLIFY_M or 5.0, help='容差（公尺）')
+    parser.add_argument('--queries', type=int, default=5000, help='測試連線數')
+    args = parser.parse_args(argv)
+
+    original = [LineString(coords) for coords in read_overpass_lines(args.filename)]
+    simplified, report = simplify_lines(original, args.tolerance)
+    report['throughput'] = crossing_throughput(original, simplified, random_queries(original, args.queries))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
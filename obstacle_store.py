@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+共用記憶體障礙數據（多進程共用同一份河流 / 高速公路幾何）
+
+一般模式下每個進程各自解析 JSON 並建立 LineString + STRtree，記憶體隨 worker 數倍增。
+此模式將障礙數據打包為 numpy 陣列並存成 .npy 檔，各進程以 np.load(mmap_mode='r')
+附加（唯讀記憶體映射，由作業系統頁面快取共用），不需解析也不需建立索引：
+  <kind>_coords.npy        → 所有線段頂點 (n_points, 2) [lon, lat]
+  <kind>_offsets.npy       → 每條線的頂點起點 (n_lines + 1)
+  <kind>_segments.npy      → 每個線段的起點頂點索引（線段 = coords[i] → coords[i + 1]）
+  <kind>_cell_offsets.npy  → 網格索引（CSR）：每個網格的線段範圍
+  <kind>_cell_items.npy    → 網格索引（CSR）：網格內的線段編號
+  meta.json                → 網格參數、數據版本
+
+使用方式：
+  python obstacle_store.py build --out /dev/shm/valhalla_obstacles   # /dev/shm 即為共用記憶體
+  OBSTACLE_STORE=/dev/shm/valhalla_obstacles python app.py          # 目錄不存在或過期時自動建立
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from app_logging import get_logger
+
+logger = get_logger('obstacle_store')
+
+STORE_FORMAT = 1
+KINDS = ('rivers', 'highways')
+ARRAYS = ('coords', 'offsets', 'segments', 'cell_offsets', 'cell_items')
+
+# 網格最多 1024 × 1024；查詢範圍超過此網格數時改為檢查全部線段
+MAX_GRID_SIDE = 1024
+MAX_QUERY_CELLS = 256
+
+
+def read_overpass_lines(filename):
+    """讀取 Overpass JSON 的 way → [[(lon, lat), ...], ...]（與 ObstacleDetector 相同規則）"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    nodes = {e['id']: (e['lon'], e['lat']) for e in data['elements'] if e['type'] == 'node'}
+    lines = []
+    for element in data['elements']:
+        if element['type'] == 'way' and 'nodes' in element:
+            coords = [nodes[node_id] for node_id in element['nodes'] if node_id in nodes]
+            if len(coords) >= 2:
+                lines.append(coords)
+    return lines
+
+
+def pack_lines(lines):
+    """
+    線列表 → 打包陣列 + 網格索引
+
+    Returns:
+        ({陣列名稱: ndarray}, 網格參數)
+    """
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in lines])
+    coords = np.array([p for line in lines for p in line], dtype=np.float64).reshape(-1, 2)
+    # 每條線的最後一個頂點不是線段起點
+    is_start = np.ones(len(coords), dtype=bool)
+    is_start[offsets[1:] - 1] = False
+    segments = np.flatnonzero(is_start).astype(np.int64)
+
+    if len(segments) == 0:
+        grid = {'min_x': 0.0, 'min_y': 0.0, 'cell_w': 1.0, 'cell_h': 1.0, 'nx': 1, 'ny': 1}
+        return {
+            'coords': coords, 'offsets': offsets, 'segments': segments,
+            'cell_offsets': np.zeros(2, dtype=np.int64), 'cell_items': np.zeros(0, dtype=np.int64),
+        }, grid
+
+    a, b = coords[segments], coords[segments + 1]
+    seg_min, seg_max = np.minimum(a, b), np.maximum(a, b)
+    min_x, min_y = seg_min.min(axis=0)
+    max_x, max_y = seg_max.max(axis=0)
+    width, height = max(max_x - min_x, 1e-9), max(max_y - min_y, 1e-9)
+
+    # 網格數約為線段數的一半，依外框長寬比分配
+    target_cells = max(1, len(segments) // 2)
+    nx = int(min(MAX_GRID_SIDE, max(1, round(math.sqrt(target_cells * width / height)))))
+    ny = int(min(MAX_GRID_SIDE, max(1, round(target_cells / nx))))
+    grid = {'min_x': float(min_x), 'min_y': float(min_y),
+            'cell_w': width / nx, 'cell_h': height / ny, 'nx': nx, 'ny': ny}
+
+    ix0, iy0 = _cell_index(grid, seg_min[:, 0], seg_min[:, 1])
+    ix1, iy1 = _cell_index(grid, seg_max[:, 0], seg_max[:, 1])
+    span_x = ix1 - ix0 + 1
+    counts = span_x * (iy1 - iy0 + 1)
+
+    # 展開每個線段覆蓋的所有網格（向量化），再依網格排序成 CSR
+    seg_ids = np.repeat(np.arange(len(segments)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    span_rep = np.repeat(span_x, counts)
+    cells = (np.repeat(iy0, counts) + local // span_rep) * nx + np.repeat(ix0, counts) + local % span_rep
+    order = np.argsort(cells, kind='stable')
+    cell_offsets = np.zeros(nx * ny + 1, dtype=np.int64)
+    cell_offsets[1:] = np.cumsum(np.bincount(cells, minlength=nx * ny))
+
+    return {
+        'coords': coords, 'offsets': offsets, 'segments': segments,
+        'cell_offsets': cell_offsets, 'cell_items': seg_ids[order].astype(np.int64),
+    }, grid
+
+
+def _cell_index(grid, x, y):
+    ix = np.clip(np.floor((np.asarray(x) - grid['min_x']) / grid['cell_w']), 0, grid['nx'] - 1).astype(np.int64)
+    iy = np.clip(np.floor((np.asarray(y) - grid['min_y']) / grid['cell_h']), 0, grid['ny'] - 1).astype(np.int64)
+    return ix, iy
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def segments_intersect(x1, y1, x2, y2, a, b):
+    """
+    線段 (x1, y1)-(x2, y2) 與多個線段 a[i]-b[i] 是否相交（含端點接觸，同 shapely intersects）
+
+    Returns:
+        bool 陣列
+    """
+    ax, ay, bx, by = a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+    o1 = _orientation(x1, y1, x2, y2, ax, ay)
+    o2 = _orientation(x1, y1, x2, y2, bx, by)
+    o3 = _orientation(ax, ay, bx, by, x1, y1)
+    o4 = _orientation(ax, ay, bx, by, x2, y2)
+    hit = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+    # 共線時另外檢查外框是否重疊
+    collinear = (o1 == 0) & (o2 == 0)
+    if collinear.any():
+        overlap = ((np.minimum(ax, bx) <= max(x1, x2)) & (np.maximum(ax, bx) >= min(x1, x2)) &
+                   (np.minimum(ay, by) <= max(y1, y2)) & (np.maximum(ay, by) >= min(y1, y2)))
+        hit &= ~collinear | overlap
+    return hit
+
+
+class PackedObstacles:
+    """單一類別障礙（唯讀陣列，可為記憶體映射）"""
+
+    def __init__(self, arrays, grid):
+        # np.asarray：memmap 子類別的索引開銷較大，改用共用同一塊映射記憶體的一般 ndarray 視圖
+        self.coords = np.asarray(arrays['coords'])
+        self.offsets = np.asarray(arrays['offsets'])
+        self.segments = np.asarray(arrays['segments'])
+        self.cell_offsets = np.asarray(arrays['cell_offsets'])
+        self.cell_items = np.asarray(arrays['cell_items'])
+        self.grid = grid
+        self.max_x = grid['min_x'] + grid['cell_w'] * grid['nx']
+        self.max_y = grid['min_y'] + grid['cell_h'] * grid['ny']
+
+    @property
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    def candidates(self, x1, y1, x2, y2):
+        """外框與查詢線段重疊的網格中的線段編號（可能重複）"""
+        grid = self.grid
+        lo_x, hi_x = min(x1, x2), max(x1, x2)
+        lo_y, hi_y = min(y1, y2), max(y1, y2)
+        if hi_x < grid['min_x'] or lo_x > self.max_x or hi_y < grid['min_y'] or lo_y > self.max_y:
+            return self.cell_items[:0]
+        # 單一查詢用純 Python 計算網格（避免小陣列的 numpy 開銷）
+        nx, ny = grid['nx'], grid['ny']
+        ix0 = min(max(int((lo_x - grid['min_x']) // grid['cell_w']), 0), nx - 1)
+        ix1 = min(max(int((hi_x - grid['min_x']) // grid['cell_w']), 0), nx - 1)
+        iy0 = min(max(int((lo_y - grid['min_y']) // grid['cell_h']), 0), ny - 1)
+        iy1 = min(max(int((hi_y - grid['min_y']) // grid['cell_h']), 0), ny - 1)
+        if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > MAX_QUERY_CELLS:
+            return np.arange(len(self.segments))
+        # 同一列的網格在 CSR 中連續，每列取一段
+        parts = [self.cell_items[self.cell_offsets[row * nx + ix0]:self.cell_offsets[row * nx + ix1 + 1]]
+                 for row in range(iy0, iy1 + 1)]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def lines_in_bounds(self, min_x, min_y, max_x, max_y):
+        """
+        與外框重疊網格中的線（ObstacleView 建立局部索引用）
+
+        Returns:
+            (頂點 (n, 2), 每個頂點所屬的線編號 (n,))，可直接傳給 shapely.linestrings(coords, indices=...)
+        """
+        ids = np.unique(self.candidates(min_x, min_y, max_x, max_y))
+        line_ids = np.unique(np.searchsorted(self.offsets, self.segments[ids], side='right') - 1)
+        starts, ends = self.offsets[line_ids], self.offsets[line_ids + 1]
+        lengths = ends - starts
+        # 各線頂點範圍展開為單一索引陣列（向量化）
+        point_ids = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.coords[point_ids], np.repeat(np.arange(len(line_ids)), lengths)
+
+    def crosses(self, lat1, lon1, lat2, lon2):
+        """訂單連線是否穿越任一線段"""
+        if len(self.segments) == 0:
+            return False
+        ids = self.candidates(lon1, lat1, lon2, lat2)
+        if len(ids) == 0:
+            return False
+        starts = self.segments[ids]
+        return bool(segments_intersect(lon1, lat1, lon2, lat2, self.coords[starts], self.coords[starts + 1]).any())
+
+
+class ObstacleStore:
+    """河流 + 高速公路的打包數據（build() 建立目錄，open() 以記憶體映射附加）"""
+
+    def __init__(self, kinds, data_version, directory=None, sources=None):
+        self.kinds = kinds
+        self.data_version = data_version
+        self.directory = directory
+        self.sources = sources or {}
+
+    def crosses(self, kind, lat1, lon1, lat2, lon2):
+        return self.kinds[kind].crosses(lat1, lon1, lat2, lon2)
+
+    def line_count(self, kind):
+        return self.kinds[kind].line_count
+
+    @staticmethod
+    def build(directory, rivers_file='rivers_data.json', highways_file='highways_data.json', simplify_m=None):
+        """讀取 Overpass JSON 並寫出打包目錄（simplify_m 為 None 時使用 OBSTACLE_SIMPLIFY_M）"""
+        from obstacle_simplify import obstacle_data_version
+
+        lines = {}
+        for kind, filename in (('rivers', rivers_file), ('highways', highways_file)):
+            try:
+                lines[kind] = read_overpass_lines(filename)
+            except FileNotFoundError:
+                logger.warning(f"找不到障礙數據檔案: {filename}")
+                lines[kind] = []
+        return ObstacleStore.build_from_lines(
+            directory, lines, obstacle_data_version(rivers_file, highways_file, tolerance_m=simplify_m),
+            {'rivers': rivers_file, 'highways': highways_file}, simplify_m)
+
+    @staticmethod
+    def build_from_lines(directory, lines, data_version, sources, simplify_m=None):
+        """
+        由線列表寫出打包目錄（先寫到暫存目錄再替換，附加中的進程不受影響）
+
+        Args:
+            lines: {'rivers': [[(lon, lat), ...], ...], 'highways': [...]}
+            data_version: 數據版本（由呼叫端以 obstacle_simplify.versioned 加上容差）
+            sources: 數據來源（寫入 meta.json；obstacle_download.py 下載的目錄含 'download'）
+            simplify_m: 簡化容差（公尺；None 使用 OBSTACLE_SIMPLIFY_M）
+        """
+        from obstacle_simplify import simplify_lines, simplify_tolerance
+        from shapely.geometry import LineString
+
+        simplify_m = simplify_tolerance(simplify_m)
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.obstacle_store-', dir=parent)
+        meta = {'format': STORE_FORMAT, 'data_version': data_version, 'sources': sources, 'kinds': {}}
+        for kind in KINDS:
+            kind_lines = lines.get(kind, [])
+            if simplify_m > 0 and kind_lines:
+                simplified, meta.setdefault('simplify', {})[kind] = simplify_lines(
+                    [LineString(coords) for coords in kind_lines], simplify_m)
+                kind_lines = [list(line.coords) for line in simplified]
+            arrays, grid = pack_lines(kind_lines)
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f"{kind}_{name}.npy"), array)
+            meta['kinds'][kind] = {'lines': len(kind_lines), 'segments': int(len(arrays['segments'])), 'grid': grid}
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        # 舊目錄改名後再刪除（已映射的檔案在 Linux 上仍可讀到刪除為止）
+        if os.path.exists(directory):
+            retired = tempfile.mkdtemp(prefix='.obstacle_store-old-', dir=parent)
+            os.replace(directory, os.path.join(retired, 'store'))
+            os.replace(staging, directory)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, directory)
+        logger.info(f"障礙數據已打包: {directory}（" + ", ".join(
+            f"{kind} {info['lines']} 條 / {info['segments']} 段" for kind, info in meta['kinds'].items()) + "）")
+        return ObstacleStore.open(directory)
+
+    @staticmethod
+    def open(directory):
+        """以記憶體映射附加（不複製數據）"""
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format') != STORE_FORMAT:
+            raise ValueError(f"不支援的障礙數據格式: {meta.get('format')}（請重新 build）")
+        kinds = {}
+        for kind, info in meta['kinds'].items():
+            arrays = {name: np.load(os.path.join(directory, f"{kind}_{name}.npy"), mmap_mode='r') for name in ARRAYS}
+            kinds[kind] = PackedObstacles(arrays, info['grid'])
+        return ObstacleStore(kinds, meta['data_version'], directory, meta.get('sources'))
+
+    @staticmethod
+    def open_or_build(directory, rivers_file='rivers_data.json', highways_file='highways_data.json', simplify_m=None):
+        """
+        目錄存在且與數據檔版本相符時直接附加，否則重新建立
+
+        obstacle_download.py 直接下載寫出的目錄沒有對應的 JSON 檔，一律直接附加（由下載工具更新）
+        """
+        from obstacle_simplify import obstacle_data_version
+
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            store = ObstacleStore.open(directory)
+            if 'download' in store.sources:
+                return store
+            if store.data_version == obstacle_data_version(rivers_file, highways_file, tolerance_m=simplify_m):
+                return store
+            logger.info(f"障礙數據已更新，重新打包: {directory}")
+        return ObstacleStore.build(directory, rivers_file, highways_file, simplify_m)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='障礙數據打包（多進程以記憶體映射共用）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='由 Overpass JSON 建立打包目錄')
+    build_parser.add_argument('--out', required=True, help='輸出目錄（建議 /dev/shm/...）')
+    build_parser.add_argument('--rivers', default='rivers_data.json')
+    build_parser.add_argument('--highways', default='highways_data.json')
+
+    info_parser = subparsers.add_parser('info', help='顯示打包目錄內容')
+    info_parser.add_argument('directory')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        ObstacleStore.build(args.out, args.rivers, args.highways)
+    else:
+        store = ObstacleStore.open(args.directory)
+        print(f"{args.directory}（數據版本 {store.data_version}）")
+        for kind, packed in store.kinds.items():
+            grid = packed.grid
+            print(f"  {kind}: {packed.line_count} 條線、{len(packed.segments)} 段，"
+                  f"網格 {grid['nx']}×{grid['ny']}，索引 {len(packed.cell_items)} 筆")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
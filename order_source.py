@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+訂單資料來源（正式 MySQL / 本機 SQLite / 快照檔）
+
+以環境變數 ORDER_SOURCE 切換：
+  mysql（預設）        → DB_CONFIG 的正式資料庫
+  sqlite:<路徑>        → 本機 SQLite（snapshot_tool.py import 產生）
+  snapshot:<目錄或檔案> → 啟動時將 .npz / .parquet 快照載入記憶體 SQLite
+
+SQLite 連線提供與 pymysql 相同的用法（conn.cursor(pymysql.cursors.DictCursor)、
+%s 參數），app.py 與分析腳本的查詢不需修改即可離線執行。
+"""
+
+import glob
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app_logging import get_logger
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+logger = get_logger('order_source')
+
+# MySQL 配置
+DB_CONFIG = {
+    'host': '15.156.112.57',
+    'port': 33306,
+    'user': 'select-user',
+    'password': 'emile2024',
+    'database': 'bonddb',
+    'charset': 'utf8mb4'
+}
+
+# 快照欄位（與 ordersjb 相同）
+SNAPSHOT_COLUMNS = ('tracking_number', 'latitude', 'longitude', 'delivery_sequence')
+SNAPSHOT_EXTENSIONS = ('.npz', '.parquet')
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ordersjb (
+        order_group TEXT NOT NULL,
+        tracking_number TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        delivery_sequence INTEGER,
+        delivery_group TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_ordersjb_group ON ordersjb (order_group, tracking_number);
+"""
+
+# 快照模式的記憶體資料庫（cache=shared：同一進程的所有連線共用）
+_MEMORY_URI = 'file:order_snapshots?mode=memory&cache=shared'
+_memory_keeper = None  # 保持至少一條連線，否則記憶體資料庫會被釋放
+_memory_source = None
+_memory_lock = threading.Lock()
+
+
+def current_source():
+    """目前的資料來源設定（ORDER_SOURCE）"""
+    return os.environ.get('ORDER_SOURCE', 'mysql').strip() or 'mysql'
+
+
+def describe_source():
+    """資料來源說明（/api/test-db 顯示用）"""
+    source = current_source()
+    return DB_CONFIG['database'] if source == 'mysql' else source
+
+
+# ============================================================================
+# SQLite 相容層
+# ============================================================================
+
+class SQLiteCursor:
+    """讓 sqlite3 接受 pymysql 風格的查詢（%s 參數、VERSION()、DictCursor）"""
+
+    def __init__(self, cursor, dict_rows):
+        self._cursor = cursor
+        self._dict_rows = dict_rows
+
+    def execute(self, query, params=None):
+        query = query.replace('%s', '?').replace('VERSION()', 'sqlite_version()')
+        self._cursor.execute(query, tuple(params or ()))
+        return self._cursor.rowcount
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(query.replace('%s', '?'), seq_of_params)
+        return self._cursor.rowcount
+
+    def _convert(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return dict(zip((col[0] for col in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """sqlite3 連線包裝（cursor(DictCursor) 返回 dict 列）"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, cursor_class=None):
+        dict_rows = cursor_class is not None and 'Dict' in getattr(cursor_class, '__name__', '')
+        return SQLiteCursor(self._conn.cursor(), dict_rows)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect_sqlite(path):
+    """開啟 SQLite 訂單資料庫（不存在時建立空表）"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(SQLITE_SCHEMA)
+    _migrate_sqlite(conn)
+    return SQLiteConnection(conn)
+
+
+def _migrate_sqlite(conn):
+    """舊版本建立的 SQLite 檔補上新增的欄位"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ordersjb)")}
+    if 'delivery_group' not in columns:
+        conn.execute("ALTER TABLE ordersjb ADD COLUMN delivery_group TEXT")
+        conn.commit()
+
+
+def _snapshot_memory_connection(location):
+    """快照模式：第一次連線時將所有快照載入共用記憶體資料庫"""
+    global _memory_keeper, _memory_source
+    with _memory_lock:
+        if _memory_source != location:
+            if _memory_keeper is not None:
+                _memory_keeper.close()
+            _memory_keeper = sqlite3.connect(_MEMORY_URI, uri=True, check_same_thread=False)
+            _memory_keeper.executescript("DROP TABLE IF EXISTS ordersjb;" + SQLITE_SCHEMA)
+            paths = find_snapshots(location)
+            total = sum(import_snapshot(SQLiteConnection(_memory_keeper), path) for path in paths)
+            _memory_keeper.commit()
+            _memory_source = location
+            logger.info(f"已載入 {len(paths)} 個訂單快照（{total} 筆）: {location}")
+    return SQLiteConnection(sqlite3.connect(_MEMORY_URI, uri=True, check_same_thread=False))
+
+
+def get_connection():
+    """依 ORDER_SOURCE 建立資料庫連線（pymysql 或 SQLite 相容連線）"""
+    source = current_source()
+    if source == 'mysql':
+        import pymysql
+        return pymysql.connect(**DB_CONFIG)
+    if source.startswith('sqlite:'):
+        return connect_sqlite(source[len('sqlite:'):])
+    if source.startswith('snapshot:'):
+        return _snapshot_memory_connection(source[len('snapshot:'):])
+    raise ValueError(f"未知的 ORDER_SOURCE: {source}（可用 mysql | sqlite:<路徑> | snapshot:<目錄>）")
+
+
+def get_write_connection():
+    """
+    可寫入的資料庫連線（寫回 delivery_sequence 用）
+
+    DB_CONFIG 為唯讀帳號；正式資料庫需設定 DB_WRITE_USER / DB_WRITE_PASSWORD，
+    未設定時拋出 PermissionError。SQLite / 快照模式直接使用 get_connection()。
+    """
+    if current_source() != 'mysql':
+        return get_connection()
+    if not os.environ.get('DB_WRITE_USER'):
+        raise PermissionError("未設定 DB_WRITE_USER（正式資料庫的寫入帳號）")
+    import pymysql
+    config = dict(DB_CONFIG, user=os.environ['DB_WRITE_USER'], password=os.environ.get('DB_WRITE_PASSWORD', ''))
+    return pymysql.connect(**config, autocommit=False)
+
+
+# ============================================================================
+# 快照檔（.npz / .parquet）
+# ============================================================================
+
+def fetch_group_rows(conn, order_group):
+    """讀取 order_group 的所有原始列（不過濾座標，保留正式資料的原貌）"""
+    import pymysql
+
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    cursor.execute("""
+        SELECT tracking_number, latitude, longitude, delivery_sequence
+        FROM ordersjb
+        WHERE order_group = %s
+        ORDER BY tracking_number
+    """, (order_group,))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+
+def save_snapshot(path, order_group, rows):
+    """
+    寫出訂單快照
+
+    .npz：欄位各為一個陣列（座標 float64，NULL → NaN；delivery_sequence NULL → -1）
+    .parquet：需安裝 pyarrow
+    """
+    tracking = np.array([str(r['tracking_number']) for r in rows], dtype=str)
+    latitude = np.array([_to_float(r['latitude']) for r in rows], dtype=np.float64)
+    longitude = np.array([_to_float(r['longitude']) for r in rows], dtype=np.float64)
+    sequence = np.array([-1 if r.get('delivery_sequence') is None else int(r['delivery_sequence']) for r in rows],
+                        dtype=np.int64)
+    exported_at = datetime.now().isoformat(timespec='seconds')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError("匯出 Parquet 需要 pyarrow，請執行：pip install pyarrow（或改用 .npz）")
+        table = pyarrow.table({
+            'tracking_number': tracking, 'latitude': latitude,
+            'longitude': longitude, 'delivery_sequence': sequence,
+        })
+        table = table.replace_schema_metadata({'order_group': order_group, 'exported_at': exported_at})
+        pq.write_table(table, path, compression='zstd')
+    else:
+        np.savez_compressed(
+            path, order_group=np.array(order_group), exported_at=np.array(exported_at),
+            tracking_number=tracking, latitude=latitude, longitude=longitude, delivery_sequence=sequence,
+        )
+    return path
+
+
+def load_snapshot(path):
+    """
+    讀取訂單快照
+
+    Returns:
+        (order_group, rows)：rows 格式同資料庫查詢結果
+        [{'tracking_number', 'latitude', 'longitude', 'delivery_sequence'}, ...]
+    """
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ImportError("讀取 Parquet 需要 pyarrow，請執行：pip install pyarrow")
+        table = pq.read_table(path)
+        order_group = table.schema.metadata[b'order_group'].decode('utf-8')
+        columns = {name: table.column(name).to_numpy() for name in SNAPSHOT_COLUMNS}
+    else:
+        with np.load(path, allow_pickle=False) as data:
+            order_group = str(data['order_group'])
+            columns = {name: data[name] for name in SNAPSHOT_COLUMNS}
+
+    rows = []
+    for tracking, lat, lon, seq in zip(*(columns[name] for name in SNAPSHOT_COLUMNS)):
+        rows.append({
+            'tracking_number': str(tracking),
+            'latitude': None if np.isnan(lat) else float(lat),
+            'longitude': None if np.isnan(lon) else float(lon),
+            'delivery_sequence': None if seq < 0 else int(seq),
+        })
+    return order_group, rows
+
+
+def find_snapshots(location):
+    """目錄下的所有快照檔（或單一快照檔）"""
+    if os.path.isdir(location):
+        return sorted(path for ext in SNAPSHOT_EXTENSIONS for path in glob.glob(os.path.join(location, f'*{ext}')))
+    return [location]
+
+
+def import_snapshot(conn, path):
+    """將快照寫入 SQLite（同 order_group 的舊資料先刪除），返回筆數"""
+    order_group, rows = load_snapshot(path)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM ordersjb WHERE order_group = %s", (order_group,))
+    cursor.executemany(
+        "INSERT INTO ordersjb (order_group, tracking_number, latitude, longitude, delivery_sequence) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        [(order_group, r['tracking_number'], r['latitude'], r['longitude'], r['delivery_sequence']) for r in rows]
+    )
+    cursor.close()
+    return len(rows)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+規劃結果寫回 ordersjb（delivery_sequence + 群組標籤）
+
+所有更新在同一個交易中完成，失敗時整批回滾，不會留下一半新、一半舊的順序：
+  MySQL  → 建立臨時表，以多列 INSERT 分批寫入（pymysql executemany 會合併為單一語句），
+           再清除舊順序並以一條 UPDATE ... JOIN 更新；數千筆只需數次往返。
+           ALTER TABLE 等 DDL 會隱含提交（臨時表也一樣），交易中只使用 CREATE / DROP TEMPORARY TABLE，
+           主鍵在建立時宣告；臨時表在清除舊順序之前建好並寫入，清除之後只剩 UPDATE
+  SQLite → 同進程執行，executemany UPDATE 即可（沒有網路往返）
+
+  WRITEBACK_CHUNK        → 每批筆數（預設 1000）
+  WRITEBACK_GROUP_COLUMN → 群組標籤欄位（預設 delivery_group；設為空字串則只寫入 delivery_sequence）
+正式資料庫需設定 DB_WRITE_USER / DB_WRITE_PASSWORD（見 order_source.get_write_connection）。
+"""
+
+import os
+import re
+import time
+
+from app_logging import get_logger
+from order_source import SQLiteConnection
+
+logger = get_logger('order_writeback')
+
+WRITEBACK_CHUNK = int(os.environ.get('WRITEBACK_CHUNK', 1000))
+WRITEBACK_GROUP_COLUMN = os.environ.get('WRITEBACK_GROUP_COLUMN', 'delivery_group')
+
+# 規劃結果中的非訂單項目（end_point_mode=manual 時的終點標記）
+NON_ORDER_TRACKING = {'ENDPOINT'}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class WriteBackError(Exception):
+    """寫回失敗（status 為對應的 HTTP 狀態碼）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def plan_rows(orders):
+    """規劃結果的 orders → [(tracking_number, delivery_sequence, 群組標籤)]"""
+    return [(o['tracking_number'], int(o['sequence']), o['group'])
+            for o in orders if o['tracking_number'] not in NON_ORDER_TRACKING]
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def write_back(conn, order_group, rows, group_column=None, clear_missing=False, chunk_size=None):
+    """
+    將 delivery_sequence（與群組標籤）寫回 ordersjb，單一交易
+
+    Args:
+        conn: get_write_connection() 的連線（完成後不關閉）
+        rows: plan_rows() 的結果
+        group_column: 群組標籤欄位（None 使用 WRITEBACK_GROUP_COLUMN，空字串不寫入）
+        clear_missing: 同 order_group 中不在規劃結果內的訂單清除為 NULL（避免新舊順序混雜；
+                       預設不清除，截斷的規劃不會抹除其餘訂單的順序）
+
+    Returns:
+        {'updated', 'cleared', 'chunks', 'method', 'elapsed'}
+
+    Raises:
+        WriteBackError: 規劃中的訂單已不在 order_group 中（409，訂單已變動）
+    """
+    group_column = WRITEBACK_GROUP_COLUMN if group_column is None else group_column
+    chunk_size = chunk_size or WRITEBACK_CHUNK
+    if group_column and not _IDENTIFIER.match(group_column):
+        raise WriteBackError(f'無效的欄位名稱: {group_column}')
+    if len({row[0] for row in rows}) != len(rows):
+        raise WriteBackError('規劃結果中有重複的 tracking_number')
+
+    started = time.perf_counter()
+    sqlite = isinstance(conn, SQLiteConnection)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT tracking_number FROM ordersjb WHERE order_group = %s", (order_group,))
+        existing = {str(row[0]) for row in cursor.fetchall()}
+        missing = [row[0] for row in rows if str(row[0]) not in existing]
+        if missing:
+            raise WriteBackError(
+                f'{len(missing)} 個訂單已不在 order_group {order_group} 中（例如 {missing[0]}），請重新規劃', 409
+            )
+
+        cleared = len(existing) - len(rows) if clear_missing else 0
+        if sqlite:
+            if clear_missing:
+                _clear_group(cursor, order_group, group_column)
+            chunks = _update_executemany(cursor, order_group, rows, group_column, chunk_size)
+        else:
+            chunks = _update_temp_table(cursor, order_group, rows, group_column, chunk_size, clear_missing)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    summary = {
+        'updated': len(rows),
+        'cleared': cleared,
+        'chunks': chunks,
+        'method': 'executemany' if sqlite else 'temp_table_join',
+        'elapsed': round(time.perf_counter() - started, 4),
+    }
+    logger.info(f"已寫回 order_group={order_group}: {summary['updated']} 筆（{summary['chunks']} 批，"
+                f"{summary['method']}），清除 {summary['cleared']} 筆舊順序")
+    return summary
+
+
+def _clear_group(cursor, order_group, group_column):
+    assignments = 'delivery_sequence = NULL' + (f', {group_column} = NULL' if group_column else '')
+    cursor.execute(f"UPDATE ordersjb SET {assignments} WHERE order_group = %s", (order_group,))
+
+
+def _update_executemany(cursor, order_group, rows, group_column, chunk_size):
+    if group_column:
+        query = (f"UPDATE ordersjb SET delivery_sequence = %s, {group_column} = %s "
+                 "WHERE order_group = %s AND tracking_number = %s")
+        params = [(seq, group, order_group, tracking) for tracking, seq, group in rows]
+    else:
+        query = "UPDATE ordersjb SET delivery_sequence = %s WHERE order_group = %s AND tracking_number = %s"
+        params = [(seq, order_group, tracking) for tracking, seq, _ in rows]
+    chunks = 0
+    for chunk in _chunks(params, chunk_size):
+        cursor.executemany(query, chunk)
+        chunks += 1
+    return chunks
+
+
+def _update_temp_table(cursor, order_group, rows, group_column, chunk_size, clear_missing):
+    # 臨時表只存在於此連線；欄位型別（含字元集）複製自 ordersjb，主鍵在建立時宣告（JOIN 時可使用索引；
+    # 另外 ALTER TABLE 會隱含提交，破壞單一交易）
+    group_select = f", {group_column}" if group_column else ''
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_delivery_sequence")
+    cursor.execute(f"CREATE TEMPORARY TABLE tmp_delivery_sequence (PRIMARY KEY (tracking_number)) "
+                   f"SELECT tracking_number, delivery_sequence{group_select} FROM ordersjb LIMIT 0")
+    try:
+        if group_column:
+            insert = (f"INSERT INTO tmp_delivery_sequence (tracking_number, delivery_sequence, {group_column}) "
+                      "VALUES (%s, %s, %s)")
+            params = rows
+        else:
+            insert = "INSERT INTO tmp_delivery_sequence (tracking_number, delivery_sequence) VALUES (%s, %s)"
+            params = [(tracking, seq) for tracking, seq, _ in rows]
+        chunks = 0
+        for chunk in _chunks(params, chunk_size):
+            cursor.executemany(insert, chunk)  # pymysql 將 INSERT ... VALUES 合併為多列語句
+            chunks += 1
+
+        # 新順序已全部寫入臨時表後才清除舊順序
+        if clear_missing:
+            _clear_group(cursor, order_group, group_column)
+        group_assignment = f", o.{group_column} = t.{group_column}" if group_column else ''
+        cursor.execute(f"""
+            UPDATE ordersjb o
+            JOIN tmp_delivery_sequence t ON t.tracking_number = o.tracking_number
+            SET o.delivery_sequence = t.delivery_sequence{group_assignment}
+            WHERE o.order_group = %s
+        """, (order_group,))
+    finally:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_delivery_sequence")
+    return chunks
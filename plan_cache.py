@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""路徑規劃結果快取 - 相同訂單快照 + 相同參數直接回傳已計算的結果"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from app_logging import get_logger
+
+logger = get_logger('plan_cache')
+
+# 演算法或回應格式變更時遞增，讓舊的磁碟快取自動失效
+PLAN_CACHE_VERSION = 2
+
+PLAN_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# order_group 子目錄名稱（sha1 前 16 碼）；其他子目錄（例如背景工作的 jobs/）不屬於規劃快取
+GROUP_DIR_PATTERN = re.compile(r'^[0-9a-f]{16}$')
+
+
+def order_snapshot_version(orders):
+    """訂單快照版本：tracking_number + 座標的內容雜湊（訂單有任何變動即改變）"""
+    digest = hashlib.sha1()
+    for order in orders:
+        digest.update(f"{order['tracking_number']}|{order['lat']!r}|{order['lon']!r}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _normalize(value):
+    """正規化參數值：1 與 1.0 視為相同，dict 依鍵排序"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return str(value)
+
+
+def canonical_params_hash(params):
+    """演算法參數的標準化雜湊"""
+    text = json.dumps(_normalize(params), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    規劃結果快取（記憶體 LRU + 可選的共用磁碟存儲）
+
+    - 鍵 = 端點 + order_group + 訂單快照版本 + 參數雜湊 + 障礙數據版本
+    - 記憶體層依項目數與總位元組數做 LRU 淘汰
+    - 設定 store_dir 後結果同時寫入磁碟，多個 worker 進程可共用
+    - invalidate(order_group) 明確清除某個 order_group 的所有結果
+    """
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024,
+                 store_dir=None, max_disk_entries=5000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_dir = store_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (order_group, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（設定來自環境變數 PLAN_CACHE_*）"""
+        if not hasattr(PlanCache, '_instance'):
+            PlanCache._instance = PlanCache(
+                max_entries=int(os.environ.get('PLAN_CACHE_MAX_ENTRIES', 256)),
+                max_bytes=int(os.environ.get('PLAN_CACHE_MAX_MB', 256)) * 1024 * 1024,
+                store_dir=os.environ.get('PLAN_CACHE_DIR') or None
+            )
+        return PlanCache._instance
+
+    @staticmethod
+    def make_key(endpoint, order_group, snapshot_version, params, obstacle_version=None):
+        """組合快取鍵（同時作為 plan_id 使用）"""
+        raw = '|'.join([
+            str(PLAN_CACHE_VERSION),
+            endpoint,
+            str(order_group),
+            snapshot_version,
+            canonical_params_hash(params),
+            obstacle_version or '-'
+        ])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def is_plan_id(plan_id):
+        """檢查 plan_id 格式（避免任意字串進入磁碟路徑）"""
+        return bool(PLAN_ID_PATTERN.match(plan_id or ''))
+
+    @staticmethod
+    def steps_key(plan_id):
+        """演算法步驟與規劃結果分開存放（只有需要時才讀取）"""
+        return f"{plan_id}-steps"
+
+    # ------------------------------------------------------------------
+    # 磁碟存儲
+    # ------------------------------------------------------------------
+
+    def _group_dir(self, order_group):
+        group_hash = hashlib.sha1(str(order_group).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.store_dir, group_hash)
+
+    def _disk_path(self, key, order_group):
+        return os.path.join(self._group_dir(order_group), f"{key}.json")
+
+    def _group_dirs(self):
+        return [entry for entry in os.scandir(self.store_dir)
+                if entry.is_dir() and GROUP_DIR_PATTERN.match(entry.name)]
+
+    def _find_on_disk(self, key):
+        if not self.store_dir:
+            return None
+        for entry in self._group_dirs():
+            path = os.path.join(entry.path, f"{key}.json")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _write_disk(self, key, order_group, payload):
+        path = self._disk_path(key, order_group)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'order_group': order_group, 'payload': payload}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)  # 原子替換，其他 worker 不會讀到半個檔案
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """磁碟項目超過上限時，刪除最久未使用的結果"""
+        files = []
+        for group_dir in self._group_dirs():
+            files.extend(e for e in os.scandir(group_dir.path) if e.name.endswith('.json'))
+        excess = len(files) - self.max_disk_entries
+        if excess > 0:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for entry in files[:excess]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    # ------------------------------------------------------------------
+    # 公開介面
+    # ------------------------------------------------------------------
+
+    def get(self, key, order_group=None):
+        """取得快取的回應（JSON 字串），未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        if self.store_dir:
+            path = self._disk_path(key, order_group) if order_group is not None else self._find_on_disk(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                os.utime(path)  # 更新使用時間（磁碟 LRU）
+                self._remember(key, stored['order_group'], stored['payload'])
+                with self._lock:
+                    self.hits += 1
+                return stored['payload']
+            except (FileNotFoundError, TypeError, ValueError, KeyError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, order_group, payload):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (order_group, payload)
+            self._bytes += len(payload)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def put(self, key, order_group, payload):
+        """存入回應（JSON 字串）"""
+        self._remember(key, order_group, payload)
+        if self.store_dir:
+            try:
+                self._write_disk(key, order_group, payload)
+            except OSError as e:
+                logger.warning(f"規劃結果寫入磁碟快取失敗: {e}")
+
+    def invalidate(self, order_group):
+        """清除指定 order_group 的所有快取結果，返回清除數量"""
+        removed = 0
+        with self._lock:
+            for key in [k for k, (group, _) in self._entries.items() if group == order_group]:
+                _, payload = self._entries.pop(key)
+                self._bytes -= len(payload)
+                removed += 1
+
+        if self.store_dir:
+            group_dir = self._group_dir(order_group)
+            if os.path.isdir(group_dir):
+                for entry in os.scandir(group_dir):
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+
+        return removed
+
+    def clear(self):
+        """清空記憶體快取"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
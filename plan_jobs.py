@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+背景規劃工作（POST /api/route/jobs → 輪詢 GET /api/route/jobs/<job_id>）
+
+大型規劃（例如 5000 筆 + OR-Tools 組內排序 + 幾何檢測）可能超過代理的逾時，
+改為放入有上限的佇列，由固定數量的背景執行緒處理；佇列滿時返回 429。
+工作在提交的進程中執行；設定 PLAN_JOB_DIR（或 PLAN_CACHE_DIR，預設使用其下的 jobs/）後，
+狀態與結果同時寫入共用目錄，多 worker 部署時任何 worker 都能回應輪詢。
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from app_logging import get_logger
+from metrics import PLAN_JOBS
+
+logger = get_logger('plan_jobs')
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def job_store_dir():
+    """共用工作目錄：PLAN_JOB_DIR，其次 PLAN_CACHE_DIR/jobs；皆未設定時為 None（只存在本進程記憶體）"""
+    if os.environ.get('PLAN_JOB_DIR'):
+        return os.environ['PLAN_JOB_DIR']
+    if os.environ.get('PLAN_CACHE_DIR'):
+        return os.path.join(os.environ['PLAN_CACHE_DIR'], 'jobs')
+    return None
+
+
+class JobQueueFull(Exception):
+    """佇列已滿（呼叫端應稍後重試）"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PlanJobError(Exception):
+    """工作無法完成的預期錯誤（例如找不到訂單），訊息直接回傳給前端"""
+
+
+class PlanJob:
+    """單一規劃工作的狀態（由背景執行緒更新，輪詢端讀取）"""
+
+    def __init__(self, func, kind, stages, meta=None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.meta = meta or {}
+        self.func = func
+        self.stage_names = list(stages)
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = []
+        self.partial = {}
+        self.payload = None
+        self.cache_status = None
+        self.error = None
+        self.on_change = None  # 狀態改變時呼叫（PlanJobQueue 寫入共用目錄）
+        self._lock = threading.Lock()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def update(self, stage, info=None, preview=None):
+        """
+        階段完成（可直接作為 run_route_pipeline 的 on_stage 回呼）
+
+        Args:
+            stage: 階段名稱
+            info: {'cached', 'elapsed', 'output'}
+            preview: 部分結果；未提供時以 route_pipeline.stage_preview 產生
+        """
+        info = info or {}
+        if preview is None and 'output' in info:
+            from route_pipeline import stage_preview
+            preview = stage_preview(stage, info['output'])
+        with self._lock:
+            self.stages.append({
+                'stage': stage,
+                'cached': bool(info.get('cached')),
+                'elapsed': round(info.get('elapsed', 0.0), 4),
+            })
+            if preview:
+                self.partial[stage] = preview
+        self._changed()
+
+    def run(self):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+        self._changed()
+        try:
+            payload, cache_status = self.func(self)
+            with self._lock:
+                self.payload = payload
+                self.cache_status = cache_status
+                self.status = 'done'
+                self.partial = {}  # 最終結果已包含
+        except PlanJobError as e:
+            with self._lock:
+                self.error = str(e)
+                self.status = 'failed'
+        except Exception as e:
+            logger.error(f"規劃工作 {self.job_id} 失敗: {e}")
+            traceback.print_exc()
+            with self._lock:
+                self.error = f'規劃錯誤: {e}'
+                self.status = 'failed'
+        finally:
+            with self._lock:
+                self.finished_at = time.time()
+                self.func = None  # 釋放閉包中的訂單資料
+            self._changed()
+
+    def to_dict(self, queue_position=None):
+        """工作狀態（不含最終結果；結果由呼叫端以 payload 附加）"""
+        with self._lock:
+            completed = [s['stage'] for s in self.stages]
+            now = self.finished_at or time.time()
+            state = {
+                'job_id': self.job_id,
+                'kind': self.kind,
+                'status': self.status,
+                'meta': self.meta,
+                'progress': {
+                    'completed': len(completed),
+                    'total': len(self.stage_names),
+                    'current_stage': next((s for s in self.stage_names if s not in completed), None)
+                    if self.status == 'running' else None,
+                },
+                'stages': list(self.stages),
+                'elapsed': round(now - (self.started_at or now), 3),
+                'queued_seconds': round((self.started_at or now) - self.created_at, 3),
+            }
+            if self.partial:
+                state['partial'] = dict(self.partial)
+            if self.error:
+                state['error'] = self.error
+            if self.cache_status:
+                state['cache_status'] = self.cache_status
+            if queue_position is not None and self.status == 'queued':
+                state['queue_position'] = queue_position
+        return state
+
+
+class StoredJob:
+    """另一個 worker 寫入共用目錄的工作狀態（唯讀快照，介面同 PlanJob）"""
+
+    def __init__(self, record):
+        self.state = record['state']
+        self.job_id = self.state['job_id']
+        self.status = self.state['status']
+        self.payload = record.get('payload')
+
+    def to_dict(self, queue_position=None):
+        return dict(self.state)
+
+
+class PlanJobQueue:
+    """有上限的背景工作佇列（固定數量的工作執行緒）"""
+
+    def __init__(self, max_workers=2, max_queued=16, max_jobs=500, ttl_seconds=3600, store_dir=None):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.store_dir = store_dir
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._workers = []
+        self._recent_durations = []
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（PLAN_JOB_WORKERS / PLAN_JOB_QUEUE / PLAN_JOB_DIR 環境變數可調整）"""
+        if not hasattr(PlanJobQueue, '_instance'):
+            PlanJobQueue._instance = PlanJobQueue(
+                max_workers=int(os.environ.get('PLAN_JOB_WORKERS', 2)),
+                max_queued=int(os.environ.get('PLAN_JOB_QUEUE', 16)),
+                store_dir=job_store_dir(),
+            )
+        return PlanJobQueue._instance
+
+    def _ensure_workers(self):
+        # 第一次提交時才啟動（避免 import 時建立執行緒）
+        with self._lock:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f'plan-job-{len(self._workers) + 1}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+                PLAN_JOBS.inc(result=job.status)
+                with self._lock:
+                    self._recent_durations = (self._recent_durations + [job.finished_at - job.started_at])[-20:]
+                logger.info(f"規劃工作 {job.job_id} {job.status}（{job.finished_at - job.started_at:.2f}s）")
+            finally:
+                self._queue.task_done()
+
+    def retry_after(self):
+        """佇列清空的估計秒數（Retry-After 標頭）"""
+        average = sum(self._recent_durations) / len(self._recent_durations) if self._recent_durations else 5.0
+        return max(1, int(average * (self._queue.qsize() + 1) / self.max_workers))
+
+    def submit(self, func, kind='route', stages=(), meta=None):
+        """
+        提交工作
+
+        Args:
+            func: func(job) → (payload, cache_status)；可呼叫 job.update() 回報進度
+            stages: 預期的階段名稱（計算進度用）
+
+        Raises:
+            JobQueueFull: 佇列已滿
+        """
+        self._ensure_workers()
+        self._prune()
+        job = PlanJob(func, kind, stages, meta)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                PLAN_JOBS.inc(result='rejected')
+                raise JobQueueFull(f"規劃佇列已滿（{self.max_queued} 個等待中），請稍後再試", self.retry_after())
+            self._jobs[job.job_id] = job
+        if self.store_dir:
+            job.on_change = self._write_job
+            self._write_job(job)
+        PLAN_JOBS.inc(result='accepted')
+        return job
+
+    # ------------------------------------------------------------------
+    # 共用目錄（多 worker）
+    # ------------------------------------------------------------------
+
+    def _job_path(self, job_id):
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def _write_job(self, job):
+        """
+        寫入工作狀態（完成時附結果）；原子替換，其他 worker 不會讀到半個檔案
+
+        提交端與工作執行緒都會寫入：狀態在寫入鎖內取得，最後寫入的一定是最新狀態
+        """
+        path = self._job_path(job.job_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._write_lock:
+            record = {'state': job.to_dict()}
+            if record['state']['status'] == 'done':
+                record['payload'] = job.payload
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(record, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"寫入規劃工作狀態失敗 {job.job_id}: {e}")
+
+    def _read_job(self, job_id):
+        if not self.store_dir or not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return StoredJob(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, job_id):
+        """本進程的工作，其次為其他 worker 寫入共用目錄的狀態"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._read_job(job_id)
+
+    def queue_position(self, job):
+        """前面還有幾個等待中的工作（其他 worker 的工作返回 None）"""
+        if isinstance(job, StoredJob):
+            return None
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if other.status == 'queued' and other.created_at < job.created_at)
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in JOB_STATUSES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {'workers': self.max_workers, 'max_queued': self.max_queued, **counts}
+
+    def _prune(self):
+        """移除過期或超出數量的已完成工作"""
+        now = time.time()
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+            excess = len(self._jobs) - self.max_jobs
+            for job_id in finished:
+                job = self._jobs[job_id]
+                if excess > 0 or now - job.finished_at > self.ttl_seconds:
+                    del self._jobs[job_id]
+                    excess -= 1
+        if self.store_dir:
+            # 共用目錄依修改時間清除（包含其他 worker 的工作）
+            for entry in os.scandir(self.store_dir):
+                try:
+                    if entry.name.endswith('.json') and now - entry.stat().st_mtime > self.ttl_seconds:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+規劃結果串流（POST /api/route/stream）
+
+規劃在背景工作中執行，各階段完成時即推送事件，前端可先畫出已完成的群組：
+  start        → {job_id, order_group, total_orders}
+  stage        → {stage, cached, elapsed}（每個階段完成時）
+  clusters     → 群組分配 {total_groups, groups: [{group, size, tracking_numbers}]}
+  group        → 單一群組排序完成 {group, index, total_groups, orders}
+                 （sequence 為暫定值；end_point_mode=farthest 可能調整，以 plan 為準）
+  verification → 障礙檢測 {verification_method, crossings}
+  plan         → 完整規劃結果（同 /api/route）
+  error        → {error}
+格式：SSE（text/event-stream，預設）或 NDJSON（?format=ndjson 或 Accept: application/x-ndjson）
+"""
+
+import queue
+
+from flask import request
+
+from response_format import dumps_json
+from route_pipeline import group_name
+
+SSE_MIMETYPE = 'text/event-stream'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# 無事件時定期送出心跳，避免代理因閒置切斷連線
+HEARTBEAT_SECONDS = 15
+
+
+def requested_stream_format():
+    """明確要求的串流格式：?format=ndjson | sse 優先，其次 Accept 標頭；未要求時返回 None"""
+    requested = request.args.get('format')
+    if requested in ('sse', 'ndjson'):
+        return requested
+    listed = {mimetype: quality for mimetype, quality in request.accept_mimetypes}
+    ndjson, sse = listed.get(NDJSON_MIMETYPE, 0), listed.get(SSE_MIMETYPE, 0)
+    if not ndjson and not sse:
+        return None
+    return 'ndjson' if ndjson > sse else 'sse'
+
+
+def negotiate_stream_format():
+    """串流端點的格式（未指定時為 SSE）"""
+    return requested_stream_format() or 'sse'
+
+
+def stream_response(response_class, chunks, fmt):
+    """串流回應（關閉代理緩衝，事件即時送出）"""
+    response = response_class(chunks, mimetype=NDJSON_MIMETYPE if fmt == 'ndjson' else SSE_MIMETYPE)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def encode_event(event, data, fmt):
+    """事件 → SSE 區塊 / NDJSON 一行"""
+    if fmt == 'ndjson':
+        return dumps_json({'event': event, 'data': data}) + b'\n'
+    if event == 'heartbeat':
+        return b': heartbeat\n\n'  # SSE 註解行，EventSource 會忽略
+    return b'event: ' + event.encode('utf-8') + b'\ndata: ' + dumps_json(data) + b'\n\n'
+
+
+class RouteStream:
+    """
+    將規劃回呼轉為事件（背景工作執行緒產生，回應產生器消費）
+
+    Example:
+        stream = RouteStream('sse', params['verification'])
+        compute_route_plan(..., on_stage=stream.on_stage, on_group=stream.on_group)
+        stream.finish(result)
+        stream.close()
+        return stream_response(app.response_class, stream.events(), stream.fmt)
+    """
+
+    def __init__(self, fmt='sse', verification='none'):
+        self.fmt = fmt
+        self.verification = verification
+        self._events = queue.Queue()
+        self._split = None
+        self._clusters_sent = False
+        self._total_groups = 0
+        self._groups_sent = 0
+        self._verification_sent = False
+
+    def emit(self, event, data):
+        self._events.put((event, data))
+
+    def close(self):
+        self._events.put(None)
+
+    def _emit_clusters(self, groups):
+        """groups: [(名稱, [訂單...]), ...]"""
+        self.emit('clusters', {
+            'total_groups': len(groups),
+            'groups': [{'group': name, 'size': len(orders), 'tracking_numbers': [o['tracking_number'] for o in orders]}
+                       for name, orders in groups],
+        })
+        self._clusters_sent = True
+        self._total_groups = len(groups)
+
+    def on_group(self, name, group_orders):
+        """run_inner_order_stage 的 on_group 回呼"""
+        self.emit('group', {
+            'group': name,
+            'index': self._groups_sent,
+            'total_groups': self._total_groups,
+            'orders': list(group_orders),
+        })
+        self._groups_sent += 1
+
+    def _emit_verification(self, crossings):
+        self.emit('verification', {'verification_method': self.verification, 'crossings': crossings})
+        self._verification_sent = True
+
+    def on_stage(self, stage, info):
+        """run_route_pipeline 的 on_stage 回呼"""
+        self.emit('stage', {'stage': stage, 'cached': bool(info.get('cached')),
+                            'elapsed': round(info.get('elapsed', 0.0), 4)})
+        output = info.get('output')
+        if stage == 'split':
+            self._split = output
+        elif stage == 'group_order':
+            clusters = self._split['clusters']
+            self._emit_clusters([(group_name(idx), clusters[label])
+                                 for idx, label in enumerate(output['cluster_order'])])
+        elif stage == 'inner_order' and info.get('cached'):
+            # 組內排序重用快取：一次送出所有群組
+            for name, orders in _groups_from_orders(output['orders']):
+                self.on_group(name, orders)
+        elif stage == 'finish':
+            self._emit_verification(output['crossings'])
+
+    def finish(self, result):
+        """送出驗證結果與完整規劃（規劃快取命中時先補送群組事件）"""
+        if not self._clusters_sent:
+            groups = _groups_from_orders(result['orders'])
+            self._emit_clusters(groups)
+            for name, orders in groups:
+                self.on_group(name, orders)
+        if not self._verification_sent:
+            self._emit_verification(result['crossings'])
+        self.emit('plan', result)
+
+    def events(self, heartbeat=HEARTBEAT_SECONDS):
+        """回應產生器：逐一輸出事件直到 close()"""
+        while True:
+            try:
+                item = self._events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield encode_event('heartbeat', {}, self.fmt)
+                continue
+            if item is None:
+                return
+            yield encode_event(item[0], item[1], self.fmt)
+
+
+def _groups_from_orders(orders):
+    """依 group 欄位分組（保持出現順序，略過終點標記）"""
+    groups = {}
+    for order in orders:
+        if order['group'] != 'End':
+            groups.setdefault(order['group'], []).append(order)
+    return list(groups.items())
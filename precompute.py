@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+預先規劃（排程）：發現新增或變動的 order_group，背景以預設與常用參數組合先行規劃
+
+調度員上班時才送出規劃請求，但 order_group 往往數小時前就已建立。
+排程器定期以單一彙總查詢（筆數 + 座標總和 + tracking_number 範圍）找出變動的 order_group，
+送入獨立的規劃進程池（數量有上限，不佔用 /api/route/batch 的進程池），結果寫入規劃快取；
+之後 /api/route 以相同參數請求時，訂單快照版本相符即直接命中。
+設定 PLAN_CACHE_DIR 後結果持久保存於磁碟，所有 worker 與重新啟動後都可使用。
+
+  PRECOMPUTE_START          → 預設起點 "lat,lon"（參數組合未指定 start 時使用）
+  PRECOMPUTE_PARAM_SETS     → 參數組合：JSON 列表或 JSON 檔案路徑（預設：預設參數 + geometry 檢測）
+  PRECOMPUTE_GROUP_PATTERN  → order_group 的 LIKE 條件（預設 %）
+  PRECOMPUTE_MAX_GROUPS     → 每輪最多檢查的 order_group 數（依名稱由新到舊，預設 200）
+  PRECOMPUTE_WORKERS        → 規劃進程數（預設 1）
+  PRECOMPUTE_INTERVAL       → 排程間隔秒數（python app.py 時 > 0 才啟動背景排程）
+  PRECOMPUTE_STATE          → 狀態檔（預設 PLAN_CACHE_DIR/precompute_state.json；未設定時只存在記憶體）
+
+  python precompute.py once      → 執行一輪
+  python precompute.py run       → 持續排程（獨立進程，建議搭配 gunicorn 部署）
+  python precompute.py status    → 顯示狀態檔內容
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import pymysql
+
+from app_logging import get_logger
+from batch_planner import BatchPlanner, BATCH_MAX_GROUPS
+from metrics import DB_LATENCY, PRECOMPUTE_GROUPS
+from order_source import get_connection
+from plan_cache import canonical_params_hash, order_snapshot_version
+from route_pipeline import route_params
+
+logger = get_logger('precompute')
+
+PRECOMPUTE_INTERVAL = float(os.environ.get('PRECOMPUTE_INTERVAL', 0))
+
+# 預設參數組合：網頁預設值，以及最常用的 geometry 跨河檢測
+DEFAULT_PARAM_SETS = ({}, {'verification': 'geometry'})
+
+STATE_VERSION = 1
+
+
+def _web():
+    """app 模組（規劃快取、批次規劃）；於函數內匯入，避免 app ↔ precompute 循環匯入"""
+    main = sys.modules.get('__main__')
+    if hasattr(main, 'plan_batch'):
+        return main  # python app.py：app 以 __main__ 執行，不重複載入
+    import app
+    return app
+
+
+def parse_start(text):
+    """'lat,lon' → {'lat', 'lon'}"""
+    lat, lon = (float(v) for v in text.split(','))
+    return {'lat': lat, 'lon': lon}
+
+
+def load_param_sets(spec=None, start=None):
+    """
+    讀取預先規劃的參數組合
+
+    Args:
+        spec: JSON 列表字串或 JSON 檔案路徑（None 時讀取 PRECOMPUTE_PARAM_SETS）
+        start: 預設起點（None 時讀取 PRECOMPUTE_START）
+
+    Returns:
+        與 /api/route 相同的完整參數列表（order_group 由規劃時填入）
+    """
+    spec = spec if spec is not None else os.environ.get('PRECOMPUTE_PARAM_SETS', '')
+    if start is None and os.environ.get('PRECOMPUTE_START'):
+        start = parse_start(os.environ['PRECOMPUTE_START'])
+
+    if not spec:
+        param_sets = list(DEFAULT_PARAM_SETS)
+    elif os.path.exists(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            param_sets = json.load(f)
+    else:
+        param_sets = json.loads(spec)
+    if not isinstance(param_sets, list) or not all(isinstance(p, dict) for p in param_sets):
+        raise ValueError('PRECOMPUTE_PARAM_SETS 必須為參數物件的列表')
+
+    params_list = []
+    for data in param_sets:
+        if not data.get('start') and not start:
+            raise ValueError('參數組合未指定 start，且未設定 PRECOMPUTE_START')
+        params_list.append(route_params(dict({'start': start}, **data, order_group=None)))
+    return params_list
+
+
+def discover_groups(group_pattern='%', max_groups=200):
+    """
+    彙總查詢各 order_group 的指紋（訂單有新增、刪除或座標變動時改變）
+
+    Returns:
+        {order_group: fingerprint}
+    """
+    query = f"""
+        SELECT order_group, COUNT(*) AS order_count, SUM(latitude) AS lat_sum, SUM(longitude) AS lon_sum,
+               MIN(tracking_number) AS first_tracking, MAX(tracking_number) AS last_tracking
+        FROM ordersjb
+        WHERE order_group LIKE %s
+        AND latitude IS NOT NULL
+        AND longitude IS NOT NULL
+        GROUP BY order_group
+        ORDER BY order_group DESC
+        LIMIT {int(max_groups)}
+    """
+    with DB_LATENCY.time(query='precompute_discover'):
+        conn = get_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        cursor.execute(query, (group_pattern,))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+    return {
+        row['order_group']: '|'.join(str(row[k]) for k in
+                                     ('order_count', 'lat_sum', 'lon_sum', 'first_tracking', 'last_tracking'))
+        for row in rows
+    }
+
+
+class Precomputer:
+    """預先規劃排程器（同一時間只執行一輪）"""
+
+    def __init__(self, param_sets=None, group_pattern='%', max_groups=200, state_path=None, workers=1):
+        self._param_sets = param_sets
+        self.group_pattern = group_pattern
+        self.max_groups = max_groups
+        self.state_path = state_path
+        self.planner = BatchPlanner(max_workers=workers)
+        self._state = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（設定來自環境變數 PRECOMPUTE_*）"""
+        if not hasattr(Precomputer, '_instance'):
+            store_dir = os.environ.get('PLAN_CACHE_DIR')
+            default_state = os.path.join(store_dir, 'precompute_state.json') if store_dir else None
+            Precomputer._instance = Precomputer(
+                group_pattern=os.environ.get('PRECOMPUTE_GROUP_PATTERN', '%'),
+                max_groups=int(os.environ.get('PRECOMPUTE_MAX_GROUPS', 200)),
+                state_path=os.environ.get('PRECOMPUTE_STATE') or default_state,
+                workers=int(os.environ.get('PRECOMPUTE_WORKERS', 1)),
+            )
+        return Precomputer._instance
+
+    @property
+    def param_sets(self):
+        if self._param_sets is None:
+            self._param_sets = load_param_sets()
+        return self._param_sets
+
+    # ------------------------------------------------------------------
+    # 狀態（各 order_group 已規劃的指紋，持久保存以跨進程 / 重新啟動）
+    # ------------------------------------------------------------------
+
+    def load_state(self):
+        if self.state_path:
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION:
+                    return state
+            except (FileNotFoundError, ValueError):
+                pass
+        elif self._state is not None:
+            return self._state
+        return {'version': STATE_VERSION, 'last_run': None, 'groups': {}}
+
+    def save_state(self, state):
+        self._state = state
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def signature(self, web):
+        """參數組合 + 障礙數據版本：任一改變時所有 order_group 都需重新規劃"""
+        obstacle_version = None
+        if any(params['verification'] != 'none' for params in self.param_sets):
+            obstacle_version = web.RiverDetector.get_instance().data_version
+        return canonical_params_hash({'param_sets': self.param_sets, 'obstacles': obstacle_version})[:16]
+
+    # ------------------------------------------------------------------
+    # 執行
+    # ------------------------------------------------------------------
+
+    def run_once(self):
+        """
+        執行一輪：發現 → 比對狀態 → 規劃變動的 order_group
+
+        Returns:
+            摘要 {discovered, changed, planned, cached, failed, empty, elapsed}
+        """
+        with self._run_lock:
+            return self._run_once()
+
+    def _run_once(self):
+        web = _web()
+        started = time.perf_counter()
+        param_sets = self.param_sets
+        signature = self.signature(web)
+        fingerprints = discover_groups(self.group_pattern, self.max_groups)
+
+        state = self.load_state()
+        known = state['groups']
+        changed = [g for g, fp in fingerprints.items()
+                   if known.get(g, {}).get('fingerprint') != fp or known[g].get('signature') != signature]
+        for order_group in changed:
+            if order_group in known and known[order_group]['fingerprint'] != fingerprints[order_group]:
+                # 訂單已變動：舊的規劃結果不會再命中，先釋放快取空間
+                web.plan_cache.invalidate(order_group)
+
+        summary = {'discovered': len(fingerprints), 'changed': len(changed),
+                   'planned': 0, 'cached': 0, 'failed': 0, 'empty': 0}
+        logger.info(f"預先規劃: 發現 {len(fingerprints)} 個 order_group，{len(changed)} 個需規劃"
+                    f"（{len(param_sets)} 組參數）")
+
+        for i in range(0, len(changed), BATCH_MAX_GROUPS):
+            chunk = changed[i:i + BATCH_MAX_GROUPS]
+            orders_by_group = web.fetch_valid_orders_many(chunk)
+            failed = set()
+            for params in param_sets:
+                for item in web.plan_batch(chunk, orders_by_group, params, planner=self.planner):
+                    if item['status'] == 'failed':
+                        failed.add(item['order_group'])
+                    elif item['cache_status'] == 'HIT':
+                        summary['cached'] += 1
+                    else:
+                        summary['planned'] += 1
+
+            for order_group in chunk:
+                valid_orders = orders_by_group.get(order_group)
+                if not valid_orders:
+                    # 沒有有效座標：記錄指紋，訂單變動前不再重試
+                    status = 'empty'
+                elif order_group in failed:
+                    summary['failed'] += 1
+                    PRECOMPUTE_GROUPS.inc(result='failed')
+                    continue  # 不記錄，下一輪重試
+                else:
+                    status = 'planned'
+                if status == 'empty':
+                    summary['empty'] += 1
+                PRECOMPUTE_GROUPS.inc(result=status)
+                known[order_group] = {
+                    'fingerprint': fingerprints[order_group],
+                    'signature': signature,
+                    'status': status,
+                    'snapshot_version': order_snapshot_version(valid_orders) if valid_orders else None,
+                    'planned_at': time.time(),
+                }
+
+        # 已不存在（或超出檢查範圍）的 order_group 不再追蹤
+        for order_group in [g for g in known if g not in fingerprints]:
+            del known[order_group]
+
+        summary['elapsed'] = round(time.perf_counter() - started, 4)
+        summary['finished_at'] = time.time()
+        state['last_run'] = summary
+        self.save_state(state)
+        logger.info(f"預先規劃完成（{summary['elapsed']:.2f}s）: 新規劃 {summary['planned']}、"
+                    f"已有快取 {summary['cached']}、失敗 {summary['failed']}")
+        return summary
+
+    def run_forever(self, interval):
+        """依間隔持續執行（單輪失敗只記錄，下一輪重試）"""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"預先規劃失敗: {e}")
+            self._stop.wait(interval)
+
+    def start_background(self, interval):
+        """背景執行緒排程（開發模式）"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, args=(interval,), name='precompute', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.planner.shutdown()
+
+    def status(self):
+        """/api/precompute/status 的回應內容（讀取狀態檔，可反映獨立排程進程）"""
+        state = self.load_state()
+        groups = state['groups']
+        return {
+            'running': self._run_lock.locked(),
+            'scheduled': self._thread is not None,
+            'state_path': self.state_path,
+            'last_run': state['last_run'],
+            'groups': len(groups),
+            'planned': sum(1 for g in groups.values() if g['status'] == 'planned'),
+            'empty': sum(1 for g in groups.values() if g['status'] == 'empty'),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='預先規劃 order_group')
+    parser.add_argument('command', choices=['once', 'run', 'status'])
+    parser.add_argument('--interval', type=float, default=PRECOMPUTE_INTERVAL or 300,
+                        help='run 的排程間隔秒數（預設 PRECOMPUTE_INTERVAL 或 300）')
+    args = parser.parse_args()
+
+    precomputer = Precomputer.get_instance()
+    if args.command == 'status':
+        print(json.dumps(precomputer.status(), ensure_ascii=False, indent=2))
+        return
+    if not os.environ.get('PLAN_CACHE_DIR'):
+        logger.warning("未設定 PLAN_CACHE_DIR：結果只存在本進程記憶體，其他進程無法使用")
+    if args.command == 'once':
+        print(json.dumps(precomputer.run_once(), ensure_ascii=False, indent=2))
+    else:
+        try:
+            precomputer.run_forever(args.interval)
+        except KeyboardInterrupt:
+            pass
+    precomputer.planner.shutdown()
+
+
+if __name__ == '__main__':
+    # 規劃進程池以 spawn 啟動子進程，主程式需放在 __main__ 之下
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+規劃請求的按需效能分析（僅限管理員）
+
+啟用方式：?profile=1 或標頭 X-Profile: 1，且 X-Admin-Token 與環境變數 ADMIN_TOKEN 相符。
+分析期間以 cProfile（確定性）記錄函數耗時、tracemalloc 追蹤記憶體，
+回應附上 profile 摘要，完整結果存於 PROFILE_DIR（預設 profiles/）：
+  <profile_id>.json → 摘要（熱點函數、各階段耗時 / CPU / 記憶體）
+  <profile_id>.prof → cProfile 原始數據（python -m pstats / snakeviz 可開啟）
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from app_logging import get_logger
+
+logger = get_logger('request_profiler')
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+TOP_N = 25
+TRACEMALLOC_FRAMES = 5
+
+# cProfile / tracemalloc 都是整個進程共用，同時只允許一個分析中的請求
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """已有其他請求正在分析"""
+
+
+def profiling_requested(request):
+    """請求是否要求分析（?profile=1 或 X-Profile: 1）"""
+    flag = request.args.get('profile') or request.headers.get('X-Profile', '')
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def is_admin(request):
+    """X-Admin-Token 是否與 ADMIN_TOKEN 相符（未設定 ADMIN_TOKEN 時一律拒絕）"""
+    expected = os.environ.get('ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8'))
+
+
+def _function_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # 內建函數，例如 <built-in method builtins.min>
+    return f"{os.path.relpath(filename) if os.path.isabs(filename) else filename}:{line}({name})"
+
+
+class RequestProfiler:
+    """
+    分析一次規劃呼叫
+
+    Example:
+        with RequestProfiler('/api/route') as profiler:
+            run_route_pipeline(..., on_stage=profiler.mark)
+        summary = profiler.save()
+
+    也可手動 start() / finish()（stop() 可重複呼叫，例如在 teardown 中確保釋放）
+    """
+
+    def __init__(self, endpoint, top_n=TOP_N):
+        self.endpoint = endpoint
+        self.top_n = top_n
+        self.profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.stages = []
+        self._profile = cProfile.Profile()
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self.running = False
+
+    def _counters(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return time.perf_counter(), time.thread_time(), current, peak
+
+    def start(self):
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfilerBusy("已有其他請求正在分析，請稍後再試")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start = self._last = self._counters()
+        self.running = True
+        self._profile.enable()
+        return self
+
+    def stop(self):
+        """停止分析並釋放鎖（已停止時不做任何事）"""
+        if not self.running:
+            return
+        self._profile.disable()
+        self.running = False
+        try:
+            self._end = self._counters()
+            self._overall_peak = max([s['peak_bytes'] for s in self.stages] + [self._end[3]])
+            self._snapshot = tracemalloc.take_snapshot()
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            _profile_lock.release()
+
+    def finish(self, directory=None):
+        """停止分析並儲存，返回摘要"""
+        self.stop()
+        return self.save(directory)
+
+    def __enter__(self):
+        return self.start()
+
+    def mark(self, stage, info=None):
+        """
+        階段邊界（可直接作為 run_route_pipeline 的 on_stage 回呼）
+
+        記錄自上一個邊界以來的 wall time、本執行緒 CPU time、記憶體淨增與峰值。
+        """
+        now = self._counters()
+        wall, cpu, current, peak = now
+        last_wall, last_cpu, last_current, _ = self._last
+        self.stages.append({
+            'stage': stage,
+            'cached': bool(info and info.get('cached')),
+            'wall_seconds': round(wall - last_wall, 6),
+            'cpu_seconds': round(cpu - last_cpu, 6),
+            'alloc_net_bytes': current - last_current,
+            'peak_bytes': peak,
+        })
+        tracemalloc.reset_peak()
+        self._last = (wall, cpu, current, current)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def hot_functions(self, sort='cumtime'):
+        """前 N 個熱點函數（cumtime = 含子呼叫，tottime = 函數本身）"""
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        rows = []
+        for func, (cc, nc, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': _function_label(func),
+                'calls': nc,
+                'primitive_calls': cc,
+                'tottime': round(tottime, 6),
+                'cumtime': round(cumtime, 6),
+            })
+        rows.sort(key=lambda r: r[sort], reverse=True)
+        return rows[:self.top_n]
+
+    def top_allocations(self):
+        """記憶體配置最多的前 N 行程式（分析結束時仍存活的配置）"""
+        if self._snapshot is None:
+            return []
+        snapshot = self._snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        return [
+            {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             'size_bytes': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:self.top_n]
+        ]
+
+    def summary(self):
+        """分析摘要（附在回應中）"""
+        wall, cpu, current, _ = self._end
+        return {
+            'profile_id': self.profile_id,
+            'endpoint': self.endpoint,
+            'profiler': 'cProfile',
+            'wall_seconds': round(wall - self._start[0], 6),
+            'cpu_seconds': round(cpu - self._start[1], 6),
+            'alloc_net_bytes': current - self._start[2],
+            'peak_bytes': self._overall_peak,
+            'stages': self.stages,
+            'hot_functions': self.hot_functions('cumtime'),
+            'hot_functions_self': self.hot_functions('tottime'),
+            'top_allocations': self.top_allocations(),
+        }
+
+    def save(self, directory=None):
+        """寫出 <profile_id>.json / .prof，返回摘要"""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        with open(os.path.join(directory, f"{self.profile_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        self._profile.dump_stats(os.path.join(directory, f"{self.profile_id}.prof"))
+        logger.info(f"效能分析已儲存: {directory}/{self.profile_id}.json "
+                    f"({summary['wall_seconds']:.2f}s, 峰值記憶體 {summary['peak_bytes'] / 1024 / 1024:.1f} MB)")
+        return summary
+
+
+def load_profile(profile_id, directory=None):
+    """讀取已儲存的分析摘要；不存在時返回 None"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(directory or PROFILE_DIR, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
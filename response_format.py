@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""API 回應格式協商 - 欄式 JSON / MessagePack + gzip / brotli 壓縮"""
+
+import gzip
+import json
+
+from flask import request
+
+from app_logging import get_logger
+
+logger = get_logger('response_format')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.route.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# 兼容用的重複欄位（精簡格式省略，保留右側欄位）
+DUPLICATE_FIELDS = {'latitude': 'lat', 'longitude': 'lon', 'group_label': 'group'}
+
+# 小於此大小不壓縮
+MIN_COMPRESS_BYTES = 1024
+
+# 缺少 msgpack 的警告只記錄一次（避免每個請求都記錄）
+_msgpack_warned = False
+
+
+def negotiate_format():
+    """
+    決定回應格式：?format= 優先，其次 Accept 標頭
+
+    Returns:
+        'json'（預設，逐筆 dict）| 'columnar'（欄式 JSON）| 'msgpack'（欄式 MessagePack）
+    """
+    requested = request.args.get('format')
+    if requested is None:
+        # 只有明確列出的精簡格式才算指定（瀏覽器的 */* 仍回傳 JSON）
+        listed = {mimetype: quality for mimetype, quality in request.accept_mimetypes}
+        requested = 'json'
+        best_quality = listed.get(JSON_MIMETYPE, 0)
+        for mimetype, name in ((COLUMNAR_MIMETYPE, 'columnar'), (MSGPACK_MIMETYPE, 'msgpack')):
+            if listed.get(mimetype, 0) > best_quality:
+                requested, best_quality = name, listed[mimetype]
+
+    if requested == 'msgpack' and msgpack is None:
+        global _msgpack_warned
+        if not _msgpack_warned:
+            _msgpack_warned = True
+            logger.warning("msgpack 未安裝，format=msgpack 改用欄式 JSON（pip install msgpack）")
+        return 'columnar'
+    return requested if requested in ('json', 'columnar', 'msgpack') else 'json'
+
+
+def negotiate_encoding():
+    """決定壓縮方式：br（需安裝 brotli）> gzip > 不壓縮"""
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(candidates)
+
+
+def dumps_json(obj):
+    """序列化為 JSON bytes（有 orjson 時使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(payload):
+    """解析 JSON（有 orjson 時使用 orjson）"""
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+def to_columns(rows):
+    """逐筆 dict 列表 → 欄式 {欄位: [值...]}（省略重複的兼容欄位）"""
+    fields = []
+    for row in rows:
+        for field in row:
+            if field not in fields:
+                fields.append(field)
+    fields = [f for f in fields if not (f in DUPLICATE_FIELDS and DUPLICATE_FIELDS[f] in fields)]
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+def to_columnar(result):
+    """回應中的 orders 轉為欄式（其餘欄位不變）"""
+    if not isinstance(result.get('orders'), list):
+        return result
+    columnar = dict(result)
+    columnar['orders'] = to_columns(result['orders'])
+    columnar['orders_format'] = 'columnar'
+    return columnar
+
+
+def compress(body, encoding):
+    """依協商結果壓縮（返回實際使用的編碼）"""
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=5), 'br'
+    return gzip.compress(body, compresslevel=5), 'gzip'
+
+
+def format_response(response_class, result=None, payload=None, status=200):
+    """
+    依 Accept / ?format= / Accept-Encoding 產生回應
+
+    Args:
+        response_class: Flask 的 app.response_class
+        result: 回應內容（dict）
+        payload: 已序列化的 JSON 字串（例如規劃結果快取）；預設格式時直接使用
+        status: HTTP 狀態碼
+    """
+    fmt = negotiate_format()
+
+    if fmt == 'json':
+        body = payload.encode('utf-8') if payload is not None else dumps_json(result)
+        mimetype = JSON_MIMETYPE
+    else:
+        if result is None:
+            result = loads_json(payload)
+        columnar = to_columnar(result)
+        if fmt == 'msgpack':
+            body = msgpack.packb(columnar, use_bin_type=True)
+            mimetype = MSGPACK_MIMETYPE
+        else:
+            body = dumps_json(columnar)
+            mimetype = COLUMNAR_MIMETYPE
+
+    body, encoding = compress(body, negotiate_encoding())
+
+    response = response_class(body, status=status, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
@@ -1,30 +1,126 @@
 #!/usr/bin/env python3
 """地理障礙檢測模組（河流 + 高速公路）"""
 
+import hashlib
 import json
-import requests
-from shapely.geometry import LineString, Point
+import math
+import os
+import numpy as np
+import shapely
+from shapely.geometry import LineString, Point, box
 from shapely import geometry
 from shapely.strtree import STRtree
 import time
 
+from app_logging import get_logger
+from metrics import OBSTACLE_CHECKS, VALHALLA_LATENCY
+from obstacle_index import PreparedObstacleIndex, prepared_enabled
+from obstacle_regions import RegionMap, regions_enabled
+from obstacle_simplify import obstacle_data_version, simplify_lines, simplify_tolerance
+
+logger = get_logger('river_detection')
+
+# 單次規劃的障礙子集：訂單外框向外擴展的距離（km）；OBSTACLE_VIEW=0 停用，直接查詢完整索引
+OBSTACLE_VIEW_MARGIN_KM = float(os.environ.get('OBSTACLE_VIEW_MARGIN_KM', 1.0))
+
+def data_files_version(*filenames):
+    """障礙數據版本：各檔案大小 + 修改時間的雜湊（數據更新即改變）"""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+        except OSError:
+            digest.update(f"{filename}:missing;".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
 class ObstacleDetector:
-    def __init__(self, rivers_data_file='rivers_data.json', highways_data_file='highways_data.json'):
-        """初始化障礙檢測器"""
+    def __init__(self, rivers_data_file='rivers_data.json', highways_data_file='highways_data.json', store=None,
+                 simplify_m=None):
+        """
+        初始化障礙檢測器
+
+        store: obstacle_store.ObstacleStore（共用記憶體模式，不建立 LineString / STRtree）
+        simplify_m: 載入時的簡化容差（公尺；None 使用 OBSTACLE_SIMPLIFY_M）
+        """
         self.rivers = []
         self.highways = []
         self.rivers_tree = None  # 空間索引
         self.highways_tree = None  # 空間索引
+        self.rivers_index = None  # 合併 + 預備幾何索引（obstacle_index.py）
+        self.highways_index = None
+        self.store = store
+        if store is not None:
+            self.data_version = store.data_version
+            return
+        # 已載入數據的版本（規劃結果快取鍵的一部分，含簡化容差）
+        self.simplify_m = simplify_tolerance(simplify_m)
+        self.data_version = obstacle_data_version(rivers_data_file, highways_data_file, tolerance_m=self.simplify_m)
+        self.simplify_reports = {}
         self.load_rivers(rivers_data_file)
         self.load_highways(highways_data_file)
     
     @staticmethod
     def get_instance(rivers_data_file='rivers_data.json', highways_data_file='highways_data.json'):
-        """獲取單例實例（避免重複載入）"""
+        """
+        獲取單例實例（避免重複載入）
+
+        設定 OBSTACLE_STORE=<目錄> 時改為附加打包數據（多進程共用，見 obstacle_store.py）
+        """
         if not hasattr(ObstacleDetector, '_instance'):
-            ObstacleDetector._instance = ObstacleDetector(rivers_data_file, highways_data_file)
+            store_dir = os.environ.get('OBSTACLE_STORE')
+            if store_dir:
+                from obstacle_store import ObstacleStore
+                store = ObstacleStore.open_or_build(store_dir, rivers_data_file, highways_data_file)
+                ObstacleDetector._instance = ObstacleDetector(store=store)
+            else:
+                ObstacleDetector._instance = ObstacleDetector(rivers_data_file, highways_data_file)
         return ObstacleDetector._instance
+
+    def obstacle_counts(self):
+        """已載入的線段數 {'rivers': n, 'highways': n}"""
+        if self.store is not None:
+            return {kind: self.store.line_count(kind) for kind in ('rivers', 'highways')}
+        return {'rivers': len(self.rivers), 'highways': len(self.highways)}
     
+    def _simplify(self, kind, lines):
+        """簡化容差 > 0 時合併並簡化線段（見 obstacle_simplify.py）"""
+        if self.simplify_m <= 0 or not lines:
+            return lines
+        lines, report = simplify_lines(lines, self.simplify_m)
+        self.simplify_reports[kind] = report
+        (lines_before, lines_after), (vertices_before, vertices_after) = report['lines'], report['vertices']
+        logger.info(f"簡化 {kind}（容差 {self.simplify_m:g} m）: {lines_before} → {lines_after} 條，"
+                    f"頂點 {vertices_before} → {vertices_after}（-{1 - vertices_after / max(vertices_before, 1):.0%}）")
+        return lines
+
+    def lines_in_bounds(self, kind, bounds):
+        """
+        與外框 (min_lon, min_lat, max_lon, max_lat) 重疊的線（ObstacleView 裁切前的候選）
+
+        Returns:
+            LineString 陣列
+        """
+        if self.store is not None:
+            coords, indices = self.store.kinds[kind].lines_in_bounds(*bounds)
+            return shapely.linestrings(coords, indices=indices) if len(coords) else np.empty(0, dtype=object)
+        lines = self.rivers if kind == 'rivers' else self.highways
+        tree = self.rivers_tree if kind == 'rivers' else self.highways_tree
+        if tree is None:
+            return np.empty(0, dtype=object)
+        return tree.geometries.take(tree.query(box(*bounds)))
+
+    def view(self, points, margin_km=None):
+        """
+        單次規劃用的障礙子集（points 為 [(lat, lon), ...]，外框向外擴展 margin_km）
+
+        OBSTACLE_VIEW=0 時返回自身（查詢完整索引）
+        """
+        if os.environ.get('OBSTACLE_VIEW', '1') == '0' or not points:
+            return self
+        return ObstacleView(self, points, OBSTACLE_VIEW_MARGIN_KM if margin_km is None else margin_km)
+
     def load_rivers(self, filename):
         """載入河流幾何數據"""
         try:
@@ -48,19 +144,22 @@ class ObstacleDetector:
                     if len(coords) >= 2:
                         self.rivers.append(LineString(coords))
             
-            print(f"[INFO] 載入 {len(self.rivers)} 條河流線段")
+            logger.info(f"載入 {len(self.rivers)} 條河流線段")
+            self.rivers = self._simplify('rivers', self.rivers)
 
             # 建立空間索引（大幅提升查詢性能）
             if self.rivers:
-                print(f"[INFO] 建立河流空間索引...")
+                logger.info(f"建立河流空間索引...")
                 self.rivers_tree = STRtree(self.rivers)
-                print(f"[INFO] 空間索引建立完成")
+                if prepared_enabled():
+                    self.rivers_index = PreparedObstacleIndex(self.rivers)
+                logger.info(f"空間索引建立完成")
 
         except FileNotFoundError:
-            print(f"[WARN] 找不到河流數據檔案: {filename}")
+            logger.warning(f"找不到河流數據檔案: {filename}")
             self.rivers = []
         except Exception as e:
-            print(f"[ERROR] 載入河流數據失敗: {e}")
+            logger.error(f"載入河流數據失敗: {e}")
             self.rivers = []
     
     def load_highways(self, filename):
@@ -86,28 +185,35 @@ class ObstacleDetector:
                     if len(coords) >= 2:
                         self.highways.append(LineString(coords))
             
-            print(f"[INFO] 載入 {len(self.highways)} 條高速公路線段")
+            logger.info(f"載入 {len(self.highways)} 條高速公路線段")
+            self.highways = self._simplify('highways', self.highways)
 
             # 建立空間索引（大幅提升查詢性能）
             if self.highways:
-                print(f"[INFO] 建立高速公路空間索引...")
+                logger.info(f"建立高速公路空間索引...")
                 self.highways_tree = STRtree(self.highways)
-                print(f"[INFO] 空間索引建立完成")
+                if prepared_enabled():
+                    self.highways_index = PreparedObstacleIndex(self.highways)
+                logger.info(f"空間索引建立完成")
 
         except FileNotFoundError:
-            print(f"[WARN] 找不到高速公路數據檔案: {filename}")
+            logger.warning(f"找不到高速公路數據檔案: {filename}")
             self.highways = []
         except Exception as e:
-            print(f"[ERROR] 載入高速公路數據失敗: {e}")
+            logger.error(f"載入高速公路數據失敗: {e}")
             self.highways = []
     
     def check_crossing_geometry(self, lat1, lon1, lat2, lon2):
         """方法 2：使用河流幾何數據檢查是否跨河（空間索引優化版）"""
+        if self.store is not None:
+            return self.store.crosses('rivers', lat1, lon1, lat2, lon2)
         if not self.rivers or not self.rivers_tree:
             return False
 
         # 建立訂單間的直線
         line = LineString([(lon1, lat1), (lon2, lat2)])
+        if self.rivers_index is not None:
+            return self.rivers_index.crosses(line)
 
         # 使用空間索引快速查詢可能相交的河流索引（性能提升 100-1000 倍）
         possible_indices = self.rivers_tree.query(line)
@@ -121,11 +227,15 @@ class ObstacleDetector:
     
     def check_highway_crossing(self, lat1, lon1, lat2, lon2):
         """檢查是否跨越高速公路（空間索引優化版）"""
+        if self.store is not None:
+            return self.store.crosses('highways', lat1, lon1, lat2, lon2)
         if not self.highways or not self.highways_tree:
             return False
 
         # 建立訂單間的直線
         line = LineString([(lon1, lat1), (lon2, lat2)])
+        if self.highways_index is not None:
+            return self.highways_index.crosses(line)
 
         # 使用空間索引快速查詢可能相交的高速公路索引（性能提升 100-1000 倍）
         possible_indices = self.highways_tree.query(line)
@@ -148,14 +258,44 @@ class ObstacleDetector:
         if check_highways:
             crosses_highway = self.check_highway_crossing(lat1, lon1, lat2, lon2)
         
+        OBSTACLE_CHECKS.inc(kind='geometry', result='crossing' if crosses_river or crosses_highway else 'clear')
         return {
             'crosses_river': crosses_river,
             'crosses_highway': crosses_highway,
             'crosses_any': crosses_river or crosses_highway
         }
     
+    def edge_crossings(self, coords, rows, cols, check_highways=False):
+        """
+        批次檢測點對之間的連線（障礙感知聚類只檢測鄰域圖的邊，O(邊數)）
+
+        Args:
+            coords: [[lat, lon], ...]
+            rows, cols: 每條邊的兩端點索引
+
+        Returns:
+            bool 陣列（與邊對齊，True = 穿越河流或高速公路）
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        result = np.zeros(len(rows), dtype=bool)
+        for k, (i, j) in enumerate(zip(np.asarray(rows).tolist(), np.asarray(cols).tolist())):
+            result[k] = self.check_obstacle_crossing(
+                coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1], check_highways=check_highways
+            )['crosses_any']
+        return result
+
     def check_crossing_api(self, lat1, lon1, lat2, lon2):
         """方法 3：使用 Valhalla API 檢查實際路線是否跨河"""
+        with VALHALLA_LATENCY.time(call='crossing_check'):
+            crosses = self._request_crossing_api(lat1, lon1, lat2, lon2)
+        result = 'error' if crosses is None else ('crossing' if crosses else 'clear')
+        OBSTACLE_CHECKS.inc(kind='api', result=result)
+        return crosses
+
+    def _request_crossing_api(self, lat1, lon1, lat2, lon2):
+        """呼叫 Valhalla route API；失敗時返回 None"""
+        import requests  # 僅 API 驗證模式使用，延遲載入
+
         try:
             # 調用 Valhalla route API
             url = "https://valhalla1.openstreetmap.de/route"
@@ -192,28 +332,250 @@ class ObstacleDetector:
                 
                 return False
             else:
-                print(f"[WARN] Valhalla API 返回錯誤: {response.status_code}")
+                logger.warning(f"Valhalla API 返回錯誤: {response.status_code}")
                 return None
                 
         except requests.exceptions.Timeout:
-            print(f"[WARN] Valhalla API 超時")
+            logger.warning(f"Valhalla API 超時")
             return None
         except Exception as e:
-            print(f"[ERROR] API 調用失敗: {e}")
+            logger.error(f"API 調用失敗: {e}")
             return None
 
 
-def verify_route_crossings(orders, verification_method='none', check_highways=False):
-    """驗證路線中的障礙穿越情況（河流 + 高速公路）"""
+class ObstacleView(ObstacleDetector):
+    """
+    單次規劃的障礙子集
+
+    將河流 / 高速公路裁切至訂單外框（外擴 margin_km）後建立小型索引（obstacle_index.py），
+    同一次規劃的所有穿越檢測都查詢此索引：長河流、湖岸線只保留外框內的頂點，
+    索引也只含附近的線，單次檢測的精確比對成本大幅下降。
+    規劃中的連線端點皆為訂單、起點、終點或群組中心，必定落在外框內；
+    外框以外的查詢（理論上不會發生）改查完整索引，結果不變。
+    外框內另建障礙面標記（obstacle_regions.py）：端點位於不同面、或連線落在兩端的淨空範圍內時，
+    不需精確比對即可得到相同的結果。
+    """
+
+    def __init__(self, detector, points, margin_km=OBSTACLE_VIEW_MARGIN_KM):
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        margin_lat = margin_km / 111.0
+        margin_lon = margin_km / (111.0 * max(math.cos(math.radians(sum(lats) / len(lats))), 0.01))
+        self.bounds = (min(lons) - margin_lon, min(lats) - margin_lat, max(lons) + margin_lon, max(lats) + margin_lat)
+        self.detector = detector
+        self.store = None
+        self.data_version = detector.data_version
+        self.queries = 0
+        self.candidates = {'rivers': 0, 'highways': 0}
+        self.fallbacks = 0
+        self.build_seconds = 0.0
+        self._lines = {}
+        self._trees = {}
+        self._vertices = {}
+        self._regions = {}
+        self._labels = {'rivers': {}, 'highways': {}}
+        self.region_decisions = {'rivers': 0, 'highways': 0}
+
+    def _region_map(self, kind):
+        """障礙面標記（與索引相同，第一次查詢該類別時才建立）"""
+        if kind not in self._regions:
+            self._index(kind)
+            start = time.perf_counter()
+            self._regions[kind] = RegionMap(self._lines[kind], self.bounds) if self._lines[kind] else None
+            self.build_seconds += time.perf_counter() - start
+        return self._regions[kind]
+
+    def _label(self, kind, regions, lat, lon):
+        """端點的 (面編號, 淨空距離)；同一次規劃中重複的端點只計算一次"""
+        cache = self._labels[kind]
+        key = (lat, lon)
+        if key not in cache:
+            labels, clearance = regions.classify([lat], [lon])
+            cache[key] = (int(labels[0]), float(clearance[0]))
+        return cache[key]
+
+    def _index(self, kind):
+        """第一次查詢該類別時才裁切並建立索引（未檢測高速公路時不建立）"""
+        if kind not in self._trees:
+            start = time.perf_counter()
+            candidates = self.detector.lines_in_bounds(kind, self.bounds)
+            lines = shapely.clip_by_rect(candidates, *self.bounds)
+            lines = lines[~shapely.is_empty(lines)] if len(lines) else lines
+            self._vertices[kind] = (int(shapely.get_num_coordinates(candidates).sum()),
+                                    int(shapely.get_num_coordinates(lines).sum()))
+            self._lines[kind] = list(lines)
+            if not len(lines):
+                self._trees[kind] = None
+            elif prepared_enabled():
+                self._trees[kind] = PreparedObstacleIndex(lines)
+            else:
+                self._trees[kind] = STRtree(lines)
+            self.build_seconds += time.perf_counter() - start
+        return self._trees[kind]
+
+    def _inside(self, lat1, lon1, lat2, lon2):
+        min_x, min_y, max_x, max_y = self.bounds
+        return (min_x <= lon1 <= max_x and min_x <= lon2 <= max_x and
+                min_y <= lat1 <= max_y and min_y <= lat2 <= max_y)
+
+    def _crosses(self, kind, lat1, lon1, lat2, lon2):
+        if not self._inside(lat1, lon1, lat2, lon2):
+            self.fallbacks += 1
+            if kind == 'rivers':
+                return self.detector.check_crossing_geometry(lat1, lon1, lat2, lon2)
+            return self.detector.check_highway_crossing(lat1, lon1, lat2, lon2)
+        tree = self._index(kind)
+        self.queries += 1
+        if tree is None:
+            return False
+        if regions_enabled():
+            regions = self._region_map(kind)
+            label1, clear1 = self._label(kind, regions, lat1, lon1)
+            label2, clear2 = self._label(kind, regions, lat2, lon2)
+            decided = RegionMap.decide(label1, clear1, label2, clear2, math.hypot(lon2 - lon1, lat2 - lat1))
+            if decided is not None:
+                self.region_decisions[kind] += 1
+                return decided
+        line = LineString([(lon1, lat1), (lon2, lat2)])
+        if isinstance(tree, PreparedObstacleIndex):
+            groups = tree.candidates(line)
+            self.candidates[kind] += len(groups)
+            return tree.intersects_any(groups, line)
+        possible_indices = tree.query(line)
+        self.candidates[kind] += len(possible_indices)
+        # 裁切後的線只剩外框內的頂點，精確檢查的成本隨之下降
+        lines = self._lines[kind]
+        for idx in possible_indices:
+            if line.intersects(lines[idx]):
+                return True
+        return False
+
+    def check_crossing_geometry(self, lat1, lon1, lat2, lon2):
+        return self._crosses('rivers', lat1, lon1, lat2, lon2)
+
+    def check_highway_crossing(self, lat1, lon1, lat2, lon2):
+        return self._crosses('highways', lat1, lon1, lat2, lon2)
+
+    def crossing_matrix(self, points, check_highways=False):
+        """
+        點之間的 n × n 穿越矩陣（河流，check_highways 時合併高速公路）
+
+        Args:
+            points: [(lat, lon), ...]，需位於外框內
+
+        Returns:
+            (bool 矩陣, 各類別統計 {'label', 'clearance', 'exact'})
+        """
+        lats = np.array([p[0] for p in points], dtype=np.float64)
+        lons = np.array([p[1] for p in points], dtype=np.float64)
+        matrix = np.zeros((len(points), len(points)), dtype=bool)
+        stats = {}
+        for kind in ('rivers', 'highways') if check_highways else ('rivers',):
+            regions = self._region_map(kind)
+            if regions is None:
+                continue
+            tree = self._trees[kind]
+
+            def exact(i, j, tree=tree, kind=kind):
+                if matrix[i, j]:
+                    return True  # 已因其他類別穿越
+                line = LineString([(lons[i], lats[i]), (lons[j], lats[j])])
+                if isinstance(tree, PreparedObstacleIndex):
+                    return tree.crosses(line)
+                lines = self._lines[kind]
+                return any(line.intersects(lines[idx]) for idx in tree.query(line))
+
+            kind_matrix, stats[kind] = regions.crossing_matrix(lats, lons, exact=exact)
+            matrix |= kind_matrix
+        return matrix, stats
+
+    def edge_crossings(self, coords, rows, cols, check_highways=False):
+        """
+        批次檢測（面編號 / 淨空距離以陣列判斷，其餘邊一次批次查詢索引）
+
+        外框以外的邊（理論上不會發生）逐條檢測，結果與 ObstacleDetector.edge_crossings 相同。
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        lats, lons = coords[:, 0], coords[:, 1]
+        min_x, min_y, max_x, max_y = self.bounds
+        inside_point = (lons >= min_x) & (lons <= max_x) & (lats >= min_y) & (lats <= max_y)
+        inside = inside_point[rows] & inside_point[cols]
+        result = np.zeros(len(rows), dtype=bool)
+
+        for kind in ('rivers', 'highways') if check_highways else ('rivers',):
+            tree = self._index(kind)
+            if tree is None:
+                continue
+            undecided = inside & ~result
+            self.queries += int(undecided.sum())
+            if regions_enabled():
+                labels, clearance = self._region_map(kind).classify(lats, lons)
+                label_a, label_b = labels[rows], labels[cols]
+                by_label = (label_a >= 0) & (label_b >= 0) & (label_a != label_b)
+                distance = np.hypot(lons[cols] - lons[rows], lats[cols] - lats[rows])
+                by_clearance = distance < clearance[rows] + clearance[cols]
+                self.region_decisions[kind] += int((undecided & (by_label | by_clearance)).sum())
+                result |= undecided & by_label
+                undecided &= ~by_label & ~by_clearance
+
+            idx = np.flatnonzero(undecided)
+            if not len(idx):
+                continue
+            segments = shapely.linestrings(np.stack([
+                np.column_stack([lons[rows[idx]], lats[rows[idx]]]),
+                np.column_stack([lons[cols[idx]], lats[cols[idx]]]),
+            ], axis=1))
+            if isinstance(tree, PreparedObstacleIndex):
+                result[idx] = tree.crosses_many(segments)
+            else:
+                lines = self._lines[kind]
+                segment_idx, line_idx = tree.query(segments)
+                self.candidates[kind] += len(line_idx)
+                hits = shapely.intersects(np.asarray(lines, dtype=object)[line_idx], segments[segment_idx])
+                result[idx[np.unique(segment_idx[hits])]] = True
+
+        crossing = int(result[inside].sum())
+        OBSTACLE_CHECKS.inc(crossing, kind='geometry', result='crossing')
+        OBSTACLE_CHECKS.inc(int(inside.sum()) - crossing, kind='geometry', result='clear')
+
+        outside = np.flatnonzero(~inside)
+        if len(outside):
+            result[outside] = ObstacleDetector.edge_crossings(self, coords, rows[outside], cols[outside], check_highways)
+        return result
+
+    def obstacle_counts(self):
+        """子集中的線數（尚未使用的類別為 0）"""
+        return {kind: len(self._lines.get(kind, ())) for kind in ('rivers', 'highways')}
+
+    def stats(self):
+        return {
+            'bounds': [round(v, 6) for v in self.bounds],
+            'lines': self.obstacle_counts(),
+            'queries': self.queries,
+            'candidates': dict(self.candidates),
+            # 裁切前 / 後的頂點數（精確檢查的成本與頂點數成正比）
+            'vertices': {kind: list(counts) for kind, counts in self._vertices.items()},
+            'fallbacks': self.fallbacks,
+            # 以障礙面 / 淨空距離判斷、不需精確比對的查詢數
+            'region_decisions': dict(self.region_decisions),
+            'faces': {kind: regions.face_count for kind, regions in self._regions.items() if regions is not None},
+            'build_seconds': round(self.build_seconds, 4),
+        }
+
+
+def verify_route_crossings(orders, verification_method='none', check_highways=False, detector=None):
+    """驗證路線中的障礙穿越情況（河流 + 高速公路）；detector 可傳入單次規劃的 ObstacleView"""
     if verification_method == 'none':
         return []
 
-    detector = ObstacleDetector.get_instance()
+    detector = detector or ObstacleDetector.get_instance()
     crossings = []
 
     if verification_method == 'geometry':
         # 方法 2：幾何檢測（河流 + 高速公路）使用空間索引優化
-        print(f"[INFO] 使用空間索引進行幾何檢測 ({len(orders) - 1} 對連接)")
+        logger.info(f"使用空間索引進行幾何檢測 ({len(orders) - 1} 對連接)")
 
         for i in range(len(orders) - 1):
             order1 = orders[i]
@@ -240,7 +602,7 @@ def verify_route_crossings(orders, verification_method='none', check_highways=Fa
         # 方法 3：API 實際路線檢測（限制數量以避免太慢）
         max_checks = min(100, len(orders) - 1)  # 最多檢查 100 對
         
-        print(f"[INFO] API 檢測模式：將檢查前 {max_checks} 對訂單")
+        logger.info(f"API 檢測模式：將檢查前 {max_checks} 對訂單")
         
         for i in range(max_checks):
             order1 = orders[i]
@@ -0,0 +1,1236 @@
+#!/usr/bin/env python3
+"""
+/api/route 分階段路徑規劃流程
+
+流程：聚類（DBSCAN + 噪聲點）→ 大群組細分 → 群組排序 → 組內排序 → 終點與障礙檢測
+每個階段的輸出以「上游階段鍵 + 本階段參數」為鍵快取：只調整組內排序參數時，
+聚類與群組排序直接重用，只重算組內排序。
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app_logging import get_logger, LogSampler
+from core_routing_algorithms import capacitated_kmeans
+from crossing_points import CrossingPointIndex
+from neighbor_graph_cache import NeighborGraphCache, metric_space
+from plan_cache import canonical_params_hash, order_snapshot_version
+from river_detection import verify_route_crossings, RiverDetector
+from metrics import STAGE_CACHE, STAGE_LATENCY
+from tsp_solver import solve_tsp
+
+logger = get_logger('route_pipeline')
+
+# 請求參數預設值
+ROUTE_DEFAULTS = {
+    'costing': 'auto',
+    'max_orders': 5000,  # 用戶指定的最大訂單數
+    'max_group_size': 30,  # 每組最多訂單數
+    'cluster_radius': 1.0,  # 鄰域半徑 (km)
+    'min_samples': 3,  # DBSCAN 最小樣本數
+    'cluster_obstacles': False,  # 障礙感知聚類：鄰域圖中穿越河流（/ 高速公路）的邊不連通
+    'metric': 'euclidean',  # 距離計算方式
+    'random_state': 42,  # K-means 隨機種子
+    'n_init': 10,  # K-means 初始化次數
+    'verification': 'none',  # 跨河檢測方式
+    'group_penalty': 2.0,  # 群組間跨河懲罰
+    'inner_penalty': 1.5,  # 組內跨河懲罰
+    'crossing_cost': 'penalty',  # 穿越障礙的成本：penalty（乘上懲罰係數）| detour（經由最近的橋 / 穿越點）
+    'check_highways': False,  # 是否檢測高速公路
+    'group_order_method': 'greedy',  # 群組排序方法
+    'inner_order_method': 'nearest',  # 組內排序方法
+    'end_point_mode': 'last_order',  # 終點模式
+    'end_point': None,  # 終點座標（手動模式）
+}
+
+# 每個階段依賴的參數：同時作為階段快取鍵與 algorithm_steps 的 affected_by
+STAGE_PARAMS = {
+    'cluster': ['cluster_radius', 'min_samples', 'metric', 'cluster_obstacles'],
+    'split': ['max_group_size', 'random_state', 'n_init'],
+    'group_order': ['start', 'group_order_method', 'verification', 'group_penalty', 'check_highways',
+                    'crossing_cost'],
+    'inner_order': ['inner_order_method', 'verification', 'inner_penalty', 'check_highways', 'crossing_cost'],
+    'finish': ['end_point_mode', 'end_point', 'verification', 'check_highways'],
+}
+
+# 使用障礙數據的階段（障礙數據更新時需重算）
+OBSTACLE_STAGES = {'group_order', 'inner_order', 'finish'}
+
+STAGE_ORDER = ['cluster', 'split', 'group_order', 'inner_order', 'finish']
+
+GROUP_NAMES = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J',
+               'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T',
+               'U', 'V', 'W', 'X', 'Y', 'Z']
+
+
+def route_params(data):
+    """合併請求參數與預設值（start / order_group 由呼叫端驗證）"""
+    params = {'start': data.get('start'), 'order_group': data.get('order_group')}
+    for name, default in ROUTE_DEFAULTS.items():
+        params[name] = data.get(name, default)
+    return params
+
+
+def group_name(idx):
+    """群組索引 → 顯示名稱（A, B, ... Z, Z1, Z2...）"""
+    return GROUP_NAMES[idx] if idx < len(GROUP_NAMES) else f"Z{idx-25}"
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """計算兩點之間的歐幾里得距離"""
+    return math.sqrt((lat2 - lat1)**2 + (lon2 - lon1)**2)
+
+
+def crossing_index_for(params):
+    """crossing_cost='detour' 時的穿越點索引（crossing_points.py），否則 None"""
+    if params.get('crossing_cost') == 'detour' and params['verification'] != 'none':
+        return CrossingPointIndex.get_instance()
+    return None
+
+
+def crossing_cost(distance, penalty, crossing_index, lat1, lon1, lat2, lon2, crosses_river, crosses_highway):
+    """穿越障礙的成本：經由最近穿越點的距離（detour），沒有索引或穿越點時為直線距離 × 懲罰係數"""
+    if crossing_index is not None:
+        detour = crossing_index.detour_cost(lat1, lon1, lat2, lon2, crosses_river, crosses_highway)
+        if detour is not None:
+            return detour
+    return distance * penalty
+
+
+def stage_uses_obstacles(stage, params):
+    """階段是否使用障礙數據（聚類只在障礙感知模式下使用）"""
+    if stage == 'cluster':
+        return bool(params.get('cluster_obstacles'))
+    return stage in OBSTACLE_STAGES and params.get('verification') != 'none'
+
+
+class StageCache:
+    """階段輸出快取（LRU）；快取的輸出為唯讀，下游階段不得修改"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例（所有請求共用快取）"""
+        if not hasattr(StageCache, '_instance'):
+            StageCache._instance = StageCache()
+        return StageCache._instance
+
+    @staticmethod
+    def stage_key(parent_key, stage, params, obstacle_version=None):
+        """階段鍵 = 上游階段鍵 + 階段名稱 + 本階段參數（+ 障礙數據版本）"""
+        stage_inputs = {name: params.get(name) for name in STAGE_PARAMS[stage]}
+        if stage == 'cluster' and params.get('cluster_obstacles'):
+            stage_inputs['check_highways'] = params.get('check_highways')
+        raw = f"{parent_key}|{stage}|{canonical_params_hash(stage_inputs)}"
+        if stage_uses_obstacles(stage, params):
+            raw += f"|{obstacle_version or '-'}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._entries.clear()
+
+
+# ============================================================================
+# 階段 1：DBSCAN 聚類 + 噪聲點處理
+# ============================================================================
+
+def obstacle_edge_filter(detector, coords, check_highways=False):
+    """
+    障礙感知聚類的邊篩選：只檢測 eps 鄰域圖中的邊（O(邊數)），移除穿越障礙的邊
+
+    每對點只檢測一次（i→j 與 j→i 共用結果，篩選後的圖保持對稱）。
+
+    Returns:
+        (edge_filter, 統計 {'edges': 檢測的點對數, 'pruned': 移除的點對數})
+    """
+    stats = {'edges': 0, 'pruned': 0}
+
+    def edge_filter(rows, cols):
+        keep = np.ones(len(rows), dtype=bool)
+        pair = rows != cols
+        n = len(coords)
+        keys = np.minimum(rows[pair], cols[pair]) * n + np.maximum(rows[pair], cols[pair])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        crossing = detector.edge_crossings(coords, unique_keys // n, unique_keys % n, check_highways)
+        keep[pair] = ~crossing[inverse]
+        stats['edges'] = int(len(unique_keys))
+        stats['pruned'] = int(crossing.sum())
+        return keep
+
+    return edge_filter, stats
+
+
+def nearest_reachable(detector, coords, idx, candidates, distances, check_highways=False, batch_size=16):
+    """
+    噪聲點的分配目標：最近且連線不穿越障礙的候選點（障礙感知聚類用）
+
+    依距離由近到遠分批檢測，找到即停止；全部穿越時退回最近的候選點。
+
+    Returns:
+        (candidates 中的位置, 是否為退回結果)
+    """
+    order = np.argsort(distances, kind='stable')
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        crossing = detector.edge_crossings(
+            coords, np.full(len(batch), idx), np.asarray(candidates)[batch], check_highways
+        )
+        if not crossing.all():
+            return int(batch[np.argmin(crossing)]), False
+        batch_size *= 4  # 近處都被阻隔時，擴大下一批
+    return int(order[0]), True
+
+
+def run_cluster_stage(valid_orders, params, detector=None):
+    """DBSCAN 密度聚類，並將噪聲點分配到最近的群組（cluster_obstacles 時鄰域不跨越障礙）"""
+    cluster_radius = params['cluster_radius']
+    min_samples = params['min_samples']
+    metric = params['metric']
+    n_orders = len(valid_orders)
+    steps = []
+
+    coords = np.array([[o['lat'], o['lon']] for o in valid_orders])
+
+    edge_filter, edge_stats = None, None
+    if params.get('cluster_obstacles'):
+        detector = detector or RiverDetector.get_instance()
+        edge_filter, edge_stats = obstacle_edge_filter(detector, coords, params.get('check_highways', False))
+
+    # 鄰域圖按訂單快照快取，調整半徑 / min_samples 時不需重新搜尋鄰域
+    _, eps_distance = metric_space(coords, cluster_radius, metric)
+    with STAGE_LATENCY.time(stage='dbscan'):
+        cluster_labels = NeighborGraphCache.get_instance().dbscan_labels(
+            coords, cluster_radius, min_samples, metric, edge_filter=edge_filter
+        )
+    if edge_stats is not None:
+        logger.info(f"障礙感知聚類: 檢測 {edge_stats['edges']} 條鄰域邊，移除 {edge_stats['pruned']} 條穿越障礙的邊")
+    if metric == 'haversine':
+        logger.info(f"使用 Haversine 距離，eps={eps_distance:.6f} 弧度")
+    else:
+        logger.info(f"使用 {metric} 距離，eps={eps_distance:.6f} 度")
+
+    # 記錄步驟：DBSCAN 聚類完成
+    unique_labels = set(cluster_labels)
+    n_clusters = len(unique_labels) - (1 if -1 in unique_labels else 0)
+    n_noise = list(cluster_labels).count(-1)
+
+    # 建立初步群組資料並計算中心點
+    dbscan_clusters = {}
+    dbscan_centers = {}
+    for idx, label in enumerate(cluster_labels):
+        label_key = str(int(label))  # 轉換為字符串
+        if label_key not in dbscan_clusters:
+            dbscan_clusters[label_key] = []
+        dbscan_clusters[label_key].append({
+            'index': int(idx),
+            'lat': float(valid_orders[idx]['lat']),
+            'lon': float(valid_orders[idx]['lon']),
+            'tracking_number': valid_orders[idx]['tracking_number']
+        })
+
+    # 計算每個 DBSCAN 群組的中心點
+    for label_key, orders in dbscan_clusters.items():
+        center_lat = sum(o['lat'] for o in orders) / len(orders)
+        center_lon = sum(o['lon'] for o in orders) / len(orders)
+        dbscan_centers[label_key] = {
+            'lat': float(center_lat),
+            'lon': float(center_lon),
+            'count': len(orders)
+        }
+
+    # 生成包含中心點的描述
+    cluster_centers_desc = []
+    for label_key, center in sorted(dbscan_centers.items(), key=lambda x: int(x[0]) if x[0] != '-1' else -999):
+        if label_key != '-1':  # 排除噪聲點
+            cluster_centers_desc.append(f"群組{label_key}: ({center['lat']:.5f}, {center['lon']:.5f}), {center['count']}點")
+
+    centers_text = " | ".join(cluster_centers_desc[:3])  # 只顯示前3個群組避免太長
+    if len(cluster_centers_desc) > 3:
+        centers_text += f" | ...共{len(cluster_centers_desc)}組"
+
+    description = f'找到 {n_clusters} 組，{n_noise} 噪聲點 | 中心點: {centers_text}'
+    if edge_stats is not None:
+        description += f" | 移除 {edge_stats['pruned']}/{edge_stats['edges']} 條跨障礙鄰域邊"
+    steps.append({
+        'name': 'DBSCAN 密度聚類',
+        'description': description,
+        'timestamp': float(time.time()),
+        'affected_by': STAGE_PARAMS['cluster'],
+        'data': {
+            'method': 'DBSCAN',
+            'parameters': {
+                'eps': eps_distance,
+                'min_samples': min_samples,
+                'metric': metric,
+                'radius_km': cluster_radius,
+                'obstacle_aware': bool(params.get('cluster_obstacles'))
+            },
+            'result': {
+                'n_clusters': int(n_clusters),
+                'n_noise': int(n_noise),
+                'clusters': dbscan_clusters,
+                'centers': dbscan_centers
+            },
+            'stats': {
+                'total_groups': int(n_clusters),
+                'noise_points': int(n_noise),
+                'clustered_points': int(n_orders - n_noise),
+                'obstacle_edges': edge_stats
+            }
+        }
+    })
+
+    # 處理噪聲點（label = -1）：將它們分配到最近的群組
+    noise_start = time.perf_counter()
+    noise_indices = np.where(cluster_labels == -1)[0]
+    noise_reassignments = []
+    obstacle_fallbacks = 0
+
+    if len(noise_indices) > 0:
+        logger.info(f"發現 {len(noise_indices)} 個孤立點，分配到最近的群組...")
+
+        for idx in noise_indices:
+            point = coords[idx]
+            # 找到最近的非噪聲點
+            valid_clusters = cluster_labels[cluster_labels != -1]
+            if len(valid_clusters) > 0:
+                distances = [calculate_distance(point[0], point[1], coords[i][0], coords[i][1])
+                             for i in range(len(coords)) if cluster_labels[i] != -1]
+                if distances:
+                    candidates = [i for i in range(len(coords)) if cluster_labels[i] != -1]
+                    nearest = int(np.argmin(distances))
+                    if edge_stats is not None:
+                        # 障礙感知：不可經由噪聲點分配把訂單併入對岸的群組
+                        nearest, fallback = nearest_reachable(
+                            detector, coords, idx, candidates, distances, params.get('check_highways', False)
+                        )
+                        obstacle_fallbacks += int(fallback)
+                    nearest_idx = candidates[nearest]
+                    old_label = cluster_labels[idx]
+                    new_label = cluster_labels[nearest_idx]
+                    cluster_labels[idx] = new_label
+
+                    # 計算目標群組的中心點
+                    target_cluster_points = [(valid_orders[i]['lat'], valid_orders[i]['lon'])
+                                             for i in range(len(cluster_labels)) if cluster_labels[i] == new_label]
+                    target_center_lat = sum(p[0] for p in target_cluster_points) / len(target_cluster_points)
+                    target_center_lon = sum(p[1] for p in target_cluster_points) / len(target_cluster_points)
+
+                    noise_reassignments.append({
+                        'order_index': int(idx),
+                        'tracking_number': valid_orders[idx]['tracking_number'],
+                        'lat': float(valid_orders[idx]['lat']),
+                        'lon': float(valid_orders[idx]['lon']),
+                        'old_label': int(old_label),
+                        'new_label': int(new_label),
+                        'distance_to_cluster': float(distances[nearest]),
+                        'target_center': {
+                            'lat': float(target_center_lat),
+                            'lon': float(target_center_lon)
+                        }
+                    })
+            else:
+                cluster_labels[idx] = 0  # 如果沒有其他群組，創建新群組
+
+        if obstacle_fallbacks:
+            logger.info(f"{obstacle_fallbacks} 個孤立點與所有群組之間都有障礙，分配到最近的群組")
+
+        # 記錄步驟：噪聲點重新分配
+        # 生成分配目標摘要
+        reassignment_summary = {}
+        for ra in noise_reassignments:
+            target_label = ra['new_label']
+            if target_label not in reassignment_summary:
+                reassignment_summary[target_label] = {
+                    'count': 0,
+                    'center': ra['target_center']
+                }
+            reassignment_summary[target_label]['count'] += 1
+
+        summary_text = " | ".join([
+            f"群組{label}: ({info['center']['lat']:.5f}, {info['center']['lon']:.5f}), {info['count']}點"
+            for label, info in list(reassignment_summary.items())[:2]
+        ])
+        if len(reassignment_summary) > 2:
+            summary_text += f" | ...共分配到{len(reassignment_summary)}個群組"
+
+        steps.append({
+            'name': '噪聲點處理',
+            'description': f'{len(noise_indices)} 孤立點 → {summary_text}',
+            'timestamp': float(time.time()),
+            'affected_by': STAGE_PARAMS['cluster'],
+            'data': {
+                'noise_count': int(len(noise_indices)),
+                'reassignments': noise_reassignments,
+                'summary': reassignment_summary,
+                'obstacle_fallbacks': int(obstacle_fallbacks)
+            }
+        })
+
+    STAGE_LATENCY.observe(time.perf_counter() - noise_start, stage='noise')
+    return {'labels': cluster_labels, 'steps': steps}
+
+
+# ============================================================================
+# 階段 2：大群組細分（容量約束 K-means）
+# ============================================================================
+
+def run_split_stage(valid_orders, labels, params):
+    """對超過 max_group_size 的群組進行二次分割"""
+    max_group_size = params['max_group_size']
+
+    # 將訂單按群組分類
+    initial_clusters = {}
+    for idx, label in enumerate(labels):
+        if label not in initial_clusters:
+            initial_clusters[label] = []
+        initial_clusters[label].append(valid_orders[idx])
+
+    logger.info(f"DBSCAN 完成，初步分成 {len(initial_clusters)} 組")
+
+    clusters = {}
+    cluster_id = 0
+    kmeans_operations = []
+    sampler = LogSampler(logger)
+
+    for label, orders in initial_clusters.items():
+        if len(orders) <= max_group_size:
+            # 群組夠小，直接使用
+            clusters[cluster_id] = orders
+            sampler.debug("  群組 %s: %d 個訂單（保持）", cluster_id, len(orders))
+
+            # 計算中心點
+            center_lat = sum(o['lat'] for o in orders) / len(orders)
+            center_lon = sum(o['lon'] for o in orders) / len(orders)
+
+            kmeans_operations.append({
+                'original_label': int(label),
+                'action': 'keep',
+                'size': int(len(orders)),
+                'final_cluster_id': int(cluster_id),
+                'center': {
+                    'lat': float(center_lat),
+                    'lon': float(center_lon)
+                }
+            })
+            cluster_id += 1
+        else:
+            # 群組太大，用容量約束 K-means 細分（保證每組 ≤ max_group_size）
+            n_sub_clusters = (len(orders) + max_group_size - 1) // max_group_size  # 向上取整
+            sampler.debug("  群組 %s 有 %d 個訂單，細分成 %d 個子群組...", label, len(orders), n_sub_clusters)
+
+            # 計算原始群組中心點
+            orig_center_lat = sum(o['lat'] for o in orders) / len(orders)
+            orig_center_lon = sum(o['lon'] for o in orders) / len(orders)
+
+            sub_coords = np.array([[o['lat'], o['lon']] for o in orders])
+            sub_labels = capacitated_kmeans(sub_coords, max_group_size,
+                                            random_state=params['random_state'], n_init=params['n_init'])
+
+            split_info = {
+                'original_label': int(label),
+                'action': 'split',
+                'original_size': int(len(orders)),
+                'original_center': {
+                    'lat': float(orig_center_lat),
+                    'lon': float(orig_center_lon)
+                },
+                'n_sub_clusters': int(n_sub_clusters),
+                'method': 'capacitated',
+                'sub_clusters': []
+            }
+
+            for sub_label in range(n_sub_clusters):
+                sub_orders = [orders[i] for i in range(len(orders)) if sub_labels[i] == sub_label]
+                clusters[cluster_id] = sub_orders
+                sampler.debug("    子群組 %s: %d 個訂單", cluster_id, len(sub_orders))
+
+                sub_center_lat = np.mean([o['lat'] for o in sub_orders])
+                sub_center_lon = np.mean([o['lon'] for o in sub_orders])
+
+                split_info['sub_clusters'].append({
+                    'final_cluster_id': int(cluster_id),
+                    'size': int(len(sub_orders)),
+                    'center': {
+                        'lat': float(sub_center_lat),
+                        'lon': float(sub_center_lon)
+                    }
+                })
+                cluster_id += 1
+
+            kmeans_operations.append(split_info)
+
+    sampler.summary("群組細分")
+    logger.info(f"最終分成 {len(clusters)} 組")
+
+    # 記錄步驟：K-means 細分
+    # 生成細分操作摘要
+    split_ops = [op for op in kmeans_operations if op['action'] == 'split']
+    split_summary = []
+    for op in split_ops[:2]:  # 只顯示前2個
+        orig_center = op['original_center']
+        sub_centers_text = ", ".join([
+            f"({sc['center']['lat']:.5f}, {sc['center']['lon']:.5f})"
+            for sc in op['sub_clusters'][:2]
+        ])
+        if len(op['sub_clusters']) > 2:
+            sub_centers_text += f" ...共{len(op['sub_clusters'])}個"
+        split_summary.append(f"群組{op['original_label']}({orig_center['lat']:.5f}, {orig_center['lon']:.5f}) → {sub_centers_text}")
+
+    summary_desc = " | ".join(split_summary)
+    if len(split_ops) > 2:
+        summary_desc += f" | ...共細分{len(split_ops)}組"
+    elif len(split_ops) == 0:
+        summary_desc = f"所有群組都在 {max_group_size} 個訂單內，無需細分"
+
+    step = {
+        'name': 'K-means 細分大群組',
+        'description': summary_desc,
+        'timestamp': float(time.time()),
+        'affected_by': STAGE_PARAMS['split'],
+        'data': {
+            'max_group_size': int(max_group_size),
+            'operations': kmeans_operations,
+            'final_clusters': {
+                str(int(cid)): [{'lat': float(o['lat']), 'lon': float(o['lon']), 'tracking_number': o['tracking_number']} for o in orders]
+                for cid, orders in clusters.items()
+            },
+            'stats': {
+                'initial_groups': int(len(initial_clusters)),
+                'final_groups': int(len(clusters)),
+                'kept_groups': int(len([op for op in kmeans_operations if op['action'] == 'keep'])),
+                'split_groups': int(len(split_ops))
+            }
+        }
+    }
+
+    return {'clusters': clusters, 'steps': [step]}
+
+
+# ============================================================================
+# 階段 3：群組訪問順序
+# ============================================================================
+
+def _greedy_group_order(clusters, cluster_centers, start_pos, group_cost, verbose=False):
+    """貪心最近鄰：每次選擇成本最低的下一個群組"""
+    visited_clusters = set()
+    cluster_order = []
+    current_pos = start_pos
+    sampler = LogSampler(logger)
+
+    while len(visited_clusters) < len(clusters):
+        best_cluster = None
+        best_cost = float('inf')
+
+        for label in clusters.keys():
+            if label in visited_clusters:
+                continue
+
+            cost = group_cost(current_pos, cluster_centers[label])
+            if cost < best_cost:
+                best_cost = cost
+                best_cluster = label
+
+        if best_cluster is not None:
+            cluster_order.append(best_cluster)
+            visited_clusters.add(best_cluster)
+            current_pos = cluster_centers[best_cluster]
+            if verbose:
+                sampler.debug("群組 %d: 選擇 cluster %s, 成本: %.4f", len(cluster_order), best_cluster, best_cost)
+
+    sampler.summary("群組選擇")
+    return cluster_order
+
+
+def _sweep_group_order(clusters, cluster_centers, start_pos):
+    """Sweep Algorithm（智能方向掃描）"""
+    logger.info(f"Sweep Algorithm: 智能選擇掃描方向...")
+
+    # 步驟 1: 計算每個群組相對起點的極角和距離
+    cluster_angles = {}
+    cluster_distances = {}
+    for label, center in cluster_centers.items():
+        dx = center[1] - start_pos[1]  # 經度差
+        dy = center[0] - start_pos[0]  # 緯度差
+        angle = math.atan2(dy, dx)  # 極角（-π 到 π）
+        dist = calculate_distance(start_pos[0], start_pos[1], center[0], center[1])
+        cluster_angles[label] = angle
+        cluster_distances[label] = dist
+
+    # 步驟 2: 找到距離起點最近的群組
+    nearest_cluster = min(clusters.keys(), key=lambda x: cluster_distances[x])
+    nearest_center = cluster_centers[nearest_cluster]
+    start_angle = cluster_angles[nearest_cluster]
+
+    logger.info(f"最近群組: {nearest_cluster} (距離: {cluster_distances[nearest_cluster]:.2f} km, 極角: {math.degrees(start_angle):.1f}°)")
+
+    # 步驟 3: 判斷其他群組在基準線（起點→最近群組）的左側/右側
+    # 使用叉積判斷：cross = (B-A) × (C-A)
+    # cross > 0: C在AB左側；cross < 0: C在AB右側
+    left_orders = 0
+    right_orders = 0
+
+    for label, center in cluster_centers.items():
+        if label == nearest_cluster:
+            continue
+
+        # 向量: 起點 → 最近群組
+        vec_base_x = nearest_center[1] - start_pos[1]
+        vec_base_y = nearest_center[0] - start_pos[0]
+
+        # 向量: 起點 → 當前群組
+        vec_current_x = center[1] - start_pos[1]
+        vec_current_y = center[0] - start_pos[0]
+
+        # 叉積
+        cross_product = vec_base_x * vec_current_y - vec_base_y * vec_current_x
+
+        # 統計兩側訂單數
+        order_count = len(clusters[label])
+        if cross_product > 0:
+            left_orders += order_count
+        else:
+            right_orders += order_count
+
+    # 步驟 4: 決定掃描方向
+    # 右側訂單多 → 順時針（先處理右側）
+    # 左側訂單多 → 逆時針（先處理左側）
+    clockwise = (right_orders >= left_orders)
+    direction_text = "順時針" if clockwise else "逆時針"
+
+    logger.info(f"訂單分布: 左側 {left_orders} 個, 右側 {right_orders} 個")
+    logger.info(f"選擇掃描方向: {direction_text} ({direction_text}先處理較多訂單側)")
+
+    # 步驟 5: 將所有極角調整為相對於最近群組的角度
+    adjusted_angles = {}
+    for label in clusters.keys():
+        angle_diff = cluster_angles[label] - start_angle
+        # 標準化到 [0, 2π) 範圍
+        if angle_diff < 0:
+            angle_diff += 2 * math.pi
+        adjusted_angles[label] = angle_diff
+
+    # 步驟 6: 按調整後的極角排序
+    if clockwise:
+        # 順時針: 極角從小到大
+        cluster_order = sorted(clusters.keys(), key=lambda x: adjusted_angles[x])
+    else:
+        # 逆時針: 極角從大到小
+        cluster_order = sorted(clusters.keys(), key=lambda x: -adjusted_angles[x])
+
+    logger.info(f"Sweep 完成，從最近群組 {nearest_cluster} 開始{direction_text}掃描")
+    logger.debug(f"群組順序: {cluster_order}")
+    return cluster_order
+
+
+def _two_opt_group_order(cluster_order, cluster_centers, start_pos):
+    """2-opt 優化群組順序（開放路徑，不回到起點）"""
+
+    def calculate_route_cost(order, include_return=False):
+        """計算路線總成本"""
+        total = 0
+        pos = start_pos
+        for label in order:
+            center = cluster_centers[label]
+            total += calculate_distance(pos[0], pos[1], center[0], center[1])
+            pos = center
+        # 是否考慮回到起點
+        if include_return:
+            total += calculate_distance(pos[0], pos[1], start_pos[0], start_pos[1])
+        return total
+
+    improved = True
+    iteration = 0
+    max_iterations = 100
+    sampler = LogSampler(logger)
+
+    while improved and iteration < max_iterations:
+        improved = False
+        iteration += 1
+
+        for i in range(len(cluster_order) - 1):
+            for j in range(i + 2, len(cluster_order)):
+                # 嘗試反轉 [i+1, j] 區間
+                new_order = cluster_order[:i+1] + cluster_order[i+1:j+1][::-1] + cluster_order[j+1:]
+
+                old_cost = calculate_route_cost(cluster_order)
+                new_cost = calculate_route_cost(new_order)
+
+                if new_cost < old_cost:
+                    cluster_order = new_order
+                    improved = True
+                    sampler.debug("  [2-opt] Iteration %d: 改善 %.2f → %.2f", iteration, old_cost, new_cost)
+                    break
+
+            if improved:
+                break
+
+    sampler.summary("2-opt 改善")
+    logger.info(f"2-opt 完成（{iteration} 次迭代）")
+    logger.debug(f"優化後順序: {cluster_order}")
+    return cluster_order
+
+
+def run_group_order_stage(clusters, params, detector=None):
+    """確定群組訪問順序（sweep / 2opt / greedy，可考慮跨河懲罰；detector 為單次規劃的障礙子集）"""
+    start = params['start']
+    verification = params['verification']
+    group_penalty = params['group_penalty']
+    check_highways = params['check_highways']
+    group_order_method = params['group_order_method']
+
+    # 計算每個群組的中心點
+    cluster_centers = {}
+    for label, orders in clusters.items():
+        avg_lat = sum(o['lat'] for o in orders) / len(orders)
+        avg_lon = sum(o['lon'] for o in orders) / len(orders)
+        cluster_centers[label] = (avg_lat, avg_lon)
+
+    start_pos = (start['lat'], start['lon'])
+    logger.info(f"起點座標: ({start_pos[0]:.6f}, {start_pos[1]:.6f})")
+    logger.debug("群組中心點:")
+    sampler = LogSampler(logger)
+    for label, center in cluster_centers.items():
+        dist = calculate_distance(start_pos[0], start_pos[1], center[0], center[1])
+        sampler.debug("  Cluster %s: (%.6f, %.6f), 距起點: %.4f°", label, center[0], center[1], dist)
+    sampler.summary("群組中心點")
+
+    # 初始化河流檢測器（如果需要在群組排序時考慮跨河）
+    river_detector_for_groups = None
+    use_api_for_groups = False
+
+    if verification == 'geometry':
+        river_detector_for_groups = detector or RiverDetector.get_instance()
+        logger.info(f"群組排序將考慮跨河（幾何檢測），懲罰係數: {group_penalty}")
+    elif verification == 'api':
+        use_api_for_groups = True
+        river_detector_for_groups = detector or RiverDetector.get_instance()  # API 模式下組內仍用幾何
+        logger.info(f"群組排序將考慮跨河（API 檢測），懲罰係數: {group_penalty}")
+    crossing_index = crossing_index_for(params)
+    if crossing_index is not None:
+        logger.info(f"穿越成本: 經由最近穿越點的繞行距離（{crossing_index.counts()}）")
+
+    def group_cost(current_pos, cluster_center):
+        """直線距離 + 跨河懲罰"""
+        cost = calculate_distance(current_pos[0], current_pos[1], cluster_center[0], cluster_center[1])
+
+        # 考慮跨河懲罰
+        if use_api_for_groups:
+            crosses = river_detector_for_groups.check_crossing_api(
+                current_pos[0], current_pos[1],
+                cluster_center[0], cluster_center[1]
+            )
+            if crosses:
+                cost = crossing_cost(cost, group_penalty, crossing_index, *current_pos, *cluster_center, True, False)
+        elif river_detector_for_groups:
+            result = river_detector_for_groups.check_obstacle_crossing(
+                current_pos[0], current_pos[1],
+                cluster_center[0], cluster_center[1],
+                check_rivers=True,
+                check_highways=check_highways
+            )
+            if result['crosses_any']:
+                cost = crossing_cost(cost, group_penalty, crossing_index, *current_pos, *cluster_center,
+                                     result['crosses_river'], result['crosses_highway'])
+        return cost
+
+    logger.info(f"使用 {group_order_method} 方法計算群組訪問順序...")
+
+    if group_order_method == 'sweep':
+        # === 方法 1: Sweep Algorithm（智能方向掃描）===
+        cluster_order = _sweep_group_order(clusters, cluster_centers, start_pos)
+    elif group_order_method == '2opt':
+        # === 方法 2: Greedy + 2-opt 優化 ===
+        logger.info(f"步驟 1/2: 貪心算法生成初始順序...")
+        cluster_order = _greedy_group_order(clusters, cluster_centers, start_pos, group_cost)
+        logger.debug(f"初始順序: {cluster_order}")
+        logger.info(f"步驟 2/2: 2-opt 優化...")
+        cluster_order = _two_opt_group_order(cluster_order, cluster_centers, start_pos)
+    else:
+        # === 方法 3: 貪心算法（默認）===
+        logger.info(f"使用貪心最近鄰算法...")
+        cluster_order = _greedy_group_order(clusters, cluster_centers, start_pos, group_cost, verbose=True)
+
+    # 記錄步驟：群組排序完成
+    group_order_info = []
+    for idx, label in enumerate(cluster_order):
+        center = cluster_centers[label]
+        group_order_info.append({
+            'group': group_name(idx),
+            'cluster_id': int(label),
+            'size': int(len(clusters[label])),
+            'center': {
+                'lat': float(center[0]),
+                'lon': float(center[1])
+            }
+        })
+
+    # 生成群組順序描述
+    group_desc = " → ".join([f"{g['group']}({g['size']})" for g in group_order_info[:5]])
+    if len(group_order_info) > 5:
+        group_desc += f" → ...共{len(group_order_info)}組"
+
+    step = {
+        'name': '群組排序',
+        'description': f'使用 {group_order_method} 方法排序 {len(cluster_order)} 個群組 | {group_desc}',
+        'timestamp': float(time.time()),
+        'affected_by': STAGE_PARAMS['group_order'],
+        'data': {
+            'method': group_order_method,
+            'total_groups': int(len(cluster_order)),
+            'group_order': group_order_info,
+            'cluster_centers': {str(int(label)): {'lat': float(center[0]), 'lon': float(center[1])}
+                                for label, center in cluster_centers.items()}
+        }
+    }
+
+    return {'cluster_order': cluster_order, 'steps': [step]}
+
+
+# ============================================================================
+# 階段 4：組內訂單排序
+# ============================================================================
+
+def run_inner_order_stage(clusters, cluster_order, params, on_group=None, detector=None):
+    """
+    為每個群組生成訂單順序（nearest / ortools / 2opt-inner / lkh）
+
+    on_group(name, group_orders)：每個群組排序完成時呼叫（串流用；訂單之後可能被快取共用，不可修改）
+    """
+    start = params['start']
+    verification = params['verification']
+    inner_penalty = params['inner_penalty']
+    check_highways = params['check_highways']
+    inner_order_method = params['inner_order_method']
+
+    optimized_orders = []
+    current_pos = (start['lat'], start['lon'])
+
+    logger.debug("最終群組訪問順序（將決定 A, B, C... 的分配）:")
+    sampler = LogSampler(logger)
+    for idx, label in enumerate(cluster_order):
+        sampler.debug("  %s = Cluster %s (%d 個訂單)", group_name(idx), label, len(clusters[label]))
+    sampler.summary("群組對應")
+
+    # 初始化河流檢測器（如果需要）
+    # 注意：API 模式下，組內仍使用幾何檢測（避免太多 API 調用）
+    river_detector = None
+    if verification in ['geometry', 'api']:
+        river_detector = detector or RiverDetector.get_instance()
+        logger.info(f"啟用組內跨河優化（幾何檢測），懲罰係數: {inner_penalty}")
+    crossing_index = crossing_index_for(params)
+
+    def penalized_distance(lat1, lon1, lat2, lon2):
+        """直線距離；穿越障礙（河流 + 高速公路）時乘上懲罰係數（detour：經由最近穿越點的距離）"""
+        dist = calculate_distance(lat1, lon1, lat2, lon2)
+        if river_detector:
+            result = river_detector.check_obstacle_crossing(
+                lat1, lon1, lat2, lon2,
+                check_rivers=True,
+                check_highways=check_highways
+            )
+            if result['crosses_any']:
+                dist = crossing_cost(dist, inner_penalty, crossing_index, lat1, lon1, lat2, lon2,
+                                     result['crosses_river'], result['crosses_highway'])
+        return dist
+
+    def nearest_sequence(group_orders, pos):
+        """最近鄰算法（考慮跨河懲罰）"""
+        remaining = group_orders.copy()
+        sequence = []
+        while remaining:
+            nearest = min(remaining, key=lambda o: penalized_distance(pos[0], pos[1], o['lat'], o['lon']))
+            sequence.append(nearest)
+            pos = (nearest['lat'], nearest['lon'])
+            remaining.remove(nearest)
+        return sequence
+
+    logger.info(f"開始生成訂單順序...")
+    sampler = LogSampler(logger)
+
+    for group_idx, cluster_label in enumerate(cluster_order):
+        name = group_name(group_idx)
+        group_orders = clusters[cluster_label].copy()
+
+        sampler.debug("處理群組 %s (%d 個訂單)，使用 %s 方法", name, len(group_orders), inner_order_method)
+
+        # 根據 inner_order_method 選擇排序方式
+        if inner_order_method == 'nearest':
+            # 方法 1: 最近鄰算法（考慮跨河懲罰）- 原有方法
+            group_sequence = nearest_sequence(group_orders, current_pos)
+
+        elif inner_order_method in ['ortools', '2opt-inner', 'lkh']:
+            # 方法 2/3/4: 使用 TSP 求解器（考慮障礙物懲罰）
+            # 準備座標（加上當前位置作為起點）
+            coords_with_start = [current_pos] + [(o['lat'], o['lon']) for o in group_orders]
+
+            def obstacle_aware_distance(i, j, coords):
+                """計算兩點間距離，考慮障礙物懲罰"""
+                lat1, lon1 = coords[i]
+                lat2, lon2 = coords[j]
+                return penalized_distance(lat1, lon1, lat2, lon2)
+
+            try:
+                # 求解 TSP（起點索引 = 0），使用障礙物感知的距離函數
+                route_indices = solve_tsp(
+                    coords_with_start,
+                    method=inner_order_method,
+                    start_index=0,
+                    distance_func=obstacle_aware_distance if river_detector else None
+                )
+
+                # 移除起點索引，調整為訂單索引
+                route_indices = [i - 1 for i in route_indices if i > 0]
+
+                # 按 TSP 順序排列
+                group_sequence = [group_orders[i] for i in route_indices]
+
+            except Exception as e:
+                logger.error(f"TSP 求解失敗: {e}，回退到 nearest neighbor")
+                group_sequence = nearest_sequence(group_orders, current_pos)
+
+        else:
+            logger.warning(f"未知的組內排序方法: {inner_order_method}，使用 nearest neighbor")
+            group_sequence = nearest_sequence(group_orders, current_pos)
+
+        # 更新當前位置為最後一個訂單
+        if group_sequence:
+            current_pos = (group_sequence[-1]['lat'], group_sequence[-1]['lon'])
+
+        # 添加到結果，格式：A-01, A-02...
+        group_start = len(optimized_orders)
+        for seq_num, order in enumerate(group_sequence, 1):
+            optimized_orders.append({
+                'sequence': len(optimized_orders) + 1,
+                'group': name,
+                'group_sequence': f"{name}-{seq_num:02d}",
+                'tracking_number': order['tracking_number'],
+                'lat': order['lat'],
+                'lon': order['lon']
+            })
+        if on_group:
+            on_group(name, optimized_orders[group_start:])
+
+    sampler.summary("群組處理")
+    logger.info(f"路線計算完成，共 {len(optimized_orders)} 個訂單，分成 {len(cluster_order)} 組")
+
+    # 記錄最終步驟：完成所有排序
+    step = {
+        'name': '完成訂單排序',
+        'description': f'所有 {len(optimized_orders)} 個訂單已排序完成',
+        'timestamp': float(time.time()),
+        'affected_by': STAGE_PARAMS['inner_order'],
+        'data': {
+            'total_orders': int(len(optimized_orders)),
+            'total_groups': int(len(cluster_order)),
+            'final_sequence': optimized_orders,
+            'group_order': [{'group': group_name(idx),
+                             'cluster_id': int(label),
+                             'size': int(len(clusters[label]))}
+                            for idx, label in enumerate(cluster_order)]
+        }
+    }
+
+    return {'orders': optimized_orders, 'steps': [step]}
+
+
+# ============================================================================
+# 階段 5：終點設置 + 障礙檢測
+# ============================================================================
+
+def run_finish_stage(orders, params, detector=None):
+    """處理終點模式並檢測路線穿越的障礙"""
+    start = params['start']
+    end_point_mode = params['end_point_mode']
+    end_point = params['end_point']
+    verification = params['verification']
+    check_highways = params['check_highways']
+
+    # 複製訂單（上游階段的輸出可能被快取重用，不可修改）
+    optimized_orders = [dict(o) for o in orders]
+
+    logger.debug(f"終點模式: {end_point_mode}, 終點座標: {end_point}")
+
+    if end_point_mode == 'manual' and end_point:
+        # 手動終點：在路徑末端加入終點標記
+        logger.info(f"加入手動終點: ({end_point['lat']}, {end_point['lon']})")
+        optimized_orders.append({
+            'sequence': len(optimized_orders) + 1,
+            'group': 'End',
+            'group_sequence': 'END',
+            'tracking_number': 'ENDPOINT',
+            'lat': end_point['lat'],
+            'lon': end_point['lon']
+        })
+    elif end_point_mode == 'farthest' and optimized_orders:
+        # 使用最遠訂單：重新排序確保最遠的在最後
+        logger.info(f"調整順序確保最遠訂單在最後...")
+
+        def distance_from_start(order):
+            return math.sqrt(
+                (order['lat'] - start['lat'])**2 +
+                (order['lon'] - start['lon'])**2
+            )
+
+        # 找出最遠訂單
+        farthest_order = max(optimized_orders, key=distance_from_start)
+        farthest_idx = optimized_orders.index(farthest_order)
+
+        logger.info(f"最遠訂單: {farthest_order['tracking_number']} (距離起點 {distance_from_start(farthest_order):.4f})")
+
+        # 如果最遠訂單不在最後，移到最後
+        if farthest_idx != len(optimized_orders) - 1:
+            optimized_orders.remove(farthest_order)
+            optimized_orders.append(farthest_order)
+
+            # 重新編號
+            for i, order in enumerate(optimized_orders, 1):
+                order['sequence'] = i
+
+            logger.info(f"已將最遠訂單移至最後")
+
+    # 障礙檢測（如果啟用）
+    crossings = []
+    if verification != 'none':
+        obstacle_type = "障礙（河流 + 高速公路）" if check_highways else "河流"
+        logger.info(f"開始{obstacle_type}檢測（方法: {verification}）...")
+        with STAGE_LATENCY.time(stage='verification'):
+            crossings = verify_route_crossings(optimized_orders, verification, check_highways, detector=detector)
+        logger.info(f"檢測完成，發現 {len(crossings)} 處穿越{obstacle_type}")
+
+    return {'orders': optimized_orders, 'crossings': crossings, 'steps': []}
+
+
+# ============================================================================
+# 主流程
+# ============================================================================
+
+def plan_obstacle_view(valid_orders, params):
+    """裁切至本次規劃範圍（訂單 + 起點 + 手動終點）的障礙子集"""
+    points = [(o['lat'], o['lon']) for o in valid_orders]
+    points.append((params['start']['lat'], params['start']['lon']))
+    if params['end_point_mode'] == 'manual' and params['end_point']:
+        points.append((params['end_point']['lat'], params['end_point']['lon']))
+    return RiverDetector.get_instance().view(points)
+
+
+def run_route_pipeline(valid_orders, params, obstacle_version=None, on_stage=None, stage_cache=None, on_group=None):
+    """
+    執行完整路徑規劃（各階段結果可重用）
+
+    Args:
+        valid_orders: 有效訂單列表 [{'tracking_number', 'lat', 'lon'}, ...]
+        params: route_params() 產生的完整參數
+        obstacle_version: 障礙數據版本（數據更新時讓相關階段失效）
+        on_stage: 每個階段完成時的回呼 on_stage(stage, {'cached': bool, 'elapsed': 秒, 'output': 階段輸出})
+                  （階段輸出可能被快取共用，回呼中不可修改）
+        stage_cache: 階段快取（預設使用共用單例）
+        on_group: 組內排序時每個群組完成的回呼 on_group(name, group_orders)（inner_order 重用快取時不呼叫）
+
+    Returns:
+        /api/route 的回應內容（success, orders, crossings, algorithm_steps...）
+    """
+    cache = stage_cache or StageCache.get_instance()
+
+    # 限制訂單數量（用戶指定或默認 5000）
+    max_allowed = min(params['max_orders'], 5000)  # 最多 5000 個
+    if len(valid_orders) > max_allowed:
+        logger.info(f"訂單數量 {len(valid_orders)}，取前 {max_allowed} 個計算")
+        valid_orders = valid_orders[:max_allowed]
+
+    n_orders = len(valid_orders)
+    logger.debug(f"有效訂單: {n_orders} 個")
+    logger.info(f"使用混合聚類對 {n_orders} 個訂單分組（每組最多 {params['max_group_size']} 個，半徑 {params['cluster_radius']} km）...")
+
+    views = []
+
+    def detector(required=False):
+        """單次規劃的障礙子集（第一個需要障礙檢測的階段才建立；全部重用快取時不建立）"""
+        if params['verification'] == 'none' and not required:
+            return None
+        if not views:
+            views.append(plan_obstacle_view(valid_orders, params))
+        return views[0]
+
+    runners = {
+        'cluster': lambda out: run_cluster_stage(
+            valid_orders, params, detector=detector(required=bool(params.get('cluster_obstacles')))
+        ),
+        'split': lambda out: run_split_stage(valid_orders, out['cluster']['labels'], params),
+        'group_order': lambda out: run_group_order_stage(out['split']['clusters'], params, detector=detector()),
+        'inner_order': lambda out: run_inner_order_stage(
+            out['split']['clusters'], out['group_order']['cluster_order'], params, on_group=on_group,
+            detector=detector()
+        ),
+        'finish': lambda out: run_finish_stage(out['inner_order']['orders'], params, detector=detector()),
+    }
+
+    outputs = {}
+    reused = {}
+    key = order_snapshot_version(valid_orders)
+    for stage in STAGE_ORDER:
+        key = StageCache.stage_key(key, stage, params, obstacle_version)
+        stage_start = time.time()
+        output = cache.get(key)
+        reused[stage] = output is not None
+        if output is None:
+            output = runners[stage](outputs)
+            cache.put(key, output)
+            STAGE_LATENCY.observe(time.time() - stage_start, stage=stage)
+        STAGE_CACHE.inc(stage=stage, result='hit' if reused[stage] else 'miss')
+        outputs[stage] = output
+        if on_stage:
+            on_stage(stage, {'cached': reused[stage], 'elapsed': time.time() - stage_start, 'output': output})
+
+    logger.info("階段快取: " + ", ".join(
+        f"{stage}={'重用' if reused[stage] else '計算'}" for stage in STAGE_ORDER
+    ))
+    if views and hasattr(views[0], 'stats'):
+        logger.info(f"障礙子集: {views[0].stats()}")
+
+    # 組合演算法步驟（重新編號；快取的步驟不直接修改）
+    algorithm_steps = [{
+        'name': '初始化',
+        'description': f'載入 {n_orders} 個訂單座標',
+        'timestamp': float(time.time()),
+        'affected_by': ['order_group'],
+        'data': {
+            'orders': [{'lat': float(o['lat']), 'lon': float(o['lon']), 'tracking_number': o['tracking_number']} for o in valid_orders],
+            'total_orders': int(n_orders)
+        }
+    }]
+    for stage in STAGE_ORDER:
+        algorithm_steps.extend(dict(step, cached=reused[stage]) for step in outputs[stage]['steps'])
+    algorithm_steps = [{'step': idx, **step} for idx, step in enumerate(algorithm_steps, 1)]
+
+    final = outputs['finish']
+    return {
+        'success': True,
+        'orders': final['orders'],
+        'shape': '',
+        'total_orders': len(final['orders']),
+        'total_groups': len(outputs['group_order']['cluster_order']),
+        'crossings': final['crossings'],
+        'verification_method': params['verification'],
+        'algorithm_steps': algorithm_steps  # 演算法步驟記錄
+    }
+
+
+def stage_preview(stage, output):
+    """
+    階段完成時可先提供給前端的部分結果（背景工作進度 / 串流用）
+
+    cluster → DBSCAN 群組數；split → 各群組的訂單；group_order → 群組訪問順序與 A, B, C... 對應；
+    inner_order → 排序後的訂單（尚未處理終點）；finish → 穿越障礙數
+    """
+    if stage == 'cluster':
+        labels = set(int(label) for label in output['labels'])
+        return {'dbscan_groups': len(labels - {-1})}
+    if stage == 'split':
+        return {
+            'total_groups': len(output['clusters']),
+            'groups': {str(cid): [o['tracking_number'] for o in orders] for cid, orders in output['clusters'].items()},
+        }
+    if stage == 'group_order':
+        return {
+            'cluster_order': [int(label) for label in output['cluster_order']],
+            'group_names': {group_name(idx): int(label) for idx, label in enumerate(output['cluster_order'])},
+        }
+    if stage == 'inner_order':
+        return {'orders': output['orders']}
+    if stage == 'finish':
+        return {'crossings': len(output['crossings'])}
+    return {}
+
+
+def compact_steps(steps, orders):
+    """
+    精簡版演算法步驟：訂單以 orders（回應中的最終路徑）的索引表示，不重複座標
+
+    - 初始化 data.orders → data.order_refs
+    - DBSCAN data.result.clusters → data.result.cluster_refs
+    - K-means data.final_clusters → data.final_cluster_refs
+    - 完成排序 data.final_sequence → data.final_sequence_refs（終點處理前的順序，sequence 依位置重新編號）
+    """
+    index_of = {o['tracking_number']: idx for idx, o in enumerate(orders)}
+
+    def refs(items):
+        return [index_of[o['tracking_number']] for o in items]
+
+    compact = []
+    for step in steps:
+        data = dict(step['data'])
+        if 'orders' in data:
+            data['order_refs'] = refs(data.pop('orders'))
+        if 'clusters' in data.get('result', {}):
+            result = dict(data['result'])
+            result['cluster_refs'] = {label: refs(members) for label, members in result.pop('clusters').items()}
+            data['result'] = result
+        if 'final_clusters' in data:
+            data['final_cluster_refs'] = {cid: refs(members) for cid, members in data.pop('final_clusters').items()}
+        if 'final_sequence' in data:
+            data['final_sequence_refs'] = refs(data.pop('final_sequence'))
+        compact.append(dict(step, data=data))
+    return compact
+
+
+def expand_compact_steps(steps, orders):
+    """
+    還原精簡版演算法步驟（compact_steps 的反向；與前端 expandCompactSteps 相同規則）
+
+    DBSCAN 群組成員的 index 為初始化步驟中的訂單位置，由 order_refs 反查
+    """
+    def to_orders(refs):
+        return [{'lat': orders[i]['lat'], 'lon': orders[i]['lon'], 'tracking_number': orders[i]['tracking_number']}
+                for i in refs]
+
+    position = {}
+    expanded = []
+    for step in steps:
+        data = dict(step['data'])
+        if 'order_refs' in data:
+            position = {ref: idx for idx, ref in enumerate(data['order_refs'])}
+            data['orders'] = to_orders(data.pop('order_refs'))
+        if 'cluster_refs' in data.get('result', {}):
+            result = dict(data['result'])
+            result['clusters'] = {label: [dict(index=position[i], **order) for i, order in zip(refs, to_orders(refs))]
+                                  for label, refs in result.pop('cluster_refs').items()}
+            data['result'] = result
+        if 'final_cluster_refs' in data:
+            data['final_clusters'] = {cid: to_orders(refs) for cid, refs in data.pop('final_cluster_refs').items()}
+        if 'final_sequence_refs' in data:
+            # 回應的 orders 已經過終點處理（ENDPOINT / 最遠訂單移至最後），sequence 以終點處理前的位置為準
+            data['final_sequence'] = [dict(orders[ref], sequence=seq)
+                                      for seq, ref in enumerate(data.pop('final_sequence_refs'), 1)]
+        expanded.append(dict(step, data=data))
+    return expanded
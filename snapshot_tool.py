@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+訂單快照工具：匯出 order_group → 快照檔，匯入快照 → 本機 SQLite
+
+使用方式：
+  # 從正式資料庫匯出（預設 .npz，可用 --format parquet）
+  python snapshot_tool.py export Group202510172101060201 Group202509301918420452 --out snapshots/
+
+  # 建立本機 SQLite，之後以 ORDER_SOURCE=sqlite:orders.db 啟動 app.py / 分析腳本
+  python snapshot_tool.py import snapshots/ --db orders.db
+
+  # 或直接使用快照目錄（啟動時載入記憶體）
+  ORDER_SOURCE=snapshot:snapshots/ python app.py
+
+  # 查看快照內容
+  python snapshot_tool.py info snapshots/Group202510172101060201.npz
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from order_source import (
+    connect_sqlite, describe_source, fetch_group_rows, find_snapshots,
+    get_connection, import_snapshot, load_snapshot, save_snapshot
+)
+
+
+def cmd_export(args):
+    conn = get_connection()
+    print(f"[INFO] 資料來源: {describe_source()}")
+    try:
+        for order_group in args.order_groups:
+            rows = fetch_group_rows(conn, order_group)
+            if not rows:
+                print(f"[WARN] 找不到 order_group: {order_group}，略過")
+                continue
+            path = os.path.join(args.out, f"{order_group}.{args.format}")
+            save_snapshot(path, order_group, rows)
+            print(f"✅ {order_group}: {len(rows)} 筆 → {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+    finally:
+        conn.close()
+
+
+def cmd_import(args):
+    conn = connect_sqlite(args.db)
+    total = 0
+    for location in args.snapshots:
+        for path in find_snapshots(location):
+            count = import_snapshot(conn, path)
+            total += count
+            print(f"✅ {path}: {count} 筆")
+    conn.commit()
+    conn.close()
+    print(f"\n共匯入 {total} 筆 → {args.db}")
+    print(f"啟動方式: ORDER_SOURCE=sqlite:{args.db} python app.py")
+
+
+def cmd_info(args):
+    for location in args.snapshots:
+        for path in find_snapshots(location):
+            order_group, rows = load_snapshot(path)
+            lats = np.array([r['latitude'] for r in rows if r['latitude'] is not None], dtype=np.float64)
+            with_sequence = sum(1 for r in rows if r['delivery_sequence'] is not None)
+            print(f"{path}")
+            print(f"  order_group: {order_group}")
+            print(f"  訂單: {len(rows)} 筆（座標缺漏 {len(rows) - len(lats)}，有 delivery_sequence {with_sequence}）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='訂單快照匯出 / 匯入')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='從目前的 ORDER_SOURCE 匯出 order_group')
+    export_parser.add_argument('order_groups', nargs='+')
+    export_parser.add_argument('--out', default='snapshots', help='輸出目錄（預設 snapshots/）')
+    export_parser.add_argument('--format', choices=['npz', 'parquet'], default='npz')
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser('import', help='將快照匯入 SQLite')
+    import_parser.add_argument('snapshots', nargs='+', help='快照檔或目錄')
+    import_parser.add_argument('--db', default='orders.db', help='SQLite 檔案（預設 orders.db）')
+    import_parser.set_defaults(func=cmd_import)
+
+    info_parser = subparsers.add_parser('info', help='顯示快照內容摘要')
+    info_parser.add_argument('snapshots', nargs='+')
+    info_parser.set_defaults(func=cmd_info)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,12 +31,21 @@ if lsof -Pi :8080 -sTCP:LISTEN -t >/dev/null 2>&1 ; then
 else
     echo "⚠️  Flask 未運行，正在啟動..."
     source venv/bin/activate
-    nohup python app.py > flask.log 2>&1 &
+    if [ "${SERVE_MODE:-dev}" = "production" ]; then
+        # 多 worker（gunicorn preload，見 gunicorn.conf.py）；規劃快取與背景工作狀態經由 PLAN_CACHE_DIR 共用
+        export PLAN_CACHE_DIR="${PLAN_CACHE_DIR:-$DIR/.plan_cache}"
+        nohup gunicorn -c gunicorn.conf.py wsgi:application > flask.log 2>&1 &
+    else
+        nohup python app.py > flask.log 2>&1 &
+    fi
     FLASK_PID=$!
     
-    # 等待 Flask 啟動
+    # 等待 Flask 啟動（production 模式需先載入障礙數據）
     echo "   等待 Flask 啟動..."
     sleep 3
+    if [ "${SERVE_MODE:-dev}" = "production" ]; then
+        sleep 5
+    fi
     
     # 驗證是否成功啟動
     if lsof -Pi :8080 -sTCP:LISTEN -t >/dev/null 2>&1 ; then
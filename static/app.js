@@ -481,10 +481,12 @@ document.getElementById('calculateBtn').addEventListener('click', async function
             console.log('預加載已停用，跳過路線加載');
         }
         
-        // 處理演算法步驟（如果有）
+        // 處理演算法步驟（分組模式：另外以精簡格式取得）
         if (data1.algorithm_steps && data1.algorithm_steps.length > 0) {
             console.log('演算法步驟數據:', data1.algorithm_steps);
             initAlgorithmViewer(data1.algorithm_steps, data1);
+        } else if (optimizationMode === 'clustering' && data1.plan_id) {
+            loadAlgorithmSteps(data1);
         }
         
         // 顯示完成提示
@@ -2199,6 +2201,69 @@ let algorithmSteps = [];
 let currentAlgorithmStep = 0;
 let algorithmResultData = null;
 
+// 取得演算法步驟（精簡格式：訂單以 resultData.orders 的索引表示）
+async function loadAlgorithmSteps(resultData) {
+    try {
+        const response = await fetch(`${API_BASE}/api/route/${resultData.plan_id}/steps?steps=compact`);
+        const data = await response.json();
+        if (!response.ok) {
+            console.warn('取得演算法步驟失敗:', data.error);
+            return;
+        }
+        const steps = expandCompactSteps(data.algorithm_steps, resultData.orders);
+        console.log('演算法步驟數據:', steps);
+        if (steps.length > 0) {
+            initAlgorithmViewer(steps, resultData);
+        }
+    } catch (error) {
+        console.warn('取得演算法步驟失敗:', error);
+    }
+}
+
+// 將精簡格式的訂單索引還原為訂單資料
+function expandCompactSteps(steps, orders) {
+    const toOrders = refs => refs.map(i => ({
+        lat: orders[i].lat,
+        lon: orders[i].lon,
+        tracking_number: orders[i].tracking_number
+    }));
+    const expandGroups = groups => Object.fromEntries(
+        Object.entries(groups).map(([label, refs]) => [label, toOrders(refs)])
+    );
+    
+    // DBSCAN 群組成員的 index 為初始化步驟中的訂單位置
+    let position = new Map();
+    const withIndex = refs => toOrders(refs).map((order, k) => ({ index: position.get(refs[k]), ...order }));
+    
+    return steps.map(step => {
+        const data = { ...step.data };
+        if (data.order_refs) {
+            position = new Map(data.order_refs.map((ref, idx) => [ref, idx]));
+            data.orders = toOrders(data.order_refs);
+            delete data.order_refs;
+        }
+        if (data.result && data.result.cluster_refs) {
+            const { cluster_refs, ...result } = data.result;
+            data.result = {
+                ...result,
+                clusters: Object.fromEntries(
+                    Object.entries(cluster_refs).map(([label, refs]) => [label, withIndex(refs)])
+                )
+            };
+        }
+        if (data.final_cluster_refs) {
+            data.final_clusters = expandGroups(data.final_cluster_refs);
+            delete data.final_cluster_refs;
+        }
+        if (data.final_sequence_refs) {
+            // 回應的 orders 已經過終點處理，sequence 以終點處理前的位置為準
+            data.final_sequence = data.final_sequence_refs.map((ref, k) => ({ ...orders[ref], sequence: k + 1 }));
+            delete data.final_sequence_refs;
+        }
+        return { ...step, data };
+    });
+}
+
 // 初始化演算法視覺化器
 function initAlgorithmViewer(steps, resultData) {
     algorithmSteps = steps;
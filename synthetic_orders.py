@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+合成訂單產生器（離線基準測試用，不需資料庫）
+
+分布類型：
+  clustered  → 數個高斯分布的聚落（一般住宅區）
+  linear     → 沿一條主幹道分布（郊區長條路線）
+  river      → 平均分布在一條合成河流兩岸（測試跨河懲罰）
+  uniform    → 邊界框內均勻分布
+
+所有產生器都以 seed 決定結果，相同參數產生相同訂單。
+"""
+
+import json
+import math
+import os
+import random
+
+# 區域邊界框 (south, west, north, east)
+BOUNDING_BOXES = {
+    'toronto': (43.58, -79.64, 43.86, -79.12),
+    'vancouver': (49.19, -123.27, 49.32, -122.98),
+}
+
+DISTRIBUTIONS = ('clustered', 'linear', 'river', 'uniform')
+
+
+def _make_order(idx, lat, lon, prefix):
+    return {'tracking_number': f'{prefix}{idx:05d}', 'lat': lat, 'lon': lon}
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+
+def generate_uniform(n, bbox, rng, prefix='SYN'):
+    """邊界框內均勻分布"""
+    south, west, north, east = bbox
+    return [_make_order(i, rng.uniform(south, north), rng.uniform(west, east), prefix) for i in range(n)]
+
+
+def generate_clustered(n, bbox, rng, prefix='SYN', n_centers=None, spread_km=0.6):
+    """數個高斯聚落（聚落數預設隨訂單數增加）"""
+    south, west, north, east = bbox
+    n_centers = n_centers or max(3, n // 60)
+    centers = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(n_centers)]
+    spread_lat = spread_km / 111.0
+    orders = []
+    for i in range(n):
+        center_lat, center_lon = centers[rng.randrange(n_centers)]
+        spread_lon = spread_lat / math.cos(math.radians(center_lat))
+        lat = _clamp(rng.gauss(center_lat, spread_lat), south, north)
+        lon = _clamp(rng.gauss(center_lon, spread_lon), west, east)
+        orders.append(_make_order(i, lat, lon, prefix))
+    return orders
+
+
+def generate_linear(n, bbox, rng, prefix='SYN', width_km=0.3):
+    """沿邊界框對角線（主幹道）分布，帶少量橫向偏移"""
+    south, west, north, east = bbox
+    offset = width_km / 111.0
+    orders = []
+    for i in range(n):
+        t = rng.random()
+        lat = _clamp(south + (north - south) * t + rng.gauss(0, offset), south, north)
+        lon = _clamp(west + (east - west) * t + rng.gauss(0, offset), west, east)
+        orders.append(_make_order(i, lat, lon, prefix))
+    return orders
+
+
+def river_line(bbox, n_points=40):
+    """合成河流：由北向南穿過邊界框中央的正弦曲線 [(lat, lon), ...]"""
+    south, west, north, east = bbox
+    mid_lon = (west + east) / 2
+    amplitude = (east - west) * 0.05
+    return [
+        (south + (north - south) * k / (n_points - 1),
+         mid_lon + amplitude * math.sin(k / (n_points - 1) * 4 * math.pi))
+        for k in range(n_points)
+    ]
+
+
+def generate_river(n, bbox, rng, prefix='SYN'):
+    """聚落平均分布在合成河流兩岸（每個聚落只在一側）"""
+    south, west, north, east = bbox
+    line = river_line(bbox)
+    mid_lon = (west + east) / 2
+    half_width = (east - west) / 2
+    n_centers = max(4, n // 60)
+    centers = []
+    for k in range(n_centers):
+        lat = rng.uniform(south, north)
+        side = -1 if k % 2 == 0 else 1
+        lon = mid_lon + side * rng.uniform(0.15, 0.85) * half_width
+        centers.append((lat, lon, side))
+
+    spread = 0.4 / 111.0
+    orders = []
+    for i in range(n):
+        center_lat, center_lon, side = centers[rng.randrange(n_centers)]
+        lat = _clamp(rng.gauss(center_lat, spread), south, north)
+        lon = rng.gauss(center_lon, spread / math.cos(math.radians(lat)))
+        # 保持在河流同一側，避免訂單落在河道上
+        river_lon = min(line, key=lambda p: abs(p[0] - lat))[1]
+        if (lon - river_lon) * side <= 0:
+            lon = river_lon + side * abs(lon - river_lon)
+        orders.append(_make_order(i, lat, _clamp(lon, west, east), prefix))
+    return orders
+
+
+GENERATORS = {
+    'clustered': generate_clustered,
+    'linear': generate_linear,
+    'river': generate_river,
+    'uniform': generate_uniform,
+}
+
+
+def generate_orders(distribution, n, region='toronto', seed=0):
+    """
+    產生合成訂單
+
+    Args:
+        distribution: 'clustered' | 'linear' | 'river' | 'uniform'
+        n: 訂單數
+        region: BOUNDING_BOXES 中的區域
+        seed: 隨機種子
+
+    Returns:
+        訂單列表 [{'tracking_number', 'lat', 'lon'}, ...]（格式同 fetch_valid_orders）
+    """
+    if distribution not in GENERATORS:
+        raise ValueError(f"未知分布 {distribution}，可用: {', '.join(DISTRIBUTIONS)}")
+    if region not in BOUNDING_BOXES:
+        raise ValueError(f"未知區域 {region}，可用: {', '.join(BOUNDING_BOXES)}")
+    rng = random.Random(f"{distribution}:{region}:{n}:{seed}")
+    prefix = f"{region[:3].upper()}{distribution[:2].upper()}"
+    return GENERATORS[distribution](n, BOUNDING_BOXES[region], rng, prefix=prefix)
+
+
+def start_point(region='toronto'):
+    """區域的預設起點（邊界框西南角附近，模擬倉庫）"""
+    south, west, north, east = BOUNDING_BOXES[region]
+    return {'lat': south + (north - south) * 0.1, 'lon': west + (east - west) * 0.1}
+
+
+def write_obstacle_files(directory, region='toronto'):
+    """
+    寫出合成障礙數據（Overpass JSON 格式，ObstacleDetector 可直接載入）
+
+    河流為 river_line()；高速公路為橫穿邊界框的東西向直線。
+
+    Returns:
+        (rivers_file, highways_file)
+    """
+    south, west, north, east = BOUNDING_BOXES[region]
+    os.makedirs(directory, exist_ok=True)
+
+    def overpass(lines):
+        elements = []
+        node_id = 1
+        for way_id, line in enumerate(lines, 1):
+            node_ids = []
+            for lat, lon in line:
+                elements.append({'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon})
+                node_ids.append(node_id)
+                node_id += 1
+            elements.append({'type': 'way', 'id': way_id, 'nodes': node_ids})
+        return {'elements': elements}
+
+    # 河流拆成多段 way（與 Overpass 實際數據相同，一條河由多段組成）
+    line = river_line((south, west, north, east))
+    river_ways = [line[k:k + 5] for k in range(0, len(line) - 1, 4)]
+    highway_lat = south + (north - south) * 0.6
+    highway_ways = [[(highway_lat, west + (east - west) * k / 20), (highway_lat, west + (east - west) * (k + 1) / 20)]
+                    for k in range(20)]
+
+    rivers_file = os.path.join(directory, f'synthetic_rivers_{region}.json')
+    highways_file = os.path.join(directory, f'synthetic_highways_{region}.json')
+    for filename, ways in ((rivers_file, river_ways), (highways_file, highway_ways)):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(overpass(ways), f)
+    return rivers_file, highways_file
+
+
+def load_orders(filename):
+    """
+    讀取重播用訂單檔（JSON 或 snapshot_tool.py 匯出的 .npz / .parquet 快照）
+
+    JSON 接受 [{'tracking_number', 'lat', 'lon'}, ...] 或 {'orders': [...]}；
+    欄位 latitude / longitude 也可（資料庫整數格式會自動除以 10^10）。
+    座標缺漏的列會略過。
+    """
+    if filename.endswith(('.npz', '.parquet')):
+        from order_source import load_snapshot
+        _, rows = load_snapshot(filename)
+    else:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rows = data['orders'] if isinstance(data, dict) else data
+
+    orders = []
+    for idx, row in enumerate(rows):
+        lat = row.get('lat', row.get('latitude'))
+        lon = row.get('lon', row.get('longitude'))
+        if lat is None or lon is None:
+            continue
+        lat, lon = float(lat), float(lon)
+        lat = lat / 10000000000.0 if abs(lat) > 1000 else lat
+        lon = lon / 10000000000.0 if abs(lon) > 1000 else lon
+        orders.append({'tracking_number': row.get('tracking_number', f'REPLAY{idx:05d}'), 'lat': lat, 'lon': lon})
+    return orders
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""測試批次規劃 API（本機 SQLite 資料來源 + 進程池，不需正式資料庫）"""
+
+import json
+import os
+import tempfile
+
+from order_source import connect_sqlite, import_snapshot, save_snapshot
+from synthetic_orders import generate_orders, start_point
+
+GROUPS = {
+    'GroupBATCH01': generate_orders('clustered', 200, seed=1),
+    'GroupBATCH02': generate_orders('linear', 150, seed=2),
+    'GroupBATCH03': generate_orders('uniform', 120, seed=3),
+}
+
+
+def build_database(tmp_dir):
+    conn = connect_sqlite(os.path.join(tmp_dir, 'orders.db'))
+    for order_group, orders in GROUPS.items():
+        rows = [{'tracking_number': o['tracking_number'], 'latitude': o['lat'], 'longitude': o['lon'],
+                 'delivery_sequence': None} for o in orders]
+        import_snapshot(conn, save_snapshot(os.path.join(tmp_dir, f'{order_group}.npz'), order_group, rows))
+    conn.commit()
+    conn.close()
+    return os.path.join(tmp_dir, 'orders.db')
+
+
+def main():
+    print("=" * 60)
+    print("測試批次規劃")
+    print("=" * 60)
+
+    os.environ['ORDER_SOURCE'] = f'sqlite:{build_database(tempfile.mkdtemp())}'
+    os.environ['BATCH_WORKERS'] = '2'
+    import app  # ORDER_SOURCE 需在匯入前設定
+
+    client = app.app.test_client()
+    body = {'start': start_point(), 'order_groups': list(GROUPS) + ['GroupMISSING']}
+
+    # 1. 單次查詢取得所有 order_group
+    print("\n1. fetch_valid_orders_many...")
+    orders_by_group = app.fetch_valid_orders_many(list(GROUPS) + ['GroupMISSING'])
+    assert set(orders_by_group) == set(GROUPS)
+    assert all(len(orders_by_group[g]) == len(GROUPS[g]) for g in GROUPS)
+    print(f"   ✅ {sum(len(v) for v in orders_by_group.values())} 筆訂單")
+
+    # 2. 進程池規劃，結果與 /api/route 相同
+    print("\n2. POST /api/route/batch...")
+    response = client.post('/api/route/batch', json=body)
+    data = response.get_json()
+    assert response.status_code == 200, data
+    assert list(data['results']) == body['order_groups']
+    assert data['summary'] == dict(data['summary'], total=4, done=3, failed=1, cached=0)
+    assert 'GroupMISSING' in data['results']['GroupMISSING']['error']
+    single = client.post('/api/route', json={'start': body['start'], 'order_group': 'GroupBATCH02'})
+    assert single.headers['X-Plan-Cache'] == 'HIT'  # 批次結果已寫入規劃快取
+    assert single.get_json()['orders'] == data['results']['GroupBATCH02']['orders']
+    plan_id = data['results']['GroupBATCH01']['plan_id']
+    assert client.get(f'/api/route/{plan_id}/steps').status_code == 200
+    print(f"   ✅ 3 個 order_group 完成（{data['summary']['elapsed']:.2f}s），1 個找不到")
+
+    # 3. NDJSON 串流：每完成一個 order_group 送出一行
+    print("\n3. 串流...")
+    response = client.post('/api/route/batch?format=ndjson', json=body)
+    events = [json.loads(line) for line in response.get_data(as_text=True).strip().split('\n')]
+    assert response.mimetype == 'application/x-ndjson'
+    assert [e['event'] for e in events] == ['group'] * 4 + ['summary']
+    assert events[-1]['data']['cached'] == 3
+    print("   ✅ group ×4 + summary（快取命中）")
+
+    # 4. 參數不同時重新規劃
+    print("\n4. 參數變更...")
+    response = client.post('/api/route/batch', json=dict(body, max_group_size=10, inner_order_method='2opt-inner'))
+    summary = response.get_json()['summary']
+    assert summary['done'] == 3 and summary['cached'] == 0
+    print("   ✅ 參數變更後重新規劃")
+
+    # 5. 驗證
+    print("\n5. 驗證...")
+    assert client.post('/api/route/batch', json={'start': body['start']}).status_code == 400
+    assert client.post('/api/route/batch', json={'order_groups': ['GroupBATCH01']}).status_code == 400
+    too_many = {'start': body['start'], 'order_groups': [f'G{i}' for i in range(app.BATCH_MAX_GROUPS + 1)]}
+    assert client.post('/api/route/batch', json=too_many).status_code == 400
+    print("   ✅ 400")
+
+    app.BatchPlanner.get_instance().shutdown()
+    print("\n✅ 所有測試通過")
+
+
+if __name__ == '__main__':
+    # 進程池以 spawn 啟動子進程，主程式需放在 __main__ 之下
+    main()
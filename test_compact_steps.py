@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""測試精簡版演算法步驟（steps=compact 還原後需與 steps=full 相同；不需資料庫）"""
+
+import app
+from route_pipeline import compact_steps, expand_compact_steps
+from synthetic_orders import generate_orders, start_point
+
+print("=" * 60)
+print("測試精簡版演算法步驟")
+print("=" * 60)
+
+orders = generate_orders('clustered', 300) + generate_orders('uniform', 40, seed=5)
+app.fetch_valid_orders = lambda order_group: orders
+client = app.app.test_client()
+body = {'start': start_point(), 'order_group': 'STEPS-TEST', 'max_group_size': 20}
+
+# 1. /api/route：compact 還原後與 full 相同
+print("\n1. steps=compact / full...")
+full = client.post('/api/route', json=dict(body, steps='full')).get_json()
+compact = client.post('/api/route', json=dict(body, steps='compact')).get_json()
+assert full['steps_format'] == 'full' and compact['steps_format'] == 'compact'
+assert compact['plan_id'] == full['plan_id'] and compact['orders'] == full['orders']
+names = [step['name'] for step in full['algorithm_steps']]
+assert {'初始化', 'DBSCAN 密度聚類', 'K-means 細分大群組', '完成訂單排序'} <= set(names), names
+assert expand_compact_steps(compact['algorithm_steps'], compact['orders']) == full['algorithm_steps']
+assert compact_steps(full['algorithm_steps'], full['orders']) == compact['algorithm_steps']
+assert 'algorithm_steps' not in client.post('/api/route', json=body).get_json()
+print(f"   ✅ {len(names)} 個步驟；精簡版 {len(app.dumps_json(compact['algorithm_steps']))} bytes"
+      f"（完整 {len(app.dumps_json(full['algorithm_steps']))} bytes）")
+
+# 2. 終點模式：回應 orders 含 ENDPOINT / 最遠訂單移至最後，final_sequence 為終點處理前的順序
+print("\n2. end_point_mode=manual / farthest...")
+# 起點在訂單中央：最遠訂單不會剛好排在最後，需要重新排序
+center = {'lat': sum(o['lat'] for o in orders) / len(orders), 'lon': sum(o['lon'] for o in orders) / len(orders)}
+for end_point_body in ({'end_point_mode': 'manual', 'end_point': {'lat': 43.62, 'lon': -79.52}},
+                       {'end_point_mode': 'farthest', 'start': center}):
+    request_body = dict(body, **end_point_body)
+    full_ep = client.post('/api/route', json=dict(request_body, steps='full')).get_json()
+    compact_ep = client.post('/api/route', json=dict(request_body, steps='compact')).get_json()
+    final_step = next(s for s in full_ep['algorithm_steps'] if s['name'] == '完成訂單排序')
+    assert final_step['data']['final_sequence'] != full_ep['orders']
+    assert expand_compact_steps(compact_ep['algorithm_steps'], compact_ep['orders']) == full_ep['algorithm_steps']
+    print(f"   ✅ {end_point_body['end_point_mode']}")
+
+# 3. /api/route/<plan_id>/steps
+print("\n3. 步驟端點...")
+plan_id = full['plan_id']
+response = client.get(f'/api/route/{plan_id}/steps')
+assert response.status_code == 200 and response.get_json()['algorithm_steps'] == full['algorithm_steps']
+response = client.get(f'/api/route/{plan_id}/steps?steps=compact')
+assert response.get_json()['steps_format'] == 'compact'
+assert expand_compact_steps(response.get_json()['algorithm_steps'], full['orders']) == full['algorithm_steps']
+assert client.get(f'/api/route/{plan_id}/steps?steps=bogus').status_code == 400
+assert client.get(f"/api/route/{'0' * len(plan_id)}/steps").status_code == 404
+assert client.get('/api/route/not-a-plan/steps').status_code == 400
+assert client.post('/api/route', json=dict(body, steps='bogus')).status_code == 400
+print("   ✅ 未知 plan_id → 404，未知 steps 格式 → 400")
+
+print("\n✅ 所有測試通過")
@@ -7,6 +7,7 @@ from core_routing_algorithms import (
     plan_route, 
     analyze_order_distribution,
     hybrid_clustering,
+    capacitated_kmeans,
     order_clusters_greedy,
     solve_tsp
 )
@@ -52,6 +53,39 @@ clusters = hybrid_clustering(
 print(f"✅ 聚类完成: {len(clusters)} 个群组")
 print()
 
+# 测试 2b: 容量约束细分
+print("测试 2b: 容量约束细分（每组 ≤ max_group_size）")
+print("-" * 80)
+import numpy as np
+rng = np.random.default_rng(0)
+dense_coords = rng.normal([43.6532, -79.3832], 0.01, size=(95, 2))
+sub_labels = capacitated_kmeans(dense_coords, max_group_size=30)
+sub_sizes = np.bincount(sub_labels).tolist()
+assert max(sub_sizes) <= 30, sub_sizes
+assert np.array_equal(sub_labels, capacitated_kmeans(dense_coords, max_group_size=30))
+print(f"✅ 细分完成: {sub_sizes}")
+
+# 候选中心不足（所有订单最近的都是中心 0）时加倍，分配结果仍满足容量
+import time
+from core_routing_algorithms import _capacitated_assign_flow
+crowded = np.array([[0.0, x * 0.001] for x in range(10)])
+centers = np.array([[0.0, 0.0], [0.0, 1.0]])
+flow_labels = _capacitated_assign_flow(crowded, centers, capacity=5, candidates=1)
+if flow_labels is not None:  # OR-Tools 未安装时使用贪心分配
+    assert np.bincount(flow_labels).tolist() == [5, 5], flow_labels
+    assert flow_labels[:5].tolist() == [0] * 5
+
+# 上限 5000 个订单（K = 250）：每个订单只连最近的候选中心，运行时间有上限
+large_coords = np.concatenate([rng.normal(center, 0.005, size=(500, 2))
+                               for center in rng.uniform([43.6, -79.6], [43.8, -79.2], size=(10, 2))])
+started = time.perf_counter()
+large_labels = capacitated_kmeans(large_coords, max_group_size=20)
+elapsed = time.perf_counter() - started
+assert np.bincount(large_labels).max() <= 20 and len(set(large_labels.tolist())) == 250
+assert elapsed < 8.0, f"5000 个订单细分耗时 {elapsed:.1f}s"
+print(f"✅ 5000 个订单细分为 250 组: {elapsed:.2f}s")
+print()
+
 # 测试 3: 群组排序
 print("测试 3: 群组排序")
 print("-" * 80)
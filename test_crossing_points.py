@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""測試穿越點索引（橋樑 / 高架 / 交流道）與繞行距離估計"""
+
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from crossing_points import CrossingPointIndex, read_overpass_ways
+from river_detection import ObstacleDetector
+from route_pipeline import StageCache, crossing_cost, route_params, run_route_pipeline
+from synthetic_orders import BOUNDING_BOXES, generate_orders, river_line, start_point, write_obstacle_files
+
+print("=" * 60)
+print("測試穿越點索引")
+print("=" * 60)
+
+rng = random.Random(4)
+tmp_dir = tempfile.mkdtemp()
+rivers_file, highways_file = write_obstacle_files(tmp_dir, 'toronto')
+south, west, north, east = BOUNDING_BOXES['toronto']
+highway_lat = south + (north - south) * 0.6
+
+# 橋樑：沿河每隔一段距離一座（一般道路）；跨越高速公路的道路（橋 + 隧道）；交流道節點；
+# 高速公路本身的高架段（不算跨越高速公路的穿越點）
+river = river_line(BOUNDING_BOXES['toronto'], n_points=400)
+ways = []
+for lat, lon in river[10:-10:12]:
+    ways.append(([(lat, lon - 0.002), (lat, lon + 0.002)], {'highway': 'secondary', 'bridge': 'yes'}))
+for lon in np.linspace(west + 0.02, east - 0.02, 15):
+    ways.append(([(highway_lat - 0.001, lon), (highway_lat + 0.001, lon)],
+                 {'highway': 'residential', rng.choice(['bridge', 'tunnel']): 'yes'}))
+ways.append(([(highway_lat, west + 0.01), (highway_lat, west + 0.03)], {'highway': 'motorway', 'bridge': 'yes'}))
+ways.append(([(south + 0.01, west + 0.01), (south + 0.012, west + 0.01)], {'highway': 'primary', 'bridge': 'no'}))
+elements, node_id = [], 1
+for way_id, (coords, tags) in enumerate(ways, 1):
+    node_ids = []
+    for lat, lon in coords:
+        elements.append({'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon})
+        node_ids.append(node_id)
+        node_id += 1
+    elements.append({'type': 'way', 'id': way_id, 'nodes': node_ids, 'tags': tags})
+elements.append({'type': 'node', 'id': node_id, 'lat': highway_lat, 'lon': (west + east) / 2 + 0.01,
+                 'tags': {'highway': 'motorway_junction', 'ref': '42'}})
+crossings_file = os.path.join(tmp_dir, 'crossings.json')
+with open(crossings_file, 'w', encoding='utf-8') as f:
+    json.dump({'elements': elements}, f)
+
+# 1. 建立索引
+print("\n1. 建立索引...")
+ways_read, tagged_nodes = read_overpass_ways(crossings_file)
+assert len(ways_read) == len(ways) and len(tagged_nodes) == 1
+index = CrossingPointIndex.build(rivers_file, highways_file, crossings_file)
+bridges = len(river[10:-10:12])
+counts = index.counts()
+assert bridges < counts['rivers'] <= bridges + 3  # 一般道路橋 + 高速公路橋（高速公路與河流的交點）
+assert counts['highways'] == 15 + 1  # 跨越 / 穿越高速公路的道路 + 交流道（高速公路本身的高架不算）
+assert index.data_version and index.data_version != CrossingPointIndex.build(rivers_file, highways_file,
+                                                                              '/nonexistent.json').data_version
+print(f"   ✅ {counts}")
+
+# 2. 經由最近穿越點的距離（與窮舉所有穿越點比較）
+print("\n2. 繞行距離...")
+orders = generate_orders('river', 400)
+detector = ObstacleDetector(rivers_file, highways_file)
+pairs = [(a['lat'], a['lon'], b['lat'], b['lon']) for a, b in zip(orders, orders[1:])]
+pairs = [p for p in pairs if detector.check_crossing_geometry(*p)]
+assert len(pairs) > 20
+a = np.array([p[:2] for p in pairs])
+b = np.array([p[2:] for p in pairs])
+estimated = index.via_distance_many('rivers', a, b)
+points = index.points['rivers']  # (lon, lat)
+exhaustive = np.array([
+    (np.hypot(points[:, 0] - p[1], points[:, 1] - p[0]) + np.hypot(points[:, 0] - p[3], points[:, 1] - p[2])).min()
+    for p in pairs
+])
+direct = np.hypot(a[:, 0] - b[:, 0], a[:, 1] - b[:, 1])
+assert (estimated >= direct - 1e-12).all() and (estimated >= exhaustive - 1e-12).all()
+assert np.isclose(estimated, exhaustive).mean() >= 0.95
+assert index.via_distance('rivers', *pairs[0]) == estimated[0]
+print(f"   ✅ {len(pairs)} 對跨河連線；與窮舉一致 {np.isclose(estimated, exhaustive).mean():.0%}；"
+      f"繞行 / 直線 中位數 ×{np.median(estimated / direct):.2f}")
+
+# 3. 速度
+print("\n3. 速度...")
+start = time.perf_counter()
+for pair in pairs:
+    index.detour_cost(*pair, True, False)
+single = (time.perf_counter() - start) / len(pairs)
+many_a, many_b = np.repeat(a, 50, axis=0), np.repeat(b, 50, axis=0)
+start = time.perf_counter()
+index.via_distance_many('rivers', many_a, many_b)
+batched = (time.perf_counter() - start) / len(many_a)
+print(f"   單對 {single * 1e6:.1f} µs，批次 {batched * 1e6:.2f} µs/對")
+print("   ✅")
+
+# 4. 穿越點不足時改用懲罰係數
+print("\n4. 回退...")
+base = CrossingPointIndex.build(rivers_file, highways_file, '/nonexistent.json')
+assert base.counts()['highways'] == 0 and base.counts()['rivers'] >= 1  # 只有高速公路橋
+assert base.detour_cost(*pairs[0], True, True) is None
+assert crossing_cost(1.0, 2.0, base, *pairs[0], True, True) == 2.0
+assert crossing_cost(1.0, 2.0, None, *pairs[0], True, False) == 2.0
+assert crossing_cost(1.0, 2.0, index, *pairs[0], True, True) == max(
+    index.via_distance('rivers', *pairs[0]), index.via_distance('highways', *pairs[0]))
+print("   ✅")
+
+# 5. 路徑規劃：crossing_cost='detour'
+print("\n5. run_route_pipeline...")
+ObstacleDetector._instance = detector
+CrossingPointIndex._instance = index
+stage_cache = StageCache()
+params = route_params({'start': start_point('toronto'), 'order_group': 'BRIDGE', 'verification': 'geometry',
+                       'check_highways': True})
+expected = run_route_pipeline(orders, params, stage_cache=stage_cache)
+stages = {}
+result = run_route_pipeline(orders, dict(params, crossing_cost='detour'), stage_cache=stage_cache,
+                            on_stage=lambda stage, info: stages.setdefault(stage, info['cached']))
+assert stages == {'cluster': True, 'split': True, 'group_order': False, 'inner_order': False, 'finish': False}
+assert sorted(o['tracking_number'] for o in result['orders']) == sorted(o['tracking_number'] for o in expected['orders'])
+print(f"   ✅ 穿越 {len(expected['crossings'])}（懲罰係數）→ {len(result['crossings'])}（繞行距離）")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""測試 Prometheus 指標輸出與取樣日誌（不需資料庫）"""
+
+import logging
+import multiprocessing
+import os
+import tempfile
+
+from metrics import Registry
+from app_logging import LogSampler
+
+print("=" * 60)
+print("測試監控指標")
+print("=" * 60)
+
+registry = Registry()
+latency = registry.histogram('demo_seconds', '測試延遲', ['stage'], buckets=(0.1, 1.0))
+checks = registry.counter('demo_total', '測試計數', ['result'])
+
+
+class FakeCache:
+    hits = 3
+    misses = 1
+
+
+registry.register_cache('plan', FakeCache())
+
+# 1. 直方圖為累積區間
+print("\n1. 直方圖...")
+for value in (0.05, 0.5, 5.0):
+    latency.observe(value, stage='dbscan')
+text = registry.render()
+assert 'demo_seconds_bucket{stage="dbscan",le="0.1"} 1' in text
+assert 'demo_seconds_bucket{stage="dbscan",le="1.0"} 2' in text
+assert 'demo_seconds_bucket{stage="dbscan",le="+Inf"} 3' in text
+assert 'demo_seconds_count{stage="dbscan"} 3' in text
+print("   ✅ 區間累積、_sum、_count 正確")
+
+# 2. 計數器與標籤跳脫
+print("\n2. 計數器...")
+checks.inc(result='cross"ing')
+checks.inc(result='cross"ing')
+assert 'demo_total{result="cross\\"ing"} 2' in registry.render()
+print("   ✅ 標籤值已跳脫")
+
+# 3. 快取命中率
+print("\n3. 快取命中率...")
+text = registry.render()
+assert 'cache_requests_total{cache="plan",result="hit"} 3' in text
+assert 'cache_hit_ratio{cache="plan"} 0.75' in text
+print("   ✅ 命中率 0.75")
+
+# 4. 計時區塊
+print("\n4. with histogram.time()...")
+with latency.time(stage='noise'):
+    pass
+assert latency.count(stage='noise') == 1
+print("   ✅ 計時完成")
+
+# 5. 取樣日誌：前 5 筆 + 每 100 筆
+print("\n5. 取樣日誌...")
+logger = logging.getLogger('test_metrics')
+logger.setLevel(logging.DEBUG)
+sampler = LogSampler(logger, first=5, every=100)
+for i in range(1000):
+    sampler.debug("item %d", i)
+assert sampler.seen == 1000
+assert sampler.logged == 15  # 前 5 筆 + 第 100, 200, ..., 1000 筆
+print(f"   ✅ 1000 筆只輸出 {sampler.logged} 筆")
+
+# 6. 多進程：各 worker 寫入共用目錄，/metrics 合計（fork 前 master 的數值不重複計算）
+print("\n6. 多進程合計...")
+shared = Registry(store_dir=tempfile.mkdtemp(), flush_seconds=0.05)
+jobs = shared.counter('jobs_total', '測試工作', ['result'])
+stage = shared.histogram('stage_seconds', '測試階段', ['stage'], buckets=(0.1, 1.0))
+cache = FakeCache()
+shared.register_cache('plan', cache)
+jobs.inc(result='done', amount=2)  # master 預熱
+shared.flush()
+
+
+def worker(n):
+    shared.after_fork()
+    for _ in range(n):
+        jobs.inc(result='done')
+        stage.observe(0.5, stage='dbscan')
+    cache.hits += n
+    shared.flush()
+
+
+processes = [multiprocessing.get_context('fork').Process(target=worker, args=(n,)) for n in (3, 4)]
+for process in processes:
+    process.start()
+for process in processes:
+    process.join()
+    assert process.exitcode == 0
+assert len(os.listdir(shared.store_dir)) == 3
+text = shared.render()
+assert 'jobs_total{result="done"} 9' in text, text  # 2 + 3 + 4
+assert 'stage_seconds_bucket{stage="dbscan",le="1.0"} 7' in text and 'stage_seconds_count{stage="dbscan"} 7' in text
+assert 'cache_requests_total{cache="plan",result="hit"} 10' in text  # 3 + 3 + 4
+assert 'cache_requests_total{cache="plan",result="miss"} 1' in text
+shared.clear_store()
+assert os.listdir(shared.store_dir) == []
+print("   ✅ master + 2 個 worker 合計；fork 前的數值只計算一次")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""測試 DBSCAN 鄰域圖快取（結果需與 sklearn DBSCAN 完全相同）"""
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from neighbor_graph_cache import MAX_CLUSTER_RADIUS_KM, NeighborGraphCache, metric_space
+from synthetic_orders import generate_orders
+
+print("=" * 60)
+print("測試 DBSCAN 鄰域圖快取")
+print("=" * 60)
+
+orders = generate_orders('clustered', 800, seed=3) + generate_orders('uniform', 200, seed=4)
+coords = np.array([[o['lat'], o['lon']] for o in orders])
+RADII = (0.2, 0.5, 1.0, 2.0, MAX_CLUSTER_RADIUS_KM)
+MIN_SAMPLES = (1, 3, 5, 10)
+
+
+def sklearn_labels(cluster_radius, min_samples, metric):
+    space, eps = metric_space(coords, cluster_radius, metric)
+    return DBSCAN(eps=eps, min_samples=min_samples, metric=metric).fit_predict(space)
+
+
+# 1. 與 sklearn DBSCAN 一致（各距離方式、半徑、最小樣本數）
+print("\n1. 與 sklearn 一致...")
+cache = NeighborGraphCache()
+for metric in ('euclidean', 'haversine', 'manhattan'):
+    for cluster_radius in RADII:
+        for min_samples in MIN_SAMPLES:
+            labels = cache.dbscan_labels(coords, cluster_radius, min_samples, metric)
+            expected = sklearn_labels(cluster_radius, min_samples, metric)
+            assert (labels == expected).all(), f"{metric} r={cluster_radius} ms={min_samples} 與 sklearn 不同"
+    print(f"   ✅ {metric}: {len(RADII) * len(MIN_SAMPLES)} 組參數結果相同")
+
+# 2. 快取重用：每種距離方式只建立一次鄰域圖
+print("\n2. 快取重用...")
+assert cache.misses == 3, f"每種距離方式應只建圖一次，實際 {cache.misses} 次"
+assert cache.hits == 3 * len(RADII) * len(MIN_SAMPLES) - 3
+_, _, hit = cache.get_graph(coords, 'euclidean')
+assert hit
+moved = coords.copy()
+moved[0, 0] += 1e-4
+_, _, hit = cache.get_graph(moved, 'euclidean')
+assert not hit, "訂單變動後應重新建圖"
+print(f"   ✅ 建圖 {cache.misses} 次，命中 {cache.hits} 次")
+
+# 3. 超過快取半徑：直接執行 DBSCAN（不建立 / 不使用快取鄰域圖）
+print("\n3. 超過快取半徑...")
+small = NeighborGraphCache(max_radius_km=0.5)
+for metric in ('euclidean', 'haversine'):
+    assert (small.dbscan_labels(coords, 1.0, 3, metric) == sklearn_labels(1.0, 3, metric)).all()
+assert small.misses == 0 and small.hits == 0
+# 需要篩選邊時以本次半徑建圖；保留全部邊時結果相同
+keep_all = small.dbscan_labels(coords, 1.0, 3, edge_filter=lambda rows, cols: np.ones(len(rows), dtype=bool))
+assert (keep_all == sklearn_labels(1.0, 3, 'euclidean')).all() and small.misses == 0
+print("   ✅")
+
+# 4. LRU 淘汰
+print("\n4. LRU...")
+lru = NeighborGraphCache(max_entries=2)
+snapshots = [coords + k * 1e-3 for k in range(3)]
+for snapshot in snapshots:
+    lru.get_graph(snapshot)
+assert lru.get_graph(snapshots[2])[2] and not lru.get_graph(snapshots[0])[2]
+print("   ✅")
+
+print("\n✅ 所有測試通過")
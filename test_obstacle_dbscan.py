@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""測試障礙感知聚類（鄰域圖中跨河的邊不連通，只檢測 eps 內的邊）"""
+
+import tempfile
+
+import numpy as np
+import shapely
+from sklearn.cluster import DBSCAN
+
+from neighbor_graph_cache import NeighborGraphCache, metric_space
+from obstacle_regions import RegionMap
+from river_detection import ObstacleDetector, ObstacleView
+from route_pipeline import StageCache, obstacle_edge_filter, route_params, run_cluster_stage, run_route_pipeline
+from synthetic_orders import BOUNDING_BOXES, generate_orders, river_line, start_point, write_obstacle_files
+
+print("=" * 60)
+print("測試障礙感知聚類")
+print("=" * 60)
+
+rivers_file, highways_file = write_obstacle_files(tempfile.mkdtemp(), 'toronto')
+detector = ObstacleDetector(rivers_file, highways_file)
+ObstacleDetector._instance = detector
+# 兩岸聚落 + 沿河兩岸約 300 m 的訂單（一般 DBSCAN 會經由這些訂單跨河連通）
+orders = generate_orders('river', 600)
+line = river_line(BOUNDING_BOXES['toronto'], n_points=400)
+for k, (lat, lon) in enumerate(line[5:-5:2]):
+    for side in (-1, 1):
+        orders.append({'tracking_number': f'BANK{k:03d}{side:+d}', 'lat': lat, 'lon': lon + side * 0.004})
+coords = np.array([[o['lat'], o['lon']] for o in orders])
+RADIUS_KM = 3.0
+
+# 以河流切出的兩岸作為參考答案
+south, west, north, east = BOUNDING_BOXES['toronto']
+bounds = (west, south, east, north)
+banks, _ = RegionMap(shapely.clip_by_rect(np.array(detector.rivers, dtype=object), *bounds), bounds).classify(
+    coords[:, 0], coords[:, 1]
+)
+assert set(banks.tolist()) == {0, 1}
+
+
+def mixed_clusters(labels):
+    """同時包含兩岸訂單的群組數"""
+    return sum(1 for label in set(labels.tolist()) - {-1} if len(set(banks[labels == label].tolist())) > 1)
+
+
+cache = NeighborGraphCache()
+
+# 1. 一般 DBSCAN 會跨河連通
+print("\n1. 一般 DBSCAN...")
+plain = cache.dbscan_labels(coords, RADIUS_KM, 3)
+assert mixed_clusters(plain) > 0
+print(f"   {len(set(plain.tolist()) - {-1})} 組，其中 {mixed_clusters(plain)} 組跨河")
+
+# 2. 障礙感知：沒有任何群組跨河，只檢測 eps 內的邊
+print("\n2. 障礙感知聚類...")
+view = detector.view([tuple(c) for c in coords])
+assert isinstance(view, ObstacleView)
+edge_filter, stats = obstacle_edge_filter(view, coords)
+aware = cache.dbscan_labels(coords, RADIUS_KM, 3, edge_filter=edge_filter)
+assert mixed_clusters(aware) == 0
+graph, row_ids, _ = cache.get_graph(coords)
+_, eps = metric_space(coords, RADIUS_KM, 'euclidean')
+within = graph.data <= eps
+expected_pairs = int((row_ids[within] < graph.indices[within]).sum())
+assert stats['edges'] == expected_pairs and stats['edges'] < len(coords) * (len(coords) - 1) // 2
+assert stats['pruned'] > 0
+print(f"   ✅ {len(set(aware.tolist()) - {-1})} 組，無跨河群組；檢測 {stats['edges']} 條邊"
+      f"（全配對 {len(coords) * (len(coords) - 1) // 2}），移除 {stats['pruned']} 條")
+
+# 3. 批次檢測與逐條檢測一致；保留全部邊時與 sklearn DBSCAN 相同
+print("\n3. 一致性...")
+rows, cols = row_ids[within], graph.indices[within]
+batched = view.edge_crossings(coords, rows, cols, check_highways=True)
+looped = ObstacleDetector.edge_crossings(detector, coords, rows, cols, check_highways=True)
+assert (batched == looped).all() and batched.any()
+keep_all = cache.dbscan_labels(coords, RADIUS_KM, 3, edge_filter=lambda r, c: np.ones(len(r), dtype=bool))
+space, eps = metric_space(coords, RADIUS_KM, 'euclidean')
+assert (keep_all == DBSCAN(eps=eps, min_samples=3).fit_predict(space)).all()
+# 超出快取半徑時以本次半徑建立鄰域圖
+small = NeighborGraphCache(max_radius_km=1.0)
+edge_filter, _ = obstacle_edge_filter(view, coords)
+assert (small.dbscan_labels(coords, RADIUS_KM, 3, edge_filter=edge_filter) == aware).all()
+print(f"   ✅ {len(rows)} 條邊批次 / 逐條結果一致")
+
+# 4. 完整索引（OBSTACLE_VIEW=0）結果相同
+print("\n4. 完整索引...")
+edge_filter, _ = obstacle_edge_filter(detector, coords)
+assert (cache.dbscan_labels(coords, RADIUS_KM, 3, edge_filter=edge_filter) == aware).all()
+print("   ✅")
+
+# 5. 路徑規劃：cluster_obstacles 參數（不需 verification 也可使用）
+print("\n5. run_route_pipeline...")
+stage_cache = StageCache()
+params = route_params({'start': start_point('toronto'), 'order_group': 'DBSCAN', 'cluster_radius': RADIUS_KM})
+run_route_pipeline(orders, params, stage_cache=stage_cache)
+stages = {}
+params = dict(params, cluster_obstacles=True)
+result = run_route_pipeline(orders, params, stage_cache=stage_cache,
+                            on_stage=lambda stage, info: stages.setdefault(stage, info['cached']))
+assert stages['cluster'] is False  # 切換模式時重算聚類
+step = next(s for s in result['algorithm_steps'] if s['name'] == 'DBSCAN 密度聚類')
+assert step['data']['parameters']['obstacle_aware'] and step['data']['stats']['obstacle_edges']['pruned'] > 0
+assert 'cluster_obstacles' in step['affected_by']
+print(f"   ✅ {step['description'][:60]}...")
+
+# 6. 噪聲點分配也不跨河（稀疏的沿岸訂單多為噪聲點）
+print("\n6. 噪聲點分配...")
+sparse = generate_orders('river', 300, seed=7) + [o for o in orders if o['tracking_number'].startswith('BANK')][::3]
+sparse_coords = np.array([[o['lat'], o['lon']] for o in sparse])
+sparse_banks, _ = RegionMap(shapely.clip_by_rect(np.array(detector.rivers, dtype=object), *bounds), bounds).classify(
+    sparse_coords[:, 0], sparse_coords[:, 1]
+)
+for cluster_radius, min_samples in ((0.5, 3), (0.5, 5), (1.0, 5), (RADIUS_KM, 3)):
+    params = route_params({'start': start_point('toronto'), 'order_group': 'NOISE', 'cluster_radius': cluster_radius,
+                           'min_samples': min_samples, 'cluster_obstacles': True})
+    stage = run_cluster_stage(sparse, params, detector=detector)
+    labels = stage['labels']
+    assert (labels != -1).all()
+    mixed = sum(1 for label in set(labels.tolist()) if len(set(sparse_banks[labels == label].tolist())) > 1)
+    assert mixed == 0, f"r={cluster_radius} ms={min_samples}: {mixed} 組跨河"
+    noise_step = next((s for s in stage['steps'] if s['name'] == '噪聲點處理'), None)
+    n_noise = noise_step['data']['noise_count'] if noise_step else 0
+    print(f"   ✅ r={cluster_radius} ms={min_samples}: {n_noise} 個噪聲點分配後無跨河群組")
+
+print("\n✅ 所有測試通過")
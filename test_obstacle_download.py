@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""測試分塊串流下載（本機 HTTP 服務模擬 Overpass；結果需與由 JSON 打包的目錄一致）"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import obstacle_download
+from obstacle_download import OverpassError, TileCache, download, iter_elements, tile_grid
+from obstacle_store import ObstacleStore, read_overpass_lines
+from synthetic_orders import BOUNDING_BOXES, generate_orders, write_obstacle_files
+
+print("=" * 60)
+print("測試分塊串流下載")
+print("=" * 60)
+
+tmp_dir = tempfile.mkdtemp()
+rivers_file, highways_file = write_obstacle_files(tmp_dir, 'toronto')
+south, west, north, east = BOUNDING_BOXES['toronto']
+BBOX = {'south': south, 'west': west, 'north': north, 'east': east}
+TILE = 0.05
+WAYS = {kind: list(enumerate(read_overpass_lines(filename), 1))
+        for kind, filename in (('rivers', rivers_file), ('highways', highways_file))}
+
+
+class FakeOverpass(BaseHTTPRequestHandler):
+    """依查詢的 bbox 回傳與分塊相交的 way（out geom 格式，分塊傳輸）；指定分塊第一次回 429"""
+
+    requests_seen = []
+    fail_once = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        query = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))['data'][0]
+        kind = 'rivers' if 'waterway' in query else 'highways'
+        s, w, n, e = (float(v) for v in re.search(r'\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)', query).groups())
+        with self.lock:
+            self.requests_seen.append((kind, round(s, 4), round(w, 4)))
+            if (kind, round(s, 4), round(w, 4)) in self.fail_once:
+                self.fail_once.discard((kind, round(s, 4), round(w, 4)))
+                self.send_response(429)
+                self.end_headers()
+                return
+        elements = []
+        for way_id, coords in WAYS[kind]:
+            lons, lats = zip(*coords)
+            if min(lons) <= e and max(lons) >= w and min(lats) <= n and max(lats) >= s:
+                elements.append({'type': 'way', 'id': way_id, 'bounds': {},
+                                 'geometry': [{'lat': lat, 'lon': lon} for lon, lat in coords]})
+        body = json.dumps({'version': 0.6, 'osm3s': {'copyright': 'test'}, 'elements': elements}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for k in range(0, len(body), 997):
+            chunk = body[k:k + 997]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOverpass)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+URL = f"http://127.0.0.1:{server.server_port}/api/interpreter"
+obstacle_download.OVERPASS_URL = URL
+obstacle_download.RETRY_BACKOFF = 0.01
+
+# 1. 串流解析（任意切割位置、多位元組字元、runtime error）
+print("\n1. iter_elements...")
+payload = json.dumps({'version': 0.6, 'osm3s': {'copyright': '數據 © OSM'},
+                      'elements': [{'type': 'way', 'id': k, 'tags': {'name': '河流 ✓'}, 'geometry': []}
+                                   for k in range(50)]}, ensure_ascii=False).encode('utf-8')
+for size in (1, 3, 7, 64, len(payload)):
+    parsed = list(iter_elements(payload[k:k + size] for k in range(0, len(payload), size)))
+    assert [e['id'] for e in parsed] == list(range(50)) and parsed[0]['tags']['name'] == '河流 ✓'
+for broken in (payload[:len(payload) // 2],
+               payload[:-1] + b', "remark": "runtime error: Query timed out"}'):
+    try:
+        list(iter_elements([broken]))
+        assert False, "應拋出 OverpassError"
+    except OverpassError:
+        pass
+print("   ✅")
+
+# 2. 並行下載（含 429 重試）→ 打包目錄與由 JSON 建立的結果一致
+print("\n2. 下載...")
+tiles = tile_grid(BBOX, TILE)
+assert len(tiles) > 4
+first_tile = tiles[0][1]
+FakeOverpass.fail_once = {('rivers', round(first_tile[0], 4), round(first_tile[1], 4))}
+store_dir, cache_dir = os.path.join(tmp_dir, 'store'), os.path.join(tmp_dir, 'tiles')
+report = download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE, workers=4, json_dir=tmp_dir)
+assert not report['failed'] and report['fetched'] == 2 * len(tiles) and report['fresh'] == 0
+assert report['attempts'] == 2 * len(tiles) + 1 and len(FakeOverpass.requests_seen) == 2 * len(tiles) + 1
+assert report['lines'] == {'rivers': len(WAYS['rivers']), 'highways': len(WAYS['highways'])}, "跨分塊的 way 應去重"
+
+downloaded = ObstacleStore.open(store_dir)
+assert 'download' in downloaded.sources and downloaded.data_version == report['data_version']
+reference = ObstacleStore.build(os.path.join(tmp_dir, 'reference'), rivers_file, highways_file)
+orders = generate_orders('river', 300)
+pairs = [(a['lat'], a['lon'], b['lat'], b['lon']) for a, b in zip(orders, orders[1:])]
+for kind in ('rivers', 'highways'):
+    expected = [reference.crosses(kind, *pair) for pair in pairs]
+    assert [downloaded.crosses(kind, *pair) for pair in pairs] == expected and any(expected)
+# 一般模式的 JSON 輸出
+assert sorted(map(tuple, map(tuple, read_overpass_lines(os.path.join(tmp_dir, 'rivers_data.json'))))) == \
+    sorted(tuple(map(tuple, coords)) for _, coords in WAYS['rivers'])
+# 下載的目錄不因 JSON 檔版本不同而重新打包
+assert ObstacleStore.open_or_build(store_dir, '/nonexistent.json', '/nonexistent.json').data_version == \
+    report['data_version']
+print(f"   ✅ {report['fetched']} 個分塊（{report['attempts']} 次請求，含 1 次 429 重試），"
+      f"{report['lines']}，{report['seconds']}s")
+
+# 3. 再次執行：沒有過期分塊 → 不發出請求，數據版本不變
+print("\n3. 增量更新...")
+FakeOverpass.requests_seen.clear()
+again = download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE)
+assert again['fetched'] == 0 and again['fresh'] == 2 * len(tiles) and not FakeOverpass.requests_seen
+assert again['data_version'] == report['data_version'] and 'lines' not in again  # 不重新打包
+
+# 只有過期的分塊重新下載
+cache = TileCache(cache_dir)
+stale_key = TileCache.key('highways', tiles[-1][0])
+cache.manifest['tiles'][stale_key]['fetched_at'] -= 31 * 86400
+cache._write_manifest()
+refreshed = download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE)
+assert refreshed['fetched'] == 1 and FakeOverpass.requests_seen == [('highways', round(tiles[-1][1][0], 4), round(tiles[-1][1][1], 4))]
+assert refreshed['data_version'] != report['data_version']
+assert [ObstacleStore.open(store_dir).crosses('highways', *pair) for pair in pairs] == \
+    [reference.crosses('highways', *pair) for pair in pairs]
+# --force 全部重新下載
+FakeOverpass.requests_seen.clear()
+assert download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE, force=True)['fetched'] == 2 * len(tiles)
+print(f"   ✅ 第二次 0 個請求；過期 1 個分塊 → 只下載 {stale_key}")
+
+# 4. 重試用盡：不覆寫打包目錄，下次只補下載失敗的分塊
+print("\n4. 失敗...")
+version = ObstacleStore.open(store_dir).data_version
+cache = TileCache(cache_dir)
+for tile_id, bounds in tiles[:2]:
+    cache.manifest['tiles'][TileCache.key('rivers', tile_id)]['fetched_at'] = 0
+cache._write_manifest()
+FakeOverpass.fail_once = {('rivers', round(b[0], 4), round(b[1], 4)) for _, b in tiles[:2]}
+failed = download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE, retries=0)
+assert len(failed['failed']) == 2 and 'data_version' not in failed
+assert ObstacleStore.open(store_dir).data_version == version
+FakeOverpass.requests_seen.clear()
+recovered = download(BBOX, store_dir, cache_dir=cache_dir, tile_deg=TILE)
+assert recovered['fetched'] == 2 and not recovered['failed'] and len(FakeOverpass.requests_seen) == 2
+print("   ✅")
+
+server.shutdown()
+print("\n✅ 所有測試通過")
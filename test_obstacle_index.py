@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""測試合併 + 預備幾何索引（結果需與逐條 intersects 一致）"""
+
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+from shapely.strtree import STRtree
+
+from obstacle_index import PreparedObstacleIndex, group_lines
+from river_detection import ObstacleDetector
+from synthetic_orders import generate_orders, write_obstacle_files
+
+print("=" * 60)
+print("測試合併 + 預備幾何索引")
+print("=" * 60)
+
+rng = random.Random(9)
+
+
+def random_line(vertices, step):
+    lat, lon = rng.uniform(43.4, 44.1), rng.uniform(-80.0, -79.0)
+    coords = []
+    for _ in range(vertices):
+        lat += rng.uniform(-step, step)
+        lon += rng.uniform(-step, step)
+        coords.append((lon, lat))
+    return LineString(coords)
+
+
+# 大量短小溪 + 少數蜿蜒長河流
+lines = [random_line(rng.randint(2, 4), 0.01) for _ in range(20000)] + [random_line(2000, 0.002) for _ in range(60)]
+queries = []
+for _ in range(3000):
+    lat, lon = rng.uniform(43.4, 44.1), rng.uniform(-80.0, -79.0)
+    queries.append(LineString([(lon, lat), (lon + rng.uniform(-0.02, 0.02), lat + rng.uniform(-0.02, 0.02))]))
+# 端點剛好落在線的頂點上（接觸也算相交）
+queries += [LineString([lines[i].coords[0], (lines[i].coords[0][0] + 0.01, lines[i].coords[0][1] + 0.01)])
+            for i in range(0, 20000, 500)]
+
+# 1. STR 分組
+print("\n1. group_lines...")
+groups = group_lines(np.array(lines, dtype=object), 32)
+assert sorted(np.concatenate(groups).tolist()) == list(range(len(lines)))
+assert max(len(g) for g in groups) <= 32
+print(f"   ✅ {len(lines)} 條線 → {len(groups)} 個群組")
+
+# 2. 與逐條比對一致
+print("\n2. 結果比對...")
+tree = STRtree(lines)
+
+
+def loop_crosses(line):
+    for idx in tree.query(line):
+        if line.intersects(lines[idx]):
+            return True
+    return False
+
+
+index = PreparedObstacleIndex(lines)
+expected = [loop_crosses(q) for q in queries]
+assert [index.crosses(q) for q in queries] == expected
+assert all(expected[-40:])
+candidates_loop = sum(len(tree.query(q)) for q in queries)
+candidates_index = sum(len(index.candidates(q)) for q in queries)
+print(f"   ✅ {len(queries)} 條連線結果一致（{sum(expected)} 條相交）；"
+      f"每次候選 {candidates_loop / len(queries):.1f} 條線 → {candidates_index / len(queries):.1f} 個群組")
+
+# 3. 吞吐量
+print("\n3. 吞吐量...")
+start = time.perf_counter()
+for q in queries:
+    loop_crosses(q)
+loop_seconds = time.perf_counter() - start
+start = time.perf_counter()
+for q in queries:
+    index.crosses(q)
+index_seconds = time.perf_counter() - start
+print(f"   逐條: {loop_seconds / len(queries) * 1e6:.1f} µs/次，合併 + 預備幾何: {index_seconds / len(queries) * 1e6:.1f} µs/次"
+      f"（×{loop_seconds / index_seconds:.1f}）")
+print("   ✅")
+
+# 4. 裁切後的幾何（MultiLineString / 空幾何）
+print("\n4. 裁切幾何...")
+clipped = shapely.clip_by_rect(np.array(lines[:2000], dtype=object), -79.6, 43.6, -79.4, 43.8)
+clipped_index = PreparedObstacleIndex(clipped[~shapely.is_empty(clipped)])
+inside = [q for q in queries if shapely.contains(shapely.box(-79.6, 43.6, -79.4, 43.8), q)]
+merged = shapely.multilinestrings(lines[:2000])
+assert [clipped_index.crosses(q) for q in inside] == [q.intersects(merged) for q in inside]
+assert not PreparedObstacleIndex([]).crosses(queries[0])
+print(f"   ✅ {len(inside)} 條外框內連線一致")
+
+# 5. ObstacleDetector 預設使用此索引
+print("\n5. ObstacleDetector...")
+
+rivers_file, highways_file = write_obstacle_files(tempfile.mkdtemp(), 'toronto')
+detector = ObstacleDetector(rivers_file, highways_file)
+assert isinstance(detector.rivers_index, PreparedObstacleIndex)
+os.environ['OBSTACLE_PREPARED'] = '0'
+plain = ObstacleDetector(rivers_file, highways_file)
+os.environ.pop('OBSTACLE_PREPARED')
+assert plain.rivers_index is None
+orders = generate_orders('river', 400)
+pairs = [(a['lat'], a['lon'], b['lat'], b['lon']) for a, b in zip(orders, orders[1:])]
+crossings = 0
+for pair in pairs:
+    result = detector.check_obstacle_crossing(*pair, check_highways=True)
+    assert result == plain.check_obstacle_crossing(*pair, check_highways=True), pair
+    crossings += result['crosses_any']
+assert crossings > 0
+print(f"   ✅ 與 OBSTACLE_PREPARED=0 一致（{len(pairs)} 對，{crossings} 對穿越）")
+
+print("\n✅ 所有測試通過")
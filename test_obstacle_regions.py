@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""測試障礙面標記（穿越矩陣需與逐對精確檢測完全一致）"""
+
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString, Point
+
+from obstacle_regions import RegionMap
+from river_detection import ObstacleDetector
+from synthetic_orders import BOUNDING_BOXES, generate_orders, write_obstacle_files
+
+print("=" * 60)
+print("測試障礙面標記")
+print("=" * 60)
+
+rng = random.Random(11)
+
+
+def brute_force(lines, lats, lons):
+    """逐對精確檢測（LineString.intersects，含端點接觸）"""
+    merged = shapely.multilinestrings(lines) if len(lines) else None
+    n = len(lats)
+    matrix = np.zeros((n, n), dtype=bool)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if merged is not None:
+                matrix[i, j] = matrix[j, i] = LineString([(lons[i], lats[i]), (lons[j], lats[j])]).intersects(merged)
+    return matrix
+
+
+def exact_for(lines, lats, lons):
+    merged = shapely.multilinestrings(lines)
+    shapely.prepare(merged)
+    return lambda i, j: merged.intersects(LineString([(lons[i], lats[i]), (lons[j], lats[j])]))
+
+
+# 1. 貫穿外框的河流：兩岸為不同的面
+print("\n1. 貫穿外框的河流...")
+south, west, north, east = BOUNDING_BOXES['toronto']
+bounds = (west, south, east, north)
+rivers_file, highways_file = write_obstacle_files(tempfile.mkdtemp(), 'toronto')
+detector = ObstacleDetector(rivers_file, highways_file)
+river = shapely.clip_by_rect(np.array(detector.rivers, dtype=object), *bounds)
+regions = RegionMap(river, bounds)
+assert regions.face_count == 2
+orders = generate_orders('river', 200)
+lats = np.array([o['lat'] for o in orders])
+lons = np.array([o['lon'] for o in orders])
+labels, clearance = regions.classify(lats, lons)
+assert (labels >= 0).all() and len(set(labels.tolist())) == 2
+matrix, stats = regions.crossing_matrix(lats, lons, exact=exact_for(river, lats, lons))
+assert (matrix == brute_force(river, lats, lons)).all()
+assert stats['label'] > 0 and stats['label'] + stats['clearance'] + stats['exact'] == 200 * 199 // 2
+print(f"   ✅ {regions.face_count} 個面；{stats}")
+
+# 2. 斷頭河流（不形成面）：由淨空距離 / 精確檢測處理
+print("\n2. 斷頭河流...")
+dangling = [LineString([(-79.40, 43.60), (-79.38, 43.65), (-79.39, 43.70)])]
+regions = RegionMap(dangling, (-79.45, 43.55, -79.30, 43.75))
+assert regions.face_count == 1
+lats = np.array([rng.uniform(43.56, 43.74) for _ in range(150)])
+lons = np.array([rng.uniform(-79.44, -79.31) for _ in range(150)])
+matrix, stats = regions.crossing_matrix(lats, lons, exact=exact_for(dangling, lats, lons))
+assert (matrix == brute_force(dangling, lats, lons)).all()
+assert stats['label'] == 0 and stats['clearance'] > 0
+# 未提供精確檢測時保守地視為穿越
+conservative, _ = regions.crossing_matrix(lats, lons)
+assert (conservative | ~matrix).all()
+print(f"   ✅ {stats}")
+
+# 3. 封閉的環（湖 / 島）：環內外為不同的面；落在線上的點不標記
+print("\n3. 封閉環...")
+ring = [LineString(Point(-79.38, 43.65).buffer(0.02).exterior.coords)]  # Overpass 的封閉 way 同樣是 LineString
+regions = RegionMap(ring, (-79.45, 43.55, -79.30, 43.75))
+assert regions.face_count == 2
+labels, _ = regions.classify([43.65, 43.56, ring[0].coords[0][1]], [-79.38, -79.44, ring[0].coords[0][0]])
+assert labels[0] >= 0 and labels[1] >= 0 and labels[0] != labels[1] and labels[2] == -1
+assert RegionMap.decide(labels[0], 0.01, labels[1], 0.01, 1.0) is True
+print("   ✅")
+
+# 4. 密集障礙網：ObstacleView.crossing_matrix 與逐對檢測一致
+print("\n4. 密集障礙網 + ObstacleView...")
+
+
+def random_line(vertices, step):
+    lat, lon = rng.uniform(43.60, 43.75), rng.uniform(-79.50, -79.30)
+    coords = []
+    for _ in range(vertices):
+        lat += rng.uniform(-step, step)
+        lon += rng.uniform(-step, step)
+        coords.append((lon, lat))
+    return LineString(coords)
+
+
+dense = [random_line(rng.randint(2, 4), 0.01) for _ in range(600)] + [random_line(300, 0.002) for _ in range(5)]
+detector.rivers = dense
+detector.rivers_tree = shapely.STRtree(dense)
+detector.rivers_index = None
+points = [(rng.uniform(43.64, 43.70), rng.uniform(-79.45, -79.36)) for _ in range(150)]
+view = detector.view(points)
+start = time.perf_counter()
+matrix, stats = view.crossing_matrix(points, check_highways=True)
+matrix_seconds = time.perf_counter() - start
+start = time.perf_counter()
+expected = np.zeros_like(matrix)
+for i in range(len(points)):
+    for j in range(i + 1, len(points)):
+        result = detector.check_obstacle_crossing(*points[i], *points[j], check_highways=True)
+        expected[i, j] = expected[j, i] = result['crosses_any']
+pair_seconds = time.perf_counter() - start
+assert (matrix == expected).all()
+assert stats['rivers']['label'] > 0
+print(f"   ✅ {len(points)} 點（{matrix.sum() // 2} 對穿越）；{stats}")
+print(f"   穿越矩陣 {matrix_seconds * 1000:.0f} ms（含建立），逐對檢測 {pair_seconds * 1000:.0f} ms")
+
+# 5. 逐對查詢也使用面標記；OBSTACLE_REGIONS=0 時結果不變
+print("\n5. OBSTACLE_REGIONS...")
+pairs = [(*points[i], *points[j]) for i in range(40) for j in range(40, 80)]
+view = detector.view(points)
+results = [view.check_crossing_geometry(*pair) for pair in pairs]
+decided = view.stats()['region_decisions']['rivers']
+assert decided > 0 and view.stats()['faces']['rivers'] > 1
+os.environ['OBSTACLE_REGIONS'] = '0'
+plain = detector.view(points)
+assert [plain.check_crossing_geometry(*pair) for pair in pairs] == results
+assert plain.stats()['region_decisions']['rivers'] == 0
+os.environ.pop('OBSTACLE_REGIONS')
+print(f"   ✅ {decided}/{len(pairs)} 對以面 / 淨空距離判斷")
+
+print("\n✅ 所有測試通過")
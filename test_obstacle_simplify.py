@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""測試障礙線段簡化（合併、頂點數、容差內不漏判跨越、吞吐量）"""
+
+import json
+import math
+import os
+import random
+import tempfile
+
+import shapely
+from shapely.geometry import LineString, Point
+
+import obstacle_simplify
+from obstacle_simplify import crossing_throughput, main, random_queries, simplify_lines
+from obstacle_store import ObstacleStore, read_overpass_lines
+from river_detection import ObstacleDetector, data_files_version
+
+print("=" * 60)
+print("測試障礙線段簡化")
+print("=" * 60)
+
+rng = random.Random(3)
+TOLERANCE_DEG = 5 / 111320.0
+
+
+def meandering_river(lat, lon, vertices=3000):
+    """約每 3 m 一個頂點的蜿蜒河流（OSM 常見的密集頂點）"""
+    coords = []
+    for i in range(vertices):
+        x = lon + i * 0.00003
+        y = lat + 0.004 * math.sin(i / 150) + rng.uniform(-0.000008, 0.000008)
+        coords.append((round(x, 7), round(y, 7)))
+    return coords
+
+
+# 每條河流拆成多段 way（首尾相接，與 Overpass 數據相同）
+rivers = [meandering_river(43.6 + k * 0.01, -79.5 + rng.uniform(0, 0.01)) for k in range(20)]
+ways = [river[i:i + 50] for river in rivers for i in range(0, len(river) - 1, 49)]
+lines = [LineString(way) for way in ways]
+
+# 1. 合併 + 簡化
+print("\n1. simplify_lines...")
+simplified, report = simplify_lines(lines, 5)
+assert report['merged_lines'] == len(rivers), report
+(vertices_before, vertices_after) = report['vertices']
+assert vertices_after < vertices_before / 3, report
+assert all(len(line.coords) <= 64 for line in simplified)
+# 簡化後每個原始頂點都在容差內
+assert shapely.distance(shapely.points(shapely.get_coordinates(lines)),
+                        shapely.multilinestrings(simplified)).max() <= TOLERANCE_DEG * 1.0001
+print(f"   ✅ {report['lines'][0]} 段 way → 合併 {report['merged_lines']} 條 → {report['lines'][1]} 段；"
+      f"頂點 {vertices_before} → {vertices_after}")
+
+# 2. 容差內的保證與吞吐量
+print("\n2. 穿越檢測...")
+queries = random_queries(lines, 3000, seed=1, max_length=0.01)
+throughput = crossing_throughput(lines, simplified, queries)
+merged_original = shapely.multilinestrings(lines)
+merged_simplified = shapely.multilinestrings(simplified)
+for lat1, lon1, lat2, lon2 in queries:
+    segment = LineString([(lon1, lat1), (lon2, lat2)])
+    if segment.intersects(merged_original) == segment.intersects(merged_simplified):
+        continue
+    # 結果不同時：至少一端在容差內，或為進出同一彎曲的偶數次穿越
+    near = min(Point(lon1, lat1).distance(merged_simplified), Point(lon2, lat2).distance(merged_simplified))
+    crossings = len(shapely.get_parts(segment.intersection(merged_original)))
+    assert near <= TOLERANCE_DEG or crossings % 2 == 0, (lat1, lon1, lat2, lon2)
+assert throughput['speedup'] > 1, throughput
+print(f"   ✅ 穿越 {throughput['crossings'][0]} → {throughput['crossings'][1]}"
+      f"（lost {throughput['lost']}，皆在容差內或偶數次穿越）；"
+      f"吞吐量 {throughput['checks_per_second'][0]} → {throughput['checks_per_second'][1]} 次/秒（×{throughput['speedup']}）")
+
+# 3. ObstacleDetector 載入時簡化
+print("\n3. ObstacleDetector...")
+tmp_dir = tempfile.mkdtemp()
+rivers_file = os.path.join(tmp_dir, 'rivers.json')
+highways_file = os.path.join(tmp_dir, 'highways.json')
+elements, node_id = [], 1
+for way_id, way in enumerate(ways, 1):
+    node_ids = []
+    for lon, lat in way:
+        elements.append({'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon})
+        node_ids.append(node_id)
+        node_id += 1
+    elements.append({'type': 'way', 'id': way_id, 'nodes': node_ids})
+with open(rivers_file, 'w', encoding='utf-8') as f:
+    json.dump({'elements': elements}, f)
+with open(highways_file, 'w', encoding='utf-8') as f:
+    json.dump({'elements': []}, f)
+
+# 容差明確傳入（不依賴匯入時的環境變數，與其他測試一起執行時結果相同）
+detector = ObstacleDetector(rivers_file, highways_file, simplify_m=5)
+assert detector.data_version == data_files_version(rivers_file, highways_file) + '-s5'  # 容差變更時快取失效
+assert ObstacleDetector(rivers_file, highways_file, simplify_m=0).data_version == \
+    data_files_version(rivers_file, highways_file)
+# 未指定時使用 OBSTACLE_SIMPLIFY_M（建立時讀取）
+original_tolerance = obstacle_simplify.OBSTACLE_SIMPLIFY_M
+obstacle_simplify.OBSTACLE_SIMPLIFY_M = 5.0
+try:
+    assert ObstacleDetector(rivers_file, highways_file).data_version == detector.data_version
+finally:
+    obstacle_simplify.OBSTACLE_SIMPLIFY_M = original_tolerance
+assert detector.simplify_reports['rivers']['vertices'] == report['vertices']
+assert detector.obstacle_counts()['rivers'] == len(simplified)
+print(f"   ✅ data_version={detector.data_version}")
+
+# 4. 共用記憶體打包同樣簡化，結果一致
+print("\n4. ObstacleStore...")
+store_dir = os.path.join(tmp_dir, 'store')
+store = ObstacleStore.build(store_dir, rivers_file, highways_file, simplify_m=5)
+assert store.data_version == detector.data_version
+assert ObstacleStore.open_or_build(store_dir, rivers_file, highways_file, simplify_m=5).directory == store_dir
+shared = ObstacleDetector(store=store)
+for pair in queries[:500]:
+    assert shared.check_crossing_geometry(*pair) == detector.check_crossing_geometry(*pair), pair
+assert len(read_overpass_lines(rivers_file)) == len(ways)
+print("   ✅ 與 STRtree 模式一致")
+
+# 5. 報告 CLI
+print("\n5. python obstacle_simplify.py...")
+main([rivers_file, '--tolerance', '5', '--queries', '200'])
+print("   ✅")
+
+print("\n✅ 所有測試通過")
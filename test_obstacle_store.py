@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""測試共用記憶體障礙數據（結果需與 shapely STRtree 一致）"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from obstacle_store import ObstacleStore
+from river_detection import ObstacleDetector
+from synthetic_orders import BOUNDING_BOXES, generate_orders, write_obstacle_files
+
+print("=" * 60)
+print("測試共用記憶體障礙數據")
+print("=" * 60)
+
+tmp_dir = tempfile.mkdtemp()
+rivers_file, highways_file = write_obstacle_files(tmp_dir, 'toronto')
+store_dir = os.path.join(tmp_dir, 'store')
+
+# 子進程：只附加，不重新載入
+CHILD_SCRIPT = """
+import json, sys
+from obstacle_store import ObstacleStore
+store = ObstacleStore.open(sys.argv[1])
+print(json.dumps([store.crosses('rivers', *pair) for pair in json.load(sys.stdin)]))
+"""
+
+
+# 1. 打包並附加
+print("\n1. build / open...")
+store = ObstacleStore.build(store_dir, rivers_file, highways_file)
+packed = store.kinds['rivers']
+assert isinstance(packed.coords.base, np.memmap) and not packed.coords.flags.owndata, "附加時應為記憶體映射"
+assert store.line_count('rivers') == 10 and store.line_count('highways') == 20
+print(f"   ✅ 網格 {packed.grid['nx']}×{packed.grid['ny']}")
+
+# 2. 與 shapely 結果一致
+print("\n2. 與 STRtree 檢測比對...")
+geometry = ObstacleDetector(rivers_file, highways_file)
+shared = ObstacleDetector(store=store)
+assert shared.data_version == geometry.data_version
+assert shared.obstacle_counts() == geometry.obstacle_counts()
+
+rng = random.Random(7)
+south, west, north, east = BOUNDING_BOXES['toronto']
+orders = generate_orders('river', 400)
+pairs = [(a['lat'], a['lon'], b['lat'], b['lon']) for a, b in zip(orders, orders[1:])]
+pairs += [(rng.uniform(south, north), rng.uniform(west, east), rng.uniform(south, north), rng.uniform(west, east))
+          for _ in range(400)]
+crossings = 0
+for pair in pairs:
+    expected = geometry.check_obstacle_crossing(*pair, check_highways=True)
+    assert shared.check_obstacle_crossing(*pair, check_highways=True) == expected, pair
+    crossings += expected['crosses_any']
+# 端點剛好落在河流頂點上（接觸也算相交）
+lon, lat = packed.coords[3]
+assert shared.check_crossing_geometry(lat, lon, lat + 0.01, lon + 0.01)
+assert geometry.check_crossing_geometry(lat, lon, lat + 0.01, lon + 0.01)
+print(f"   ✅ {len(pairs)} 對連線結果一致（{crossings} 對穿越障礙）")
+
+# 3. 其他進程直接附加
+print("\n3. 子進程附加...")
+child = subprocess.run([sys.executable, '-c', CHILD_SCRIPT, store_dir], input=json.dumps(pairs[:50]),
+                       capture_output=True, text=True, timeout=120, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+child_results = json.loads(child.stdout.strip().splitlines()[-1])
+assert child_results == [geometry.check_crossing_geometry(*pair) for pair in pairs[:50]]
+print("   ✅ 子進程結果一致")
+
+# 4. 數據檔更新時重新打包
+print("\n4. open_or_build...")
+assert ObstacleStore.open_or_build(store_dir, rivers_file, highways_file).data_version == store.data_version
+time.sleep(0.01)
+os.utime(rivers_file)
+rebuilt = ObstacleStore.open_or_build(store_dir, rivers_file, highways_file)
+assert rebuilt.data_version != store.data_version
+assert store.crosses('rivers', *pairs[0]) == rebuilt.crosses('rivers', *pairs[0])  # 舊映射仍可用
+print("   ✅ 版本不符時重新打包")
+
+print("\n✅ 所有測試通過")
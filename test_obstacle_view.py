@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""測試單次規劃的障礙子集（結果需與完整索引一致，候選數大幅下降）"""
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from obstacle_store import ObstacleStore
+from river_detection import ObstacleDetector, ObstacleView
+from route_pipeline import StageCache, route_params, run_route_pipeline
+
+print("=" * 60)
+print("測試障礙子集 ObstacleView")
+print("=" * 60)
+
+# 大範圍（約 110 × 80 km）的密集小溪 / 運河 + 蜿蜒的長河流，訂單只在其中約 6 km 見方的區域
+REGION = (43.40, -80.00, 44.10, -79.00)
+ORDER_BOX = (43.65, -79.45, 43.70, -79.38)
+rng = random.Random(5)
+
+
+def random_ways(count, max_len, vertices=(1, 3)):
+    south, west, north, east = REGION
+    ways = []
+    for _ in range(count):
+        lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+        way = [(lat, lon)]
+        for _ in range(rng.randint(*vertices)):
+            lat += rng.uniform(-max_len, max_len)
+            lon += rng.uniform(-max_len, max_len)
+            way.append((lat, lon))
+        ways.append(way)
+    return ways
+
+
+def write_overpass(filename, ways):
+    elements = []
+    node_id = 1
+    for way_id, way in enumerate(ways, 1):
+        node_ids = []
+        for lat, lon in way:
+            elements.append({'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon})
+            node_ids.append(node_id)
+            node_id += 1
+        elements.append({'type': 'way', 'id': way_id, 'nodes': node_ids})
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({'elements': elements}, f)
+
+
+tmp_dir = tempfile.mkdtemp()
+rivers_file = os.path.join(tmp_dir, 'rivers.json')
+highways_file = os.path.join(tmp_dir, 'highways.json')
+write_overpass(rivers_file, random_ways(20000, 0.01) + random_ways(300, 0.003, vertices=(1500, 2000)))
+write_overpass(highways_file, random_ways(3000, 0.05))
+
+detector = ObstacleDetector(rivers_file, highways_file)
+south, west, north, east = ORDER_BOX
+orders = [{'tracking_number': f'V{i:04d}', 'lat': rng.uniform(south, north), 'lon': rng.uniform(west, east)}
+          for i in range(300)]
+points = [(o['lat'], o['lon']) for o in orders]
+pairs = [(a['lat'], a['lon'], b['lat'], b['lon']) for a in orders[:60] for b in orders[60:90]]
+
+# 1. 與完整索引結果一致
+print("\n1. 與完整索引比對...")
+view = detector.view(points)
+assert isinstance(view, ObstacleView) and view.data_version == detector.data_version
+for pair in pairs:
+    assert view.check_obstacle_crossing(*pair, check_highways=True) == \
+        detector.check_obstacle_crossing(*pair, check_highways=True), pair
+counts = view.obstacle_counts()
+assert 0 < counts['rivers'] < detector.obstacle_counts()['rivers'] / 20
+print(f"   ✅ {len(pairs)} 對連線結果一致；子集 {counts} / 完整 {detector.obstacle_counts()}")
+
+# 2. 候選數與查詢時間
+print("\n2. 候選數與查詢時間...")
+from shapely.geometry import LineString
+
+full_candidates = sum(len(detector.rivers_tree.query(LineString([(p[1], p[0]), (p[3], p[2])]))) for p in pairs)
+stats = view.stats()
+assert stats['candidates']['rivers'] <= full_candidates and stats['fallbacks'] == 0
+before, after = stats['vertices']['rivers']
+assert after < before / 3  # 長河流裁切後只剩外框內的頂點
+start = time.perf_counter()
+for pair in pairs:
+    detector.check_crossing_geometry(*pair)
+full_seconds = time.perf_counter() - start
+start = time.perf_counter()
+for pair in pairs:
+    view.check_crossing_geometry(*pair)
+view_seconds = time.perf_counter() - start
+print(f"   河流候選（{len(pairs)} 次查詢）: 子集 {stats['candidates']['rivers']} / 完整索引 {full_candidates}")
+print(f"   單次查詢: 子集 {view_seconds / len(pairs) * 1e6:.1f} µs / 完整索引 {full_seconds / len(pairs) * 1e6:.1f} µs"
+      f"（建立子集 {stats['build_seconds'] * 1000:.1f} ms，頂點 {before} → {after}）")
+print("   ✅")
+
+# 3. 外框以外的查詢改查完整索引
+print("\n3. 外框以外...")
+far = (43.45, -79.95, 44.05, -79.05)
+assert view.check_crossing_geometry(*far) == detector.check_crossing_geometry(*far)
+assert view.stats()['fallbacks'] == 1
+print("   ✅ fallback")
+
+# 4. 共用記憶體模式同樣可建立子集
+print("\n4. OBSTACLE_STORE 模式...")
+shared = ObstacleDetector(store=ObstacleStore.build(os.path.join(tmp_dir, 'store'), rivers_file, highways_file))
+shared_view = shared.view(points)
+assert shared_view.obstacle_counts() == {'rivers': 0, 'highways': 0}  # 第一次查詢才建立
+for pair in pairs[:300]:
+    assert shared_view.check_obstacle_crossing(*pair, check_highways=True) == \
+        detector.check_obstacle_crossing(*pair, check_highways=True), pair
+print(f"   ✅ 結果一致（子集 {shared_view.obstacle_counts()}）")
+
+# 5. 路徑規劃結果不變
+print("\n5. run_route_pipeline...")
+ObstacleDetector._instance = detector
+params = route_params({'start': {'lat': 43.66, 'lon': -79.44}, 'order_group': 'VIEW', 'verification': 'geometry',
+                       'check_highways': True, 'max_group_size': 20})
+os.environ['OBSTACLE_VIEW'] = '0'
+start = time.perf_counter()
+expected = run_route_pipeline(orders, params, stage_cache=StageCache())
+full_seconds = time.perf_counter() - start
+os.environ['OBSTACLE_VIEW'] = '1'
+start = time.perf_counter()
+result = run_route_pipeline(orders, params, stage_cache=StageCache())
+view_seconds = time.perf_counter() - start
+assert result['orders'] == expected['orders']
+assert result['crossings'] == expected['crossings']
+print(f"   ✅ 結果一致（{len(result['crossings'])} 處穿越；{view_seconds:.2f}s，完整索引 {full_seconds:.2f}s）")
+
+print("\n✅ 所有測試通過")
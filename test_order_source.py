@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""測試訂單快照與離線資料來源（不需正式資料庫）"""
+
+import os
+import tempfile
+
+from order_source import connect_sqlite, import_snapshot, load_snapshot, save_snapshot
+
+print("=" * 60)
+print("測試訂單快照 / 離線資料來源")
+print("=" * 60)
+
+tmp_dir = tempfile.mkdtemp()
+GROUP = 'GroupOFFLINE01'
+rows = [
+    # 資料庫整數格式（× 10^10）
+    {'tracking_number': 'T003', 'latitude': 436512345678, 'longitude': -793812345678, 'delivery_sequence': 217},
+    {'tracking_number': 'T001', 'latitude': 43.6400, 'longitude': -79.4000, 'delivery_sequence': 215},
+    {'tracking_number': 'T002', 'latitude': 43.6500, 'longitude': -79.3900, 'delivery_sequence': 216},
+    {'tracking_number': 'T004', 'latitude': None, 'longitude': None, 'delivery_sequence': None},
+]
+
+# 1. .npz 快照往返
+print("\n1. 匯出 / 讀取 .npz 快照...")
+path = save_snapshot(os.path.join(tmp_dir, 'snapshots', f'{GROUP}.npz'), GROUP, rows)
+order_group, loaded = load_snapshot(path)
+assert order_group == GROUP
+assert loaded[3] == {'tracking_number': 'T004', 'latitude': None, 'longitude': None, 'delivery_sequence': None}
+assert loaded[0]['latitude'] == 436512345678 and loaded[0]['delivery_sequence'] == 217
+print(f"   ✅ {len(loaded)} 筆（含 NULL 座標）保持原貌")
+
+# 2. 匯入 SQLite 後可用 pymysql 風格查詢
+print("\n2. 匯入 SQLite...")
+db_path = os.path.join(tmp_dir, 'orders.db')
+conn = connect_sqlite(db_path)
+assert import_snapshot(conn, path) == 4
+assert import_snapshot(conn, path) == 4  # 重複匯入會覆蓋，不會重複
+conn.commit()
+conn.close()
+
+os.environ['ORDER_SOURCE'] = f'sqlite:{db_path}'
+import app  # noqa: E402  (ORDER_SOURCE 需在匯入前設定)
+
+valid = app.fetch_valid_orders(GROUP)
+assert [o['tracking_number'] for o in valid] == ['T001', 'T002', 'T003']
+assert abs(valid[2]['lat'] - 43.6512345678) < 1e-9
+assert app.fetch_valid_orders('NOPE') is None
+print(f"   ✅ fetch_valid_orders 返回 {len(valid)} 筆有效訂單")
+
+# 3. Flask 端點
+print("\n3. 端點使用離線資料來源...")
+client = app.app.test_client()
+response = client.get(f'/api/orders-sequence?order_group={GROUP}')
+data = response.get_json()
+assert response.status_code == 200, data
+assert [o['delivery_sequence'] for o in data['orders']] == [1, 2, 3]
+response = client.post('/api/route', json={'start': {'lat': 43.64, 'lon': -79.41}, 'order_group': GROUP})
+assert response.status_code == 200 and response.get_json()['total_orders'] == 3
+assert client.get('/api/test-db').get_json()['success']
+print("   ✅ /api/orders-sequence、/api/route、/api/test-db")
+
+# 4. snapshot: 直接使用快照目錄
+print("\n4. ORDER_SOURCE=snapshot:<目錄>...")
+os.environ['ORDER_SOURCE'] = f"snapshot:{os.path.join(tmp_dir, 'snapshots')}"
+assert len(app.fetch_valid_orders(GROUP)) == 3
+print("   ✅ 快照載入記憶體資料庫")
+
+print("\n✅ 所有測試通過")
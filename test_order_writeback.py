@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""測試規劃結果寫回 ordersjb（本機 SQLite 資料來源，不需正式資料庫）"""
+
+import os
+import sqlite3
+import tempfile
+
+from order_source import connect_sqlite, import_snapshot, save_snapshot
+from synthetic_orders import generate_orders, start_point
+
+GROUP = 'GroupWRITEBACK01'
+ORDERS = generate_orders('clustered', 2500, seed=21)
+
+print("=" * 60)
+print("測試規劃結果寫回")
+print("=" * 60)
+
+tmp_dir = tempfile.mkdtemp()
+db_path = os.path.join(tmp_dir, 'orders.db')
+
+# 舊版本建立的 SQLite 檔（沒有 delivery_group 欄位）
+legacy = sqlite3.connect(db_path)
+legacy.execute("CREATE TABLE ordersjb (order_group TEXT NOT NULL, tracking_number TEXT NOT NULL, "
+               "latitude REAL, longitude REAL, delivery_sequence INTEGER)")
+legacy.close()
+
+conn = connect_sqlite(db_path)
+rows = [{'tracking_number': o['tracking_number'], 'latitude': o['lat'], 'longitude': o['lon'],
+         'delivery_sequence': None} for o in ORDERS]
+import_snapshot(conn, save_snapshot(os.path.join(tmp_dir, f'{GROUP}.npz'), GROUP, rows))
+# 沒有座標的訂單不會出現在規劃結果中（舊的順序會被清除）
+conn.cursor().execute("INSERT INTO ordersjb (order_group, tracking_number, delivery_sequence) VALUES (%s, %s, %s)",
+                      (GROUP, 'NOCOORD', 99))
+conn.commit()
+conn.close()
+
+os.environ['ORDER_SOURCE'] = f'sqlite:{db_path}'
+os.environ['ADMIN_TOKEN'] = 'test-admin-token'
+import app  # ORDER_SOURCE 需在匯入前設定
+from order_writeback import WriteBackError, plan_rows, write_back
+
+
+def stored_sequence():
+    conn = connect_sqlite(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT tracking_number, delivery_sequence, delivery_group FROM ordersjb "
+                   "WHERE order_group = %s", (GROUP,))
+    result = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    conn.close()
+    return result
+
+
+client = app.app.test_client()
+start = start_point()
+ADMIN = {'X-Admin-Token': 'test-admin-token'}
+
+# 1. 舊的 SQLite 檔自動補上 delivery_group 欄位
+print("\n1. SQLite 欄位遷移...")
+assert all(group is None for _, group in stored_sequence().values())
+print("   ✅ delivery_group")
+
+# 2. 規劃後寫回
+print("\n2. POST /api/route/<plan_id>/write-back...")
+plan = client.post('/api/route', json={'start': start, 'order_group': GROUP,
+                                       'end_point_mode': 'manual', 'end_point': start}).get_json()
+response = client.post(f"/api/route/{plan['plan_id']}/write-back", json={'order_group': GROUP, 'clear_missing': True},
+                       headers=ADMIN)
+summary = response.get_json()
+assert response.status_code == 200, summary
+assert summary['updated'] == len(ORDERS) and summary['cleared'] == 1
+assert summary['method'] == 'executemany' and summary['chunks'] == 3
+stored = stored_sequence()
+for order in plan['orders']:
+    if order['tracking_number'] != 'ENDPOINT':
+        assert stored[order['tracking_number']] == (order['sequence'], order['group'])
+assert stored['NOCOORD'] == (None, None)
+print(f"   ✅ {summary['updated']} 筆（{summary['chunks']} 批，{summary['elapsed']:.3f}s），舊順序清除 1 筆")
+
+# 3. /api/orders-sequence 讀回相同順序
+print("\n3. /api/orders-sequence...")
+data = client.get(f'/api/orders-sequence?order_group={GROUP}').get_json()
+expected = [o['tracking_number'] for o in plan['orders'] if o['tracking_number'] != 'ENDPOINT']
+assert [o['tracking_number'] for o in data['orders']] == expected
+print("   ✅ 順序一致")
+
+# 4. 訂單已變動 → 409，交易回滾
+print("\n4. 訂單已變動...")
+conn = connect_sqlite(db_path)
+try:
+    write_back(conn, GROUP, [('GHOST', 1, 'A')] + plan_rows(plan['orders'])[:5], chunk_size=2)
+    raise AssertionError('應拋出 WriteBackError')
+except WriteBackError as e:
+    assert e.status == 409
+conn.close()
+assert stored_sequence() == stored
+response = client.post(f"/api/route/{plan['plan_id']}/write-back", json={'order_group': 'GroupOTHER'}, headers=ADMIN)
+assert response.status_code == 409
+print("   ✅ 409，資料未變動")
+
+# 5. 寫入途中失敗整批回滾
+print("\n5. 回滾...")
+reversed_rows = [(t, len(expected) + 1 - seq, 'Z') for t, seq, _ in plan_rows(plan['orders'])]
+conn = connect_sqlite(db_path)
+try:
+    write_back(conn, GROUP, reversed_rows, group_column='no_such_column')
+    raise AssertionError('應失敗')
+except sqlite3.OperationalError:
+    pass
+conn.close()
+assert stored_sequence() == stored
+conn = connect_sqlite(db_path)
+summary = write_back(conn, GROUP, reversed_rows, group_column='', clear_missing=False)
+conn.close()
+assert summary['cleared'] == 0
+assert all(stored_sequence()[t] == (seq, stored[t][1]) for t, seq, _ in reversed_rows)  # 群組標籤未寫入
+print("   ✅ 清除舊順序後失敗也會回滾；group_column='' 只寫入 delivery_sequence")
+
+# 6. 驗證
+print("\n6. 驗證...")
+assert client.post(f"/api/route/{plan['plan_id']}/write-back", json={}, headers=ADMIN).status_code == 400
+assert client.post('/api/route/not-a-plan/write-back', json={'order_group': GROUP}, headers=ADMIN).status_code == 400
+assert client.post(f"/api/route/{'0' * 32}/write-back", json={'order_group': GROUP}, headers=ADMIN).status_code == 404
+os.environ['ORDER_SOURCE'] = 'mysql'
+os.environ.pop('DB_WRITE_USER', None)
+response = client.post(f"/api/route/{plan['plan_id']}/write-back", json={'order_group': GROUP}, headers=ADMIN)
+assert response.status_code == 503  # 正式資料庫未設定寫入帳號
+os.environ['ORDER_SOURCE'] = f'sqlite:{db_path}'
+# 寫回會修改正式資料：未附或附錯 X-Admin-Token → 403，資料未變動
+before = stored_sequence()
+for headers in ({}, {'X-Admin-Token': 'wrong'}):
+    response = client.post(f"/api/route/{plan['plan_id']}/write-back", json={'order_group': GROUP}, headers=headers)
+    assert response.status_code == 403
+assert stored_sequence() == before
+print("   ✅ 400 / 404 / 503；非管理員 403")
+
+# 截斷的規劃（max_orders）、其他端點的規劃 → 409；預設不清除規劃外訂單的順序
+before = stored_sequence()
+truncated = client.post('/api/route', json={'start': start, 'order_group': GROUP, 'max_orders': 100}).get_json()
+assert truncated['total_orders'] == 100
+response = client.post(f"/api/route/{truncated['plan_id']}/write-back", json={'order_group': GROUP}, headers=ADMIN)
+assert response.status_code == 409 and '100 / 2500' in response.get_json()['error']
+global_id = '1' * 32
+app.plan_cache.put(global_id, GROUP, app.dumps_json({
+    'success': True, 'optimization_method': 'ortools',
+    'orders': [{'tracking_number': o['tracking_number'], 'sequence': k, 'group': 'Global'}
+               for k, o in enumerate(ORDERS, 1)],
+}).decode('utf-8'))
+response = client.post(f"/api/route/{global_id}/write-back", json={'order_group': GROUP}, headers=ADMIN)
+assert response.status_code == 409
+assert stored_sequence() == before
+conn = connect_sqlite(db_path)
+conn.cursor().execute("UPDATE ordersjb SET delivery_sequence = 99 WHERE tracking_number = 'NOCOORD'")
+conn.commit()
+conn.close()
+response = client.post(f"/api/route/{plan['plan_id']}/write-back", json={'order_group': GROUP}, headers=ADMIN)
+assert response.status_code == 200 and response.get_json()['cleared'] == 0
+assert stored_sequence()['NOCOORD'] == (99, None)
+print("   ✅ 截斷 / 全局規劃 409，資料未變動；預設保留規劃外訂單的順序")
+
+# 7. MySQL 臨時表路徑（記錄語句的假連線）：交易中不得有會隱含提交的 DDL，
+#    臨時表寫入完成後才清除舊順序，任何一步失敗皆回滾
+print("\n7. MySQL 臨時表路徑...")
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        statement = ' '.join(query.split())
+        self.conn.log.append(statement)
+        if self.conn.fail_on and statement.startswith(self.conn.fail_on):
+            raise RuntimeError(f'模擬失敗: {self.conn.fail_on}')
+
+    def executemany(self, query, params):
+        self.conn.log.append(('executemany', ' '.join(query.split()), len(params)))
+
+    def fetchall(self):
+        return [(tracking,) for tracking in self.conn.existing]
+
+    def close(self):
+        pass
+
+
+class FakeMySQLConnection:
+    def __init__(self, existing, fail_on=None):
+        self.existing = existing
+        self.fail_on = fail_on
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append('COMMIT')
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+
+
+def statement_kind(entry):
+    if isinstance(entry, tuple):
+        return 'INSERT tmp'
+    for prefix, kind in (('SELECT', 'SELECT'), ('DROP TEMPORARY TABLE', 'DROP tmp'),
+                         ('CREATE TEMPORARY TABLE', 'CREATE tmp'), ('UPDATE ordersjb SET', 'CLEAR'),
+                         ('UPDATE ordersjb o JOIN', 'UPDATE JOIN'), ('COMMIT', 'COMMIT'), ('ROLLBACK', 'ROLLBACK')):
+        if entry.startswith(prefix):
+            return kind
+    raise AssertionError(f'未預期的語句: {entry}')
+
+
+rows_7 = plan_rows(plan['orders'])
+existing = [t for t, _, _ in rows_7] + ['NOCOORD']
+fake = FakeMySQLConnection(existing)
+summary = write_back(fake, GROUP, rows_7, clear_missing=True, chunk_size=1000)
+assert summary['method'] == 'temp_table_join' and summary['chunks'] == 3 and summary['cleared'] == 1
+kinds = [statement_kind(entry) for entry in fake.log]
+assert kinds == ['SELECT', 'DROP tmp', 'CREATE tmp', 'INSERT tmp', 'INSERT tmp', 'INSERT tmp',
+                 'CLEAR', 'UPDATE JOIN', 'DROP tmp', 'COMMIT'], kinds
+create = next(entry for entry in fake.log if statement_kind(entry) == 'CREATE tmp')
+assert 'PRIMARY KEY (tracking_number)' in create and 'delivery_group' in create
+assert not any(isinstance(entry, str) and entry.startswith(('ALTER', 'CREATE TABLE', 'TRUNCATE')) for entry in fake.log)
+assert sum(entry[2] for entry in fake.log if isinstance(entry, tuple)) == len(rows_7)
+
+# 不清除舊順序、不寫群組標籤
+fake = FakeMySQLConnection(existing)
+write_back(fake, GROUP, rows_7, group_column='', clear_missing=False, chunk_size=5000)
+assert [statement_kind(entry) for entry in fake.log] == ['SELECT', 'DROP tmp', 'CREATE tmp', 'INSERT tmp',
+                                                         'UPDATE JOIN', 'DROP tmp', 'COMMIT']
+assert 'delivery_group' not in ' '.join(entry for entry in fake.log if isinstance(entry, str))
+
+# 清除舊順序之後失敗：回滾（清除尚未提交），臨時表仍會刪除
+for fail_on in ('UPDATE ordersjb o JOIN', 'CREATE TEMPORARY TABLE'):
+    fake = FakeMySQLConnection(existing, fail_on=fail_on)
+    try:
+        write_back(fake, GROUP, rows_7, clear_missing=True)
+        raise AssertionError('應失敗')
+    except RuntimeError:
+        pass
+    kinds = [statement_kind(entry) for entry in fake.log]
+    assert kinds[-1] == 'ROLLBACK' and 'COMMIT' not in kinds, kinds
+    if fail_on.startswith('UPDATE'):
+        assert kinds[-3:] == ['UPDATE JOIN', 'DROP tmp', 'ROLLBACK']
+print("   ✅ DROP/CREATE TEMPORARY → INSERT ×3 → 清除 → UPDATE JOIN → DROP → COMMIT；失敗時 ROLLBACK")
+
+print("\n✅ 所有測試通過")
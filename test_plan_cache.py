@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""測試規劃結果快取（記憶體 LRU + 磁碟共用存儲）"""
+
+import os
+import tempfile
+from plan_cache import PlanCache, order_snapshot_version
+
+print("=" * 60)
+print("測試規劃結果快取")
+print("=" * 60)
+
+orders = [
+    {'tracking_number': 'TEST001', 'lat': 43.6532, 'lon': -79.3832},
+    {'tracking_number': 'TEST002', 'lat': 43.6545, 'lon': -79.3850},
+]
+params = {'start': {'lat': 43.65, 'lon': -79.38}, 'cluster_radius': 1, 'max_group_size': 30}
+
+# 1. 鍵：參數標準化、訂單變動即失效
+print("\n1. 快取鍵...")
+snapshot = order_snapshot_version(orders)
+key = PlanCache.make_key('route', 'G1', snapshot, params)
+assert key == PlanCache.make_key('route', 'G1', snapshot, dict(params, cluster_radius=1.0))
+assert key != PlanCache.make_key('route', 'G1', snapshot, dict(params, cluster_radius=1.5))
+moved = [dict(orders[0], lat=43.66), orders[1]]
+assert key != PlanCache.make_key('route', 'G1', order_snapshot_version(moved), params)
+assert key != PlanCache.make_key('route', 'G1', snapshot, params, obstacle_version='v2')
+print("   ✅ 參數順序 / 數值型別不影響鍵，訂單與障礙數據變動會改變鍵")
+
+# 2. 記憶體 LRU 淘汰
+print("\n2. 記憶體 LRU...")
+cache = PlanCache(max_entries=2)
+cache.put('a', 'G1', '{"a":1}')
+cache.put('b', 'G1', '{"b":1}')
+cache.get('a')
+cache.put('c', 'G2', '{"c":1}')
+assert cache.get('b') is None and cache.get('a') == '{"a":1}'
+print("   ✅ 超過上限時淘汰最久未使用的結果")
+
+# 3. 磁碟存儲：另一個實例（模擬另一個 worker）可直接讀取
+print("\n3. 磁碟共用存儲...")
+with tempfile.TemporaryDirectory() as store_dir:
+    writer = PlanCache(store_dir=store_dir)
+    writer.put(key, 'G1', '{"success":true}')
+    reader = PlanCache(store_dir=store_dir)
+    assert reader.get(key, 'G1') == '{"success":true}'
+    assert reader.get(key) == '{"success":true}'
+
+    # 4. 明確失效
+    print("\n4. 明確失效...")
+    assert writer.invalidate('G1') >= 1
+    assert PlanCache(store_dir=store_dir).get(key, 'G1') is None
+    assert writer.get(key, 'G1') is None
+    print("   ✅ invalidate 同時清除記憶體與磁碟")
+
+    # 5. 同目錄下的背景工作狀態（jobs/）不計入、也不會被快取淘汰
+    print("\n5. 共用目錄的其他子目錄...")
+    os.makedirs(os.path.join(store_dir, 'jobs'))
+    job_file = os.path.join(store_dir, 'jobs', f"{key}.json")
+    with open(job_file, 'w') as f:
+        f.write('{}')
+    small = PlanCache(store_dir=store_dir, max_disk_entries=1)
+    small.put('a' * 32, 'G1', '{"a":1}')
+    small.put('b' * 32, 'G2', '{"b":1}')
+    assert os.path.exists(job_file) and PlanCache(store_dir=store_dir).get(key) is None
+    print("   ✅")
+
+print(f"\n命中 / 未命中: {cache.hits} / {cache.misses}")
+print("\n✅ 所有測試通過")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""測試背景規劃工作與進度輪詢（不需資料庫）"""
+
+import os
+import tempfile
+import threading
+import time
+
+import app
+from plan_jobs import PlanJobQueue, JobQueueFull, StoredJob
+from synthetic_orders import generate_orders, start_point
+
+print("=" * 60)
+print("測試背景規劃工作")
+print("=" * 60)
+
+orders = generate_orders('clustered', 300)
+app.fetch_valid_orders = lambda order_group: orders if order_group != 'MISSING' else None
+client = app.app.test_client()
+body = {'start': start_point(), 'order_group': 'JOB-TEST'}
+
+
+def wait_for(job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = client.get(f'/api/route/jobs/{job_id}').get_json()
+        if state['status'] in ('done', 'failed'):
+            return state
+        time.sleep(0.05)
+    raise AssertionError(f"工作 {job_id} 逾時")
+
+
+# 1. 提交並輪詢至完成
+print("\n1. 提交 /api/route/jobs...")
+response = client.post('/api/route/jobs', json=body)
+assert response.status_code == 202
+submitted = response.get_json()
+assert response.headers['Location'] == submitted['status_url']
+state = wait_for(submitted['job_id'])
+assert state['status'] == 'done', state
+assert state['progress']['completed'] == state['progress']['total'] == 6
+assert [s['stage'] for s in state['stages']] == ['fetch_orders', 'cluster', 'split', 'group_order', 'inner_order', 'finish']
+sync = client.post('/api/route', json=body)
+assert sync.headers['X-Plan-Cache'] == 'HIT'  # 背景工作已寫入規劃快取
+assert state['result']['orders'] == sync.get_json()['orders']
+print(f"   ✅ {len(state['result']['orders'])} 筆，耗時 {state['elapsed']:.2f}s")
+
+# 2. 驗證錯誤與找不到訂單
+print("\n2. 錯誤處理...")
+assert client.post('/api/route/jobs', json={'order_group': 'JOB-TEST'}).status_code == 400
+failed = wait_for(client.post('/api/route/jobs', json={**body, 'order_group': 'MISSING'}).get_json()['job_id'])
+assert failed['status'] == 'failed' and 'MISSING' in failed['error']
+assert client.get('/api/route/jobs/unknown').status_code == 404
+print("   ✅ 400 / failed / 404")
+
+# 3. 執行中可取得部分結果
+print("\n3. 部分結果...")
+queue = PlanJobQueue(max_workers=1, max_queued=2)
+release = threading.Event()
+
+
+def blocked(job):
+    job.update('fetch_orders', preview={'total_orders': 3})
+    release.wait(10)
+    return '{"orders": []}', 'MISS'
+
+
+job = queue.submit(blocked, stages=['fetch_orders', 'plan'])
+while not job.stages:
+    time.sleep(0.01)
+running = job.to_dict()
+assert running['status'] == 'running'
+assert running['progress'] == {'completed': 1, 'total': 2, 'current_stage': 'plan'}
+assert running['partial'] == {'fetch_orders': {'total_orders': 3}}
+print("   ✅ running 狀態附進度與 partial")
+
+# 4. 佇列已滿時拒絕（背壓）
+print("\n4. 佇列上限...")
+waiting = [queue.submit(blocked), queue.submit(blocked)]
+assert queue.queue_position(waiting[1]) == 1
+try:
+    queue.submit(blocked)
+    raise AssertionError("佇列已滿時應拒絕")
+except JobQueueFull as e:
+    assert e.retry_after >= 1
+release.set()
+for queued_job in [job] + waiting:
+    while queued_job.status != 'done':
+        time.sleep(0.01)
+assert queue.stats()['done'] == 3
+print("   ✅ JobQueueFull（端點返回 429 + Retry-After）")
+
+# 5. 共用目錄：另一個 worker（另一個 PlanJobQueue）也能回應輪詢
+print("\n5. 多 worker 共用工作狀態...")
+store_dir = tempfile.mkdtemp()
+worker_a = PlanJobQueue(max_workers=1, store_dir=store_dir)
+worker_b = PlanJobQueue(max_workers=1, store_dir=store_dir)
+release.clear()
+shared = worker_a.submit(blocked, stages=['fetch_orders', 'plan'])
+while not shared.stages:
+    time.sleep(0.01)
+seen = worker_b.get(shared.job_id)
+assert isinstance(seen, StoredJob) and seen.status == 'running' and worker_b.queue_position(seen) is None
+assert seen.to_dict()['partial'] == {'fetch_orders': {'total_orders': 3}}
+release.set()
+while worker_a.get(shared.job_id).status != 'done':
+    time.sleep(0.01)
+seen = worker_b.get(shared.job_id)
+assert seen.status == 'done' and seen.payload == '{"orders": []}' and seen.to_dict() == shared.to_dict()
+assert worker_b.get('0' * 32) is None and worker_b.get('../' + shared.job_id) is None
+assert not [name for name in os.listdir(store_dir) if name.endswith('.tmp')]
+
+# 經由端點：worker A 提交，輪詢送到 worker B
+original_queue = app.plan_jobs
+app.plan_jobs = worker_a
+submitted = client.post('/api/route/jobs', json=body).get_json()
+app.plan_jobs = worker_b
+try:
+    state = wait_for(submitted['job_id'])
+finally:
+    app.plan_jobs = original_queue
+assert state['status'] == 'done' and state['result']['orders'] == sync.get_json()['orders']
+# 過期的工作檔案由任一 worker 清除
+worker_b.ttl_seconds = -1
+worker_b._prune()
+assert worker_b.get(submitted['job_id']) is None
+print("   ✅ 其他 worker 讀取共用目錄（running 進度 / done 結果），未知 job_id → 404")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""測試規劃結果串流（SSE / NDJSON，不需資料庫）"""
+
+import json
+import time
+
+import app
+from synthetic_orders import generate_orders, start_point
+
+print("=" * 60)
+print("測試規劃結果串流")
+print("=" * 60)
+
+orders = generate_orders('clustered', 300)
+app.fetch_valid_orders = lambda order_group: orders if order_group != 'MISSING' else None
+client = app.app.test_client()
+body = {'start': start_point(), 'order_group': 'STREAM-TEST'}
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def parse_ndjson(text):
+    return [(item['event'], item['data']) for item in map(json.loads, text.strip().split('\n'))]
+
+
+# 1. SSE：群組分配 → 各群組 → 驗證 → 完整結果
+print("\n1. SSE...")
+response = client.post('/api/route/stream', json=body)
+assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+events = parse_sse(response.get_data(as_text=True))
+names = [name for name, _ in events]
+assert names[0] == 'start' and names[-1] == 'plan'
+assert names.index('clusters') < names.index('group') < names.index('verification') < names.index('plan')
+clusters = dict(events)['clusters']
+groups = [data for name, data in events if name == 'group']
+plan = events[-1][1]
+assert len(groups) == clusters['total_groups'] == plan['total_groups']
+assert [g['group'] for g in groups] == [g['group'] for g in clusters['groups']]
+assert [o['tracking_number'] for g in groups for o in g['orders']] == [o['tracking_number'] for o in plan['orders']]
+assert plan['cache_status'] == 'MISS'
+# 串流結束時背景工作可能還在收尾，稍候再查詢狀態
+job_url = f"/api/route/jobs/{response.headers['X-Job-Id']}"
+for _ in range(100):
+    if client.get(job_url).get_json()['status'] == 'done':
+        break
+    time.sleep(0.01)
+else:
+    raise AssertionError("背景工作未完成")
+print(f"   ✅ {len(events)} 個事件，{len(groups)} 個群組")
+
+# 2. NDJSON + 規劃快取命中（補送群組事件）
+print("\n2. NDJSON（快取命中）...")
+response = client.post('/api/route/stream?format=ndjson', json=body)
+assert response.mimetype == 'application/x-ndjson'
+cached = parse_ndjson(response.get_data(as_text=True))
+assert cached[-1][1]['cache_status'] == 'HIT'
+cached_groups = [data for name, data in cached if name == 'group']
+assert [g['orders'] for g in cached_groups] == [g['orders'] for g in groups]
+assert 'stage' not in [name for name, _ in cached]
+print("   ✅ 快取命中時仍依序送出 clusters / group / verification / plan")
+
+# 3. 只改組內排序參數：前段階段重用，群組仍逐一送出
+print("\n3. 階段快取...")
+response = client.post('/api/route/stream', json={**body, 'inner_order_method': '2opt-inner'},
+                       headers={'Accept': 'application/x-ndjson'})
+events = parse_ndjson(response.get_data(as_text=True))
+stages = {data['stage']: data['cached'] for name, data in events if name == 'stage'}
+assert stages['cluster'] and stages['split'] and not stages['inner_order']
+assert len([1 for name, _ in events if name == 'group']) == clusters['total_groups']
+print("   ✅ cluster / split 重用，inner_order 重算")
+
+# 4. 錯誤
+print("\n4. 錯誤處理...")
+assert client.post('/api/route/stream', json={'order_group': 'X'}).status_code == 400
+events = parse_ndjson(client.post('/api/route/stream?format=ndjson',
+                                  json={**body, 'order_group': 'MISSING'}).get_data(as_text=True))
+assert events == [('error', {'error': '找不到 order_group: MISSING 的訂單'})]
+print("   ✅ 400 / error 事件")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""測試預先規劃排程（本機 SQLite 資料來源 + 磁碟規劃快取，不需正式資料庫）"""
+
+import json
+import os
+import tempfile
+
+from order_source import connect_sqlite, import_snapshot, save_snapshot
+from synthetic_orders import generate_orders, start_point
+
+GROUPS = {
+    'GroupPRE01': generate_orders('clustered', 120, seed=11),
+    'GroupPRE02': generate_orders('uniform', 80, seed=12),
+}
+PARAM_SETS = [{}, {'max_group_size': 10, 'inner_order_method': '2opt-inner'}]
+
+
+def add_group(db_path, tmp_dir, order_group, orders):
+    conn = connect_sqlite(db_path)
+    rows = [{'tracking_number': o['tracking_number'], 'latitude': o['lat'], 'longitude': o['lon'],
+             'delivery_sequence': None} for o in orders]
+    import_snapshot(conn, save_snapshot(os.path.join(tmp_dir, f'{order_group}.npz'), order_group, rows))
+    conn.commit()
+    conn.close()
+
+
+def execute(db_path, query, params=()):
+    conn = connect_sqlite(db_path)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    print("=" * 60)
+    print("測試預先規劃排程")
+    print("=" * 60)
+
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'orders.db')
+    for order_group, orders in GROUPS.items():
+        add_group(db_path, tmp_dir, order_group, orders)
+    start = start_point()
+    os.environ['ORDER_SOURCE'] = f'sqlite:{db_path}'
+    os.environ['PLAN_CACHE_DIR'] = os.path.join(tmp_dir, 'plans')
+    os.environ['PRECOMPUTE_START'] = f"{start['lat']},{start['lon']}"
+    os.environ['PRECOMPUTE_PARAM_SETS'] = json.dumps(PARAM_SETS)
+    import app  # 環境變數需在匯入前設定
+    from plan_cache import PlanCache
+    from precompute import Precomputer, discover_groups, load_param_sets
+
+    client = app.app.test_client()
+    precomputer = Precomputer.get_instance()
+
+    # 1. 參數組合
+    print("\n1. 參數組合...")
+    param_sets = load_param_sets()
+    assert [p['max_group_size'] for p in param_sets] == [30, 10]
+    assert all(p['start'] == start for p in param_sets)
+    default_start = os.environ.pop('PRECOMPUTE_START')
+    try:
+        load_param_sets('[{}]')
+        raise AssertionError('未指定起點應失敗')
+    except ValueError:
+        pass
+    os.environ['PRECOMPUTE_START'] = default_start
+    print("   ✅ 預設起點套用至所有參數組合，缺少起點時報錯")
+
+    # 2. 第一輪：所有 order_group × 所有參數組合
+    print("\n2. 第一輪...")
+    summary = precomputer.run_once()
+    assert summary == dict(summary, discovered=2, changed=2, planned=4, cached=0, failed=0), summary
+    response = client.post('/api/route', json={'start': start, 'order_group': 'GroupPRE01'})
+    assert response.headers['X-Plan-Cache'] == 'HIT'
+    response = client.post('/api/route', json=dict(PARAM_SETS[1], start=start, order_group='GroupPRE02'))
+    assert response.headers['X-Plan-Cache'] == 'HIT'
+    print(f"   ✅ 4 個規劃（{summary['elapsed']:.2f}s），/api/route 直接命中")
+
+    # 3. 結果持久保存（新的快取實例 = 重新啟動後）
+    print("\n3. 持久保存...")
+    valid_orders = app.fetch_valid_orders('GroupPRE01')
+    plan_key, _ = app.route_plan_key(valid_orders, app.route_params({'start': start, 'order_group': 'GroupPRE01'}))
+    assert PlanCache(store_dir=os.environ['PLAN_CACHE_DIR']).get(plan_key, 'GroupPRE01') is not None
+    assert os.path.exists(precomputer.state_path)
+    print("   ✅ 磁碟快取與狀態檔")
+
+    # 4. 沒有變動時不重新規劃
+    print("\n4. 沒有變動...")
+    summary = precomputer.run_once()
+    assert summary['changed'] == 0 and summary['planned'] == 0
+    print("   ✅ changed=0")
+
+    # 5. 訂單變動 + 新增 order_group
+    print("\n5. 訂單變動與新增...")
+    fingerprints = discover_groups()
+    execute(db_path, "UPDATE ordersjb SET latitude = latitude + 0.001 WHERE order_group = ? AND tracking_number = ?",
+            ('GroupPRE02', GROUPS['GroupPRE02'][0]['tracking_number']))
+    add_group(db_path, tmp_dir, 'GroupPRE03', generate_orders('linear', 60, seed=13))
+    assert discover_groups()['GroupPRE02'] != fingerprints['GroupPRE02']
+    summary = precomputer.run_once()
+    assert summary == dict(summary, discovered=3, changed=2, planned=4, failed=0), summary
+    response = client.post('/api/route', json={'start': start, 'order_group': 'GroupPRE02'})
+    assert response.headers['X-Plan-Cache'] == 'HIT'  # 新的快照版本
+    print("   ✅ 只重新規劃變動的 GroupPRE02 與新的 GroupPRE03")
+
+    # 6. 沒有有效座標的 order_group 只記錄一次
+    print("\n6. 無有效座標...")
+    execute(db_path, "INSERT INTO ordersjb (order_group, tracking_number, latitude, longitude) VALUES ('GroupPRE04', 'T1', 0.0, 0.0)")
+    assert precomputer.run_once()['empty'] == 1
+    assert precomputer.run_once()['changed'] == 0
+    print("   ✅ empty 記錄後不再重試")
+
+    # 7. 狀態端點
+    print("\n7. /api/precompute/status...")
+    status = client.get('/api/precompute/status').get_json()
+    assert status['groups'] == 4 and status['planned'] == 3 and status['empty'] == 1
+    assert status['last_run']['changed'] == 0
+    assert 'precompute_groups_total{result="planned"} 4' in client.get('/metrics').get_data(as_text=True)
+    print("   ✅ 狀態與 /metrics")
+
+    precomputer.planner.shutdown()
+    print("\n✅ 所有測試通過")
+
+
+if __name__ == '__main__':
+    # 規劃進程池以 spawn 啟動子進程，主程式需放在 __main__ 之下
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""測試規劃請求的效能分析模式（不需資料庫）"""
+
+import os
+import tempfile
+
+os.environ['ADMIN_TOKEN'] = 'test-admin-token'
+os.environ['PROFILE_DIR'] = tempfile.mkdtemp()
+
+import app  # noqa: E402
+from synthetic_orders import generate_orders, start_point  # noqa: E402
+
+print("=" * 60)
+print("測試效能分析模式")
+print("=" * 60)
+
+orders = generate_orders('clustered', 300)
+app.fetch_valid_orders = lambda order_group: orders
+client = app.app.test_client()
+body = {'start': start_point(), 'order_group': 'PROFILE-TEST'}
+admin = {'X-Admin-Token': 'test-admin-token'}
+
+# 1. 非管理員不可分析
+print("\n1. 權限檢查...")
+assert client.post('/api/route?profile=1', json=body).status_code == 403
+assert client.post('/api/route', json=body, headers={'X-Profile': '1', 'X-Admin-Token': 'wrong'}).status_code == 403
+normal = client.post('/api/route', json=body)
+assert normal.status_code == 200 and 'profile' not in normal.get_json()
+print("   ✅ 無 token / 錯誤 token 返回 403，未要求分析時回應不變")
+
+# 2. 管理員分析：略過規劃快取，各階段都重算
+print("\n2. /api/route?profile=1...")
+response = client.post('/api/route?profile=1', json=body, headers=admin)
+data = response.get_json()
+assert response.status_code == 200
+assert response.headers['X-Plan-Cache'] == 'MISS'
+profile = data['profile']
+assert response.headers['X-Profile-Id'] == profile['profile_id']
+stages = [s['stage'] for s in profile['stages']]
+assert stages == ['fetch_orders', 'cluster', 'split', 'group_order', 'inner_order', 'finish'], stages
+assert not any(s['cached'] for s in profile['stages'])
+assert all(k in profile['stages'][1] for k in ('wall_seconds', 'cpu_seconds', 'alloc_net_bytes', 'peak_bytes'))
+assert profile['hot_functions'] and profile['peak_bytes'] > 0
+assert any('route_pipeline' in f['function'] for f in profile['hot_functions'])
+assert data['orders'] == normal.get_json()['orders']
+print(f"   ✅ {profile['wall_seconds']:.3f}s，峰值 {profile['peak_bytes'] / 1024:.0f} KB，"
+      f"熱點: {profile['hot_functions_self'][0]['function']}")
+
+# 3. 分析結果已儲存，可再取得
+print("\n3. 已儲存的分析...")
+profile_dir = os.environ['PROFILE_DIR']
+assert os.path.exists(os.path.join(profile_dir, f"{profile['profile_id']}.prof"))
+stored = client.get(f"/api/profiles/{profile['profile_id']}", headers=admin)
+assert stored.status_code == 200 and stored.get_json()['profile_id'] == profile['profile_id']
+assert client.get(f"/api/profiles/{profile['profile_id']}").status_code == 403
+assert client.get('/api/profiles/../../etc/passwd', headers=admin).status_code == 404
+print("   ✅ /api/profiles/<id>")
+
+# 4. 快取中的結果不含 profile
+print("\n4. 規劃快取...")
+again = client.post('/api/route', json=body)
+assert again.headers['X-Plan-Cache'] == 'HIT' and 'profile' not in again.get_json()
+print("   ✅ 快取命中的回應不含分析資料")
+
+# 5. Smart 端點
+print("\n5. /api/optimize-route-smart?profile=1...")
+response = client.post('/api/optimize-route-smart?profile=1', json=body, headers=admin)
+stages = [s['stage'] for s in response.get_json()['profile']['stages']]
+assert stages == ['fetch_orders', 'smart_planner'], stages
+print("   ✅ 分析完成")
+
+print("\n✅ 所有測試通過")
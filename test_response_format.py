@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""測試 API 回應格式協商（欄式 JSON / MessagePack + gzip / brotli；不需資料庫）"""
+
+import gzip
+import json
+import logging
+
+import app
+import response_format
+from response_format import (COLUMNAR_MIMETYPE, MSGPACK_MIMETYPE, compress, negotiate_encoding, negotiate_format,
+                             to_columnar)
+from synthetic_orders import generate_orders, start_point
+
+print("=" * 60)
+print("測試 API 回應格式")
+print("=" * 60)
+
+orders = generate_orders('clustered', 200)
+app.fetch_valid_orders = lambda order_group: orders
+client = app.app.test_client()
+body = {'start': start_point(), 'order_group': 'FORMAT-TEST'}
+
+
+def rows(columns):
+    """欄式 → 逐筆 dict"""
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*(columns[f] for f in fields))]
+
+
+# 1. 欄式轉換
+print("\n1. to_columnar...")
+result = {'success': True, 'orders': [
+    {'tracking_number': 'A', 'lat': 1.0, 'lon': 2.0, 'latitude': 1.0, 'longitude': 2.0, 'group': 'A'},
+    {'tracking_number': 'B', 'lat': 3.0, 'lon': 4.0, 'latitude': 3.0, 'longitude': 4.0, 'group': 'A', 'note': 'x'},
+]}
+columnar = to_columnar(result)
+assert columnar['orders_format'] == 'columnar' and columnar['success'] is True
+assert set(columnar['orders']) == {'tracking_number', 'lat', 'lon', 'group', 'note'}, "重複的兼容欄位應省略"
+assert columnar['orders']['note'] == [None, 'x'] and columnar['orders']['lat'] == [1.0, 3.0]
+assert to_columnar({'error': 'x'}) == {'error': 'x'} and 'orders_format' not in result
+print("   ✅")
+
+# 2. 協商
+print("\n2. negotiate_format / negotiate_encoding...")
+cases = [
+    ('/', {}, 'json'),
+    ('/', {'Accept': '*/*'}, 'json'),
+    ('/', {'Accept': COLUMNAR_MIMETYPE}, 'columnar'),
+    ('/', {'Accept': f'application/json;q=0.5, {MSGPACK_MIMETYPE}'}, 'msgpack'),
+    ('/', {'Accept': f'application/json, {MSGPACK_MIMETYPE};q=0.5'}, 'json'),
+    ('/?format=columnar', {'Accept': MSGPACK_MIMETYPE}, 'columnar'),
+    ('/?format=bogus', {}, 'json'),
+]
+for path, headers, expected in cases:
+    with app.app.test_request_context(path, headers=headers):
+        assert negotiate_format() == expected, (path, headers)
+with app.app.test_request_context('/', headers={'Accept-Encoding': 'gzip, br'}):
+    assert negotiate_encoding() == ('br' if response_format.brotli is not None else 'gzip')
+with app.app.test_request_context('/', headers={'Accept-Encoding': 'identity'}):
+    assert negotiate_encoding() is None
+assert compress(b'x' * 10, 'gzip') == (b'x' * 10, None), "小回應不壓縮"
+assert gzip.decompress(compress(b'x' * 5000, 'gzip')[0]) == b'x' * 5000
+print("   ✅")
+
+# 3. 經由 /api/route 往返（json / columnar / msgpack，gzip / br）
+print("\n3. /api/route 往返...")
+expected = client.post('/api/route', json=body).get_json()
+assert expected['success'] and len(expected['orders']) == len(orders)
+
+response = client.post('/api/route?format=columnar', json=body)
+assert response.mimetype == COLUMNAR_MIMETYPE and 'Accept' in response.headers['Vary']
+data = json.loads(response.get_data())
+assert data['orders_format'] == 'columnar' and rows(data['orders']) == expected['orders']
+
+response = client.post('/api/route', json=body, headers={'Accept-Encoding': 'gzip'})
+assert response.headers['Content-Encoding'] == 'gzip'
+assert json.loads(gzip.decompress(response.get_data())) == expected
+
+if response_format.msgpack is not None:
+    response = client.post('/api/route', json=body, headers={'Accept': MSGPACK_MIMETYPE, 'Accept-Encoding': 'gzip'})
+    assert response.mimetype == MSGPACK_MIMETYPE and response.headers['Content-Encoding'] == 'gzip'
+    data = response_format.msgpack.unpackb(gzip.decompress(response.get_data()), raw=False)
+    assert rows(data['orders']) == expected['orders']
+    print("   ✅ msgpack + gzip")
+else:
+    print("   ⚠️  msgpack 未安裝，略過 msgpack 往返")
+
+if response_format.brotli is not None:
+    response = client.post('/api/route?format=columnar', json=body, headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert rows(json.loads(response_format.brotli.decompress(response.get_data()))['orders']) == expected['orders']
+    print("   ✅ columnar + br")
+else:
+    print("   ⚠️  brotli 未安裝，略過 br 往返")
+
+# 4. 未安裝 msgpack：改用欄式 JSON，警告只記錄一次
+print("\n4. 退回欄式 JSON...")
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+collect = Collect()
+response_format.logger.addHandler(collect)
+installed, response_format.msgpack = response_format.msgpack, None
+response_format._msgpack_warned = False
+try:
+    for _ in range(3):
+        response = client.post('/api/route?format=msgpack', json=body)
+        assert response.mimetype == COLUMNAR_MIMETYPE
+        assert rows(json.loads(response.get_data())['orders']) == expected['orders']
+finally:
+    response_format.msgpack = installed
+    response_format.logger.removeHandler(collect)
+assert len([m for m in collect.messages if 'msgpack' in m]) == 1
+print("   ✅ 3 個請求只記錄 1 次警告")
+
+print("\n✅ 所有測試通過")
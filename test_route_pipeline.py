@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""測試 /api/route 分階段流程與階段快取（不需資料庫）"""
+
+import random
+from route_pipeline import run_route_pipeline, route_params, StageCache
+
+print("=" * 60)
+print("測試分階段路徑規劃")
+print("=" * 60)
+
+random.seed(1)
+orders = [
+    {'tracking_number': f'T{i:04d}', 'lat': 43.64 + random.random() * 0.05, 'lon': -79.40 + random.random() * 0.05}
+    for i in range(200)
+]
+base = {'start': {'lat': 43.65, 'lon': -79.38}, 'order_group': 'TEST'}
+cache = StageCache()
+
+
+def run(**overrides):
+    executed = []
+    result = run_route_pipeline(
+        orders, route_params(dict(base, **overrides)), stage_cache=cache,
+        on_stage=lambda stage, info: None if info['cached'] else executed.append(stage)
+    )
+    return result, executed
+
+
+# 1. 第一次：所有階段都計算
+print("\n1. 首次規劃...")
+first, executed = run()
+assert executed == ['cluster', 'split', 'group_order', 'inner_order', 'finish']
+assert len(first['orders']) == len(orders)
+print(f"   ✅ {first['total_groups']} 組，{len(first['algorithm_steps'])} 個步驟")
+
+# 2. 只改組內排序：聚類與群組排序重用
+print("\n2. 只調整 inner_order_method...")
+_, executed = run(inner_order_method='2opt-inner')
+assert executed == ['inner_order', 'finish'], executed
+print("   ✅ 只重算組內排序與終點處理")
+
+# 3. 終點模式會修改序號，不可影響快取的上游結果
+print("\n3. farthest 終點模式後重新規劃...")
+run(end_point_mode='farthest')
+again, executed = run()
+assert executed == []
+assert again['orders'] == first['orders']
+print("   ✅ 快取結果未被修改")
+
+# 4. 改聚類參數：下游全部重算
+print("\n4. 調整 cluster_radius...")
+_, executed = run(cluster_radius=0.5)
+assert executed[0] == 'cluster' and len(executed) == 5
+print("   ✅ 上游變動時下游階段全部重算")
+
+print(f"\n階段快取命中 / 未命中: {cache.hits} / {cache.misses}")
+print("\n✅ 所有測試通過")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""測試合成訂單產生器（基準測試輸入）"""
+
+import tempfile
+from synthetic_orders import BOUNDING_BOXES, DISTRIBUTIONS, generate_orders, write_obstacle_files
+from river_detection import ObstacleDetector
+
+print("=" * 60)
+print("測試合成訂單產生器")
+print("=" * 60)
+
+# 1. 相同參數產生相同訂單，且都在邊界框內
+print("\n1. 可重現性與邊界...")
+for region, (south, west, north, east) in BOUNDING_BOXES.items():
+    for distribution in DISTRIBUTIONS:
+        orders = generate_orders(distribution, 300, region, seed=7)
+        assert orders == generate_orders(distribution, 300, region, seed=7)
+        assert orders != generate_orders(distribution, 300, region, seed=8)
+        assert len({o['tracking_number'] for o in orders}) == 300
+        assert all(south <= o['lat'] <= north and west <= o['lon'] <= east for o in orders)
+print(f"   ✅ {len(BOUNDING_BOXES)} 個區域 × {len(DISTRIBUTIONS)} 種分布")
+
+# 2. 合成障礙數據可被 ObstacleDetector 載入；river 分布的訂單不落在河道上
+print("\n2. 合成河流...")
+rivers_file, highways_file = write_obstacle_files(tempfile.mkdtemp(), 'toronto')
+detector = ObstacleDetector(rivers_file, highways_file)
+assert detector.rivers and detector.highways
+
+orders = generate_orders('river', 400, 'toronto')
+mid_lon = sum(BOUNDING_BOXES['toronto'][1::2]) / 2
+west_side = [o for o in orders if o['lon'] < mid_lon - 0.05]
+east_side = [o for o in orders if o['lon'] > mid_lon + 0.05]
+assert west_side and east_side
+a, b = west_side[0], east_side[0]
+assert detector.check_crossing_geometry(a['lat'], a['lon'], b['lat'], b['lon'])
+print(f"   ✅ {len(detector.rivers)} 段河流，兩岸訂單連線會穿越河流")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""測試啟動預熱與 /healthz 就緒檢查（不需資料庫）"""
+
+import os
+
+import app
+from warmup import Warmup, WARMUP_STEPS
+
+print("=" * 60)
+print("測試啟動預熱")
+print("=" * 60)
+
+client = app.app.test_client()
+
+# 1. 預熱前不就緒
+print("\n1. 預熱前...")
+response = client.get('/healthz')
+assert response.status_code == 503
+state = response.get_json()
+assert state['status'] == 'cold' and state['import_seconds'] > 0
+print(f"   ✅ 503（模組載入 {state['import_seconds']:.2f}s）")
+
+# 2. 預熱後就緒，各步驟有耗時
+print("\n2. 預熱...")
+Warmup.get_instance().run()
+response = client.get('/healthz')
+state = response.get_json()
+assert response.status_code == 200 and state['status'] == 'ready'
+assert set(state['steps']) == {name for name, _ in WARMUP_STEPS}
+assert not state['errors'], state['errors']
+assert state['details']['solvers'] == {'ortools': 45, '2opt-inner': 8, 'lkh': 8}
+assert 'warmup_duration_seconds_count{step="pipeline"} 1' in client.get('/metrics').get_data(as_text=True)
+print(f"   ✅ 200，預熱 {state['warmup_seconds']:.2f}s: {state['steps']}")
+
+# 3. 單一步驟失敗不影響就緒
+print("\n3. 步驟失敗...")
+
+
+def broken():
+    raise RuntimeError('boom')
+
+
+warmup = Warmup(steps=(('broken', broken), ('ok', lambda: {'fine': True}))).run()
+assert warmup.ready and warmup.state()['errors'] == {'broken': 'boom'} and warmup.details['ok'] == {'fine': True}
+print("   ✅ 錯誤記錄於 errors，狀態仍為 ready")
+
+# 4. WARMUP=0
+print("\n4. WARMUP=0...")
+os.environ['WARMUP'] = '0'
+skipped = Warmup(steps=(('broken', broken),)).run()
+assert skipped.status == 'skipped' and skipped.ready and not skipped.timings
+del os.environ['WARMUP']
+print("   ✅ 略過預熱")
+
+print("\n✅ 所有測試通過")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""測試生產環境入口的預先載入（不需 gunicorn / 資料庫）"""
+
+import os
+import runpy
+import tempfile
+import sys
+
+print("=" * 60)
+print("測試 WSGI 預先載入")
+print("=" * 60)
+
+# 1. 載入 wsgi 即完成預先載入
+print("\n1. import wsgi...")
+import wsgi  # noqa: E402
+from river_detection import ObstacleDetector  # noqa: E402
+
+assert hasattr(ObstacleDetector, '_instance'), "障礙數據應在 import 時載入"
+assert 'sklearn.cluster' in sys.modules and 'ortools.constraint_solver.pywrapcp' in sys.modules
+assert set(wsgi.PRELOAD_TIMINGS) == {'imports', 'obstacles', 'warmup'}
+print(f"   ✅ {', '.join(f'{k} {v:.2f}s' for k, v in wsgi.PRELOAD_TIMINGS.items())}")
+
+# 2. 預先載入後請求可直接處理
+print("\n2. 請求...")
+response = wsgi.application.test_client().get('/metrics')
+assert response.status_code == 200
+assert wsgi.application.test_client().get('/healthz').get_json()['status'] == 'ready'
+print("   ✅ application 可處理請求，fork 前已完成預熱")
+
+# 3. gunicorn 設定
+print("\n3. gunicorn.conf.py...")
+os.environ['WEB_CONCURRENCY'] = '3'
+config = runpy.run_path('gunicorn.conf.py')
+assert config['preload_app'] is True and config['workers'] == 3 and config['worker_class'] == 'gthread'
+assert os.path.exists(os.path.join(config['chdir'], 'wsgi.py'))
+
+# 多 worker 但工作狀態未共用時，啟動記錄警告
+class FakeLog:
+    def __init__(self):
+        self.warnings = []
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class FakeServer:
+    log = FakeLog()
+
+
+from metrics import REGISTRY  # noqa: E402
+from plan_jobs import PlanJobQueue  # noqa: E402
+
+job_queue = PlanJobQueue.get_instance()
+store_dir, job_queue.store_dir = job_queue.store_dir, None
+metrics_store, REGISTRY.store_dir = REGISTRY.store_dir, None
+config['when_ready'](FakeServer)
+assert len(FakeServer.log.warnings) == 2
+assert 'PLAN_JOB_DIR' in FakeServer.log.warnings[0] and 'METRICS_DIR' in FakeServer.log.warnings[1]
+job_queue.store_dir = '/tmp/shared-jobs'
+REGISTRY.store_dir = tempfile.mkdtemp()
+config['when_ready'](FakeServer)
+assert len(FakeServer.log.warnings) == 2
+assert os.listdir(REGISTRY.store_dir) == [f'{os.getpid()}.json']  # master 預熱的指標
+job_queue.store_dir = store_dir
+REGISTRY.store_dir = metrics_store
+print("   ✅ preload_app / workers / chdir；多 worker 未共用工作狀態 / 指標時警告")
+
+print("\n✅ 所有測試通過")
@@ -5,6 +5,10 @@ import math
 import numpy as np
 from typing import List, Tuple, Dict, Optional, Callable
 
+from app_logging import get_logger
+
+logger = get_logger('tsp_solver')
+
 
 def calculate_distance_matrix(coords: List[Tuple[float, float]], 
                               distance_func: Optional[Callable] = None) -> np.ndarray:
@@ -66,7 +70,7 @@ def solve_tsp_ortools(coords: List[Tuple[float, float]], start_index: int = 0, d
     distance_matrix = (distance_matrix_float * 1000000).astype(int)  # 放大 10^6 倍
     
     n = len(coords)
-    print(f"[INFO] OR-Tools TSP: {n} 個點，起點索引 {start_index}")
+    logger.debug(f"OR-Tools TSP: {n} 個點，起點索引 {start_index}")
     
     # 創建路徑模型
     manager = pywrapcp.RoutingIndexManager(n, 1, start_index)
@@ -105,15 +109,15 @@ def solve_tsp_ortools(coords: List[Tuple[float, float]], start_index: int = 0, d
         search_parameters.time_limit.seconds = 2
     
     # 求解
-    print(f"[INFO] OR-Tools 開始求解...")
+    logger.debug(f"OR-Tools 開始求解...")
     solution = routing.SolveWithParameters(search_parameters)
     
     if not solution:
         # 失敗時返回貪心順序
-        print("[WARN] OR-Tools 求解失敗，使用貪心順序")
+        logger.warning("OR-Tools 求解失敗，使用貪心順序")
         return list(range(n))
     
-    print(f"[INFO] OR-Tools 求解成功")
+    logger.debug(f"OR-Tools 求解成功")
     
     # 提取路徑
     route = []
@@ -230,7 +234,7 @@ def solve_tsp_lkh(coords: List[Tuple[float, float]], start_index: int = 0) -> Li
     try:
         from python_tsp.heuristics import solve_tsp_simulated_annealing
     except ImportError:
-        print("[WARN] python-tsp 未安裝，回退到 2-opt")
+        logger.warning("python-tsp 未安裝，回退到 2-opt")
         return solve_tsp_2opt(coords, start_index)
     
     # 計算距離矩陣
@@ -246,7 +250,7 @@ def solve_tsp_lkh(coords: List[Tuple[float, float]], start_index: int = 0) -> Li
         
         return route
     except Exception as e:
-        print(f"[WARN] python-tsp 求解失敗: {e}，回退到 2-opt")
+        logger.warning(f"python-tsp 求解失敗: {e}，回退到 2-opt")
         return solve_tsp_2opt(coords, start_index)
 
 
@@ -270,7 +274,7 @@ def solve_tsp_with_end(coords: List[Tuple[float, float]], method: str = 'ortools
     if end_index is None:
         return solve_tsp(coords, method, start_index)
     
-    print(f"[INFO] solve_tsp_with_end: 固定起點 {start_index}，終點 {end_index}")
+    logger.debug(f"solve_tsp_with_end: 固定起點 {start_index}，終點 {end_index}")
     
     # 使用 OR-Tools 求解固定起點和終點的路徑
     if method == 'ortools':
@@ -319,15 +323,15 @@ def solve_tsp_with_end(coords: List[Tuple[float, float]], method: str = 'ortools
                 # 添加終點
                 route.append(manager.IndexToNode(index))
                 
-                print(f"[INFO] OR-Tools 求解成功，路徑長度: {len(route)}")
-                print(f"[INFO] 路徑: {route[:10]}...{route[-10:] if len(route) > 10 else ''}")
+                logger.debug(f"OR-Tools 求解成功，路徑長度: {len(route)}")
+                logger.debug(f"路徑: {route[:10]}...{route[-10:] if len(route) > 10 else ''}")
                 return route
             else:
-                print("[WARN] OR-Tools 無解，回退到貪心")
+                logger.warning("OR-Tools 無解，回退到貪心")
                 return solve_tsp_greedy_with_end(coords, start_index, end_index)
         
         except Exception as e:
-            print(f"[ERROR] OR-Tools 求解失敗: {e}")
+            logger.error(f"OR-Tools 求解失敗: {e}")
             return solve_tsp_greedy_with_end(coords, start_index, end_index)
     
     else:
@@ -421,11 +425,11 @@ def solve_tsp_smart(orders: List[Dict], start_point: Dict, max_group_size: int =
         return result
 
     except ImportError as e:
-        print(f"[ERROR] 無法導入 SmartRoutePlanner: {e}")
-        print("[INFO] 請確保 smart_route_planner.py 存在且可訪問")
+        logger.error(f"無法導入 SmartRoutePlanner: {e}")
+        logger.info("請確保 smart_route_planner.py 存在且可訪問")
         raise
     except Exception as e:
-        print(f"[ERROR] SmartRoutePlanner 執行失敗: {e}")
+        logger.error(f"SmartRoutePlanner 執行失敗: {e}")
         raise
 
 
@@ -456,10 +460,10 @@ def solve_tsp(coords: List[Tuple[float, float]], method: str = 'ortools', start_
     elif method == 'lkh':
         return solve_tsp_lkh(coords, start_index)  # LKH 暫不支援
     elif method == 'smart':
-        print("[WARN] 'smart' 方法需要使用 solve_tsp_smart() 函數")
-        print("[INFO] 回退到 2-opt 方法")
+        logger.warning("'smart' 方法需要使用 solve_tsp_smart() 函數")
+        logger.info("回退到 2-opt 方法")
         return solve_tsp_2opt(coords, start_index, distance_func)
     else:
-        print(f"[WARN] 未知方法 {method}，使用 nearest neighbor")
+        logger.warning(f"未知方法 {method}，使用 nearest neighbor")
         return greedy_tsp(coords, start_index, distance_func)
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+啟動預熱：載入障礙數據，並以少量合成訂單執行一次聚類與各 TSP 方法
+
+DBSCAN / KMeans（含 threadpool 初始化）、OR-Tools、python-tsp 第一次呼叫都較慢，
+預熱後第一個實際請求不必承擔；進度與耗時由 /healthz 回報（未完成時返回 503）。
+  gunicorn（wsgi.py）→ master fork 前同步執行，worker 共用結果
+  python app.py      → 背景執行緒執行
+  WARMUP=0           → 略過（/healthz 直接回報 ready）
+"""
+
+import os
+import threading
+import time
+import traceback
+
+from app_logging import get_logger
+from metrics import WARMUP_LATENCY
+
+logger = get_logger('warmup')
+
+WARMUP_ORDERS = 60
+
+# OR-Tools 在 20 點以下會以 GUIDED_LOCAL_SEARCH 跑滿時間上限，預熱用 41 點以上（只求初始解）
+ORTOOLS_POINTS = 45
+SMALL_TSP_POINTS = 8
+
+
+def _synthetic_orders(n):
+    from synthetic_orders import generate_orders, start_point
+    return generate_orders('clustered', n), start_point()
+
+
+def warm_obstacles():
+    from river_detection import ObstacleDetector
+    detector = ObstacleDetector.get_instance()
+    return detector.obstacle_counts()
+
+
+def warm_pipeline():
+    """完整 /api/route 流程（獨立的階段快取，不影響實際請求的快取）"""
+    from river_detection import ObstacleDetector
+    from route_pipeline import StageCache, route_params, run_route_pipeline
+
+    orders, start = _synthetic_orders(WARMUP_ORDERS)
+    has_obstacles = any(ObstacleDetector.get_instance().obstacle_counts().values())
+    params = route_params({'start': start, 'order_group': 'WARMUP', 'max_group_size': 15,
+                           'verification': 'geometry' if has_obstacles else 'none'})
+    result = run_route_pipeline(orders, params, stage_cache=StageCache())
+    return {'orders': result['total_orders'], 'groups': result['total_groups']}
+
+
+def warm_solvers():
+    from tsp_solver import solve_tsp
+
+    orders, start = _synthetic_orders(ORTOOLS_POINTS)
+    coords = [(start['lat'], start['lon'])] + [(o['lat'], o['lon']) for o in orders]
+    solved = {}
+    for method, n in (('ortools', ORTOOLS_POINTS), ('2opt-inner', SMALL_TSP_POINTS), ('lkh', SMALL_TSP_POINTS)):
+        solved[method] = len(solve_tsp(coords[:n], method=method, start_index=0))
+    return solved
+
+
+def warm_smart_planner():
+    from tsp_solver import solve_tsp_smart
+
+    orders, start = _synthetic_orders(30)
+    return {'groups': len(solve_tsp_smart(orders, start)['groups'])}
+
+
+WARMUP_STEPS = (
+    ('obstacles', warm_obstacles),
+    ('pipeline', warm_pipeline),
+    ('solvers', warm_solvers),
+    ('smart_planner', warm_smart_planner),
+)
+
+
+class Warmup:
+    """預熱狀態（cold → warming → ready；WARMUP=0 時為 skipped）"""
+
+    def __init__(self, steps=WARMUP_STEPS):
+        self.steps = steps
+        self.status = 'cold'
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.details = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def get_instance():
+        """獲取單例實例"""
+        if not hasattr(Warmup, '_instance'):
+            Warmup._instance = Warmup()
+        return Warmup._instance
+
+    @property
+    def ready(self):
+        return self.status in ('ready', 'skipped')
+
+    def run(self):
+        """同步執行所有預熱步驟（單一步驟失敗只記錄，不影響服務）"""
+        with self._lock:
+            if self.status != 'cold':
+                return self
+            if os.environ.get('WARMUP', '1') == '0':
+                self.status = 'skipped'
+                return self
+            self.status = 'warming'
+            self.started_at = time.time()
+
+        logger.info("開始預熱...")
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                self.details[name] = step()
+            except Exception as e:
+                logger.warning(f"預熱步驟 {name} 失敗: {e}")
+                traceback.print_exc()
+                self.errors[name] = str(e)
+            elapsed = time.perf_counter() - start
+            self.timings[name] = round(elapsed, 4)
+            WARMUP_LATENCY.observe(elapsed, step=name)
+
+        self.finished_at = time.time()
+        self.status = 'ready'
+        logger.info(f"預熱完成（{self.finished_at - self.started_at:.2f}s）: "
+                    + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()))
+        return self
+
+    def start_background(self):
+        """背景執行緒預熱（開發模式）"""
+        if self._thread is None and self.status == 'cold':
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def state(self):
+        """/healthz 的回應內容"""
+        now = self.finished_at or time.time()
+        return {
+            'status': self.status,
+            'ready': self.ready,
+            'warmup_seconds': round(now - self.started_at, 4) if self.started_at else None,
+            'steps': dict(self.timings),
+            'details': dict(self.details),
+            'errors': dict(self.errors),
+        }
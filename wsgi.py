@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+生產環境 WSGI 入口
+
+  gunicorn -c gunicorn.conf.py wsgi:application
+
+gunicorn.conf.py 設定 preload_app = True：本模組只在 master 進程載入一次，
+先載入重型模組（sklearn / scipy / ortools / python-tsp）與障礙數據（JSON 解析 + STRtree），
+fork 後各 worker 以 copy-on-write 共用同一份記憶體，第一個請求不必再等待載入。
+PRELOAD_OBSTACLES=0 可略過障礙數據（例如只使用 verification=none 的部署），WARMUP=0 可略過預熱。
+"""
+
+import importlib
+import os
+import time
+
+from app_logging import get_logger
+from app import app as application
+from river_detection import ObstacleDetector
+from warmup import Warmup
+
+logger = get_logger('wsgi')
+
+# 請求中才載入（函數內 import）的模組，於 fork 前先載入
+PRELOAD_MODULES = (
+    'sklearn.cluster',
+    'sklearn.neighbors',
+    'scipy.spatial',
+    'scipy.sparse.csgraph',
+    'ortools.constraint_solver.pywrapcp',
+    'ortools.constraint_solver.routing_enums_pb2',
+    'python_tsp.heuristics',
+    'smart_route_planner',
+)
+
+
+def preload_shared_state():
+    """
+    fork 前載入共用狀態
+
+    Returns:
+        各項耗時 {'imports': 秒, 'obstacles': 秒, 'warmup': 秒}
+    """
+    timings = {}
+    start = time.perf_counter()
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            # python-tsp 等選用套件未安裝時，對應方法在請求中會自行回退
+            logger.warning(f"預先載入 {module} 失敗: {e}")
+    timings['imports'] = time.perf_counter() - start
+
+    if os.environ.get('PRELOAD_OBSTACLES', '1') != '0':
+        start = time.perf_counter()
+        detector = ObstacleDetector.get_instance()
+        timings['obstacles'] = time.perf_counter() - start
+        counts = detector.obstacle_counts()
+        mode = '共用記憶體' if detector.store is not None else '一般'
+        logger.info(f"障礙數據已預先載入（{mode}）: {counts['rivers']} 條河流、{counts['highways']} 條高速公路線段")
+
+    # 預熱（聚類、各 TSP 方法第一次呼叫的初始化）也在 fork 前完成，/healthz 於 worker 中即為 ready
+    start = time.perf_counter()
+    Warmup.get_instance().run()
+    timings['warmup'] = time.perf_counter() - start
+
+    logger.info("預先載入完成: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+
+PRELOAD_TIMINGS = preload_shared_state()